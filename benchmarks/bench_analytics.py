@@ -0,0 +1,202 @@
+"""
+GET insights/analytics (db_helpers/insightRollups.py) against --insights insights.
+
+Offline stages (always run):
+
+    full_group_by   counting every insight by domain, audience, confidence level, value priority
+                    and month with numpy, a lower bound for any approach that reads the rows
+    incremental     the same counts built chunk by chunk as ingest does, then compared with the
+                    full count through compare_counts
+    query           summarize_insights over the rollup rows, per request shape
+
+When SqlConnectionString is set the schema in that database is recreated (never point it at a
+real database), --insights insights and --recommendation-ratio recommendations are bulk loaded,
+and the stages run against SQL Server:
+
+    rebuild         rebuild_rollups after the direct load
+    query           insight_analytics compared with the same counts by a full GROUP BY
+    writes          an upload of --upload rows through ingest_rows and a chunk of recommendations
+                    through insert_recommendations, then check_rollups
+
+The script exits non-zero if the incremental counts or check_rollups disagree with a full count.
+
+    python benchmarks/bench_analytics.py --insights 10m
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import random
+
+import numpy as np
+
+import benchutil
+from db_helpers.dimensionCache import DimensionTable
+from db_helpers.ingestInsights import CHUNK_SIZE
+from db_helpers.insightRollups import GROUP_KEYS, ROLLUP_DIMENSIONS, compare_counts, summarize_insights
+from fakertools.generate_insights import LOOKUP_COUNTS, LOOKUP_NAMES, START_DATE
+
+MONTHS = 24
+# Share of generated insights without created_at (month NULL)
+UNDATED_RATIO = 0.001
+
+QUERIES = {
+    "totals by each key": (),
+    "by domain and month": ("domain", "month"),
+    "by every key": GROUP_KEYS,
+}
+
+
+def seed_tables():
+    tables = {}
+    for key in ROLLUP_DIMENSIONS:
+        tables[key] = DimensionTable(key)
+        for position, name in enumerate(LOOKUP_NAMES[key]):
+            tables[key].add(position + 1, name, None)
+    return tables
+
+
+def generate(insights, seed):
+    """Rollup columns of insights as an (insights, 5) array; the month column is 0 for NULL."""
+    rng = np.random.default_rng(seed)
+    columns = [rng.integers(1, LOOKUP_COUNTS[f"{key}_id"] + 1, insights, dtype=np.int32) for key in ROLLUP_DIMENSIONS]
+    months = rng.integers(1, MONTHS + 1, insights, dtype=np.int32)
+    months[rng.random(insights) < UNDATED_RATIO] = 0
+    return np.stack(columns + [months], axis=1)
+
+
+def month_date(month):
+    if not month:
+        return None
+    year, index = divmod(START_DATE.month - 1 + month - 1, 12)
+    return datetime.date(START_DATE.year + year, index + 1, 1)
+
+
+def count_groups(rows):
+    """{(lookup ids..., month): count} of rows, the GROUP BY the rollups stand for, in one bincount."""
+    shape = [LOOKUP_COUNTS[f"{key}_id"] + 1 for key in ROLLUP_DIMENSIONS] + [MONTHS + 1]
+    counts = np.bincount(np.ravel_multi_index(rows.T, shape), minlength=int(np.prod(shape)))
+    present = np.flatnonzero(counts)
+    groups = np.stack(np.unravel_index(present, shape), axis=1)
+    return {tuple(group): int(count) for group, count in zip(groups.tolist(), counts[present])}
+
+
+def incremental_counts(rows, chunk_size):
+    counts = {}
+    for start in range(0, len(rows), chunk_size):
+        for group, count in count_groups(rows[start:start + chunk_size]).items():
+            counts[group] = counts.get(group, 0) + count
+    return counts
+
+
+def rollup_rows(counts):
+    return [(*group[:-1], month_date(group[-1]), count) for group, count in counts.items()]
+
+
+def timed_repeat(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        _, seconds = benchutil.timed(fn)
+        samples.append(seconds)
+    return benchutil.percentiles(samples, (50, 99))
+
+
+def offline(args, insights, failures):
+    rows, generate_seconds = benchutil.timed(generate, insights, args.seed)
+    full, full_seconds = benchutil.timed(count_groups, rows)
+    incremental, incremental_seconds = benchutil.timed(incremental_counts, rows, CHUNK_SIZE)
+    differences = compare_counts(full, incremental)
+    if differences:
+        failures.append(f"{len(differences)} incremental groups differ")
+
+    tables = seed_tables()
+    rollups = rollup_rows(full)
+    return {
+        "generate_seconds": round(generate_seconds, 3),
+        "rollup_rows": len(rollups),
+        "full_group_by_ms": round(full_seconds * 1000, 1),
+        "incremental": {
+            "chunks": -(-insights // CHUNK_SIZE),
+            "ms_per_chunk": round(incremental_seconds * 1000 / -(-insights // CHUNK_SIZE), 3),
+            "groups_differing": len(differences),
+        },
+        "query_ms": {name: timed_repeat(lambda: summarize_insights(rollups, tables, group_by), args.repeat)
+                     for name, group_by in QUERIES.items()},
+    }
+
+
+def live(args, insights, failures):
+    import pyodbc
+    from bench_functions import INSERT_INSIGHT_SQL, INSERT_RECOMMENDATION_SQL, bulk_insert, recreate_schema
+    from fakertools.generate_insights import insight_rows, recommendation_rows
+    from db_helpers import insightRollups
+    from db_helpers.generateRecommendations import insert_recommendations
+    from db_helpers.ingestInsights import ingest_rows, open_csv
+    import insights_analytics
+
+    conn = pyodbc.connect(benchutil.connection_string(), autocommit=False)
+    try:
+        recreate_schema(conn)
+        _, load_seconds = benchutil.timed(bulk_insert, conn, INSERT_INSIGHT_SQL, insight_rows(insights, seed=args.seed))
+        scored = random.Random(args.seed).sample(range(1, insights + 1), int(insights * args.recommendation_ratio))
+        bulk_insert(conn, INSERT_RECOMMENDATION_SQL, recommendation_rows(sorted(scored), seed=args.seed))
+        written, rebuild_seconds = benchutil.timed(insightRollups.rebuild_rollups, conn)
+
+        insights_analytics.get_connection = lambda: contextlib.nullcontext(conn)
+        queries = {name: timed_repeat(lambda: insights_analytics.insight_analytics(group_by, {}, None, None), args.repeat)
+                   for name, group_by in QUERIES.items()}
+        cursor = conn.cursor()
+        full_group_by = timed_repeat(lambda: cursor.execute(insightRollups.insight_counts_query()).fetchall(),
+                                     max(1, args.repeat // 10))
+
+        reader, header_index = open_csv(io.BytesIO(benchutil.synthetic_insights_csv(args.upload, seed=args.seed + 1)))
+        uploaded, upload_seconds = benchutil.timed(ingest_rows, conn, reader, header_index)
+        new_ids = uploaded["insight_ids"][:CHUNK_SIZE]
+        feature_rows = [(insight_id, 1, 1, 1) for insight_id in new_ids]
+        insert_recommendations(cursor, feature_rows, [0] * len(feature_rows))
+        conn.commit()
+        differences, check_seconds = benchutil.timed(insightRollups.check_rollups, conn)
+        differing = sum(map(len, differences.values()))
+        if differing:
+            failures.append(f"check_rollups found {differing} differing groups")
+    finally:
+        conn.close()
+    return {
+        "load_seconds": round(load_seconds, 3),
+        "rebuild_seconds": round(rebuild_seconds, 3),
+        "rollup_rows": written,
+        "query_ms": queries,
+        "full_group_by_ms": full_group_by,
+        "writes": {
+            "upload_rows": args.upload,
+            "upload_rows_per_second": round(args.upload / upload_seconds),
+            "recommendations": len(feature_rows),
+            "check_seconds": round(check_seconds, 3),
+            "groups_differing": differing,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--insights", default="10m")
+    parser.add_argument("--recommendation-ratio", type=float, default=0.5)
+    parser.add_argument("--upload", default="100k", help="Rows ingested after the load in the database stages")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    insights = benchutil.parse_sizes(args.insights)[0]
+    args.upload = benchutil.parse_sizes(args.upload)[0]
+
+    failures = []
+    results = {"insights": insights, "offline": offline(args, insights, failures)}
+    if benchutil.connection_string():
+        results["database"] = live(args, insights, failures)
+
+    benchutil.emit("analytics", results)
+    if failures:
+        raise SystemExit("Rollups differ from a full count: " + ", ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
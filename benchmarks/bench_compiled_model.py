@@ -0,0 +1,102 @@
+"""
+Checks that the compiled lookup-table predictor agrees with model.predict and compares
+per-prediction latency and cold import/load time. Runs offline.
+
+Parity is asserted over the full compiled grid plus random rows that include ids outside the
+compiled domains (which must go through the fallback). The script exits non-zero on a mismatch.
+
+    python benchmarks/bench_compiled_model.py
+"""
+import argparse
+import itertools
+import random
+import subprocess
+import sys
+import time
+import warnings
+
+import benchutil
+from db_helpers.compiledPredictor import FEATURE_COLUMNS, compile_model, model_predict
+from db_helpers.modelRegistry import ModelRegistry
+
+COLD_START_SNIPPETS = {
+    # What generate_recommendations paid at import time before the registry
+    "joblib_model": "import joblib; joblib.load({path!r})",
+    "compiled_table": (
+        "from db_helpers.compiledPredictor import load_compiled; "
+        "from db_helpers.modelRegistry import ModelRegistry; "
+        "r = ModelRegistry({path!r}); assert load_compiled(r.compiled_path, r.version()) is not None"
+    ),
+}
+
+
+def check_parity(registry, samples, seed=11):
+    loaded = registry.get()
+    compiled = compile_model(loaded.model, loaded.version)
+    grid = list(itertools.product(*compiled.domains))
+    rng = random.Random(seed)
+    outside = [tuple(rng.randint(1, max(compiled.domains[0]) * 2) for _ in FEATURE_COLUMNS) for _ in range(samples)]
+    rows = grid + outside
+
+    expected = [int(prediction) for prediction in model_predict(loaded.model, rows)]
+    actual = compiled.predict(rows)
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    return compiled, {"rows_checked": len(rows), "fallback_rows": compiled.fallback_rows, "mismatches": mismatches}
+
+
+def per_prediction_latency(registry, compiled, repeat):
+    import pandas as pd
+
+    model = registry.get().model
+    row = (1, 2, 3)
+    frame = pd.DataFrame([row], columns=FEATURE_COLUMNS)
+
+    # The original serving path: a one-row DataFrame and model.predict
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for _ in range(repeat):
+            model.predict(frame)
+    sklearn_us = (time.perf_counter() - start) / repeat * 1e6
+
+    start = time.perf_counter()
+    for _ in range(repeat * 100):
+        compiled.predict_one(row)
+    compiled_us = (time.perf_counter() - start) / (repeat * 100) * 1e6
+    return {"sklearn_predict_us": round(sklearn_us, 2), "compiled_predict_us": round(compiled_us, 3)}
+
+
+def cold_start(path):
+    results = {}
+    for name, snippet in COLD_START_SNIPPETS.items():
+        code = f"import sys; sys.path.insert(0, {benchutil.REPO_ROOT!r}); import warnings; warnings.simplefilter('ignore'); " \
+               + snippet.format(path=path)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        results[f"{name}_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=5000, help="Random rows checked besides the grid")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    registry = ModelRegistry(compiled=False)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        compiled, parity = check_parity(registry, args.samples)
+
+    results = {
+        "parity": parity,
+        "latency": per_prediction_latency(registry, compiled, args.repeat),
+        "cold_start": cold_start(registry.path),
+    }
+    benchutil.emit("compiled_model", results)
+    if parity["mismatches"]:
+        raise SystemExit(f"{parity['mismatches']} compiled predictions differ from model.predict")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Latency of GET /insights (insights_summary pages) while CSV ingests run in the same worker process.
+
+Readers (--readers concurrent clients) page through insights for --seconds in three phases:
+
+    idle        no other traffic
+    ingest      --ingesters clients post --upload-rows row uploads back to back
+    serialized  the same, but every invocation runs to completion on a host pool of
+                --host-threads threads, the way the synchronous handlers ran
+                (PYTHON_THREADPOOL_THREAD_COUNT), so a page read can wait behind an ingest
+
+Reports p50/p95/p99 page latency, status counts, completed uploads and the limiter counters of
+concurrency.py. Requires SqlConnectionString pointing at a database loaded by bench_functions.py;
+the uploads add rows to it.
+
+    python benchmarks/bench_concurrency.py --readers 8 --seconds 20 --upload-rows 20000
+"""
+import argparse
+import asyncio
+import collections
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import azure.functions as func
+
+import benchutil
+
+
+def page_request(limit, cursor):
+    params = {"limit": str(limit)}
+    if cursor:
+        params["cursor"] = cursor
+    return func.HttpRequest("GET", "http://localhost/api/insights_summary", params=params, body=b"")
+
+
+async def upload_request(rows, seed):
+    payload = await asyncio.to_thread(benchutil.synthetic_insights_csv, rows, seed)
+    body, headers = benchutil.multipart_upload(payload)
+    return func.HttpRequest("POST", "http://localhost/api/insights_injest_csv", headers=headers, body=body)
+
+
+async def reader(dispatch, stop, page_size, latencies, statuses):
+    import insights_summary
+
+    cursor = None
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await dispatch(insights_summary.main, page_request(page_size, cursor))
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] += 1
+        cursor = json.loads(response.get_body()).get("next_cursor") if response.status_code == 200 else None
+
+
+async def ingester(dispatch, stop, rows, seed, uploads):
+    import insights_injest_csv
+
+    while not stop.is_set():
+        req = await upload_request(rows, seed + len(uploads))
+        started = time.perf_counter()
+        response = await dispatch(insights_injest_csv.main, req)
+        uploads.append((time.perf_counter() - started, response.status_code))
+
+
+async def run_phase(args, ingesters, dispatch):
+    stop = asyncio.Event()
+    latencies, statuses, uploads = [], collections.Counter(), []
+    tasks = [asyncio.create_task(reader(dispatch, stop, args.page_size, latencies, statuses))
+             for _ in range(args.readers)]
+    tasks += [asyncio.create_task(ingester(dispatch, stop, args.upload_rows, args.seed + 1000 * n, uploads))
+              for n in range(ingesters)]
+    await asyncio.sleep(args.seconds)
+    stop.set()
+    await asyncio.gather(*tasks)
+    return {
+        "requests": len(latencies),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        "latency_ms": benchutil.percentiles(latencies, (50, 95, 99)),
+        "uploads": len(uploads),
+        "upload_ms": benchutil.percentiles([seconds for seconds, _ in uploads], (50,)),
+    }
+
+
+def async_dispatch():
+    async def dispatch(main, req):
+        return await main(req)
+    return dispatch
+
+
+def serialized_dispatch(executor):
+    async def dispatch(main, req):
+        return await asyncio.get_running_loop().run_in_executor(executor, benchutil.invoke, main, req)
+    return dispatch
+
+
+async def run(args):
+    from db_helpers.concurrency import concurrency_stats
+
+    results = {}
+    # Warm-up: pool connections, dimension cache
+    await run_phase(argparse.Namespace(**{**vars(args), "seconds": 1}), 0, async_dispatch())
+    results["idle"] = await run_phase(args, 0, async_dispatch())
+    results["ingest"] = await run_phase(args, args.ingesters, async_dispatch())
+    results["limiters"] = concurrency_stats()["functions"]
+    with ThreadPoolExecutor(args.host_threads) as executor:
+        results["serialized"] = await run_phase(args, args.ingesters, serialized_dispatch(executor))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--ingesters", type=int, default=1)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--upload-rows", type=int, default=20000)
+    parser.add_argument("--host-threads", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if not benchutil.connection_string():
+        raise SystemExit("Set SqlConnectionString to a database loaded by bench_functions.py.")
+
+    benchutil.emit("concurrency", asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Cost of the ingest duplicate checks (db_helpers/ingestDedup.py) per 100k uploaded rows.
+
+An upload of --rows rows is parsed and validated as in bench_ingest.py, then run through the
+dedup stages one at a time:
+
+    baseline    parse and validate only
+    exact       plus content hashing and the in-upload exact check (the default)
+    near        plus MinHash signatures and LSH lookups in chunks of CHUNK_SIZE, against an index
+                of --existing stored insights and the upload's earlier rows
+
+--exact-ratio of the rows repeat an earlier upload row with other case and spacing, and
+--near-ratio copy a stored insight with one word added; the report shows how many of each the
+stages caught, and how many other rows were flagged. Runs offline; the database probe for exact
+duplicates of stored rows is one set-based statement per chunk and is not included.
+
+    python benchmarks/bench_dedup.py --rows 100k --existing 1m
+"""
+import argparse
+import csv
+import io
+import random
+
+import benchutil
+from db_helpers import ingestDedup
+from db_helpers.dimensionCache import normalize_name
+from db_helpers.ingestDedup import NearDuplicateIndex, UploadDeduplicator
+from db_helpers.ingestInsights import CHUNK_SIZE, open_csv, validate_row
+from fakertools.generate_insights import INSIGHT_CSV_HEADERS, LOOKUP_NAMES, insight_csv_rows, insight_rows
+
+
+class GeneratedInsights:
+    """Connection stand-in serving NearDuplicateIndex.sync from generated Insights rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, top, after_id):
+        self._rows = self.rows[after_id:after_id + top]
+        return self
+
+    def fetchall(self):
+        return self._rows
+
+
+def existing_rows(count, seed):
+    """(id, content, lookup ids...) rows as the index sync query returns them."""
+    return [(insight_id, row[0], *row[2:]) for insight_id, row in enumerate(insight_rows(count, seed), start=1)]
+
+
+def upload(rows, existing, exact_ratio, near_ratio, seed):
+    """CSV bytes plus the line numbers of the planted exact and near duplicates."""
+    rng = random.Random(seed)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(INSIGHT_CSV_HEADERS)
+    written = []
+    planted = {"exact": set(), "near": set()}
+    for line_number, row in enumerate(insight_csv_rows(rows, seed), start=2):
+        draw = rng.random()
+        if draw < exact_ratio and written:
+            row = list(rng.choice(written))
+            row[0] = "  " + row[0].upper().replace(" ", "   ")
+            planted["exact"].add(line_number)
+        elif draw < exact_ratio + near_ratio:
+            stored = rng.choice(existing)
+            names = [seeded[lookup_id - 1] for seeded, lookup_id in zip(LOOKUP_NAMES.values(), stored[2:])]
+            row = [stored[1] + " Confirmed.", row[1]] + names
+            planted["near"].add(line_number)
+        written.append(row)
+        writer.writerow(row)
+    return buffer.getvalue().encode("utf-8"), planted
+
+
+def run_stage(payload, lookups, deduplicator):
+    reader, header_index = open_csv(io.BytesIO(payload))
+    batch = []
+    kept = 0
+    for row in reader:
+        values, errors = validate_row(row, header_index, lookups)
+        if errors:
+            continue
+        if deduplicator is not None:
+            if deduplicator.check_row(reader.line_num, values):
+                continue
+            batch.append([reader.line_num] + values)
+            if len(batch) >= CHUNK_SIZE:
+                kept += len(deduplicator.filter_chunk(batch))
+                batch = []
+        else:
+            kept += 1
+    if deduplicator is not None:
+        kept += len(deduplicator.filter_chunk(batch))
+    return kept
+
+
+def caught(deduplicator, planted):
+    flagged = {kind: set() for kind in planted}
+    for detail in deduplicator.details:
+        flagged[detail["kind"]].add(detail["line"])
+    all_planted = set().union(*planted.values())
+    return {
+        "exact_caught": f"{len(flagged['exact'] & planted['exact'])}/{len(planted['exact'])}",
+        "near_caught": f"{len(flagged['near'] & planted['near'])}/{len(planted['near'])}",
+        "other_rows_flagged": len(set().union(*flagged.values()) - all_planted),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="100k")
+    parser.add_argument("--existing", default="1m", help="Stored insights in the near-duplicate index")
+    parser.add_argument("--exact-ratio", type=float, default=0.05)
+    parser.add_argument("--near-ratio", type=float, default=0.05)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rows = benchutil.parse_sizes(args.rows)[0]
+    existing = benchutil.parse_sizes(args.existing)[0]
+
+    stored = existing_rows(existing, args.seed)
+    index = NearDuplicateIndex(args.threshold)
+    _, index_seconds = benchutil.timed(index.sync, GeneratedInsights(stored))
+    payload, planted = upload(rows, stored, args.exact_ratio, args.near_ratio, args.seed + 1)
+    lookups = benchutil.seed_lookups(normalize_name)
+    # Every skipped row is needed to tell which planted duplicates were caught
+    ingestDedup.MAX_REPORTED_DUPLICATES = rows
+
+    results = {
+        "rows": rows,
+        "index": {
+            "insights": existing,
+            "build_seconds": round(index_seconds, 3),
+            "insights_per_second": round(existing / index_seconds),
+            "mb": round(index.stats()["bytes"] / 2**20, 1),
+        },
+        "stages": {},
+    }
+    per_100k = 100000 / rows
+    baseline = None
+    for stage, deduplicator in (
+        ("baseline", None),
+        ("exact", UploadDeduplicator(exact=True)),
+        ("near", UploadDeduplicator(exact=True, near_index=index)),
+    ):
+        kept, seconds = benchutil.timed(run_stage, payload, lookups, deduplicator)
+        baseline = seconds if baseline is None else baseline
+        result = {
+            "rows_per_second": round(rows / seconds),
+            "seconds_per_100k": round(seconds * per_100k, 3),
+            "overhead_seconds_per_100k": round((seconds - baseline) * per_100k, 3),
+            "kept": kept,
+        }
+        if deduplicator is not None:
+            result.update(caught(deduplicator, planted))
+        results["stages"][stage] = result
+
+    benchutil.emit("dedup", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Compares the original 8-way JOIN for GET /insights against the slim fact query plus
+dimension cache decoration.
+
+Requires SqlConnectionString. Each variant is run --repeat times; the cache is warmed by the
+first fact-query run, as it would be after the first request on a worker.
+
+    python benchmarks/bench_dimension_cache.py --repeat 5
+"""
+import argparse
+
+import benchutil
+
+JOIN_QUERY = """
+SELECT
+    i.id AS insight_id, i.content AS insight_content, i.created_at AS insight_created_at,
+    it.type_name, it.description, ds.source_name, ds.description, a.audience_name, a.description,
+    d.domain_name, d.description, cl.level_name, cl.description, t.timeliness_type, t.description,
+    ag.goal_name, ag.description, vp.priority_name, vp.description
+FROM Insights i
+JOIN InsightTypes it ON i.insight_type_id = it.id
+JOIN DataSources ds ON i.data_source_id = ds.id
+JOIN Audiences a ON i.audience_id = a.id
+JOIN Domains d ON i.domain_id = d.id
+JOIN ConfidenceLevels cl ON i.confidence_level_id = cl.id
+JOIN Timeliness t ON i.timeliness_id = t.id
+JOIN AlignmentGoals ag ON i.alignment_goal_id = ag.id
+JOIN ValuePriorities vp ON i.value_priority_id = vp.id
+"""
+
+KEYS = [("insight_type", "name"), ("data_source", "name"), ("audience", "name"), ("domain", "name"),
+        ("confidence_level", "name"), ("timeliness", "type"), ("alignment_goal", "name"),
+        ("value_priority", "name")]
+
+
+def join_path(conn):
+    cursor = conn.cursor()
+    cursor.execute(JOIN_QUERY)
+    insights = []
+    for row in cursor.fetchall():
+        insight = {
+            "insight_id": row[0],
+            "content": row[1],
+            "created_at": row[2].strftime("%Y-%m-%d %H:%M:%S") if row[2] else None,
+        }
+        for position, (key, name_key) in enumerate(KEYS):
+            insight[key] = {name_key: row[3 + position * 2], "description": row[4 + position * 2]}
+        insights.append(insight)
+    return insights
+
+
+def cached_path(conn):
+    from db_helpers.getInsights import INSIGHT_FACTS_QUERY, decorate_insights
+
+    cursor = conn.cursor()
+    cursor.execute(INSIGHT_FACTS_QUERY)
+    return decorate_insights(conn, cursor.fetchall())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if not benchutil.connection_string():
+        raise SystemExit("SqlConnectionString is not set.")
+
+    import pyodbc
+    from db_helpers.dimensionCache import get_dimension_cache
+
+    results = {}
+    with pyodbc.connect(benchutil.connection_string()) as conn:
+        for name, path in (("join", join_path), ("facts_plus_cache", cached_path)):
+            samples = []
+            rows = 0
+            for _ in range(args.repeat):
+                insights, elapsed = benchutil.timed(path, conn)
+                samples.append(elapsed)
+                rows = len(insights)
+            results[name] = {"rows": rows, **benchutil.percentiles(samples, (50, 95))}
+    results["cache"] = get_dimension_cache().stats()
+
+    benchutil.emit("dimension_cache", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Compares what an analytics client pays to get insights and recommendations into pandas: the JSON
+endpoints (insights_summary?snapshot=true and recommendations_summary) against insights_export
+as Arrow IPC and Parquet.
+
+For each variant it reports bytes on the wire, server time and peak Python memory in the handler,
+and client time to a DataFrame (json.loads plus pandas.json_normalize, or the Arrow / Parquet
+readers). Requires SqlConnectionString pointing at a database loaded by bench_functions.py.
+
+    python benchmarks/bench_export.py --repeat 3
+"""
+import argparse
+import gzip
+import io
+import json
+import time
+import tracemalloc
+
+import azure.functions as func
+
+import benchutil
+
+VARIANTS = {
+    "insights": [
+        ("json_gzip", "insights_summary", {"snapshot": "true"}, {"Accept-Encoding": "gzip"}),
+        ("arrow_gzip", "insights_export", {"format": "arrow"}, {"Accept-Encoding": "gzip"}),
+        ("arrow_zstd", "insights_export", {"format": "arrow", "compression": "zstd"}, {}),
+        ("parquet", "insights_export", {"format": "parquet"}, {}),
+    ],
+    "recommendations": [
+        ("json_gzip", "recommendations_summary", {}, {"Accept-Encoding": "gzip"}),
+        ("arrow_gzip", "insights_export", {"format": "arrow"}, {"Accept-Encoding": "gzip"}),
+        ("arrow_zstd", "insights_export", {"format": "arrow", "compression": "zstd"}, {}),
+        ("parquet", "insights_export", {"format": "parquet"}, {}),
+    ],
+}
+
+
+def load_dataframe(dataset, response):
+    """What the client does with the body: returns the DataFrame."""
+    import pandas as pd
+    import pyarrow as pa
+
+    body = response.get_body()
+    if response.headers.get("Content-Encoding") == "gzip":
+        body = gzip.decompress(body)
+    mimetype = response.mimetype
+    if mimetype == "application/json":
+        payload = json.loads(body)
+        return pd.json_normalize(payload["insights" if dataset == "insights" else "recommendations"])
+    if mimetype == "application/vnd.apache.parquet":
+        return pd.read_parquet(io.BytesIO(body))
+    return pa.ipc.open_stream(body).read_pandas()
+
+
+def run_variant(dataset, handler, params, headers, repeat):
+    module = __import__(handler)
+    route_params = {"dataset": dataset} if handler == "insights_export" else {}
+    server, client, wire, peak, rows = [], [], 0, 0, 0
+    for _ in range(repeat):
+        req = func.HttpRequest("GET", f"http://localhost/api/{handler}", params=params, headers=headers,
+                               route_params=route_params, body=b"")
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = benchutil.invoke(module.main, req)
+        server.append(time.perf_counter() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        if response.status_code != 200:
+            raise SystemExit(f"{handler} returned {response.status_code}: {response.get_body()[:200]!r}")
+        wire = len(response.get_body())
+        frame, seconds = benchutil.timed(load_dataframe, dataset, response)
+        client.append(seconds)
+        rows = len(frame)
+    return {
+        "rows": rows,
+        "wire_mb": round(wire / 2**20, 3),
+        "server_ms": benchutil.percentiles(server, (50,))["p50"],
+        "server_peak_mb": round(peak / 2**20, 1),
+        "client_ms": benchutil.percentiles(client, (50,))["p50"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--datasets", default="insights,recommendations")
+    args = parser.parse_args()
+    if not benchutil.connection_string():
+        raise SystemExit("Set SqlConnectionString to a database loaded by bench_functions.py.")
+
+    results = {}
+    for dataset in args.datasets.split(","):
+        results[dataset] = {
+            name: run_variant(dataset, handler, params, headers, args.repeat)
+            for name, handler, params, headers in VARIANTS[dataset]
+        }
+    benchutil.emit("export", results)
+
+
+if __name__ == "__main__":
+    main()
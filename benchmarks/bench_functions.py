@@ -0,0 +1,259 @@
+"""
+End-to-end benchmark of the function handlers against a local SQL Server stand-in.
+
+For every size the harness recreates the Eureka schema with the migrations of
+fakertools/create_eureka_database_structure.py (tables, lookup seed data, indexes) and bulk
+loads synthetic insights and recommendations (fakertools/generate_insights.py). Each scenario then runs in a fresh Python process, calling the
+function's main with synthetic func.HttpRequest objects, so cold start and peak RSS are per
+scenario. Results are printed as one JSON document.
+
+The stand-in is SQL Server itself, since the code is written in T-SQL. For example:
+
+    docker run -d -p 1433:1433 -e ACCEPT_EULA=Y -e MSSQL_SA_PASSWORD=<password> \\
+        mcr.microsoft.com/mssql/server:2022-latest
+    # create an empty database, e.g. CREATE DATABASE eureka_bench
+    export SqlConnectionString="Driver={ODBC Driver 18 for SQL Server};Server=localhost,1433;\\
+        Database=eureka_bench;Uid=sa;Pwd=<password>;TrustServerCertificate=yes"
+    python benchmarks/bench_functions.py --sizes 10k,100k,1m --requests 100
+
+The schema in the target database is dropped and recreated; never point this at a real database.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+import benchutil
+from fakertools.generate_insights import INSIGHT_COLUMNS, insight_rows, recommendation_rows
+
+LOAD_CHUNK_SIZE = 10000
+
+INSERT_INSIGHT_SQL = f"INSERT INTO Insights ({', '.join(INSIGHT_COLUMNS)}) VALUES ({', '.join('?' * len(INSIGHT_COLUMNS))})"
+INSERT_RECOMMENDATION_SQL = """
+INSERT INTO Recommendations (insight_id, recommendation_text, confidence_level_id, delivery_channel_id, status, created_at, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+SCENARIOS = [
+    "read_all_insights", "insights_summary", "insights_injest_csv",
+    "generate_recommendations", "recommendations_summary",
+]
+# Scenarios that read the whole table per request; they get --full-reads requests instead of --requests
+FULL_READ_SCENARIOS = {"read_all_insights", "recommendations_summary"}
+
+
+def recreate_schema(conn):
+    """Drops the Eureka tables and applies every migration, as a fresh deployment would."""
+    from fakertools.create_eureka_database_structure import drop_schema, migrate
+
+    drop_schema(conn)
+    migrate(conn, log=lambda message: None)
+
+
+def bulk_insert(conn, sql, rows):
+    cursor = conn.cursor()
+    cursor.fast_executemany = True
+    chunk = []
+    inserted = 0
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == LOAD_CHUNK_SIZE:
+            cursor.executemany(sql, chunk)
+            conn.commit()
+            inserted += len(chunk)
+            chunk = []
+    if chunk:
+        cursor.executemany(sql, chunk)
+        conn.commit()
+        inserted += len(chunk)
+    return inserted
+
+
+def prepare(size, args):
+    import pyodbc
+
+    conn = pyodbc.connect(benchutil.connection_string(), autocommit=False)
+    try:
+        started = time.perf_counter()
+        recreate_schema(conn)
+        insights = bulk_insert(conn, INSERT_INSIGHT_SQL, insight_rows(size, seed=args.seed))
+        # Identity ids start at 1 in the fresh table
+        scored = random.Random(args.seed).sample(range(1, size + 1), int(size * args.recommendation_ratio))
+        recommendations = bulk_insert(conn, INSERT_RECOMMENDATION_SQL, recommendation_rows(sorted(scored), seed=args.seed))
+        elapsed = time.perf_counter() - started
+    finally:
+        conn.close()
+    return {"insights": insights, "recommendations": recommendations, "load_seconds": round(elapsed, 3),
+            "rows_per_second": round((insights + recommendations) / elapsed)}
+
+
+# Scenario bodies run in the child process; each returns a list of (seconds, status, rows)
+
+def http_request(method, url, params=None, body=b"", headers=None):
+    import azure.functions as func
+
+    return func.HttpRequest(method, url, params=params or {}, headers=headers or {}, body=body)
+
+
+def call(main, req):
+    started = time.perf_counter()
+    response = benchutil.invoke(main, req)
+    # Include building and encoding the body, as the host would
+    body = response.get_body()
+    return time.perf_counter() - started, response.status_code, body
+
+
+def run_read_all_insights(args, requests):
+    from db_helpers.getInsights import read_all_insights
+
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        insights = read_all_insights()
+        samples.append((time.perf_counter() - started, 200, len(insights)))
+    return samples
+
+
+def run_insights_summary(args, requests):
+    import insights_summary
+
+    samples = []
+    cursor = None
+    for _ in range(requests):
+        params = {"limit": str(args.page_size)}
+        if cursor:
+            params["cursor"] = cursor
+        seconds, status, body = call(insights_summary.main, http_request("GET", "/api/insights_summary", params))
+        page = json.loads(body) if status == 200 else {}
+        samples.append((seconds, status, len(page.get("insights", []))))
+        cursor = page.get("next_cursor")
+    return samples
+
+
+def run_insights_injest_csv(args, requests):
+    import insights_injest_csv
+
+    samples = []
+    for n in range(requests):
+        body, headers = benchutil.multipart_upload(benchutil.synthetic_insights_csv(args.upload_rows, seed=args.seed + n))
+        req = http_request("POST", "/api/insights_injest_csv", body=body, headers=headers)
+        seconds, status, response = call(insights_injest_csv.main, req)
+        inserted = json.loads(response).get("inserted", 0) if status == 200 else 0
+        samples.append((seconds, status, inserted))
+    return samples
+
+
+def run_generate_recommendations(args, requests):
+    import generate_recommendations
+
+    rng = random.Random(args.seed)
+    samples = []
+    for _ in range(requests):
+        body = json.dumps({"insight_id": rng.randint(1, args.size)}).encode("utf-8")
+        req = http_request("POST", "/api/generate_recommendations", body=body,
+                           headers={"Content-Type": "application/json"})
+        seconds, status, _ = call(generate_recommendations.main, req)
+        samples.append((seconds, status, 1 if status == 200 else 0))
+    return samples
+
+
+def run_recommendations_summary(args, requests):
+    import recommendations_summary
+
+    samples = []
+    for _ in range(requests):
+        seconds, status, body = call(recommendations_summary.main, http_request("GET", "/api/recommendations_summary"))
+        rows = len(json.loads(body).get("recommendations", [])) if status == 200 else 0
+        samples.append((seconds, status, rows))
+    return samples
+
+
+def run_scenario(args):
+    """Child process entry point: runs one scenario and prints its measurements as JSON."""
+    requests = args.full_reads if args.scenario in FULL_READ_SCENARIOS else args.requests
+    started = time.perf_counter()
+    samples = globals()[f"run_{args.scenario}"](args, requests)
+    elapsed = time.perf_counter() - started
+
+    latencies = [sample[0] for sample in samples]
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    rows = sum(sample[2] for sample in samples)
+    print(json.dumps({
+        "requests": len(samples),
+        "statuses": statuses,
+        "first_request_ms": round(latencies[0] * 1000, 3) if latencies else None,
+        # Steady state: the first request pays imports, pool warm-up and model loading
+        "latency_ms": benchutil.percentiles(latencies[1:] or latencies),
+        "requests_per_second": round(len(samples) / elapsed, 3),
+        "rows": rows,
+        "rows_per_second": round(rows / elapsed),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }))
+
+
+def spawn_scenario(scenario, size, args):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--scenario", scenario, "--size", str(size),
+        "--requests", str(args.requests), "--full-reads", str(args.full_reads), "--page-size", str(args.page_size),
+        "--upload-rows", str(args.upload_rows), "--seed", str(args.seed),
+    ]
+    result = subprocess.run(command, capture_output=True, text=True, check=False)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit {result.returncode}"}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=benchutil.REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10k", help="Insights per run, e.g. 10k,100k,1m,10m")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=50, help="Requests per scenario")
+    parser.add_argument("--full-reads", type=int, default=3, help="Requests for scenarios that read whole tables")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--upload-rows", type=int, default=1000, help="Rows per CSV upload")
+    parser.add_argument("--recommendation-ratio", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-load", action="store_true", help="Reuse the data already in the database")
+    # Internal: run one scenario in this process
+    parser.add_argument("--scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario:
+        run_scenario(args)
+        return
+
+    if not benchutil.connection_string():
+        raise SystemExit("Set SqlConnectionString to a disposable SQL Server database (see --help).")
+
+    scenarios = [scenario for scenario in args.scenarios.split(",") if scenario]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = {"revision": git_revision(), "python": sys.version.split()[0], "sizes": {}}
+    for size in benchutil.parse_sizes(args.sizes):
+        run = {"data": None if args.skip_load else prepare(size, args)}
+        for scenario in scenarios:
+            run[scenario] = spawn_scenario(scenario, size, args)
+        results["sizes"][str(size)] = run
+    benchutil.emit("functions", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measures insights_injest_csv throughput in rows/sec.
+
+The parse/validate stage always runs (it needs no database). When SqlConnectionString is set the
+full bulk ingest into Insights is measured as well; point it at a disposable database, the rows
+are committed.
+
+    python benchmarks/bench_ingest.py --sizes 1k,100k,1m
+"""
+import argparse
+import io
+
+import benchutil
+from db_helpers.dimensionCache import normalize_name
+from db_helpers.ingestInsights import ingest_rows, open_csv, validate_row
+
+
+def parse_and_validate(payload, lookups):
+    reader, header_index = open_csv(io.BytesIO(payload))
+    accepted = rejected = 0
+    for row in reader:
+        values, errors = validate_row(row, header_index, lookups)
+        if errors:
+            rejected += 1
+        else:
+            accepted += 1
+    return accepted, rejected
+
+
+def full_ingest(payload, chunk_size):
+    import pyodbc
+
+    with pyodbc.connect(benchutil.connection_string()) as conn:
+        reader, header_index = open_csv(io.BytesIO(payload))
+        return ingest_rows(conn, reader, header_index, chunk_size=chunk_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1k,100k,1m", help="Comma separated row counts")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--reject-ratio", type=float, default=0.01)
+    args = parser.parse_args()
+
+    lookups = benchutil.seed_lookups(normalize_name)
+    results = []
+    for size in benchutil.parse_sizes(args.sizes):
+        payload = benchutil.synthetic_insights_csv(size, reject_ratio=args.reject_ratio)
+        (accepted, rejected), elapsed = benchutil.timed(parse_and_validate, payload, lookups)
+        result = {
+            "rows": size,
+            "bytes": len(payload),
+            "parse_validate_rows_per_sec": round(size / elapsed),
+            "accepted": accepted,
+            "rejected": rejected,
+        }
+        if benchutil.connection_string():
+            summary, elapsed = benchutil.timed(full_ingest, payload, args.chunk_size)
+            result["ingest_rows_per_sec"] = round(size / elapsed)
+            result["ingest_seconds"] = round(elapsed, 3)
+            result["inserted"] = summary["inserted"]
+        results.append(result)
+
+    benchutil.emit("ingest", results)
+
+
+if __name__ == "__main__":
+    main()
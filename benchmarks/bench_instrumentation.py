@@ -0,0 +1,64 @@
+"""
+Measures the cost of the request instrumentation: a span outside a timed request (the disabled
+path), a span inside one, and a full instrumented() invocation. Runs offline.
+
+    python benchmarks/bench_instrumentation.py --iterations 1000000
+"""
+import argparse
+import logging
+import time
+
+import benchutil
+from db_helpers.instrumentation import instrumented, span
+
+
+def per_call_ns(fn, iterations):
+    start = time.perf_counter()
+    fn(iterations)
+    return round((time.perf_counter() - start) / iterations * 1e9, 1)
+
+
+def bare_loop(iterations):
+    for _ in range(iterations):
+        pass
+
+
+def spans(iterations):
+    for _ in range(iterations):
+        with span("phase") as current:
+            current.rows = 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    args = parser.parse_args()
+    # The structured log line is part of the per-request cost, but not worth printing here
+    logging.disable(logging.INFO)
+
+    loop_ns = per_call_ns(bare_loop, args.iterations)
+
+    @instrumented("benchmark")
+    def timed_request(iterations):
+        spans(iterations)
+
+    @instrumented("benchmark")
+    def empty_request():
+        return None
+
+    requests = max(1, args.iterations // 100)
+    start = time.perf_counter()
+    for _ in range(requests):
+        empty_request()
+    request_us = (time.perf_counter() - start) / requests * 1e6
+
+    benchutil.emit("instrumentation", {
+        "loop_ns": loop_ns,
+        "span_outside_request_ns": round(per_call_ns(spans, args.iterations) - loop_ns, 1),
+        "span_inside_request_ns": round(per_call_ns(timed_request, args.iterations) - loop_ns, 1),
+        "instrumented_request_overhead_us": round(request_us, 2),
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Shows per-page latency of GET /insights as the Insights table grows.
+
+Requires SqlConnectionString pointing at a disposable database: the table is grown in steps
+with synthetic rows through the bulk ingest path. At each step the first page and a page
+near the end of the table are timed.
+
+    python benchmarks/bench_pagination.py --steps 10k,100k,1m --limit 100
+"""
+import argparse
+import io
+
+import benchutil
+
+
+def grow(rows, seed):
+    from db_helpers.connectionPool import get_connection
+    from db_helpers.ingestInsights import ingest_rows, open_csv
+
+    reader, header_index = open_csv(io.BytesIO(benchutil.synthetic_insights_csv(rows, seed=seed)))
+    with get_connection() as conn:
+        ingest_rows(conn, reader, header_index)
+
+
+def table_stats():
+    from db_helpers.connectionPool import get_connection
+
+    with get_connection() as conn:
+        return conn.cursor().execute("SELECT COUNT(*), MAX(id) FROM Insights").fetchone()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", default="10k,100k,1m", help="Target table sizes")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if not benchutil.connection_string():
+        raise SystemExit("SqlConnectionString is not set.")
+
+    from db_helpers.getInsights import encode_cursor, read_insights_page
+
+    results = []
+    for step, target in enumerate(benchutil.parse_sizes(args.steps)):
+        count, max_id = table_stats()
+        if count < target:
+            grow(target - count, seed=step)
+            count, max_id = table_stats()
+
+        deep_cursor = encode_cursor(max(0, max_id - args.limit * 2))
+        timings = {}
+        for label, cursor in (("first_page", None), ("deep_page", deep_cursor)):
+            samples = []
+            for _ in range(args.repeat):
+                _, elapsed = benchutil.timed(read_insights_page, args.limit, cursor)
+                samples.append(elapsed)
+            timings[label] = benchutil.percentiles(samples, (50, 95))
+        results.append({"table_rows": count, "limit": args.limit, **timings})
+
+    benchutil.emit("pagination", results)
+
+
+if __name__ == "__main__":
+    main()
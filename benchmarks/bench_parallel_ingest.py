@@ -0,0 +1,123 @@
+"""
+Pipelined CSV ingest (db_helpers/parallelIngest.py): per-stage throughput. That it maps columns
+exactly like ingest_rows, stray quotes included, is checked by test/test_parallel_ingest.py.
+
+Offline: a synthetic upload of --rows rows is ingested through ingest_rows and through
+ingest_chunks with each --workers-list count, writing to a database stand-in that only collects
+the staged rows, so the report shows the Python side of the pipeline and the reading, parsing
+and writing stages of each run. When SqlConnectionString is set the same upload is also
+ingested into that database (point it at a disposable one, the rows are committed).
+
+    python benchmarks/bench_parallel_ingest.py --rows 1m --workers-list 1,2,4
+"""
+import argparse
+import io
+import os
+
+import benchutil
+from db_helpers.dimensionCache import LOAD_QUERY, get_dimension_cache, normalize_name
+from db_helpers.ingestInsights import STAGING_INSERT_SQL, ingest_rows, open_csv
+from db_helpers.parallelIngest import UploadChunks, ingest_chunks, parse_chunk, parse_pool
+
+
+class StagingDatabase:
+    """
+    Connection stand-in for an ingest: serves the seed lookups, collects what is bulk copied
+    into the staging table and hands out ids for the moved rows. Finds no stored duplicates.
+    """
+
+    def __init__(self):
+        self.staged = []
+        self._rows = []
+        self._pending = 0
+        self.fast_executemany = False
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, *params):
+        if sql == LOAD_QUERY:
+            self._rows = [(column, position + 1, name, None)
+                          for column, names in benchutil.SEED_LOOKUP_NAMES.items()
+                          for position, name in enumerate(names)]
+        elif "OUTPUT INSERTED.id" in sql:
+            first = len(self.staged) - self._pending + 1
+            self._rows = [(insight_id,) for insight_id in range(first, first + self._pending)]
+            self._pending = 0
+        else:
+            self._rows = []
+        return self
+
+    def executemany(self, sql, rows):
+        assert sql == STAGING_INSERT_SQL
+        rows = [list(row) for row in rows]
+        self.staged.extend(rows)
+        self._pending += len(rows)
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def throughput(args, rows):
+    payload = benchutil.synthetic_insights_csv(rows, seed=args.seed, reject_ratio=args.reject_ratio)
+    lookups = benchutil.seed_lookups(normalize_name)
+    reader, header_index = open_csv(io.BytesIO(payload))
+    serial, serial_seconds = benchutil.timed(ingest_rows, StagingDatabase(), reader, header_index)
+    results = {
+        "rows": rows,
+        "mb": round(len(payload) / 2**20, 1),
+        "cpus": os.cpu_count(),
+        "serial": {"rows_per_second": round(rows / serial_seconds), "inserted": serial["inserted"]},
+        "pipelined": {},
+    }
+    for workers in benchutil.parse_sizes(args.workers_list):
+        if workers > 1:
+            # Processes start (and import the app) on first use; the report is of a warm pool
+            pool = parse_pool(workers)
+            for future in [pool.submit(parse_chunk, b"", 2, {}, lookups) for _ in range(workers)]:
+                future.result()
+        database = StagingDatabase()
+        chunks = UploadChunks(io.BytesIO(payload), chunk_bytes=args.chunk_bytes)
+        result, seconds = benchutil.timed(ingest_chunks, database, chunks, workers=workers)
+        results["pipelined"][workers] = {
+            "rows_per_second": round(rows / seconds),
+            "speedup_over_serial": round(serial_seconds / seconds, 2),
+            "inserted": result["inserted"],
+            "stages": result["stages"],
+        }
+
+    if benchutil.connection_string():
+        import pyodbc
+
+        with pyodbc.connect(benchutil.connection_string()) as conn:
+            result, seconds = benchutil.timed(ingest_chunks, conn, UploadChunks(io.BytesIO(payload), args.chunk_bytes))
+        results["database"] = {"rows_per_second": round(rows / seconds), "stages": result["stages"]}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="1m")
+    parser.add_argument("--workers-list", default="1,2,4", help="Parse process counts to measure")
+    parser.add_argument("--chunk-bytes", type=int, default=4 << 20)
+    parser.add_argument("--reject-ratio", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # The lookups are loaded from the stand-in, not a cache filled by an earlier run
+    get_dimension_cache().invalidate()
+    benchutil.emit("parallel_ingest", {"throughput": throughput(args, benchutil.parse_sizes(args.rows)[0])})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Drives the insight queue end to end: a producer enqueues ids in ingest-sized chunks while the
+recommendation worker drains them in micro-batches. Runs offline; the database write is replaced
+by a simulated per-batch and per-row cost, and a fraction of batches fail to exercise retries.
+
+Reports producer backpressure, consumer throughput, lag and dead letters per backend, and exits
+non-zero if any id was lost (neither acked nor dead-lettered).
+
+    python benchmarks/bench_queue.py --ids 50000 --backends memory,sqlite
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+import benchutil
+from db_helpers.insightQueue import MemoryInsightQueue, QueueFullError, SqliteInsightQueue
+from db_helpers.recommendationWorker import drain_queue
+
+
+def make_queue(backend, directory, args):
+    options = {"max_depth": args.max_depth, "max_attempts": 3, "retry_backoff_seconds": 0.01}
+    if backend == "sqlite":
+        return SqliteInsightQueue(os.path.join(directory, "queue.sqlite3"), **options)
+    return MemoryInsightQueue(**options)
+
+
+def run(backend, args):
+    rng = random.Random(3)
+    scored = set()
+
+    def process(insight_ids):
+        time.sleep(args.batch_cost_ms / 1000 + len(insight_ids) * args.row_cost_us / 1e6)
+        if rng.random() < args.failure_rate:
+            raise RuntimeError("Simulated database failure.")
+        scored.update(insight_ids)
+        return {"processed": len(insight_ids), "not_found": [], "skipped": 0}
+
+    with tempfile.TemporaryDirectory() as directory:
+        queue = make_queue(backend, directory, args)
+        producer_done = threading.Event()
+        put_latencies = []
+
+        def produce():
+            for start in range(0, args.ids, args.chunk):
+                ids = range(start + 1, min(args.ids, start + args.chunk) + 1)
+                began = time.perf_counter()
+                try:
+                    queue.put_many(ids, timeout=60)
+                except QueueFullError:
+                    pass
+                put_latencies.append(time.perf_counter() - began)
+            producer_done.set()
+
+        started = time.perf_counter()
+        producer = threading.Thread(target=produce)
+        producer.start()
+        totals = {"batches": 0, "processed": 0, "failed_batches": 0}
+        peak_lag = 0.0
+        while True:
+            summary = drain_queue(queue, args.batch, args.window, max_seconds=1.0, process=process)
+            for key in totals:
+                totals[key] += summary[key]
+            metrics = queue.metrics()
+            peak_lag = max(peak_lag, metrics["lag_seconds"])
+            if producer_done.is_set() and metrics["waiting"] == 0 and metrics["in_flight"] == 0:
+                break
+        producer.join()
+        elapsed = time.perf_counter() - started
+
+        dead = {row[0] for row in queue.dead_letters()}
+        lost = args.ids - len(scored | dead)
+        return {
+            "seconds": round(elapsed, 3),
+            "insights_per_second": round(len(scored) / elapsed),
+            "put_chunk_ms": benchutil.percentiles(put_latencies),
+            "peak_lag_seconds": peak_lag,
+            "worker": totals,
+            "queue": queue.metrics(),
+            "dead_letters": len(dead),
+            "lost": lost,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ids", type=int, default=50000)
+    parser.add_argument("--backends", default="memory,sqlite")
+    parser.add_argument("--chunk", type=int, default=5000, help="Ids per put, like one ingest upload chunk")
+    parser.add_argument("--max-depth", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--window", type=float, default=0.05)
+    parser.add_argument("--batch-cost-ms", type=float, default=5.0)
+    parser.add_argument("--row-cost-us", type=float, default=20.0)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    results = {backend: run(backend, args) for backend in args.backends.split(",")}
+    benchutil.emit("queue", results)
+    if any(result["lost"] for result in results.values()):
+        raise SystemExit("Some queued insight ids were neither processed nor dead-lettered.")
+
+
+if __name__ == "__main__":
+    main()
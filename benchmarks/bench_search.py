@@ -0,0 +1,222 @@
+"""
+Search index (db_helpers/searchIndex.py) at scale: --insights insights of about --words words each,
+drawn with a Zipf-like popularity from a --vocabulary word vocabulary, with random domain,
+audience and confidence level ids.
+
+Runs offline. The Insights reads are served from the generated rows in FETCH_ROWS chunks, the
+way read_rows pages through the table. Reports:
+
+    build       full build time, insights per second, terms, postings and bytes on disk
+    cold_load   time for a fresh SearchIndex to map the published generation
+    queries     latency and match counts of common, rare, multi-word, match=all, filtered and
+                partial-word queries
+    delta       catch-up of --delta new insights, query latency with the delta, and compaction
+
+The script exits non-zero if ranking differs from a brute-force BM25 over --verify-insights
+insights, or if a search over base plus delta differs from the same search after compaction.
+
+    python benchmarks/bench_search.py --insights 1m
+"""
+import argparse
+import math
+import shutil
+import tempfile
+
+import numpy as np
+
+import benchutil
+from db_helpers.searchIndex import B, FETCH_ROWS, K1, SearchIndex, tokenize
+
+SYLLABLES = ["ka", "lo", "mi", "ren", "tas", "vor", "du", "pel", "sin", "gro", "bet", "nu", "ari", "sol", "fen", "tri"]
+
+
+class GeneratedInsights:
+    """Connection stand-in serving the search index's row query from generated insights."""
+
+    def __init__(self, insight_ids, contents, filters):
+        self.insight_ids = insight_ids
+        self.contents = contents
+        self.filters = filters
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, top, after_id):
+        start = int(np.searchsorted(self.insight_ids, after_id, side="right"))
+        self._rows = [
+            (int(self.insight_ids[i]), self.contents[i], *self.filters[i].tolist())
+            for i in range(start, min(start + top, len(self.insight_ids)))
+        ]
+        return self
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+def vocabulary(size):
+    """Pronounceable distinct words, so partial-word queries match real substrings."""
+    words = []
+    for n in range(size):
+        word = ""
+        n += len(SYLLABLES)
+        while n:
+            n, digit = divmod(n, len(SYLLABLES))
+            word += SYLLABLES[digit]
+        words.append(word)
+    return words
+
+
+def generate(insights, words_per_insight, vocabulary_size, seed):
+    rng = np.random.default_rng(seed)
+    words = np.array(vocabulary(vocabulary_size), dtype=object)
+    weights = 1.0 / np.arange(1, vocabulary_size + 1)
+    lengths = rng.integers(words_per_insight // 2, words_per_insight * 3 // 2 + 1, size=insights)
+    drawn = words[rng.choice(vocabulary_size, size=int(lengths.sum()), p=weights / weights.sum())]
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    contents = [" ".join(drawn[bounds[i]:bounds[i + 1]]) for i in range(insights)]
+    filters = np.stack([rng.integers(1, 9, insights), rng.integers(1, 6, insights), rng.integers(1, 4, insights)], axis=1)
+    return np.arange(1, insights + 1), contents, filters, words
+
+
+def brute_force(contents, insight_ids, query):
+    """Insight id -> match=any BM25 score over the raw text, for every matching insight."""
+    documents = [tokenize(content) for content in contents]
+    avgdl = sum(map(len, documents)) / len(documents)
+    words = list(dict.fromkeys(tokenize(query)))
+    df = {word: sum(1 for document in documents if word in document) for word in words}
+    idf = {word: math.log(1 + (len(documents) - df[word] + 0.5) / (df[word] + 0.5)) for word in words}
+    scores = {}
+    for insight_id, document in zip(insight_ids, documents):
+        score = 0.0
+        for word in words:
+            tf = document.count(word)
+            if tf:
+                score += idf[word] * tf * (K1 + 1) / (tf + K1 * (1 - B + B * len(document) / avgdl))
+        if score:
+            scores[int(insight_id)] = score
+    return scores
+
+
+def same_ranking(results, expected, tolerance=1e-3):
+    """Each result carries its brute-force score and no better-scoring insight was left out."""
+    best = sorted(expected.values(), reverse=True)[:len(results)]
+    return (len(results) == len(best)
+            and all(abs(expected.get(insight_id, 0.0) - score) < tolerance for insight_id, score in results)
+            and all(abs(score - best_score) < tolerance for (_, score), best_score in zip(results, best)))
+
+
+def timed_repeat(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        result, seconds = benchutil.timed(fn)
+        samples.append(seconds)
+    return result, benchutil.percentiles(samples, (50, 99))
+
+
+def run_queries(index, queries, repeat):
+    results = {}
+    for name, query in queries.items():
+        found, latency = timed_repeat(lambda: index.search(**query), repeat)
+        results[name] = {"matches": found["total"], "ms": latency}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--insights", default="1m")
+    parser.add_argument("--words", type=int, default=24, help="Average words per insight")
+    parser.add_argument("--vocabulary", default="50k")
+    parser.add_argument("--delta", default="50k", help="Insights added after the build")
+    parser.add_argument("--verify-insights", default="20k")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    insights = benchutil.parse_sizes(args.insights)[0]
+    delta = benchutil.parse_sizes(args.delta)[0]
+    verify = benchutil.parse_sizes(args.verify_insights)[0]
+    vocabulary_size = benchutil.parse_sizes(args.vocabulary)[0]
+
+    (insight_ids, contents, filters, words), generate_seconds = benchutil.timed(
+        generate, insights + delta, args.words, vocabulary_size, args.seed)
+    directory = tempfile.mkdtemp(prefix="bench-search-")
+    results = {"insights": insights, "vocabulary": vocabulary_size, "generate_seconds": round(generate_seconds, 3)}
+    failures = []
+    try:
+        # The table as it was at build time; the delta rows are "inserted" later
+        conn = GeneratedInsights(insight_ids[:insights], contents, filters)
+        index = SearchIndex(directory, refresh_seconds=3600, max_delta_docs=insights)
+        _, build_seconds = benchutil.timed(index.rebuild, conn)
+        stats = index.stats()
+        results["build"] = {
+            "seconds": round(build_seconds, 3),
+            "insights_per_second": round(insights / build_seconds),
+            "fetch_rows": FETCH_ROWS,
+            "terms": stats["terms"],
+            "postings": stats["postings"],
+            "disk_mb": round(stats["bytes"] / 2**20, 1),
+        }
+
+        # Compaction is timed on its own below, not left to start in the background
+        cold = SearchIndex(directory, refresh_seconds=3600, max_delta_docs=insights)
+        _, load_seconds = benchutil.timed(cold.sync, conn, True)
+        results["cold_load"] = {"seconds": round(load_seconds, 3), "docs": cold.stats()["docs"]}
+
+        common, second, mid, rare = words[0], words[1], words[len(words) // 50], words[-1]
+        queries = {
+            "common word": {"text": common},
+            "mid word": {"text": mid},
+            "rare word": {"text": rare},
+            "three words, any": {"text": f"{common} {mid} {rare}"},
+            "two words, all": {"text": f"{common} {second}", "match_all": True},
+            "mid word, domain and audience": {"text": mid, "filters": {"domain": 3, "audience": 2}},
+            "partial word": {"text": mid[1:-1]},
+            "page 10": {"text": f"{second} {mid}", "offset": 180},
+        }
+        results["queries"] = run_queries(cold, queries, args.repeat)
+
+        # Ranking parity against a brute-force BM25 on a smaller corpus
+        small_directory = tempfile.mkdtemp(prefix="bench-search-verify-")
+        try:
+            small = SearchIndex(small_directory, refresh_seconds=3600)
+            small.rebuild(GeneratedInsights(insight_ids[:verify], contents, filters))
+            parity = {}
+            for query in (common, mid, f"{mid} {rare}", f"{second} {words[len(words) // 5]}"):
+                ranked = small.search(query, limit=20)["results"]
+                parity[query] = same_ranking(ranked, brute_force(contents[:verify], insight_ids[:verify], query))
+            results["parity"] = parity
+            failures += [f"ranking of '{query}'" for query, same in parity.items() if not same]
+        finally:
+            shutil.rmtree(small_directory, ignore_errors=True)
+
+        # New insights arrive: catch up, search with the delta, then compact
+        conn.insight_ids = insight_ids
+        _, catch_up_seconds = benchutil.timed(cold.update, conn)
+        with_delta = run_queries(cold, queries, args.repeat)
+        before = {name: cold.search(**query)["results"] for name, query in queries.items()}
+        _, compact_seconds = benchutil.timed(cold.compact)
+        cold.sync(conn, True)
+        after = {name: cold.search(**query)["results"] for name, query in queries.items()}
+        same = {name: [i for i, _ in before[name]] == [i for i, _ in after[name]] for name in queries}
+        failures += [f"'{name}' across compaction" for name, equal in same.items() if not equal]
+        results["delta"] = {
+            "insights": delta,
+            "catch_up_seconds": round(catch_up_seconds, 3),
+            "queries": {name: {"ms": query["ms"]} for name, query in with_delta.items()},
+            "compact_seconds": round(compact_seconds, 3),
+            "docs_after_compaction": cold.stats()["docs"],
+            "same_results_after_compaction": all(same.values()),
+        }
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    benchutil.emit("search", results)
+    if failures:
+        raise SystemExit("Search results differ: " + ", ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Compares peak memory and latency of the original response path (materialize every insight,
+json.dumps(indent=4)) against the NDJSON streaming encoder, plain and gzip.
+
+Runs offline on synthetic insight records shaped like the GET /insights payload.
+
+    python benchmarks/bench_serialization.py --sizes 10k,100k,500k
+"""
+import argparse
+import json
+import random
+import tracemalloc
+
+import benchutil
+from db_helpers.responseEncoding import encode_ndjson
+
+
+def synthetic_insights(rows, seed=7):
+    rng = random.Random(seed)
+    for n in range(rows):
+        insight = {
+            "insight_id": n + 1,
+            "content": f"Synthetic insight {n}: members in cohort {rng.randint(1, 500)} changed by {rng.randint(1, 90)}%.",
+            "created_at": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 10:00:00",
+        }
+        for key, names in benchutil.SEED_LOOKUP_NAMES.items():
+            name_key = "type" if key == "timeliness" else "name"
+            insight[key] = {name_key: rng.choice(names), "description": f"Description of {key}."}
+        yield insight
+
+
+def current_path(rows):
+    insights = list(synthetic_insights(rows))
+    return json.dumps(insights, indent=4).encode("utf-8")
+
+
+def ndjson_path(rows, encoding=None):
+    return encode_ndjson(synthetic_insights(rows), encoding)
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    body, elapsed = benchutil.timed(fn, *args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(elapsed, 3), "peak_mb": round(peak / 2**20, 1), "body_mb": round(len(body) / 2**20, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10k,100k,500k")
+    args = parser.parse_args()
+
+    results = []
+    for size in benchutil.parse_sizes(args.sizes):
+        results.append({
+            "rows": size,
+            "json_indent": measure(current_path, size),
+            "ndjson": measure(ndjson_path, size),
+            "ndjson_gzip": measure(ndjson_path, size, "gzip"),
+        })
+
+    benchutil.emit("serialization", results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Requests per second of GET /insights?snapshot=true served from the materialized snapshot versus
+the live path (build every insight dictionary, serialize, compress) for identity, gzip and
+conditional (If-None-Match) requests.
+
+Offline by default, on synthetic insight records shaped like the GET /insights payload. With
+SqlConnectionString set and --database, the live path is read_all_insights() and the snapshot is
+built from iter_insights(), both against the loaded database (see bench_functions.py).
+
+The script exits non-zero if a snapshot body differs from the live body.
+
+    python benchmarks/bench_snapshot.py --sizes 10k,100k --requests 50
+"""
+import argparse
+import gzip
+import tempfile
+import time
+
+import azure.functions as func
+
+import benchutil
+from bench_serialization import synthetic_insights
+from db_helpers.insightsSnapshot import InsightsSnapshot, snapshot_response
+from db_helpers.responseEncoding import compact_json, json_response
+
+VARIANTS = {
+    "identity": {},
+    "gzip": {"Accept-Encoding": "gzip"},
+}
+
+
+def request(headers):
+    return func.HttpRequest("GET", "http://localhost/api/insights", params={"snapshot": "true"}, headers=headers, body=b"")
+
+
+def throughput(handler, headers, requests):
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        _, elapsed = benchutil.timed(handler, request(headers))
+        latencies.append(elapsed)
+    total = time.perf_counter() - started
+    return {"requests_per_second": round(requests / total, 1), "latency_ms": benchutil.percentiles(latencies)}
+
+
+def run(size, args, directory):
+    if args.database:
+        from db_helpers.getInsights import read_all_insights
+
+        def live_insights():
+            return read_all_insights()
+        source = None
+    else:
+        def live_insights():
+            return list(synthetic_insights(size))
+
+        def source(batch_size):
+            return synthetic_insights(size)
+
+    snapshot = InsightsSnapshot(directory, max_age_seconds=3600, max_stale_seconds=60, source=source)
+    generation, build_seconds = benchutil.timed(snapshot.rebuild)
+
+    def live(req):
+        return json_response({"insights": live_insights(), "next_cursor": None}, req)
+
+    def materialized(req):
+        return snapshot_response(req, snapshot)
+
+    expected = compact_json({"insights": live_insights(), "next_cursor": None}).encode("utf-8")
+    parity = (generation.body() == expected
+              and gzip.decompress(generation.body("gzip")) == expected)
+
+    result = {
+        "rows": generation.rows,
+        "build_seconds": round(build_seconds, 3),
+        "bytes": generation.manifest["bytes"],
+        "parity": parity,
+    }
+    for name, headers in VARIANTS.items():
+        result[f"live_{name}"] = throughput(live, headers, max(1, args.requests // 10))
+        result[f"snapshot_{name}"] = throughput(materialized, headers, args.requests)
+    result["snapshot_not_modified"] = throughput(materialized, {"If-None-Match": generation.etag()}, args.requests)
+
+    # Write path: invalidation cost, then the stale read that schedules the background rebuild
+    _, invalidate_seconds = benchutil.timed(snapshot.invalidate)
+    result["invalidate_us"] = round(invalidate_seconds * 1e6, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10k,100k")
+    parser.add_argument("--requests", type=int, default=50, help="Snapshot requests per variant (live gets a tenth)")
+    parser.add_argument("--database", action="store_true", help="Use SqlConnectionString instead of synthetic rows")
+    args = parser.parse_args()
+    if args.database and not benchutil.connection_string():
+        raise SystemExit("--database needs SqlConnectionString.")
+
+    results = {}
+    for size in ([None] if args.database else benchutil.parse_sizes(args.sizes)):
+        with tempfile.TemporaryDirectory() as directory:
+            results[size or "database"] = run(size, args, directory)
+    benchutil.emit("snapshot", results)
+    if not all(result["parity"] for result in results.values()):
+        raise SystemExit("Snapshot body differs from the live response body.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Tag index (db_helpers/tagIndex.py) at scale: --insights insights carrying --tags-per-insight tags
+each, drawn from --tags tags with a Zipf-like popularity, so a few tags are on a large share
+of the insights and most are rare.
+
+Runs offline. The InsightTags read is served from generated (tag_id, insight_id) rows in
+LOAD_CHUNK_SIZE chunks, the way fetchmany returns them. Reports:
+
+    load       TagIndex full load time, postings and bytes held, against one Python set per tag
+    queries    latency of boolean queries (AND of a popular and a mid tag, OR of rare tags, AND
+               NOT ...) on the index and on the per-tag sets
+    apply      incremental update of a popular tag with a bulk add and remove of --bulk-ids ids
+
+The script exits non-zero if an index result differs from the set result.
+
+    python benchmarks/bench_tags.py --insights 1m --tags 10k
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+import benchutil
+from db_helpers.tagIndex import LOAD_CHUNK_SIZE, TagIndex
+
+
+class GeneratedInsightTags:
+    """Connection stand-in serving the two TagIndex load queries from generated postings."""
+
+    def __init__(self, tag_ids, pairs):
+        self.tag_ids = tag_ids
+        self.pairs = pairs
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, *params):
+        if "FROM Tags" in sql:
+            self._rows = [(tag_id, f"tag-{tag_id}", tag_id) for tag_id in self.tag_ids]
+        else:
+            self._rows = None
+            self._position = 0
+        return self
+
+    def fetchall(self):
+        return self._rows
+
+    def fetchmany(self, size):
+        chunk = self.pairs[self._position:self._position + size].tolist()
+        self._position += size
+        return chunk
+
+    def close(self):
+        pass
+
+
+def generate(insights, tags, per_insight, seed):
+    """Sorted unique (tag_id, insight_id) pairs."""
+    rng = np.random.default_rng(seed)
+    # Zipf-like tag popularity: weight 1/rank
+    weights = 1.0 / np.arange(1, tags + 1)
+    tag_ids = rng.choice(np.arange(1, tags + 1), size=insights * per_insight, p=weights / weights.sum())
+    insight_ids = np.repeat(np.arange(1, insights + 1), per_insight)
+    pairs = np.unique(np.stack([tag_ids, insight_ids], axis=1), axis=0)
+    return pairs
+
+
+def set_query(sets, all_of=(), any_of=(), none_of=()):
+    result = None
+    for name in all_of:
+        result = set(sets.get(name, ())) if result is None else result & sets.get(name, set())
+    if any_of:
+        either = set().union(*(sets.get(name, set()) for name in any_of))
+        result = either if result is None else result & either
+    for name in none_of:
+        result -= sets.get(name, set())
+    return result
+
+
+def timed_repeat(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        result, seconds = benchutil.timed(fn)
+        samples.append(seconds)
+    return result, benchutil.percentiles(samples, (50, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--insights", default="1m")
+    parser.add_argument("--tags", default="10k")
+    parser.add_argument("--tags-per-insight", type=int, default=5)
+    parser.add_argument("--bulk-ids", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--skip-sets", action="store_true", help="Do not build the Python set baseline")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    insights = benchutil.parse_sizes(args.insights)[0]
+    tags = benchutil.parse_sizes(args.tags)[0]
+
+    pairs, generate_seconds = benchutil.timed(generate, insights, tags, args.tags_per_insight, args.seed)
+    conn = GeneratedInsightTags(list(range(1, tags + 1)), pairs)
+    index = TagIndex(refresh_seconds=3600, max_age_seconds=3600)
+    _, load_seconds = benchutil.timed(index.sync, conn, True)
+    stats = index.stats()
+    results = {
+        "insights": insights,
+        "tags": tags,
+        "generate_seconds": round(generate_seconds, 3),
+        "load": {
+            "seconds": round(load_seconds, 3),
+            "rows_per_second": round(len(pairs) / load_seconds),
+            "chunk_rows": LOAD_CHUNK_SIZE,
+            "postings": stats["postings"],
+            "index_mb": round(stats["bytes"] / 2**20, 1),
+        },
+    }
+
+    sizes = {name: count for name, count in index.tags()}
+    by_size = sorted(sizes, key=sizes.get, reverse=True)
+    popular, second, mid, rare = by_size[0], by_size[1], by_size[len(by_size) // 20], by_size[-20:]
+    queries = {
+        "popular AND mid": {"all_of": [popular, mid]},
+        "popular AND second": {"all_of": [popular, second]},
+        "OR of 20 rare": {"any_of": rare},
+        "popular AND NOT second": {"all_of": [popular], "none_of": [second]},
+        "mid AND (popular OR second) NOT rare": {"all_of": [mid], "any_of": [popular, second], "none_of": rare[:5]},
+    }
+    query_results = {}
+    for name, query in queries.items():
+        matches, latency = timed_repeat(lambda: index.query(**query), args.repeat)
+        query_results[name] = {"matches": len(matches), "index_ms": latency}
+    results["queries"] = query_results
+
+    if not args.skip_sets:
+        tracemalloc.start()
+        started = time.perf_counter()
+        sets = {name: set(index.postings(name).tolist()) for name in sizes}
+        results["load"]["sets_seconds"] = round(time.perf_counter() - started, 3)
+        results["load"]["sets_mb"] = round(tracemalloc.get_traced_memory()[0] / 2**20, 1)
+        tracemalloc.stop()
+        for name, query in queries.items():
+            expected, latency = timed_repeat(lambda: set_query(sets, **query), max(1, args.repeat // 4))
+            query_results[name]["sets_ms"] = latency
+            query_results[name]["parity"] = sorted(expected) == index.query(**query).tolist()
+
+    rng = np.random.default_rng(args.seed + 1)
+    bulk = rng.choice(np.arange(1, insights + 1), size=args.bulk_ids, replace=False)
+    tag_id = index.tag_id(popular)
+    _, add_seconds = benchutil.timed(index.apply, tag_id, popular, added=bulk)
+    _, remove_seconds = benchutil.timed(index.apply, tag_id, popular, removed=bulk)
+    results["apply"] = {
+        "tag_postings": sizes[popular],
+        "bulk_ids": args.bulk_ids,
+        "add_ms": round(add_seconds * 1000, 3),
+        "remove_ms": round(remove_seconds * 1000, 3),
+    }
+
+    benchutil.emit("tags", results)
+    if not all(result.get("parity", True) for result in query_results.values()):
+        raise SystemExit("Tag index results differ from the set results.")
+
+
+if __name__ == "__main__":
+    main()
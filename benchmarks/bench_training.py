@@ -0,0 +1,109 @@
+"""
+Compares the training pipeline of train_recommendation_model.py with the original script on
+synthetic labeled rows. Runs offline; the database read is replaced by chunks of generated rows.
+
+The original trains RandomForestClassifier(n_estimators=100) on every row in one thread. The
+pipeline folds the rows into weighted distinct pairs while streaming, searches PARAM_GRID under the
+budgets and refits the winner. Reports read throughput, fit time, the selected parameters,
+accuracy on a fresh sample and peak RSS per size.
+
+    python benchmarks/bench_training.py --sizes 100k,1m --n-jobs 4
+"""
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+import benchutil
+from db_helpers.compiledPredictor import FEATURE_COLUMNS
+
+sys.path.insert(0, os.path.join(benchutil.REPO_ROOT, "generate_recommendations"))
+import train_recommendation_model as training  # noqa: E402
+
+# Upper bounds of the synthetic feature ids (the seeded lookup sizes)
+FEATURE_SIZES = [3, 3, 3]
+
+
+def labeled_rows(count, seed, noise=0.15):
+    """Rows of (*features, class) where the class follows the features except for a noisy fraction."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        features = tuple(rng.randint(1, size) for size in FEATURE_SIZES)
+        label = (features[0] + features[2]) % 3 if rng.random() > noise else rng.randint(0, 2)
+        yield (*features, label)
+
+
+def chunked(rows, chunk_size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def accuracy(model, rows):
+    predictions = training.model_predict(model, [row[:-1] for row in rows])
+    return round(sum(int(p) == row[-1] for p, row in zip(predictions, rows)) / len(rows), 4)
+
+
+def run_original(size, evaluation, seed):
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+
+    started = time.perf_counter()
+    data = pd.DataFrame(list(labeled_rows(size, seed)), columns=FEATURE_COLUMNS + ["recommendation_type"])
+    read_seconds = time.perf_counter() - started
+    model = RandomForestClassifier(n_estimators=100, random_state=42)
+    _, fit_seconds = benchutil.timed(model.fit, data[FEATURE_COLUMNS], data["recommendation_type"])
+    return {"read_seconds": round(read_seconds, 3), "fit_seconds": round(fit_seconds, 3),
+            "accuracy": accuracy(model, evaluation)}
+
+
+def run_pipeline(size, evaluation, seed, args, directory):
+    output = os.path.join(directory, f"model-{size}.pkl")
+    chunks = chunked(labeled_rows(size, seed), training.DEFAULT_CHUNK_SIZE)
+    metadata = training.train(chunks, output, args.n_jobs, args.max_latency_ms, args.max_size_mb,
+                              seed=seed, source={"benchmark": True}, progress=None)
+    import joblib
+
+    return {
+        **metadata["timings"],
+        "read_rows_per_second": round(size / metadata["timings"]["read_seconds"]),
+        "distinct_rows": metadata["distinct_rows"],
+        "params": metadata["params"],
+        "candidates_fitted": sum(1 for result in metadata["candidates"] if "fit_seconds" in result),
+        "latency_ms_per_batch": metadata["latency_ms_per_batch"],
+        "size_bytes": metadata["size_bytes"],
+        "accuracy": accuracy(joblib.load(output), evaluation),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100k,1m")
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    parser.add_argument("--max-latency-ms", type=float, default=training.DEFAULT_MAX_LATENCY_MS)
+    parser.add_argument("--max-size-mb", type=float, default=training.DEFAULT_MAX_SIZE_MB)
+    parser.add_argument("--skip-original", action="store_true", help="Only run the pipeline (large sizes)")
+    args = parser.parse_args()
+
+    evaluation = list(labeled_rows(20000, seed=999))
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for size in benchutil.parse_sizes(args.sizes):
+            result = {"pipeline": run_pipeline(size, evaluation, 7, args, directory)}
+            if not args.skip_original:
+                result["original"] = run_original(size, evaluation, 7)
+            result["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+            results[size] = result
+    benchutil.emit("training", results)
+
+
+if __name__ == "__main__":
+    main()
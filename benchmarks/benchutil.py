@@ -0,0 +1,111 @@
+import asyncio
+import csv
+import inspect
+import io
+import json
+import os
+import random
+import sys
+import time
+
+# Make the function app packages (db_helpers, function folders) importable from benchmarks/
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from fakertools.generate_insights import LOOKUP_NAMES as SEED_LOOKUP_NAMES  # noqa: E402
+
+
+def seed_lookups(normalize=lambda name: name):
+    """Returns {column: {name: id}} for the seed lookup data, ids assigned in seed order."""
+    return {
+        column: {normalize(name): position + 1 for position, name in enumerate(names)}
+        for column, names in SEED_LOOKUP_NAMES.items()
+    }
+
+
+def synthetic_insights_csv(rows, seed=42, reject_ratio=0.0):
+    """
+    Builds an insights upload in the insights_injest_csv format.
+
+    Args:
+        rows (int): Number of data rows.
+        seed (int): Random seed so runs are comparable.
+        reject_ratio (float): Fraction of rows carrying an unknown data source.
+    Returns:
+        bytes: UTF-8 encoded CSV including the header row.
+    """
+    rng = random.Random(seed)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([
+        "content", "created_at", "insight_type", "data_source", "audience",
+        "domain", "confidence_level", "timeliness", "alignment_goal", "value_priority"
+    ])
+    for n in range(rows):
+        names = {column: rng.choice(names) for column, names in SEED_LOOKUP_NAMES.items()}
+        if reject_ratio and rng.random() < reject_ratio:
+            names["data_source"] = "Unknown Source"
+        writer.writerow([
+            f"Synthetic insight {n}: members in cohort {rng.randint(1, 500)} changed by {rng.randint(1, 90)}%.",
+            f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+            names["insight_type"], names["data_source"], names["audience"], names["domain"],
+            names["confidence_level"], names["timeliness"], names["alignment_goal"], names["value_priority"],
+        ])
+    return buffer.getvalue().encode("utf-8")
+
+
+def multipart_upload(payload, boundary="eureka-benchmark"):
+    """Wraps a CSV payload as the multipart/form-data body insights_injest_csv expects; returns (body, headers)."""
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="insights.csv"\r\n'
+            f"Content-Type: text/csv\r\n\r\n").encode("utf-8") + payload + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def timed(fn, *args, **kwargs):
+    """Runs fn once and returns (result, elapsed seconds)."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def invoke(main, req):
+    """Calls a function's main like the host does: async mains are run to completion on an event loop."""
+    response = main(req)
+    if inspect.isawaitable(response):
+        response = asyncio.run(response)
+    return response
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    """Returns {"p50": ..., ...} in milliseconds for a list of durations in seconds."""
+    if not samples:
+        return {f"p{point}": None for point in points}
+    ordered = sorted(samples)
+    return {
+        f"p{point}": round(ordered[min(len(ordered) - 1, int(len(ordered) * point / 100))] * 1000, 3)
+        for point in points
+    }
+
+
+def parse_sizes(value):
+    """Parses a comma separated list of sizes such as '1k,100k,1m'."""
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    sizes = []
+    for item in value.split(","):
+        item = item.strip().lower()
+        if item[-1] in multipliers:
+            sizes.append(int(float(item[:-1]) * multipliers[item[-1]]))
+        else:
+            sizes.append(int(item))
+    return sizes
+
+
+def connection_string():
+    """Connection string for benchmarks that need a database; None runs the offline stages only."""
+    return os.getenv("SqlConnectionString")
+
+
+def emit(benchmark, results):
+    """Prints results as one JSON document so runs can be diffed across commits."""
+    print(json.dumps({"benchmark": benchmark, "results": results}, indent=2, default=str))
@@ -0,0 +1,68 @@
+import logging
+import os
+import shutil
+import time
+
+# A build lock older than this is assumed to be left over from a crashed process. Long enough
+# for the slowest build (a full search index rebuild), so a running build is never taken over.
+BUILD_LOCK_TIMEOUT_SECONDS = 3600
+
+
+def acquire_build_lock(lock_path, name):
+    """
+    Creates the build lock file shared by every process using the directory.
+
+    Args:
+        lock_path (str): Lock file; its directory is created if needed.
+        name (str): What is being built, for the log line when a stale lock is removed.
+    Returns:
+        bool: False if another process holds a lock younger than BUILD_LOCK_TIMEOUT_SECONDS.
+    """
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                age = time.time() - os.stat(lock_path).st_mtime
+            except FileNotFoundError:
+                continue
+            if age < BUILD_LOCK_TIMEOUT_SECONDS:
+                return False
+            logging.warning(f"Removing {name} build lock left for {age:.0f}s.")
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+            continue
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        os.close(fd)
+        return True
+    return False
+
+
+def release_build_lock(lock_path):
+    try:
+        os.remove(lock_path)
+    except OSError:
+        pass
+
+
+def remove_old_generations(directory, prefix, keep):
+    """
+    Deletes the files and directories of published generations other than those in keep.
+
+    A generation is named prefix + an id; its entries are that name, optionally followed by
+    extensions. Callers keep the previous generation for processes that have not re-read the
+    manifest yet; deleting files another process has mapped is safe on POSIX and skipped on Windows.
+    """
+    for entry in os.scandir(directory):
+        if not entry.name.startswith(prefix) or entry.name.split(".")[0] in keep:
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,198 @@
+import logging
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from db_helpers.dimensionCache import INSIGHT_DIMENSIONS, get_dimension_cache
+from db_helpers.getInsights import insights_query
+from db_helpers.instrumentation import span
+from db_helpers.responseEncoding import StreamCompressor
+
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+PARQUET_MIMETYPE = "application/vnd.apache.parquet"
+FORMATS = {"arrow": ARROW_MIMETYPE, "parquet": PARQUET_MIMETYPE}
+
+# Compression inside the file. Parquet always compresses its pages; Arrow buffers only on
+# request (not every reader supports it), otherwise the HTTP Content-Encoding applies.
+COMPRESSIONS = {
+    "arrow": (None, "lz4", "zstd"),
+    "parquet": ("zstd", "snappy", "gzip", "none"),
+}
+
+# Rows per fetchmany call and per record batch (Parquet row group)
+DEFAULT_CHUNK_SIZE = int(os.getenv("ExportChunkSize", "50000"))
+MAX_CHUNK_SIZE = 200000
+
+# Column kinds: "int", "string", "timestamp", "category" (dictionary-encoded per batch) and
+# ("lookup", dimension key), dictionary-encoded against the whole lookup table
+DATASETS = {
+    "insights": {
+        "query": insights_query("i.id > ?"),
+        "columns": [("insight_id", "int"), ("content", "string"), ("created_at", "timestamp")]
+                   + [(key, ("lookup", key)) for key in INSIGHT_DIMENSIONS],
+    },
+    "recommendations": {
+        "query": """
+            SELECT r.id, r.insight_id, i.content, r.recommendation_text,
+                   r.confidence_level_id, r.delivery_channel_id, r.status,
+                   r.created_at, r.updated_at
+            FROM Recommendations r
+            JOIN Insights i ON r.insight_id = i.id
+            WHERE r.id > ?
+            ORDER BY r.id
+        """,
+        "columns": [
+            ("recommendation_id", "int"), ("insight_id", "int"), ("insight_content", "string"),
+            ("recommendation_text", "category"), ("confidence_level", ("lookup", "confidence_level")),
+            ("delivery_channel", ("lookup", "delivery_channel")), ("status", "category"),
+            ("created_at", "timestamp"), ("updated_at", "timestamp"),
+        ],
+    },
+}
+
+DICTIONARY_TYPE = pa.dictionary(pa.int32(), pa.string())
+ARROW_TYPES = {"int": pa.int64(), "string": pa.string(), "timestamp": pa.timestamp("ms"), "category": DICTIONARY_TYPE}
+
+
+def export_schema(dataset):
+    return pa.schema([
+        (name, DICTIONARY_TYPE if isinstance(kind, tuple) else ARROW_TYPES[kind])
+        for name, kind in DATASETS[dataset]["columns"]
+    ])
+
+
+def lookup_builder(table, stats):
+    """
+    Returns a function turning a column of lookup ids into a DictionaryArray whose dictionary is
+    the lookup's names, shared by every batch so the IPC stream carries it once.
+    """
+    ids = sorted(table.by_id)
+    positions = {row_id: position for position, row_id in enumerate(ids)}
+    dictionary = pa.array([table.by_id[row_id][0] for row_id in ids], pa.string())
+
+    def build(values):
+        indices = [positions.get(value) for value in values]
+        # An id added to the lookup since the cache was loaded; exported as null
+        stats["unknown_lookup_ids"] += sum(1 for index, value in zip(indices, values)
+                                           if index is None and value is not None)
+        return pa.DictionaryArray.from_arrays(pa.array(indices, pa.int32()), dictionary)
+    return build
+
+
+def column_builder(kind, tables, stats):
+    if isinstance(kind, tuple):
+        return lookup_builder(tables[kind[1]], stats)
+    if kind == "category":
+        return lambda values: pa.array(values, pa.string()).dictionary_encode()
+    arrow_type = ARROW_TYPES[kind]
+    return lambda values: pa.array(values, arrow_type)
+
+
+def record_batches(conn, dataset, after_id=0, chunk_size=DEFAULT_CHUNK_SIZE, stats=None):
+    """
+    Streams a dataset as Arrow record batches of at most chunk_size rows, in id order.
+
+    Only one fetchmany chunk of Python rows exists at a time. Lookup ids are mapped to dictionary
+    indices against the dimension cache, so no per-row name strings are built.
+
+    Args:
+        conn: An open database connection.
+        dataset (str): A DATASETS key.
+        after_id (int): Only export rows with a larger id (incremental pulls).
+        chunk_size (int): Rows per fetchmany call and per batch.
+        stats (dict): Receives rows, last_id and unknown_lookup_ids.
+    Yields:
+        pyarrow.RecordBatch: Batches matching export_schema(dataset).
+    """
+    spec = DATASETS[dataset]
+    stats = stats if stats is not None else {}
+    stats.update(rows=0, last_id=after_id, unknown_lookup_ids=0)
+    schema = export_schema(dataset)
+
+    # Loaded before the query: the connection is busy while the result set streams
+    tables = get_dimension_cache().snapshot(conn)
+    builders = [column_builder(kind, tables, stats) for _, kind in spec["columns"]]
+
+    cursor = conn.cursor()
+    with span("db.query"):
+        cursor.execute(spec["query"], after_id)
+    while True:
+        with span("db.fetch") as fetch:
+            rows = cursor.fetchmany(chunk_size)
+            fetch.rows = len(rows)
+        if not rows:
+            break
+        with span("build", rows=len(rows)):
+            columns = list(zip(*rows))
+            batch = pa.RecordBatch.from_arrays(
+                [build(values) for build, values in zip(builders, columns)], schema=schema
+            )
+        stats["rows"] += len(rows)
+        stats["last_id"] = rows[-1][0]
+        yield batch
+
+    if stats["unknown_lookup_ids"]:
+        logging.warning(f"Exported {stats['unknown_lookup_ids']} lookup ids missing from the dimension cache as null.")
+
+
+class _EncodedSink:
+    """Write-only file object for pyarrow that keeps only the (HTTP-compressed) output bytes."""
+
+    def __init__(self, encoding=None):
+        self._compressor = StreamCompressor(encoding)
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._position += len(data)
+        self._chunks.append(self._compressor.compress(data))
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self._chunks.append(self._compressor.flush())
+            self.closed = True
+
+    def writable(self):
+        return True
+
+    def getvalue(self):
+        self.close()
+        return b"".join(self._chunks)
+
+
+def write_export(batches, schema, output_format="arrow", compression=None, content_encoding=None):
+    """
+    Writes record batches as an Arrow IPC stream or a Parquet file, one batch (row group) at a time.
+
+    Args:
+        batches: Iterable of record batches matching schema.
+        schema (pyarrow.Schema): The export schema.
+        output_format (str): "arrow" or "parquet".
+        compression (str): One of COMPRESSIONS[output_format]; None picks the default.
+        content_encoding (str): HTTP Content-Encoding ("gzip", "br") applied to the bytes, or None.
+    Returns:
+        bytes: The body.
+    """
+    sink = _EncodedSink(content_encoding)
+    # Includes producing the batches, which is where the fetches happen
+    with span("stream"):
+        if output_format == "parquet":
+            with pq.ParquetWriter(sink, schema, compression=compression or COMPRESSIONS["parquet"][0]) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=compression)
+            with pa.ipc.new_stream(sink, schema, options=options) as writer:
+                for batch in batches:
+                    writer.write_batch(batch)
+    return sink.getvalue()
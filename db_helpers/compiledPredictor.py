@@ -0,0 +1,149 @@
+import itertools
+import json
+import logging
+import os
+import time
+import warnings
+
+# Model input columns, in training order
+FEATURE_COLUMNS = ["confidence_level_id", "timeliness_id", "value_priority_id"]
+
+# Ids 1..N of every feature are enumerated when no explicit domains are given
+DEFAULT_MAX_ID = int(os.getenv("CompiledModelMaxId", "16"))
+
+COMPILED_FORMAT = 1
+
+
+def compiled_path_for(model_path):
+    """recommendation_model.pkl -> recommendation_model.compiled.json"""
+    return os.path.splitext(model_path)[0] + ".compiled.json"
+
+
+class CompiledPredictor:
+    """
+    Lookup-table replacement for model.predict over the enumerable feature space.
+
+    The model's prediction for every combination of known feature ids is precomputed into one flat
+    list, so serving is a few dict lookups with no sklearn, numpy or pandas involved. Rows with an
+    id outside the compiled domains are sent to fallback (the real model) in one batch.
+    """
+
+    def __init__(self, model_version, domains, predictions, fallback=None):
+        self.model_version = model_version
+        self.domains = [list(domain) for domain in domains]
+        self.predictions = predictions
+        self.fallback = fallback
+        self._positions = [{value: position for position, value in enumerate(domain)} for domain in self.domains]
+        self._strides = []
+        stride = 1
+        for domain in reversed(self.domains):
+            self._strides.insert(0, stride)
+            stride *= len(domain)
+        self.fallback_rows = 0
+
+    def _index(self, row):
+        index = 0
+        for value, positions, stride in zip(row, self._positions, self._strides):
+            position = positions.get(value)
+            if position is None:
+                return None
+            index += position * stride
+        return index
+
+    def predict_one(self, row):
+        """Returns the class for one feature row, or None if it lies outside the compiled domains."""
+        index = self._index(row)
+        return None if index is None else self.predictions[index]
+
+    def predict(self, rows):
+        """
+        Predicts a class for each feature row (any sequence of FEATURE_COLUMNS values).
+
+        Returns:
+            list: One int class per row.
+        """
+        results = []
+        unseen = []
+        for position, row in enumerate(rows):
+            index = self._index(row)
+            if index is None:
+                unseen.append(position)
+                results.append(None)
+            else:
+                results.append(self.predictions[index])
+
+        if unseen:
+            if self.fallback is None:
+                raise KeyError(f"{len(unseen)} feature row(s) outside the compiled domains and no fallback model.")
+            self.fallback_rows += len(unseen)
+            for position, prediction in zip(unseen, self.fallback([rows[position] for position in unseen])):
+                results[position] = int(prediction)
+        return results
+
+    def to_dict(self):
+        return {
+            "format": COMPILED_FORMAT,
+            "model_version": self.model_version,
+            "feature_columns": FEATURE_COLUMNS,
+            "domains": self.domains,
+            "predictions": self.predictions,
+        }
+
+    def save(self, path):
+        """Writes the table next to the model; the rename keeps concurrent readers from seeing a partial file."""
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, separators=(",", ":"))
+        os.replace(temporary_path, path)
+
+
+def default_domains(max_id=DEFAULT_MAX_ID):
+    return [list(range(1, max_id + 1)) for _ in FEATURE_COLUMNS]
+
+
+def model_predict(model, rows):
+    """Calls model.predict on plain feature rows."""
+    import numpy as np
+
+    with warnings.catch_warnings():
+        # The model was fitted on a DataFrame; a plain array in FEATURE_COLUMNS order is equivalent
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        return model.predict(np.asarray(rows, dtype=np.int64))
+
+
+def compile_model(model, model_version, domains=None):
+    """
+    Precomputes model.predict over the cartesian product of the feature domains.
+
+    Args:
+        model: A fitted classifier over FEATURE_COLUMNS.
+        model_version (str): Version of the model file, stored so stale tables are detected.
+        domains (list): One list of ids per feature; defaults to 1..DEFAULT_MAX_ID.
+    Returns:
+        CompiledPredictor: With the model itself as fallback for unseen ids.
+    """
+    domains = [sorted(set(domain)) for domain in (domains or default_domains())]
+    start = time.perf_counter()
+    grid = list(itertools.product(*domains))
+    predictions = [int(prediction) for prediction in model_predict(model, grid)]
+    logging.info(f"Compiled model {model_version} over {len(grid)} feature combinations "
+                 f"in {(time.perf_counter() - start) * 1000:.1f} ms.")
+    return CompiledPredictor(model_version, domains, predictions, fallback=lambda rows: model_predict(model, rows))
+
+
+def load_compiled(path, model_version):
+    """
+    Loads a compiled table written by CompiledPredictor.save.
+
+    Returns:
+        CompiledPredictor or None: None if the file is missing, unreadable or built from another model version.
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if (data.get("format") != COMPILED_FORMAT or data.get("model_version") != model_version
+            or data.get("feature_columns") != FEATURE_COLUMNS):
+        return None
+    return CompiledPredictor(model_version, data["domains"], data["predictions"])
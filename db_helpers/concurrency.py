@@ -0,0 +1,231 @@
+import asyncio
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import azure.functions as func
+
+from db_helpers.instrumentation import current_timer, profiled
+
+# Worker threads per lane. Blocking database, model and file work runs on these instead of the
+# worker's event loop. Interactive and bulk work never share threads, so a running ingest or
+# export cannot delay a page read; keep BulkPoolThreads below SqlPoolSize so bulk work cannot
+# hold every pooled connection either.
+LANE_THREADS = {
+    "interactive": int(os.getenv("InteractivePoolThreads", "16")),
+    "bulk": int(os.getenv("BulkPoolThreads", "2")),
+}
+
+# Function name -> (lane, invocations allowed to run at once in this worker process)
+DEFAULT_FUNCTION_LIMITS = {
+    "insights_summary": ("interactive", 32),
+    "recommendations_summary": ("interactive", 8),
+    "generate_recommendations": ("interactive", 16),
+    "tag_management": ("interactive", 16),
+    "insights_search": ("interactive", 16),
+    "insights_analytics": ("interactive", 16),
+    "insights_injest_csv": ("bulk", 2),
+    "insights_export": ("bulk", 2),
+}
+
+# Overrides of the limits, e.g. "insights_injest_csv=1,insights_summary=64"
+FUNCTION_LIMITS_SETTING = os.getenv("FunctionConcurrencyLimits", "")
+
+# How long an invocation waits for a free slot before it is answered 503
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("FunctionQueueTimeoutSeconds", "30"))
+RETRY_AFTER_SECONDS = 5
+
+# Lane of the invocation being handled, so run_blocking picks the right pool by default
+_lane = contextvars.ContextVar("eureka_lane", default="interactive")
+
+
+def parse_limits(setting, defaults=DEFAULT_FUNCTION_LIMITS):
+    """
+    Applies a FunctionConcurrencyLimits value ("name=limit,...") to the default limits.
+
+    Returns:
+        dict: Function name -> (lane, limit).
+    Raises:
+        ValueError: If an entry is malformed.
+    """
+    limits = dict(defaults)
+    for entry in filter(None, (part.strip() for part in setting.split(","))):
+        name, _, value = entry.partition("=")
+        name = name.strip()
+        try:
+            limit = int(value)
+        except ValueError:
+            raise ValueError(f"Invalid FunctionConcurrencyLimits entry '{entry}'.")
+        if limit < 1:
+            raise ValueError(f"FunctionConcurrencyLimits for '{name}' must be positive.")
+        limits[name] = (limits.get(name, ("interactive", limit))[0], limit)
+    return limits
+
+
+FUNCTION_LIMITS = parse_limits(FUNCTION_LIMITS_SETTING)
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def lane_executor(lane):
+    """Returns the lane's ThreadPoolExecutor, created on first use."""
+    with _executors_lock:
+        executor = _executors.get(lane)
+        if executor is None:
+            executor = _executors[lane] = ThreadPoolExecutor(
+                max_workers=LANE_THREADS[lane], thread_name_prefix=f"eureka-{lane}"
+            )
+        return executor
+
+
+async def run_blocking(fn, *args, lane=None, **kwargs):
+    """
+    Runs a blocking call on a lane's thread pool and awaits its result.
+
+    The call runs in a copy of the caller's context, so spans land in the invocation's timer
+    and the sampling profiler covers it.
+
+    Args:
+        fn: The blocking callable.
+        lane (str): "interactive" or "bulk"; defaults to the lane of the current function.
+    Returns:
+        The result of fn(*args, **kwargs).
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, profiled, fn, *args, **kwargs)
+    return await loop.run_in_executor(lane_executor(lane or _lane.get()), call)
+
+
+class FunctionLimiter:
+    """
+    Caps how many invocations of one function run at once in this worker process.
+
+    Waiters are admitted in arrival order. asyncio semaphores belong to one event loop, so there
+    is one per loop; the worker runs a single loop, benchmarks may run several.
+    """
+
+    def __init__(self, function_name, lane, limit):
+        self.function_name = function_name
+        self.lane = lane
+        self.limit = limit
+        self._semaphores = weakref.WeakKeyDictionary()
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_seconds_max = 0.0
+
+    def _current_semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+        return semaphore
+
+    async def acquire(self, timeout=QUEUE_TIMEOUT_SECONDS):
+        """Waits for a slot; returns the seconds waited, or None if the timeout passed first."""
+        semaphore = self._current_semaphore()
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            # Not wait_for: on 3.11 it runs the acquire in a separate task, which can be cancelled
+            # after taking the permit. asyncio.timeout cancels this task in place instead, where a
+            # cancellation that lands after the semaphore woke it hands the permit back, and
+            # nothing is awaited after the acquire for a late timeout to interrupt.
+            async with asyncio.timeout(timeout):
+                await semaphore.acquire()
+        except TimeoutError:
+            self.rejected += 1
+            return None
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - started
+        self.running += 1
+        self.admitted += 1
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        return waited
+
+    def release(self):
+        self.running -= 1
+        self._current_semaphore().release()
+
+    def stats(self):
+        return {
+            "lane": self.lane,
+            "limit": self.limit,
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "wait_ms_max": round(self.wait_seconds_max * 1000, 1),
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(function_name):
+    """Returns the process-wide limiter of a function (FUNCTION_LIMITS, else interactive with one slot per thread)."""
+    with _limiters_lock:
+        limiter = _limiters.get(function_name)
+        if limiter is None:
+            lane, limit = FUNCTION_LIMITS.get(function_name, ("interactive", LANE_THREADS["interactive"]))
+            limiter = _limiters[function_name] = FunctionLimiter(function_name, lane, limit)
+        return limiter
+
+
+def limited(function_name):
+    """
+    Decorates an async main: at most the function's limit of invocations run at once; the rest
+    wait for a slot (recorded as the "queue" phase) and are answered 503 with Retry-After once
+    FunctionQueueTimeoutSeconds passes. Blocking calls made through run_blocking use the
+    function's lane.
+
+    Apply under @instrumented so the queue wait shows in Server-Timing.
+    """
+    def decorator(main):
+        @functools.wraps(main)
+        async def wrapper(*args, **kwargs):
+            limiter = get_limiter(function_name)
+            waited = await limiter.acquire()
+            if waited is None:
+                logging.warning(f"{function_name}: no slot free within {QUEUE_TIMEOUT_SECONDS}s "
+                                f"({limiter.running} running, {limiter.waiting} waiting).")
+                return func.HttpResponse(
+                    json.dumps({"error": "Too many concurrent requests. Retry later."}),
+                    mimetype="application/json",
+                    status_code=503,
+                    headers={"Retry-After": str(RETRY_AFTER_SECONDS)}
+                )
+            timer = current_timer()
+            if timer is not None:
+                timer.add("queue", waited)
+            token = _lane.set(limiter.lane)
+            try:
+                return await main(*args, **kwargs)
+            finally:
+                _lane.reset(token)
+                limiter.release()
+        return wrapper
+    return decorator
+
+
+def concurrency_stats():
+    """Per-function limiter counters and per-lane pool backlog, for diagnostics."""
+    with _executors_lock:
+        lanes = {
+            lane: {"threads": LANE_THREADS[lane], "queued": executor._work_queue.qsize()}
+            for lane, executor in _executors.items()
+        }
+    with _limiters_lock:
+        functions = {name: limiter.stats() for name, limiter in _limiters.items()}
+    return {"lanes": lanes, "functions": functions}
@@ -0,0 +1,229 @@
+import contextlib
+import logging
+import os
+import threading
+import time
+
+import pyodbc
+
+from db_helpers.instrumentation import span
+
+# Load database connection string from environment variable
+DB_CONNECTION_STRING = os.getenv("SqlConnectionString")
+
+# Pool settings, overridable per Function App through application settings
+POOL_SIZE = int(os.getenv("SqlPoolSize", "4"))
+POOL_WARMUP = int(os.getenv("SqlPoolWarmup", "1"))
+POOL_TIMEOUT_SECONDS = float(os.getenv("SqlPoolTimeoutSeconds", "30"))
+# Idle connections older than this are pinged before being handed out
+POOL_HEALTH_CHECK_SECONDS = float(os.getenv("SqlPoolHealthCheckSeconds", "60"))
+# Connections are closed and replaced after this long, regardless of health
+POOL_MAX_LIFETIME_SECONDS = float(os.getenv("SqlPoolMaxLifetimeSeconds", "1800"))
+CONNECT_RETRIES = int(os.getenv("SqlConnectRetries", "3"))
+CONNECT_BACKOFF_SECONDS = float(os.getenv("SqlConnectBackoffSeconds", "0.5"))
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    Bounded pool of warm pyodbc connections shared by every function in the worker process.
+
+    Connections are handed out most-recently-used first, health checked with SELECT 1 after
+    sitting idle, replaced after a maximum lifetime, and discarded if the borrowing code raises.
+    Opening a connection is retried with exponential backoff.
+    """
+
+    def __init__(self, connection_string, max_size=POOL_SIZE, timeout=POOL_TIMEOUT_SECONDS,
+                 health_check_seconds=POOL_HEALTH_CHECK_SECONDS, max_lifetime_seconds=POOL_MAX_LIFETIME_SECONDS,
+                 connect=pyodbc.connect):
+        self.connection_string = connection_string
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_seconds = health_check_seconds
+        self.max_lifetime_seconds = max_lifetime_seconds
+        self._connect = connect
+        self._idle = []
+        self._open = 0
+        self._condition = threading.Condition()
+
+        self.in_use = 0
+        self.created = 0
+        self.recycled = 0
+        self.connect_failures = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _new_connection(self):
+        if not self.connection_string:
+            raise EnvironmentError("Environment variable 'SqlConnectionString' is not set.")
+        delay = CONNECT_BACKOFF_SECONDS
+        for attempt in range(1, CONNECT_RETRIES + 1):
+            try:
+                with span("db.connect"):
+                    pooled = _PooledConnection(self._connect(self.connection_string))
+                with self._condition:
+                    self.created += 1
+                return pooled
+            except pyodbc.Error as e:
+                with self._condition:
+                    self.connect_failures += 1
+                if attempt == CONNECT_RETRIES:
+                    raise
+                logging.warning(f"Database connect attempt {attempt} failed, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                delay *= 2
+
+    def _healthy(self, pooled):
+        now = time.monotonic()
+        if now - pooled.created_at > self.max_lifetime_seconds:
+            return False
+        if now - pooled.last_used > self.health_check_seconds:
+            try:
+                pooled.conn.cursor().execute("SELECT 1").fetchall()
+            except pyodbc.Error as e:
+                logging.warning(f"Discarding unhealthy pooled connection: {e}")
+                return False
+        return True
+
+    def _discard(self, pooled):
+        try:
+            pooled.conn.close()
+        except pyodbc.Error:
+            pass
+        with self._condition:
+            self.recycled += 1
+            self._open -= 1
+            self._condition.notify()
+
+    def _acquire(self):
+        started = time.monotonic()
+        waited = False
+        while True:
+            with self._condition:
+                while not self._idle and self._open >= self.max_size:
+                    waited = True
+                    remaining = self.timeout - (time.monotonic() - started)
+                    if remaining <= 0:
+                        raise PoolTimeoutError(f"No database connection available after {self.timeout}s.")
+                    self._condition.wait(remaining)
+                pooled = self._idle.pop() if self._idle else None
+                if pooled is None:
+                    # Reserve the slot before connecting outside the lock
+                    self._open += 1
+
+            if pooled is None:
+                try:
+                    pooled = self._new_connection()
+                except Exception:
+                    with self._condition:
+                        self._open -= 1
+                        self._condition.notify()
+                    raise
+            elif not self._healthy(pooled):
+                self._discard(pooled)
+                continue
+
+            with self._condition:
+                if waited:
+                    waited_seconds = time.monotonic() - started
+                    self.waits += 1
+                    self.wait_seconds_total += waited_seconds
+                    self.wait_seconds_max = max(self.wait_seconds_max, waited_seconds)
+                self.in_use += 1
+            return pooled
+
+    def _release(self, pooled, failed):
+        with self._condition:
+            self.in_use -= 1
+        if failed:
+            self._discard(pooled)
+            return
+        try:
+            # Never hand the next borrower an open transaction
+            pooled.conn.rollback()
+        except pyodbc.Error:
+            self._discard(pooled)
+            return
+        pooled.last_used = time.monotonic()
+        with self._condition:
+            self._idle.append(pooled)
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Borrows a connection for the duration of a with block.
+
+        Uncommitted work is rolled back when the block exits; if the block raises, the
+        connection is closed instead of being returned to the pool.
+        """
+        with span("db.acquire"):
+            pooled = self._acquire()
+        failed = True
+        try:
+            yield pooled.conn
+            failed = False
+        finally:
+            self._release(pooled, failed)
+
+    def warm_up(self, count=POOL_WARMUP):
+        """Opens up to count connections ahead of the first request."""
+        count = min(count, self.max_size)
+        borrowed = []
+        try:
+            for _ in range(count):
+                borrowed.append(self._acquire())
+        except Exception as e:
+            logging.warning(f"Connection pool warm-up stopped early: {e}")
+        for pooled in borrowed:
+            self._release(pooled, failed=False)
+        logging.info(f"Connection pool warmed up with {len(borrowed)} connection(s).")
+
+    def metrics(self):
+        """Returns pool counters for metrics and diagnostics."""
+        with self._condition:
+            idle = len(self._idle)
+            open_connections = self._open
+            in_use = self.in_use
+        return {
+            "max_size": self.max_size,
+            "open": open_connections,
+            "idle": idle,
+            "in_use": in_use,
+            "created": self.created,
+            "recycled": self.recycled,
+            "connect_failures": self.connect_failures,
+            "waits": self.waits,
+            "wait_ms_total": round(self.wait_seconds_total * 1000, 3),
+            "wait_ms_max": round(self.wait_seconds_max * 1000, 3),
+        }
+
+
+_pool = ConnectionPool(DB_CONNECTION_STRING)
+
+# Open the first connections in the background at cold start so the first request finds them warm
+if DB_CONNECTION_STRING and POOL_WARMUP > 0:
+    threading.Thread(target=_pool.warm_up, name="sql-pool-warmup", daemon=True).start()
+
+
+def get_pool():
+    """Returns the process-wide ConnectionPool."""
+    return _pool
+
+
+def get_connection():
+    """Borrows a pooled connection: `with get_connection() as conn: ...`"""
+    return _pool.connection()
@@ -0,0 +1,156 @@
+import logging
+import os
+import threading
+import time
+from db_helpers.instrumentation import span
+
+# Dimension key -> (lookup table, name column, Insights foreign key column or None)
+DIMENSIONS = {
+    "insight_type": ("InsightTypes", "type_name", "insight_type_id"),
+    "data_source": ("DataSources", "source_name", "data_source_id"),
+    "audience": ("Audiences", "audience_name", "audience_id"),
+    "domain": ("Domains", "domain_name", "domain_id"),
+    "confidence_level": ("ConfidenceLevels", "level_name", "confidence_level_id"),
+    "timeliness": ("Timeliness", "timeliness_type", "timeliness_id"),
+    "alignment_goal": ("AlignmentGoals", "goal_name", "alignment_goal_id"),
+    "value_priority": ("ValuePriorities", "priority_name", "value_priority_id"),
+    "delivery_channel": ("DeliveryChannels", "channel_name", None),
+}
+
+# The eight dimensions every insight row references
+INSIGHT_DIMENSIONS = {key: value for key, value in DIMENSIONS.items() if value[2]}
+
+# All lookup tables are read in a single round trip
+LOAD_QUERY = "\nUNION ALL\n".join(
+    f"SELECT '{key}' AS dimension, id, {name_column} AS name, description FROM {table}"
+    for key, (table, name_column, _) in DIMENSIONS.items()
+)
+
+DEFAULT_TTL_SECONDS = float(os.getenv("DimensionCacheTtlSeconds", "300"))
+
+
+def normalize_name(name):
+    """
+    Normalizes a lookup name the way the default SQL Server collation compares them
+    (case-insensitive, trailing spaces ignored).
+    """
+    return name.strip().casefold()
+
+
+class DimensionTable:
+    """In-memory copy of one lookup table with id -> (name, description) and name -> id maps."""
+
+    def __init__(self, key):
+        self.key = key
+        self.by_id = {}
+        self.by_name = {}
+
+    def add(self, row_id, name, description):
+        self.by_id[row_id] = (name, description)
+        self.by_name[normalize_name(name)] = row_id
+
+    def name(self, row_id):
+        entry = self.by_id.get(row_id)
+        return entry[0] if entry else None
+
+    def id_for(self, name):
+        return self.by_name.get(normalize_name(name))
+
+
+class DimensionCache:
+    """
+    Process-wide cache of the Eureka lookup tables.
+
+    The tables are loaded together in one query and kept for ttl_seconds. Callers get an
+    immutable snapshot ({dimension key: DimensionTable}); a reload swaps in a new snapshot so
+    readers holding the old one are never affected.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._tables = None
+        self._loaded_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.last_load_seconds = None
+
+    def fresh(self):
+        """True while the cached tables are loaded and within their TTL."""
+        return self._fresh_tables() is not None
+
+    def _fresh_tables(self):
+        # Read once: callers off the lock may see invalidate() clear _tables between two reads
+        tables = self._tables
+        if tables is None or time.monotonic() - self._loaded_at >= self.ttl_seconds:
+            return None
+        return tables
+
+    def snapshot(self, conn, force=False):
+        """
+        Returns the cached lookup tables, loading them on first use, after expiry or when forced.
+
+        Args:
+            conn: An open database connection, only used on a miss.
+            force (bool): Reload even if the cached copy is still fresh.
+        Returns:
+            dict: Dimension key -> DimensionTable.
+        """
+        tables = None if force else self._fresh_tables()
+        if tables is not None:
+            self.hits += 1
+            return tables
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            tables = None if force else self._fresh_tables()
+            if tables is not None:
+                self.hits += 1
+                return tables
+            self.misses += 1
+            with span("db.dimensions"):
+                tables = self._load(conn)
+            self._loaded_at = time.monotonic()
+            self._tables = tables
+            return tables
+
+    def _load(self, conn):
+        start = time.perf_counter()
+        tables = {key: DimensionTable(key) for key in DIMENSIONS}
+        cursor = conn.cursor()
+        cursor.execute(LOAD_QUERY)
+        for dimension, row_id, name, description in cursor.fetchall():
+            tables[dimension].add(row_id, name, description)
+        cursor.close()
+
+        self.loads += 1
+        self.last_load_seconds = time.perf_counter() - start
+        logging.info(f"Loaded {sum(len(t.by_id) for t in tables.values())} lookup rows "
+                     f"in {self.last_load_seconds * 1000:.1f} ms.")
+        return tables
+
+    def invalidate(self):
+        """Drops the cached tables so the next snapshot() reloads them."""
+        with self._lock:
+            self._tables = None
+
+    def stats(self):
+        """Returns hit/miss counters for metrics and diagnostics."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "loads": self.loads,
+            "last_load_ms": round(self.last_load_seconds * 1000, 3) if self.last_load_seconds is not None else None,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._tables is not None else None,
+        }
+
+
+_cache = DimensionCache()
+
+
+def get_dimension_cache():
+    """Returns the process-wide DimensionCache."""
+    return _cache
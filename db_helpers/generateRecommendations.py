@@ -0,0 +1,290 @@
+import datetime
+import logging
+import os
+import time
+from db_helpers.compiledPredictor import FEATURE_COLUMNS, CompiledPredictor, model_predict
+from db_helpers.insightRollups import add_recommendation_counts
+from db_helpers.instrumentation import span
+from db_helpers.ttlCache import TTLCache
+
+# Recommendation mapping
+RECOMMENDATION_MAPPING = {
+    0: "Send targeted notification about health resources.",
+    1: "Send an email to select a primary care physician.",
+    2: "Provide manual review for custom recommendation."
+}
+NO_RECOMMENDATION = "No recommendation available."
+
+# Default notification channel for generated recommendations
+DEFAULT_DELIVERY_CHANNEL_ID = 1
+
+# Insights scored, and recommendations written, per chunk
+CHUNK_SIZE = 2000
+
+# SQL Server accepts at most 2100 parameters per statement
+MAX_IN_PARAMETERS = 2000
+
+MISSING_FILTER = "missing_recommendation"
+
+# Idempotent mode: a repeated request for an insight returns its existing Pending recommendation
+IDEMPOTENT_DEFAULT = os.getenv("RecommendationsIdempotent", "false").lower() in ("1", "true", "yes")
+CACHE_SIZE = int(os.getenv("RecommendationCacheSize", "50000"))
+CACHE_TTL_SECONDS = float(os.getenv("RecommendationCacheTtlSeconds", "300"))
+
+# insight_id -> (recommendation id, recommendation text) of its Pending recommendation
+_pending_cache = TTLCache(CACHE_SIZE, CACHE_TTL_SECONDS)
+# (model version, feature tuple) -> predicted class
+_prediction_cache = TTLCache(CACHE_SIZE, CACHE_TTL_SECONDS)
+
+# Insert-if-absent under a key-range lock so concurrent workers cannot both insert a Pending row
+# for the same insight; either way the surviving Pending row is returned with an inserted flag.
+UPSERT_PENDING_SQL = """
+SET NOCOUNT ON;
+INSERT INTO Recommendations (insight_id, recommendation_text, confidence_level_id, delivery_channel_id, status, created_at, updated_at)
+SELECT ?, ?, ?, ?, 'Pending', ?, ?
+WHERE NOT EXISTS (
+    SELECT 1 FROM Recommendations WITH (UPDLOCK, HOLDLOCK)
+    WHERE insight_id = ? AND status = 'Pending'
+);
+DECLARE @inserted INT = @@ROWCOUNT;
+SELECT TOP 1 id, recommendation_text, @inserted
+FROM Recommendations
+WHERE insight_id = ? AND status = 'Pending'
+ORDER BY id;
+"""
+
+INSERT_RECOMMENDATION_SQL = """
+INSERT INTO Recommendations (insight_id, recommendation_text, confidence_level_id, delivery_channel_id, status, created_at, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def fetch_features(cursor, insight_ids, unscored_only=False):
+    """
+    Fetches model features for the given insight ids.
+
+    Args:
+        unscored_only (bool): Leave out insights that already have a recommendation.
+    Returns:
+        list: Rows of (id, confidence_level_id, timeliness_id, value_priority_id); unknown ids are absent.
+    """
+    unscored = " AND NOT EXISTS (SELECT 1 FROM Recommendations r WHERE r.insight_id = i.id)" if unscored_only else ""
+    rows = []
+    with span("db.features") as features:
+        for start in range(0, len(insight_ids), MAX_IN_PARAMETERS):
+            chunk = insight_ids[start:start + MAX_IN_PARAMETERS]
+            cursor.execute(
+                f"SELECT i.id, {', '.join(f'i.{column}' for column in FEATURE_COLUMNS)} FROM Insights i "
+                f"WHERE i.id IN ({', '.join('?' * len(chunk))}){unscored}",
+                *chunk
+            )
+            rows.extend(cursor.fetchall())
+        features.rows = len(rows)
+    return rows
+
+
+def fetch_missing_features(cursor, after_id, limit):
+    """
+    Fetches the next chunk of insights that have no recommendation yet, in id order.
+
+    Returns:
+        list: Rows of (id, confidence_level_id, timeliness_id, value_priority_id).
+    """
+    with span("db.features") as features:
+        cursor.execute(f"""
+            SELECT TOP (?) i.id, {', '.join(f'i.{column}' for column in FEATURE_COLUMNS)}
+            FROM Insights i
+            WHERE i.id > ?
+              AND NOT EXISTS (SELECT 1 FROM Recommendations r WHERE r.insight_id = i.id)
+            ORDER BY i.id
+        """, limit, after_id)
+        rows = cursor.fetchall()
+        features.rows = len(rows)
+    return rows
+
+
+def predict(model, feature_rows):
+    """
+    Scores a chunk of feature rows with one table lookup pass or a single model.predict call.
+
+    Args:
+        model: A CompiledPredictor or a fitted classifier.
+        feature_rows: Sequence of (id, *FEATURE_COLUMNS) rows.
+    Returns:
+        sequence: One predicted class per row.
+    """
+    features = [tuple(row[1:]) for row in feature_rows]
+    with span("model.predict", rows=len(features)):
+        if isinstance(model, CompiledPredictor):
+            return model.predict(features)
+        return model_predict(model, features)
+
+
+def insert_recommendations(cursor, feature_rows, predictions, now=None):
+    """
+    Writes one Pending recommendation per scored insight in a single bulk round trip and counts
+    them in the status rollups. The caller commits.
+    """
+    now = now or datetime.datetime.utcnow()
+    cursor.fast_executemany = True
+    with span("db.write", rows=len(feature_rows)):
+        cursor.executemany(INSERT_RECOMMENDATION_SQL, [
+            (
+                int(row[0]), RECOMMENDATION_MAPPING.get(int(prediction), NO_RECOMMENDATION), int(row[1]),
+                DEFAULT_DELIVERY_CHANNEL_ID, "Pending", now, now
+            )
+            for row, prediction in zip(feature_rows, predictions)
+        ])
+    add_recommendation_counts(cursor, {"Pending": len(feature_rows)})
+
+
+def generate_one(conn, predictor, model_version, insight_id, idempotent=IDEMPOTENT_DEFAULT):
+    """
+    Generates the recommendation for one insight.
+
+    In idempotent mode an existing Pending recommendation is returned instead of inserting a new
+    one: first from the in-process cache, otherwise through UPSERT_PENDING_SQL, which keeps this
+    correct across workers. Predictions are cached per (model version, features) either way.
+
+    Args:
+        conn: An open database connection.
+        predictor: A CompiledPredictor or a fitted classifier.
+        model_version (str): Version of the model behind predictor.
+        insight_id (int): The insight to score.
+        idempotent (bool): Reuse an existing Pending recommendation.
+    Returns:
+        dict or None: recommendation text plus created/cached flags (and the id in idempotent
+        mode), or None if the insight does not exist.
+    """
+    if idempotent:
+        cached = _pending_cache.get(insight_id)
+        if cached is not None:
+            return {"recommendation": cached[1], "recommendation_id": cached[0], "created": False, "cached": True}
+
+    cursor = conn.cursor()
+    feature_rows = fetch_features(cursor, [insight_id])
+    if not feature_rows:
+        return None
+    row = feature_rows[0]
+
+    cache_key = (model_version, tuple(row[1:]))
+    prediction = _prediction_cache.get(cache_key)
+    if prediction is None:
+        prediction = int(predict(predictor, feature_rows)[0])
+        _prediction_cache.set(cache_key, prediction)
+    recommendation_text = RECOMMENDATION_MAPPING.get(prediction, NO_RECOMMENDATION)
+
+    now = datetime.datetime.utcnow()
+    if idempotent:
+        with span("db.write", rows=1):
+            cursor.execute(
+                UPSERT_PENDING_SQL,
+                row[0], recommendation_text, int(row[1]), DEFAULT_DELIVERY_CHANNEL_ID, now, now, row[0], row[0]
+            )
+            recommendation_id, recommendation_text, inserted = cursor.fetchone()
+        if inserted:
+            add_recommendation_counts(cursor, {"Pending": 1})
+        conn.commit()
+        _pending_cache.set(insight_id, (recommendation_id, recommendation_text))
+        return {"recommendation": recommendation_text, "recommendation_id": recommendation_id,
+                "created": bool(inserted), "cached": False}
+
+    # Insert the recommendation into the Recommendations table
+    with span("db.write", rows=1):
+        cursor.execute(
+            INSERT_RECOMMENDATION_SQL,
+            row[0], recommendation_text, int(row[1]), DEFAULT_DELIVERY_CHANNEL_ID, 'Pending', now, now
+        )
+    add_recommendation_counts(cursor, {"Pending": 1})
+    conn.commit()
+    return {"recommendation": recommendation_text, "created": True, "cached": False}
+
+
+def recommendation_cache_stats():
+    """Returns hit rate and eviction counters of the idempotency and prediction caches."""
+    return {"pending": _pending_cache.stats(), "predictions": _prediction_cache.stats()}
+
+
+def _score_chunk(conn, cursor, model, feature_rows, class_counts):
+    predictions = predict(model, feature_rows)
+    insert_recommendations(cursor, feature_rows, predictions)
+    conn.commit()
+    for prediction in predictions:
+        class_counts[int(prediction)] = class_counts.get(int(prediction), 0) + 1
+
+
+def generate_batch(conn, model, insight_ids=None, missing=False, after_id=0, chunk_size=CHUNK_SIZE, max_seconds=None,
+                   skip_scored=False):
+    """
+    Generates recommendations for many insights, one predict call and one bulk insert per chunk.
+
+    Each chunk is committed on its own so a long backfill makes durable progress. When max_seconds
+    is reached in missing mode, the summary carries resume_after_id for the next call.
+
+    Args:
+        conn: An open database connection.
+        model: A CompiledPredictor or a fitted classifier.
+        insight_ids (list): Explicit insight ids to score.
+        missing (bool): Score every insight without a recommendation instead of insight_ids.
+        after_id (int): In missing mode, only consider insights with a larger id (resume point).
+        chunk_size (int): Insights per chunk.
+        max_seconds (float): Optional time budget.
+        skip_scored (bool): With insight_ids, leave out insights that already have a recommendation,
+            so redelivered queue messages do not create duplicates. They are counted as skipped.
+    Returns:
+        dict: Counts per recommendation class, not-found ids and throughput.
+    """
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    class_counts = {}
+    processed = 0
+    not_found = []
+    skipped = 0
+    resume_after_id = None
+
+    if missing:
+        while True:
+            feature_rows = fetch_missing_features(cursor, after_id, chunk_size)
+            if not feature_rows:
+                break
+            _score_chunk(conn, cursor, model, feature_rows, class_counts)
+            processed += len(feature_rows)
+            after_id = feature_rows[-1][0]
+            if max_seconds and time.perf_counter() - started > max_seconds:
+                resume_after_id = after_id
+                break
+    else:
+        # Preserve order while dropping duplicates
+        insight_ids = list(dict.fromkeys(insight_ids or []))
+        for start in range(0, len(insight_ids), chunk_size):
+            chunk = insight_ids[start:start + chunk_size]
+            feature_rows = fetch_features(cursor, chunk, unscored_only=skip_scored)
+            found = {row[0] for row in feature_rows}
+            absent = [insight_id for insight_id in chunk if insight_id not in found]
+            if skip_scored and absent:
+                # Tell already-scored insights apart from ids that do not exist
+                existing = {row[0] for row in fetch_features(cursor, absent)}
+                skipped += len(existing)
+                absent = [insight_id for insight_id in absent if insight_id not in existing]
+            not_found.extend(absent)
+            if feature_rows:
+                _score_chunk(conn, cursor, model, feature_rows, class_counts)
+                processed += len(feature_rows)
+
+    elapsed = time.perf_counter() - started
+    logging.info(f"Generated {processed} recommendations in {elapsed:.2f}s.")
+    return {
+        "processed": processed,
+        "not_found": not_found,
+        "skipped": skipped,
+        "recommendations": {
+            str(prediction): {
+                "recommendation": RECOMMENDATION_MAPPING.get(prediction, NO_RECOMMENDATION),
+                "count": count
+            }
+            for prediction, count in sorted(class_counts.items())
+        },
+        "seconds": round(elapsed, 3),
+        "insights_per_second": round(processed / elapsed) if elapsed > 0 else None,
+        "resume_after_id": resume_after_id,
+    }
@@ -1,9 +1,86 @@
 import pyodbc
+import asyncio
+import base64
+import binascii
+import json
 import logging
-import os
+from db_helpers.concurrency import run_blocking
+from db_helpers.connectionPool import get_connection
+from db_helpers.dimensionCache import INSIGHT_DIMENSIONS, get_dimension_cache
+from db_helpers.instrumentation import span
+
+INSIGHT_FACT_COLUMNS = "i.id, i.content, i.created_at, " + ", ".join(
+    f"i.{fact_column}" for _, _, fact_column in INSIGHT_DIMENSIONS.values()
+)
+
+INSIGHT_FACTS_QUERY = f"""
+SELECT
+    {INSIGHT_FACT_COLUMNS}
+FROM
+    Insights i
+"""
+
+# Dimensions that GET /insights can be filtered on (by lookup name)
+FILTER_DIMENSIONS = ("domain", "audience", "confidence_level")
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Response key used for the lookup name of each dimension
+NAME_KEYS = {"timeliness": "type"}
+
+
+def dimension_tables(conn=None, force=False):
+    """
+    Returns the dimension cache snapshot. Without conn a pooled connection is borrowed, and only
+    if the cache has to be (re)loaded, so it can run alongside a fact query on another connection.
+    """
+    cache = get_dimension_cache()
+    if conn is not None or (not force and cache.fresh()):
+        return cache.snapshot(conn, force)
+    with get_connection() as own_conn:
+        return cache.snapshot(own_conn, force)
+
+
+def decorate_insights(conn, rows):
+    """
+    Turns slim Insights fact rows into the nested insight dictionaries returned by the API.
+
+    Lookup names and descriptions are taken from the dimension cache instead of being joined in SQL.
+    An id missing from the cache (a lookup row added since it was loaded) forces one reload.
+
+    Args:
+        conn: An open database connection, used only if the cache needs loading; None borrows one.
+        rows: Rows shaped like INSIGHT_FACTS_QUERY (id, content, created_at, then the dimension ids).
+    Returns:
+        list: A list of dictionaries containing detailed insight information.
+    """
+    tables = dimension_tables(conn)
+    refreshed = False
+    while True:
+        dimensions = [(key, tables[key].by_id, NAME_KEYS.get(key, "name")) for key in INSIGHT_DIMENSIONS]
+        missing = False
+        insights = []
+        for row in rows:
+            insight = {
+                "insight_id": row[0],
+                "content": row[1],
+                "created_at": row[2].strftime("%Y-%m-%d %H:%M:%S") if row[2] else None,
+            }
+            for position, (key, by_id, name_key) in enumerate(dimensions, start=3):
+                entry = by_id.get(row[position])
+                if entry is None:
+                    missing = True
+                    entry = (None, None)
+                insight[key] = {name_key: entry[0], "description": entry[1]}
+            insights.append(insight)
+
+        if not missing or refreshed:
+            break
+        tables = dimension_tables(conn, force=True)
+        refreshed = True
+    return insights
 
-# Load database connection string from environment variable
-DB_CONNECTION_STRING = os.getenv("SqlConnectionString")
 
 def read_all_insights():
     """
@@ -15,103 +92,22 @@ def read_all_insights():
         Exception: If there's an error connecting to the database or executing the query.
     """
     try:
-        # Log the start of the process
-        logging.info("Connecting to the database EurekaDB...")
-
-        # Establish the database connection
-        conn = pyodbc.connect(DB_CONNECTION_STRING)
-        cursor = conn.cursor()
-
-        # Comprehensive query to fetch all insights details
-        query = """
-        SELECT 
-            i.id AS insight_id,
-            i.content AS insight_content,
-            i.created_at AS insight_created_at,
-            it.type_name AS insight_type,
-            it.description AS insight_type_description,
-            ds.source_name AS data_source,
-            ds.description AS data_source_description,
-            a.audience_name AS audience,
-            a.description AS audience_description,
-            d.domain_name AS domain,
-            d.description AS domain_description,
-            cl.level_name AS confidence_level,
-            cl.description AS confidence_level_description,
-            t.timeliness_type AS timeliness,
-            t.description AS timeliness_description,
-            ag.goal_name AS alignment_goal,
-            ag.description AS alignment_goal_description,
-            vp.priority_name AS value_priority,
-            vp.description AS value_priority_description
-        FROM 
-            Insights i
-        JOIN 
-            InsightTypes it ON i.insight_type_id = it.id
-        JOIN 
-            DataSources ds ON i.data_source_id = ds.id
-        JOIN 
-            Audiences a ON i.audience_id = a.id
-        JOIN 
-            Domains d ON i.domain_id = d.id
-        JOIN 
-            ConfidenceLevels cl ON i.confidence_level_id = cl.id
-        JOIN 
-            Timeliness t ON i.timeliness_id = t.id
-        JOIN 
-            AlignmentGoals ag ON i.alignment_goal_id = ag.id
-        JOIN 
-            ValuePriorities vp ON i.value_priority_id = vp.id;
-        """
-
-        # Execute the query
-        cursor.execute(query)
-
-        # Fetch all rows from the query result
-        rows = cursor.fetchall()
-
-
-        # Convert rows to a list of dictionaries
-        insights = [
-            {
-                "insight_id": row.insight_id,
-                "content": row.insight_content,
-                "created_at": row.insight_created_at.strftime("%Y-%m-%d %H:%M:%S") if row.insight_created_at else None,
-                "insight_type": {
-                    "name": row.insight_type,
-                    "description": row.insight_type_description
-                },
-                "data_source": {
-                    "name": row.data_source,
-                    "description": row.data_source_description
-                },
-                "audience": {
-                    "name": row.audience,
-                    "description": row.audience_description
-                },
-                "domain": {
-                    "name": row.domain,
-                    "description": row.domain_description
-                },
-                "confidence_level": {
-                    "name": row.confidence_level,
-                    "description": row.confidence_level_description
-                },
-                "timeliness": {
-                    "type": row.timeliness,
-                    "description": row.timeliness_description
-                },
-                "alignment_goal": {
-                    "name": row.alignment_goal,
-                    "description": row.alignment_goal_description
-                },
-                "value_priority": {
-                    "name": row.value_priority,
-                    "description": row.value_priority_description
-                }
-            }
-            for row in rows
-        ]
+        # Borrow a warm connection from the process-wide pool
+        with get_connection() as conn:
+            cursor = conn.cursor()
+
+            # Slim fact query; lookup names come from the process-wide dimension cache
+            with span("db.query"):
+                cursor.execute(INSIGHT_FACTS_QUERY)
+
+            # Fetch all rows from the query result
+            with span("db.fetch") as fetch:
+                rows = cursor.fetchall()
+                fetch.rows = len(rows)
+
+            # Convert rows to a list of dictionaries
+            with span("build", rows=len(rows)):
+                insights = decorate_insights(conn, rows)
 
         # Log the number of insights fetched
         logging.info(f"Fetched {len(insights)} insights from the database.")
@@ -122,8 +118,212 @@ def read_all_insights():
         logging.error(f"Database error: {e}")
         raise Exception("Error connecting to the database or executing the query.") from e
 
-    finally:
-        # Ensure the connection is closed
-        if 'conn' in locals() and conn:
-            conn.close()
-            logging.info("Database connection closed.")
+
+def encode_cursor(last_id):
+    """Encodes the keyset position after the last returned insight as an opaque token."""
+    return base64.urlsafe_b64encode(json.dumps({"id": last_id}).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token):
+    """
+    Decodes a token produced by encode_cursor.
+
+    Raises:
+        ValueError: If the token is malformed.
+    """
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        return int(position["id"])
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+def build_insight_filters(conn, filters):
+    """
+    Translates API filters into SQL predicates on the Insights fact columns.
+
+    Lookup names are resolved to ids through the dimension cache so the query never joins the
+    lookup tables and can use the foreign key indexes.
+
+    Args:
+        conn: An open database connection, used only if the cache needs loading.
+        filters (dict): Optional keys from FILTER_DIMENSIONS (lookup names) plus
+            created_from / created_to (datetime, inclusive / exclusive).
+    Returns:
+        tuple: (list of SQL predicates, list of parameters), or (None, None) if a lookup name
+        is unknown and nothing can match.
+    """
+    return filter_predicates(dimension_tables(conn), filters)
+
+
+def filter_predicates(tables, filters):
+    """build_insight_filters against an already loaded dimension cache snapshot."""
+    predicates = []
+    params = []
+    for key in FILTER_DIMENSIONS:
+        name = filters.get(key)
+        if name is None:
+            continue
+        lookup_id = tables[key].id_for(name)
+        if lookup_id is None:
+            return None, None
+        predicates.append(f"i.{INSIGHT_DIMENSIONS[key][2]} = ?")
+        params.append(lookup_id)
+    if filters.get("created_from") is not None:
+        predicates.append("i.created_at >= ?")
+        params.append(filters["created_from"])
+    if filters.get("created_to") is not None:
+        predicates.append("i.created_at < ?")
+        params.append(filters["created_to"])
+    return predicates, params
+
+
+def insights_query(where, top=False):
+    """Fact query over Insights for a WHERE clause in keyset (id) order; top adds a TOP (?) parameter."""
+    return f"""
+    SELECT {"TOP (?) " if top else ""}{INSIGHT_FACT_COLUMNS}
+    FROM Insights i
+    WHERE {where}
+    ORDER BY i.id
+    """
+
+
+def read_insights_page(limit=DEFAULT_PAGE_SIZE, cursor=None, filters=None):
+    """
+    Reads one page of insights using keyset pagination on Insights.id.
+
+    Each page is a bounded index seek (WHERE id > last_id ORDER BY id), so its cost does not
+    grow with the table or with how deep the client has paged.
+
+    Args:
+        limit (int): Page size, capped at MAX_PAGE_SIZE.
+        cursor (str): Token from a previous page's next_cursor, or None for the first page.
+        filters (dict): See build_insight_filters.
+    Returns:
+        tuple: (list of insight dictionaries, next cursor token or None on the last page)
+    Raises:
+        ValueError: If the cursor is malformed.
+        Exception: If there's an error connecting to the database or executing the query.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    after_id = decode_cursor(cursor) if cursor else 0
+
+    try:
+        with get_connection() as conn:
+            predicates, params = build_insight_filters(conn, filters or {})
+            if predicates is None:
+                return [], None
+            rows = fetch_page_rows(conn, limit, after_id, predicates, params)
+            return build_page(conn, rows, limit, after_id)
+
+    except pyodbc.Error as e:
+        # Log and raise database errors
+        logging.error(f"Database error: {e}")
+        raise Exception("Error connecting to the database or executing the query.") from e
+
+
+async def read_insights_page_async(limit=DEFAULT_PAGE_SIZE, cursor=None, filters=None):
+    """
+    read_insights_page for async handlers; the database work runs on the handler's thread pool.
+
+    Without lookup-name filters the fact query does not depend on the dimension cache, so a cold
+    or expired cache is loaded on a second pooled connection while the page is fetched.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    after_id = decode_cursor(cursor) if cursor else 0
+    filters = filters or {}
+
+    try:
+        if any(filters.get(key) for key in FILTER_DIMENSIONS):
+            # Lookup names must be resolved to ids before the fact query can be built
+            predicates, params = filter_predicates(await run_blocking(dimension_tables), filters)
+            if predicates is None:
+                return [], None
+            rows = await run_blocking(_with_connection, fetch_page_rows, limit, after_id, predicates, params)
+        else:
+            predicates, params = filter_predicates(None, filters)
+            _, rows = await asyncio.gather(
+                run_blocking(dimension_tables),
+                run_blocking(_with_connection, fetch_page_rows, limit, after_id, predicates, params),
+            )
+        return await run_blocking(build_page, None, rows, limit, after_id)
+
+    except pyodbc.Error as e:
+        # Log and raise database errors
+        logging.error(f"Database error: {e}")
+        raise Exception("Error connecting to the database or executing the query.") from e
+
+
+def fetch_page_rows(conn, limit, after_id, predicates, params):
+    """Runs the keyset page query; returns up to limit + 1 fact rows."""
+    query = insights_query(" AND ".join(["i.id > ?"] + predicates), top=True)
+
+    db_cursor = conn.cursor()
+    # Fetch one extra row to learn whether another page follows
+    with span("db.query"):
+        db_cursor.execute(query, limit + 1, after_id, *params)
+    with span("db.fetch") as fetch:
+        rows = db_cursor.fetchall()
+        fetch.rows = len(rows)
+    return rows
+
+
+def build_page(conn, rows, limit, after_id):
+    """Decorates the fetched rows of a page; returns (insights, next cursor token or None)."""
+    with span("build", rows=min(len(rows), limit)):
+        insights = decorate_insights(conn, rows[:limit])
+
+    next_cursor = encode_cursor(insights[-1]["insight_id"]) if len(rows) > limit else None
+    logging.info(f"Fetched page of {len(insights)} insights after id {after_id}.")
+    return insights, next_cursor
+
+
+def _with_connection(fn, *args):
+    with get_connection() as conn:
+        return fn(conn, *args)
+
+
+def iter_insights(cursor=None, filters=None, batch_size=1000):
+    """
+    Streams every insight matching filters, in id order, without materializing the result set.
+
+    Rows are pulled with fetchmany and decorated one batch at a time. The pooled connection is
+    held until the generator is exhausted or closed.
+
+    Args:
+        cursor (str): Optional token to resume after, as returned by read_insights_page.
+        filters (dict): See build_insight_filters.
+        batch_size (int): Rows per fetchmany call.
+    Yields:
+        dict: Insight dictionaries in the same shape as read_all_insights.
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    after_id = decode_cursor(cursor) if cursor else 0
+
+    try:
+        with get_connection() as conn:
+            predicates, params = build_insight_filters(conn, filters or {})
+            if predicates is None:
+                return
+
+            query = insights_query(" AND ".join(["i.id > ?"] + predicates))
+
+            db_cursor = conn.cursor()
+            with span("db.query"):
+                db_cursor.execute(query, after_id, *params)
+            while True:
+                with span("db.fetch") as fetch:
+                    rows = db_cursor.fetchmany(batch_size)
+                    fetch.rows = len(rows)
+                if not rows:
+                    break
+                # conn is busy with the open result set; a cache reload borrows another connection
+                with span("build", rows=len(rows)):
+                    insights = decorate_insights(None, rows)
+                yield from insights
+
+    except pyodbc.Error as e:
+        # Log and raise database errors
+        logging.error(f"Database error: {e}")
+        raise Exception("Error connecting to the database or executing the query.") from e
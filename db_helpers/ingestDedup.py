@@ -0,0 +1,420 @@
+import array
+import collections
+import hashlib
+import logging
+import os
+import struct
+import threading
+import unicodedata
+import zlib
+
+import numpy as np
+
+from db_helpers.dimensionCache import INSIGHT_DIMENSIONS
+from db_helpers.instrumentation import span
+from db_helpers.searchIndex import tokenize
+
+# Skip rows whose normalized content and lookup ids match an insight already stored or an
+# earlier row of the same upload
+EXACT_DEDUP_ENABLED = os.getenv("IngestExactDedup", "true").lower() in ("1", "true", "yes")
+# Also skip rows whose content has at least this estimated Jaccard similarity (over consecutive
+# word pairs) with an insight carrying the same lookup ids; 0 turns near-duplicate detection off.
+# The LSH bands below are tuned for thresholds of about 0.8 to 0.9: lower ones miss more pairs.
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("IngestNearDuplicateThreshold", "0"))
+
+# Upper bound on duplicate details returned to the caller; the count is always exact
+MAX_REPORTED_DUPLICATES = 1000
+
+# MinHash signatures keep the low 8 bits of NUM_PERMUTATIONS minimum hashes (64 bytes per
+# insight). LSH splits them into BANDS bands of ROWS_PER_BAND bytes, each read as one uint64
+# bucket key mixed with the lookup hash: insights with the same lookups sharing any bucket are
+# compared. With 8 x 8, a pair at Jaccard 0.9 shares a bucket 99% of the time and a pair at 0.5
+# about 3% of the time.
+NUM_PERMUTATIONS = 64
+BANDS = 8
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+# Prime above 2**32 for the (a * h + b) mod p permutations of 32-bit shingle hashes
+PERMUTATION_PRIME = 4294967311
+# Bucket members compared per band at most; only very repetitive content fills a bucket
+MAX_BUCKET_CANDIDATES = 64
+# Rows hashed together when computing signatures, bounding the temporary permutation matrix
+SIGNATURE_BATCH = 1024
+# Rows added one at a time that are kept out of the sorted band arrays at least
+MERGE_ROWS = 20000
+# Rows per round trip while loading the worker's index
+FETCH_ROWS = 10000
+
+LOOKUP_COLUMNS = [fact_column for _, _, fact_column in INSIGHT_DIMENSIONS.values()]
+
+ROWS_QUERY = f"""
+SELECT TOP (?) id, content, {", ".join(LOOKUP_COLUMNS)}
+FROM Insights
+WHERE id > ?
+ORDER BY id
+"""
+
+_permutations = np.random.default_rng(20240601)
+PERMUTATION_A = _permutations.integers(1, 2**31, NUM_PERMUTATIONS, dtype=np.uint64)
+PERMUTATION_B = _permutations.integers(0, 2**31, NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def normalize_content(content):
+    """NFKC, case-folded, with runs of whitespace collapsed: the text duplicates are compared on."""
+    return " ".join(unicodedata.normalize("NFKC", content).casefold().split())
+
+
+def content_hash(content):
+    """The 16 byte digest stored in Insights.content_hash."""
+    return hashlib.blake2b(normalize_content(content).encode("utf-8"), digest_size=16).digest()
+
+
+def duplicate_key(hash_value, lookup_ids):
+    """64-bit identity of a row for exact matching: content hash plus every lookup id."""
+    packed = hash_value + struct.pack(f"<{len(lookup_ids)}i", *lookup_ids)
+    return int.from_bytes(hashlib.blake2b(packed, digest_size=8).digest(), "little")
+
+
+def lookup_hash(lookup_ids):
+    return zlib.crc32(struct.pack(f"<{len(lookup_ids)}i", *lookup_ids))
+
+
+def shingles(contents):
+    """
+    Hashes of the consecutive word pairs (of the single word, for one-word content) of many
+    contents, flattened into one array, plus how many belong to each content (0 if it has no
+    words).
+
+    Word hashes come from the built-in hash(): signatures are only compared within the process
+    that computed them, so hash randomization between processes does not matter.
+    """
+    words = array.array("q")
+    counts = np.empty(len(contents), dtype=np.int64)
+    for position, content in enumerate(contents):
+        tokens = tokenize(content)
+        words.extend(map(hash, tokens))
+        counts[position] = len(tokens)
+    hashes = np.frombuffer(words, dtype=np.int64).view(np.uint64) & np.uint64(0xFFFFFFFF)
+    if not len(hashes):
+        return hashes, counts
+    # The last word of each content pairs with nothing and is dropped, unless it is the only one
+    last = np.zeros(len(hashes), dtype=bool)
+    last[np.cumsum(counts[counts > 0]) - 1] = True
+    pairs = hashes.copy()
+    pairs[:-1] = (hashes[:-1] * np.uint64(0x9E3779B1) + hashes[1:]) & np.uint64(0xFFFFFFFF)
+    pairs[last] = hashes[last]
+    single = last.copy()
+    single[1:] &= last[:-1]
+    single[0] = last[0]
+    return pairs[~last | single], np.where(counts > 1, counts - 1, counts)
+
+
+def signatures(hashes, counts):
+    """8-bit MinHash signatures (one row of NUM_PERMUTATIONS bytes each) from shingles() output, all counts non-zero."""
+    result = np.empty((len(counts), NUM_PERMUTATIONS), dtype=np.uint8)
+    ends = np.cumsum(counts)
+    for start in range(0, len(counts), SIGNATURE_BATCH):
+        lengths = counts[start:start + SIGNATURE_BATCH]
+        first = ends[start] - counts[start]
+        batch = hashes[first:ends[start + len(lengths) - 1]]
+        permuted = (PERMUTATION_A[:, None] * batch[None, :] + PERMUTATION_B[:, None]) % PERMUTATION_PRIME
+        minimums = np.minimum.reduceat(permuted, ends[start:start + len(lengths)] - lengths - first, axis=1)
+        result[start:start + len(lengths)] = (minimums & 0xFF).T
+    return result
+
+
+def band_keys(signatures, lookup_hashes):
+    """
+    LSH bucket keys, one uint64 per band of each signature, mixed with the row's lookup hash so
+    that only rows with the same lookups share buckets.
+    """
+    mix = np.asarray(lookup_hashes, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return signatures.view(np.uint64) ^ mix[:, None]
+
+
+def similarity(matching_fraction):
+    """Jaccard estimate from the fraction of equal signature bytes (8-bit values collide 1 in 256)."""
+    return (matching_fraction - 1 / 256) / (1 - 1 / 256)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index of insight content, in flat arrays.
+
+    Each insight is its 64 byte signature, its id and a hash of its lookup ids. The band keys
+    are kept sorted per band with the row each key belongs to, so a chunk of uploaded rows is
+    matched with a few vectorized searchsorted calls. Rows added one at a time sit in a
+    dictionary of buckets until there are MERGE_ROWS of them (or an eighth of the index) and are
+    then merged in. About 170 bytes per insight in all.
+    """
+
+    def __init__(self, threshold=NEAR_DUPLICATE_THRESHOLD, merge_rows=MERGE_ROWS):
+        self.threshold = threshold
+        self.merge_rows = merge_rows
+        self.signatures = np.zeros((0, NUM_PERMUTATIONS), dtype=np.uint8)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.lookup_hashes = np.zeros(0, dtype=np.uint32)
+        self._band_keys = np.zeros((BANDS, 0), dtype=np.uint64)
+        self._band_rows = np.zeros((BANDS, 0), dtype=np.int32)
+        self._pending = []
+        self._pending_buckets = collections.defaultdict(list)
+        self.max_insight_id = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids) + len(self._pending)
+
+    def extend(self, signatures, ids, lookup_hashes):
+        """Adds rows in bulk, re-sorting the band arrays once."""
+        self.signatures = np.concatenate([self.signatures, signatures])
+        self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+        self.lookup_hashes = np.concatenate([self.lookup_hashes, np.asarray(lookup_hashes, dtype=np.uint32)])
+        self.merge()
+
+    def _add_pending(self, signature, keys, row_id, row_lookup_hash):
+        position = len(self._pending)
+        self._pending.append((signature, row_id, row_lookup_hash))
+        for band, key in enumerate(keys.tolist()):
+            self._pending_buckets[(band, key)].append(position)
+
+    def _merge_if_due(self):
+        # Merging re-sorts every row, so the pending share may grow with the index
+        if len(self._pending) >= max(self.merge_rows, len(self.ids) // 8):
+            self.merge()
+
+    def merge(self):
+        """Moves the pending rows into the sorted band arrays."""
+        if self._pending:
+            signatures, ids, lookup_hashes = zip(*self._pending)
+            self.signatures = np.concatenate([self.signatures, np.stack(signatures)])
+            self.ids = np.concatenate([self.ids, np.asarray(ids, dtype=np.int64)])
+            self.lookup_hashes = np.concatenate([self.lookup_hashes, np.asarray(lookup_hashes, dtype=np.uint32)])
+        keys = band_keys(self.signatures, self.lookup_hashes)
+        order = np.argsort(keys, axis=0, kind="stable")
+        self._band_keys = np.take_along_axis(keys, order, axis=0).T.copy()
+        self._band_rows = order.T.astype(np.int32)
+        self._pending = []
+        self._pending_buckets = collections.defaultdict(list)
+
+    def match(self, signatures, lookup_hashes, add_ids=None):
+        """
+        Finds the most similar indexed row at or above the threshold for each signature.
+
+        Args:
+            signatures: Array of signature rows.
+            lookup_hashes: lookup_hash of each row; only rows with the same lookups match.
+            add_ids: If given, every row without a match is added under its id right after it
+                is checked, so later rows of the same call are compared with it.
+        Returns:
+            list: (id, similarity) or None per row.
+        """
+        results = []
+        keys = band_keys(signatures, lookup_hashes)
+        merged = self._match_merged(signatures, keys, lookup_hashes)
+        for row in range(len(signatures)):
+            best = merged.get(row)
+            pending = self._match_pending(signatures[row], keys[row], lookup_hashes[row])
+            if pending is not None and (best is None or pending[1] > best[1]):
+                best = pending
+            results.append(best)
+            if add_ids is not None and best is None:
+                self._add_pending(signatures[row], keys[row], add_ids[row], lookup_hashes[row])
+        self._merge_if_due()
+        return results
+
+    def _match_merged(self, signatures, keys, lookup_hashes):
+        if not len(self.ids) or not len(signatures):
+            return {}
+        query_rows = []
+        indexed_rows = []
+        for band in range(BANDS):
+            starts = np.searchsorted(self._band_keys[band], keys[:, band], side="left")
+            counts = np.minimum(np.searchsorted(self._band_keys[band], keys[:, band], side="right") - starts,
+                                MAX_BUCKET_CANDIDATES)
+            hits = np.flatnonzero(counts)
+            if not len(hits):
+                continue
+            repeated = np.repeat(hits, counts[hits])
+            within = np.arange(len(repeated)) - np.repeat(np.cumsum(counts[hits]) - counts[hits], counts[hits])
+            query_rows.append(repeated)
+            indexed_rows.append(self._band_rows[band][starts[repeated] + within])
+        if not query_rows:
+            return {}
+
+        # A pair sharing several buckets is compared once
+        pairs = np.unique(np.concatenate(query_rows) * len(self.ids) + np.concatenate(indexed_rows))
+        query, indexed = np.divmod(pairs, len(self.ids))
+        # Bucket keys carry the lookup hash, so this only catches key collisions
+        same_lookups = self.lookup_hashes[indexed] == np.asarray(lookup_hashes, dtype=np.uint32)[query]
+        query, indexed = query[same_lookups], indexed[same_lookups]
+        scores = similarity((self.signatures[indexed] == signatures[query]).mean(axis=1))
+        close = scores >= self.threshold
+        query, indexed, scores = query[close], indexed[close], scores[close]
+        # Best match per query row
+        order = np.lexsort((-scores, query))
+        _, first = np.unique(query[order], return_index=True)
+        best = order[first]
+        return {int(row): (int(self.ids[match]), float(score))
+                for row, match, score in zip(query[best], indexed[best], scores[best])}
+
+    def _match_pending(self, signature, keys, row_lookup_hash):
+        candidates = set()
+        for band, key in enumerate(keys.tolist()):
+            candidates.update(self._pending_buckets.get((band, key), ())[:MAX_BUCKET_CANDIDATES])
+        best = None
+        for position in candidates:
+            pending_signature, row_id, pending_lookup_hash = self._pending[position]
+            if pending_lookup_hash != row_lookup_hash:
+                continue
+            score = float(similarity((pending_signature == signature).mean()))
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (int(row_id), score)
+        return best
+
+    def sync(self, conn, fetch_rows=FETCH_ROWS):
+        """Adds the insights above the highest indexed id. Call with lock held."""
+        added = 0
+        chunks = []
+        with span("dedup.index_sync") as sync:
+            cursor = conn.cursor()
+            after_id = self.max_insight_id
+            while True:
+                cursor.execute(ROWS_QUERY, fetch_rows, after_id)
+                rows = cursor.fetchall()
+                if not rows:
+                    break
+                hashes, counts = shingles([row[1] for row in rows])
+                kept = [row for row, count in zip(rows, counts) if count]
+                if kept:
+                    chunks.append((signatures(hashes, counts[counts > 0]), [row[0] for row in kept],
+                                   [lookup_hash(row[2:]) for row in kept]))
+                added += len(rows)
+                after_id = rows[-1][0]
+                if len(rows) < fetch_rows:
+                    break
+            if chunks:
+                self.extend(np.concatenate([chunk[0] for chunk in chunks]),
+                            [insight_id for chunk in chunks for insight_id in chunk[1]],
+                            [value for chunk in chunks for value in chunk[2]])
+            self.max_insight_id = after_id
+            sync.rows = added
+        return added
+
+    def stats(self):
+        return {
+            "insights": len(self),
+            "pending": len(self._pending),
+            "bytes": int(self.signatures.nbytes + self.ids.nbytes + self.lookup_hashes.nbytes
+                         + self._band_keys.nbytes + self._band_rows.nbytes),
+            "max_insight_id": self.max_insight_id,
+        }
+
+
+class UploadDeduplicator:
+    """
+    Duplicate checks for one upload, applied while ingest_rows streams through it.
+
+    check_row runs for every valid row: it computes the row's content hash and skips exact
+    repeats of an earlier row of the upload. filter_chunk runs on each chunk before it is
+    staged and skips near duplicates of stored insights (through the worker's
+    NearDuplicateIndex) and of earlier rows. Exact duplicates of stored insights are found by
+    the database probe in ingest_rows and reported through record.
+    """
+
+    def __init__(self, exact=EXACT_DEDUP_ENABLED, near_index=None):
+        self.exact = exact
+        self.near_index = near_index
+        # Line numbers stand in for ids among the upload's own rows
+        self._upload_index = NearDuplicateIndex(near_index.threshold) if near_index is not None else None
+        self._seen = {}
+        self.count = 0
+        self.by_kind = collections.Counter()
+        self.details = []
+
+    def record(self, line_number, kind, insight_id=None, first_line=None, score=None):
+        self.count += 1
+        self.by_kind[kind] += 1
+        if len(self.details) < MAX_REPORTED_DUPLICATES:
+            detail = {"line": line_number, "kind": kind}
+            if insight_id is not None:
+                detail["insight_id"] = insight_id
+            if first_line is not None:
+                detail["first_line"] = first_line
+            if score is not None:
+                detail["similarity"] = round(score, 3)
+            self.details.append(detail)
+
+    def check_row(self, line_number, values):
+        """
+        Appends the content hash to a validated row (lookup ids, created_at, content).
+
+        Returns:
+            bool: True if the row repeats an earlier row of the upload and is skipped.
+        """
+        values.append(content_hash(values[-1]))
+        return self.check_hashed_row(line_number, values)
+
+    def check_hashed_row(self, line_number, values):
+        """check_row for a row that already ends with its content hash (hashed by a parse worker)."""
+        if not self.exact:
+            return False
+        first_line = self._seen.setdefault(duplicate_key(values[-1], values[:len(LOOKUP_COLUMNS)]), line_number)
+        if first_line != line_number:
+            self.record(line_number, "exact", first_line=first_line)
+            return True
+        return False
+
+    def filter_chunk(self, batch):
+        """Drops near duplicates from a chunk of staged rows ([line, lookup ids..., created_at, content, hash])."""
+        if self.near_index is None or not batch:
+            return batch
+        with span("dedup.near", rows=len(batch)):
+            hashes, counts = shingles([row[-2] for row in batch])
+            positions = np.flatnonzero(counts).tolist()
+            if not positions:
+                return batch
+            chunk_signatures = signatures(hashes, counts[counts > 0])
+            lookup_hashes = [lookup_hash(batch[position][1:1 + len(LOOKUP_COLUMNS)]) for position in positions]
+            with self.near_index.lock:
+                stored = self.near_index.match(chunk_signatures, lookup_hashes)
+            # Rows matching a stored insight are not added to the upload index; their duplicates
+            # match the stored insight as well
+            fresh = [row for row, match in enumerate(stored) if match is None]
+            earlier = self._upload_index.match(
+                chunk_signatures[fresh], [lookup_hashes[row] for row in fresh],
+                add_ids=[batch[positions[row]][0] for row in fresh],
+            )
+            skipped = set()
+            for row, match in enumerate(stored):
+                if match is not None:
+                    skipped.add(positions[row])
+                    self.record(batch[positions[row]][0], "near", insight_id=match[0], score=match[1])
+            for row, match in zip(fresh, earlier):
+                if match is not None:
+                    skipped.add(positions[row])
+                    self.record(batch[positions[row]][0], "near", first_line=match[0], score=match[1])
+        return [row for position, row in enumerate(batch) if position not in skipped]
+
+    def report(self):
+        return {
+            "duplicates": self.count,
+            "duplicates_by_kind": dict(self.by_kind),
+            "duplicate_rows": sorted(self.details, key=lambda detail: detail["line"]),
+            "duplicates_truncated": self.count > len(self.details),
+        }
+
+
+_near_index = NearDuplicateIndex() if NEAR_DUPLICATE_THRESHOLD > 0 else None
+
+
+def synced_near_duplicate_index(conn):
+    """
+    The worker's NearDuplicateIndex caught up with Insights, or None when near-duplicate
+    detection is off. The first call in a worker reads and hashes every insight.
+    """
+    if _near_index is None:
+        return None
+    with _near_index.lock:
+        added = _near_index.sync(conn)
+    if added:
+        logging.info(f"Near-duplicate index: added {added} insights, {_near_index.stats()}.")
+    return _near_index
@@ -0,0 +1,341 @@
+import codecs
+import csv
+import datetime
+import logging
+import re
+import time
+from db_helpers.dimensionCache import INSIGHT_DIMENSIONS, get_dimension_cache, normalize_name
+from db_helpers.ingestDedup import UploadDeduplicator
+from db_helpers.insightRollups import CREATE_INSIGHT_DELTA_SQL, ROLLUP_COLUMNS, apply_insight_delta, month_of
+from db_helpers.instrumentation import current_timer, span
+
+EXPECTED_HEADERS = [
+    "content", "created_at", "insight_type", "data_source", "audience",
+    "domain", "confidence_level", "timeliness",
+    "alignment_goal", "value_priority"
+]
+
+TIMESTAMP_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+# Zero-padded values of TIMESTAMP_FORMATS, which datetime.fromisoformat parses far faster than strptime
+ISO_TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}:\d{2}| \d{2}:\d{2})?", re.ASCII)
+
+# Rows sent to the database per round trip
+CHUNK_SIZE = 5000
+
+# Upper bound on reject details returned to the caller; the count is always exact
+MAX_REPORTED_REJECTS = 1000
+
+LOOKUP_COLUMNS = [fact_column for _, _, fact_column in INSIGHT_DIMENSIONS.values()]
+FACT_COLUMNS = LOOKUP_COLUMNS + ["created_at", "content", "content_hash"]
+
+# Rows are validated and resolved in Python, bulk copied into a session temp table,
+# then moved into Insights with a single set-based INSERT ... SELECT per chunk so the
+# generated ids come back in one round trip.
+CREATE_STAGING_SQL = """
+IF OBJECT_ID('tempdb..#InsightsStaging') IS NOT NULL DROP TABLE #InsightsStaging;
+CREATE TABLE #InsightsStaging (
+    row_num INT NOT NULL,
+    insight_type_id INT NOT NULL,
+    data_source_id INT NOT NULL,
+    audience_id INT NOT NULL,
+    domain_id INT NOT NULL,
+    confidence_level_id INT NOT NULL,
+    timeliness_id INT NOT NULL,
+    alignment_goal_id INT NOT NULL,
+    value_priority_id INT NOT NULL,
+    created_at DATETIME NULL,
+    content NVARCHAR(MAX) NOT NULL,
+    content_hash BINARY(16) NOT NULL,
+    duplicate_of INT NULL
+)
+"""
+
+STAGING_INSERT_SQL = f"""
+INSERT INTO #InsightsStaging (row_num, {", ".join(FACT_COLUMNS)})
+VALUES ({", ".join("?" * (len(FACT_COLUMNS) + 1))})
+"""
+
+# Marks staged rows whose content hash and lookup ids match a stored insight. The range locks
+# (UPDLOCK, HOLDLOCK) on the hash index are held until the upload commits, so a concurrent
+# upload of the same rows waits here instead of inserting them a second time.
+MARK_DUPLICATES_SQL = f"""
+SET NOCOUNT ON;
+UPDATE s SET duplicate_of = d.id
+FROM #InsightsStaging s
+CROSS APPLY (
+    SELECT TOP (1) i.id
+    FROM Insights i WITH (UPDLOCK, HOLDLOCK)
+    WHERE i.content_hash = s.content_hash
+      AND {" AND ".join(f"i.{column} = s.{column}" for column in LOOKUP_COLUMNS)}
+    ORDER BY i.id
+) d;
+SELECT row_num, duplicate_of FROM #InsightsStaging WHERE duplicate_of IS NOT NULL;
+"""
+
+# The chunk's rollup counts (see insightRollups) are collected with the same @now the rows get
+# for a missing created_at
+MOVE_STAGING_SQL = f"""
+SET NOCOUNT ON;
+DECLARE @now DATETIME = GETDATE();
+INSERT INTO #InsightRollupDelta ({", ".join(ROLLUP_COLUMNS)}, month, insight_count)
+SELECT {", ".join(ROLLUP_COLUMNS)}, {month_of("COALESCE(created_at, @now)")}, COUNT_BIG(*)
+FROM #InsightsStaging
+WHERE duplicate_of IS NULL
+GROUP BY {", ".join(ROLLUP_COLUMNS)}, {month_of("COALESCE(created_at, @now)")};
+INSERT INTO Insights ({", ".join(FACT_COLUMNS)})
+OUTPUT INSERTED.id
+SELECT {", ".join(LOOKUP_COLUMNS)}, COALESCE(created_at, @now), content, content_hash
+FROM #InsightsStaging
+WHERE duplicate_of IS NULL
+ORDER BY row_num;
+"""
+
+
+class CsvHeaderError(ValueError):
+    """Raised when the uploaded CSV does not carry the expected header row."""
+
+
+def name_lookups(conn, force=False):
+    """
+    Returns {CSV column: {normalized lookup name: id}} from the process-wide dimension cache.
+    """
+    tables = get_dimension_cache().snapshot(conn, force=force)
+    return {column: tables[column].by_name for column in INSIGHT_DIMENSIONS}
+
+
+def parse_created_at(value):
+    """
+    Parses a CSV created_at value.
+
+    Returns:
+        datetime.datetime or None: None when the value is blank (the database default applies).
+    Raises:
+        ValueError: If the value does not match any supported timestamp format.
+    """
+    value = value.strip()
+    if not value:
+        return None
+    if ISO_TIMESTAMP.fullmatch(value):
+        try:
+            return datetime.datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    for timestamp_format in TIMESTAMP_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, timestamp_format)
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid created_at '{value}'")
+
+
+def open_csv(stream):
+    """
+    Wraps a binary upload stream in an incrementally decoding CSV reader and validates the header.
+
+    Args:
+        stream: A binary file-like object or iterable of byte lines.
+    Returns:
+        tuple: (csv reader positioned after the header, {column name: position})
+    Raises:
+        CsvHeaderError: If the header row is missing or does not contain exactly the expected columns.
+    """
+    reader = csv.reader(codecs.iterdecode(stream, "utf-8-sig"))
+    return reader, header_positions(next(reader, []))
+
+
+def header_positions(header_row):
+    """
+    Maps the expected column names to their positions in an upload's header row, so the
+    columns may come in any order.
+
+    Raises:
+        CsvHeaderError: If the header row does not contain exactly the expected columns.
+    """
+    headers = [header.strip() for header in header_row]
+    if sorted(headers) != sorted(EXPECTED_HEADERS):
+        raise CsvHeaderError(f"Invalid CSV headers. Expected: {EXPECTED_HEADERS}, Received: {headers}")
+    return {header: position for position, header in enumerate(headers)}
+
+
+def validate_row(row, header_index, lookups):
+    """
+    Resolves one CSV row into Insights column values.
+
+    Returns:
+        tuple: (values in FACT_COLUMNS order or None, list of error messages)
+    """
+    if len(row) != len(header_index):
+        return None, [f"Expected {len(header_index)} columns, found {len(row)}"]
+
+    errors = []
+    values = []
+    for column in INSIGHT_DIMENSIONS:
+        name = row[header_index[column]]
+        lookup_id = lookups[column].get(normalize_name(name))
+        if lookup_id is None:
+            errors.append(f"Unknown {column} '{name}'")
+        values.append(lookup_id)
+
+    try:
+        values.append(parse_created_at(row[header_index["created_at"]]))
+    except ValueError as e:
+        errors.append(str(e))
+
+    content = row[header_index["content"]]
+    if not content.strip():
+        errors.append("Missing content")
+    values.append(content)
+
+    return (None if errors else values), errors
+
+
+def _flush(cursor, batch, deduplicator):
+    """
+    Drops near duplicates from one chunk, bulk copies the rest into the staging table, skips
+    exact duplicates of stored insights and moves the remainder into Insights. Returns the new ids.
+    """
+    batch = deduplicator.filter_chunk(batch)
+    if not batch:
+        return []
+    with span("db.stage", rows=len(batch)):
+        cursor.executemany(STAGING_INSERT_SQL, batch)
+    if deduplicator.exact:
+        with span("db.dedup", rows=len(batch)) as probe:
+            cursor.execute(MARK_DUPLICATES_SQL)
+            duplicates = cursor.fetchall()
+            probe.rows = len(duplicates)
+        for line_number, insight_id in duplicates:
+            deduplicator.record(line_number, "exact", insight_id=insight_id)
+    with span("db.move", rows=len(batch)):
+        cursor.execute(MOVE_STAGING_SQL)
+        insight_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("TRUNCATE TABLE #InsightsStaging")
+    return insight_ids
+
+
+class InsightWriter:
+    """
+    Database side of an upload: validated rows are checked for duplicates, staged in chunks and
+    moved into Insights, all in one transaction that finish() commits.
+
+    Args:
+        conn: An open pyodbc connection, used by this writer only until finish().
+        chunk_size (int): Rows per bulk round trip.
+        deduplicator (UploadDeduplicator): Duplicate checks to apply; defaults to exact
+            duplicate detection as configured by IngestExactDedup.
+    """
+
+    def __init__(self, conn, chunk_size=CHUNK_SIZE, deduplicator=None):
+        self.conn = conn
+        self.chunk_size = chunk_size
+        self.deduplicator = deduplicator or UploadDeduplicator()
+        self.cursor = conn.cursor()
+        self.cursor.fast_executemany = True
+        self.cursor.execute(CREATE_STAGING_SQL)
+        self.cursor.execute(CREATE_INSIGHT_DELTA_SQL)
+        self.batch = []
+        self.insight_ids = []
+
+    def add(self, line_number, values, hashed=False):
+        """
+        Queues one validated row (values in FACT_COLUMNS order, plus the content hash when
+        hashed). Returns True once a full chunk is waiting for flush().
+        """
+        check = self.deduplicator.check_hashed_row if hashed else self.deduplicator.check_row
+        if check(line_number, values):
+            return False
+        self.batch.append([line_number] + values)
+        return len(self.batch) >= self.chunk_size
+
+    def flush(self):
+        if self.batch:
+            self.insight_ids.extend(_flush(self.cursor, self.batch, self.deduplicator))
+            logging.debug(f"Inserted chunk of {len(self.batch)} rows ({len(self.insight_ids)} total).")
+            self.batch = []
+
+    def finish(self):
+        """Writes the last chunk, updates the rollups and commits. Returns the duplicate report."""
+        self.flush()
+        apply_insight_delta(self.cursor)
+        self.cursor.execute("DROP TABLE #InsightsStaging")
+        self.cursor.execute("DROP TABLE #InsightRollupDelta")
+        with span("db.commit"):
+            self.conn.commit()
+        return self.deduplicator.report()
+
+
+def ingest_result(insight_ids, rejected_count, rejects, duplicates):
+    """The summary ingest functions return (and the upload response is built from)."""
+    logging.info(f"Inserted {len(insight_ids)} rows, rejected {rejected_count} rows, "
+                 f"skipped {duplicates['duplicates']} duplicates.")
+    return {
+        "inserted": len(insight_ids),
+        "rejected": rejected_count,
+        "rejects": rejects,
+        "rejects_truncated": rejected_count > len(rejects),
+        **duplicates,
+        "insight_ids": insight_ids,
+    }
+
+
+def ingest_rows(conn, reader, header_index, chunk_size=CHUNK_SIZE, deduplicator=None):
+    """
+    Validates and bulk inserts CSV rows into the Insights table in chunks.
+
+    Lookup names are resolved against the process-wide dimension cache, so no per-row
+    subqueries are issued. The first unknown name in an upload forces one cache reload in
+    case the lookup row was added after the cache was filled. Rows that fail validation are skipped and
+    reported back instead of aborting the upload. Duplicates (see ingestDedup) are skipped
+    and reported as well. The analytics rollups (see insightRollups) are updated in the same
+    transaction.
+
+    Args:
+        conn: An open pyodbc connection. The caller owns it; this function commits on success.
+        reader: CSV reader positioned after the header row (see open_csv).
+        header_index (dict): Column name -> position in each row.
+        chunk_size (int): Rows per bulk round trip.
+        deduplicator (UploadDeduplicator): Duplicate checks to apply; defaults to exact
+            duplicate detection as configured by IngestExactDedup.
+    Returns:
+        dict: inserted/rejected/duplicate counts, reject and duplicate details and the new
+        insight ids.
+    """
+    lookups = name_lookups(conn)
+    refreshed = False
+    writer = InsightWriter(conn, chunk_size, deduplicator)
+
+    rejects = []
+    rejected_count = 0
+    # Parsing and validation are timed per chunk rather than per row
+    timer = current_timer()
+    parse_started = time.perf_counter()
+    parsed = 0
+
+    for row in reader:
+        if not row:
+            continue
+        line_number = reader.line_num
+        values, errors = validate_row(row, header_index, lookups)
+        if errors and not refreshed and any(error.startswith("Unknown ") for error in errors):
+            lookups = name_lookups(conn, force=True)
+            refreshed = True
+            values, errors = validate_row(row, header_index, lookups)
+        if errors:
+            rejected_count += 1
+            if len(rejects) < MAX_REPORTED_REJECTS:
+                rejects.append({"line": line_number, "errors": errors})
+            continue
+
+        parsed += 1
+        if writer.add(line_number, values):
+            if timer is not None:
+                timer.add("parse", time.perf_counter() - parse_started, parsed)
+            writer.flush()
+            parsed = 0
+            parse_started = time.perf_counter()
+
+    if timer is not None:
+        timer.add("parse", time.perf_counter() - parse_started, parsed)
+    duplicates = writer.finish()
+    return ingest_result(writer.insight_ids, rejected_count, rejects, duplicates)
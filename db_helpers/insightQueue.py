@@ -0,0 +1,473 @@
+import abc
+import collections
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Queue backend for new insight ids: "sqlite", "memory" or "none" (ingest does not enqueue and
+# new insights are scored by the missing_recommendation backfill). Off unless configured: the
+# memory backend loses its messages on restart and is not shared between instances, so it is
+# meant for local runs, benchmarks and tests.
+QUEUE_BACKEND = os.getenv("InsightQueueBackend", "none").lower()
+QUEUE_PATH = os.getenv("InsightQueuePath", os.path.join(tempfile.gettempdir(), "eureka_insight_queue.sqlite3"))
+# Backpressure: producers wait, then fail, once this many messages are waiting or in flight
+QUEUE_MAX_DEPTH = int(os.getenv("InsightQueueMaxDepth", "100000"))
+QUEUE_PUT_TIMEOUT_SECONDS = float(os.getenv("InsightQueuePutTimeoutSeconds", "5"))
+# Deliveries before a message is dead-lettered
+QUEUE_MAX_ATTEMPTS = int(os.getenv("InsightQueueMaxAttempts", "5"))
+# A delivered message that is neither acked nor nacked within this time is delivered again
+QUEUE_VISIBILITY_SECONDS = float(os.getenv("InsightQueueVisibilitySeconds", "300"))
+# A nacked message becomes visible again after attempts * this delay
+QUEUE_RETRY_BACKOFF_SECONDS = float(os.getenv("InsightQueueRetryBackoffSeconds", "5"))
+
+# Window over which consumer throughput is reported
+THROUGHPUT_WINDOW_SECONDS = 60
+# Dead letters kept by the in-memory backend
+MAX_MEMORY_DEAD_LETTERS = 10000
+
+
+class QueueFullError(Exception):
+    """Raised when a producer could not enqueue within its timeout; enqueued says how many made it."""
+
+    def __init__(self, message, enqueued=0):
+        super().__init__(message)
+        self.enqueued = enqueued
+
+
+class QueueMessage:
+    """
+    One delivery of an insight id; attempts counts deliveries including this one. ack and nack
+    only settle the message while this is still its latest delivery.
+    """
+
+    __slots__ = ("id", "insight_id", "attempts", "enqueued_at")
+
+    def __init__(self, message_id, insight_id, attempts, enqueued_at):
+        self.id = message_id
+        self.insight_id = insight_id
+        self.attempts = attempts
+        self.enqueued_at = enqueued_at
+
+
+class InsightQueue(abc.ABC):
+    """
+    At-least-once queue of insight ids waiting for a recommendation.
+
+    Consumers take micro-batches with get_batch and settle each message with ack (done) or nack
+    (retry after a backoff). A message delivered max_attempts times without an ack is moved to
+    the dead-letter store instead of being delivered again. A consumer whose lease expired and
+    whose message was delivered again cannot settle it any more; the later delivery owns it.
+    """
+
+    def __init__(self, max_depth=QUEUE_MAX_DEPTH, max_attempts=QUEUE_MAX_ATTEMPTS,
+                 visibility_seconds=QUEUE_VISIBILITY_SECONDS, retry_backoff_seconds=QUEUE_RETRY_BACKOFF_SECONDS):
+        self.max_depth = max_depth
+        self.max_attempts = max_attempts
+        self.visibility_seconds = visibility_seconds
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self._stats_lock = threading.Lock()
+        self._acked_times = collections.deque()
+        self.enqueued = 0
+        self.acked = 0
+        self.retried = 0
+        self.dead_lettered = 0
+        self.put_waits = 0
+
+    # Backend interface
+
+    @abc.abstractmethod
+    def put_many(self, insight_ids, timeout=QUEUE_PUT_TIMEOUT_SECONDS):
+        """
+        Enqueues insight ids, waiting up to timeout for room when the queue is full.
+
+        Returns:
+            int: Number of ids enqueued.
+        Raises:
+            QueueFullError: If the queue stayed full for the whole timeout.
+        """
+
+    @abc.abstractmethod
+    def get_batch(self, max_items, max_wait_seconds):
+        """
+        Takes up to max_items messages, waiting up to max_wait_seconds for the batch to fill.
+
+        Returns:
+            list: QueueMessage objects, possibly empty.
+        """
+
+    @abc.abstractmethod
+    def ack(self, messages):
+        """Removes delivered messages for good."""
+
+    @abc.abstractmethod
+    def nack(self, messages, error=None):
+        """Makes delivered messages visible again after a backoff, or dead-letters them."""
+
+    @abc.abstractmethod
+    def depth(self):
+        """Returns (ready or delayed, in flight, dead-lettered) message counts."""
+
+    @abc.abstractmethod
+    def oldest_enqueued_at(self):
+        """Returns the enqueue time of the oldest unsettled message, or None."""
+
+    # Metrics shared by the backends
+
+    def _record(self, enqueued=0, acked=0, retried=0, dead_lettered=0, put_waits=0):
+        with self._stats_lock:
+            self.enqueued += enqueued
+            self.retried += retried
+            self.dead_lettered += dead_lettered
+            self.put_waits += put_waits
+            if acked:
+                self.acked += acked
+                self._acked_times.append((time.monotonic(), acked))
+                self._trim_acked()
+
+    def _trim_acked(self):
+        horizon = time.monotonic() - THROUGHPUT_WINDOW_SECONDS
+        while self._acked_times and self._acked_times[0][0] < horizon:
+            self._acked_times.popleft()
+
+    def metrics(self):
+        """Returns depth, lag (age of the oldest unsettled message) and throughput counters."""
+        waiting, in_flight, dead = self.depth()
+        oldest = self.oldest_enqueued_at()
+        with self._stats_lock:
+            self._trim_acked()
+            recent = sum(count for _, count in self._acked_times)
+            return {
+                "backend": type(self).__name__,
+                "waiting": waiting,
+                "in_flight": in_flight,
+                "dead_letters": dead,
+                "lag_seconds": round(max(0.0, time.time() - oldest), 3) if oldest else 0.0,
+                "enqueued": self.enqueued,
+                "acked": self.acked,
+                "retried": self.retried,
+                "dead_lettered": self.dead_lettered,
+                "put_waits": self.put_waits,
+                "acked_per_second": round(recent / THROUGHPUT_WINDOW_SECONDS, 3),
+            }
+
+
+class MemoryInsightQueue(InsightQueue):
+    """
+    In-process queue. Shared by every function hosted in the same worker process and lost on
+    restart; use it locally or where ingest can be replayed through the missing_recommendation
+    backfill.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._condition = threading.Condition()
+        self._ready = collections.deque()
+        self._delayed = []  # heap of (visible_at monotonic, sequence, message)
+        self._in_flight = {}  # message id -> (lease deadline monotonic, latest delivery)
+        self._dead = collections.deque(maxlen=MAX_MEMORY_DEAD_LETTERS)
+        self._ids = itertools.count(1)
+
+    def _size(self):
+        return len(self._ready) + len(self._delayed) + len(self._in_flight)
+
+    def _promote(self):
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            self._ready.append(heapq.heappop(self._delayed)[2])
+        expired = [message_id for message_id, (deadline, _) in self._in_flight.items() if deadline <= now]
+        for message_id in expired:
+            self._ready.append(self._in_flight.pop(message_id)[1])
+
+    def put_many(self, insight_ids, timeout=QUEUE_PUT_TIMEOUT_SECONDS):
+        insight_ids = list(insight_ids)
+        deadline = time.monotonic() + timeout
+        enqueued = 0
+        waited = False
+        with self._condition:
+            while enqueued < len(insight_ids):
+                room = self.max_depth - self._size()
+                if room <= 0:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._record(enqueued=enqueued, put_waits=int(waited))
+                        raise QueueFullError(f"Insight queue is full ({self.max_depth} messages).", enqueued)
+                    waited = True
+                    self._condition.wait(remaining)
+                    continue
+                now = time.time()
+                for insight_id in insight_ids[enqueued:enqueued + room]:
+                    self._ready.append(QueueMessage(next(self._ids), int(insight_id), 0, now))
+                enqueued += min(room, len(insight_ids) - enqueued)
+                self._condition.notify_all()
+        self._record(enqueued=enqueued, put_waits=int(waited))
+        return enqueued
+
+    def get_batch(self, max_items, max_wait_seconds):
+        deadline = time.monotonic() + max_wait_seconds
+        batch = []
+        dead = 0
+        with self._condition:
+            self._promote()
+            while len(self._ready) < max_items:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Wake up for new messages, or for the next delayed retry to become visible
+                if self._delayed:
+                    remaining = min(remaining, max(0.0, self._delayed[0][0] - time.monotonic()))
+                self._condition.wait(remaining)
+                self._promote()
+
+            lease_deadline = time.monotonic() + self.visibility_seconds
+            while self._ready and len(batch) < max_items:
+                queued = self._ready.popleft()
+                # A new object per delivery, so the consumer of an expired lease keeps its attempts
+                message = QueueMessage(queued.id, queued.insight_id, queued.attempts + 1, queued.enqueued_at)
+                if message.attempts > self.max_attempts:
+                    self._dead.append((queued, "Lease expired too many times."))
+                    dead += 1
+                    continue
+                self._in_flight[message.id] = (lease_deadline, message)
+                batch.append(message)
+            if dead:
+                self._condition.notify_all()
+        self._record(dead_lettered=dead)
+        return batch
+
+    def _settle(self, message):
+        """Takes message out of flight if it is still the latest delivery; returns whether it was."""
+        leased = self._in_flight.get(message.id)
+        if leased is None or leased[1].attempts != message.attempts:
+            return False
+        del self._in_flight[message.id]
+        return True
+
+    def ack(self, messages):
+        with self._condition:
+            acked = sum(1 for message in messages if self._settle(message))
+            self._condition.notify_all()
+        self._record(acked=acked)
+
+    def nack(self, messages, error=None):
+        retried = dead = 0
+        with self._condition:
+            for message in messages:
+                if not self._settle(message):
+                    continue
+                if message.attempts >= self.max_attempts:
+                    self._dead.append((message, str(error) if error else None))
+                    dead += 1
+                else:
+                    visible_at = time.monotonic() + self.retry_backoff_seconds * message.attempts
+                    heapq.heappush(self._delayed, (visible_at, message.id, message))
+                    retried += 1
+            self._condition.notify_all()
+        self._record(retried=retried, dead_lettered=dead)
+
+    def dead_letters(self):
+        """Returns (insight_id, attempts, last error) for dead-lettered messages."""
+        with self._condition:
+            return [(message.insight_id, message.attempts, error) for message, error in self._dead]
+
+    def depth(self):
+        with self._condition:
+            return len(self._ready) + len(self._delayed), len(self._in_flight), len(self._dead)
+
+    def oldest_enqueued_at(self):
+        with self._condition:
+            times = [message.enqueued_at for message in self._ready]
+            times += [message.enqueued_at for _, _, message in self._delayed]
+            times += [message.enqueued_at for _, message in self._in_flight.values()]
+            return min(times) if times else None
+
+
+class SqliteInsightQueue(InsightQueue):
+    """
+    Durable queue in a local SQLite file, shared by every process on the host.
+
+    Claims run in BEGIN IMMEDIATE transactions, so concurrent consumers never receive the same
+    message while its lease is valid. Dead letters stay in the table with dead = 1.
+    """
+
+    POLL_SECONDS = 0.05
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS insight_queue (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        insight_id INTEGER NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        enqueued_at REAL NOT NULL,
+        visible_at REAL NOT NULL,
+        leased INTEGER NOT NULL DEFAULT 0,
+        dead INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS ix_insight_queue_ready ON insight_queue (dead, visible_at, id);
+    """
+
+    def __init__(self, path=QUEUE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def _unsettled(self):
+        return self._conn.execute("SELECT COUNT(*) FROM insight_queue WHERE dead = 0").fetchone()[0]
+
+    def put_many(self, insight_ids, timeout=QUEUE_PUT_TIMEOUT_SECONDS):
+        insight_ids = [int(insight_id) for insight_id in insight_ids]
+        deadline = time.monotonic() + timeout
+        enqueued = 0
+        waited = False
+        while enqueued < len(insight_ids):
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    room = self.max_depth - self._unsettled()
+                    chunk = insight_ids[enqueued:enqueued + max(room, 0)]
+                    now = time.time()
+                    self._conn.executemany(
+                        "INSERT INTO insight_queue (insight_id, enqueued_at, visible_at) VALUES (?, ?, ?)",
+                        [(insight_id, now, now) for insight_id in chunk]
+                    )
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            enqueued += len(chunk)
+            if enqueued < len(insight_ids):
+                if time.monotonic() >= deadline:
+                    self._record(enqueued=enqueued, put_waits=int(waited))
+                    raise QueueFullError(f"Insight queue is full ({self.max_depth} messages).", enqueued)
+                waited = True
+                time.sleep(self.POLL_SECONDS)
+        self._record(enqueued=enqueued, put_waits=int(waited))
+        return enqueued
+
+    def _visible(self):
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM insight_queue WHERE dead = 0 AND visible_at <= ?", (time.time(),)
+        ).fetchone()[0]
+
+    def get_batch(self, max_items, max_wait_seconds):
+        deadline = time.monotonic() + max_wait_seconds
+        while True:
+            with self._lock:
+                visible = self._visible()
+            if visible >= max_items or time.monotonic() >= deadline:
+                break
+            time.sleep(min(self.POLL_SECONDS, max(0.0, deadline - time.monotonic())))
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                rows = self._conn.execute(
+                    "SELECT id, insight_id, attempts, enqueued_at FROM insight_queue "
+                    "WHERE dead = 0 AND visible_at <= ? ORDER BY id LIMIT ?", (now, max_items)
+                ).fetchall()
+                # attempts counts deliveries, so a consumer that dies mid-batch still uses one up
+                expired = [row[0] for row in rows if row[2] >= self.max_attempts]
+                batch = [QueueMessage(row[0], row[1], row[2] + 1, row[3]) for row in rows if row[2] < self.max_attempts]
+                self._conn.executemany(
+                    "UPDATE insight_queue SET dead = 1, last_error = 'Lease expired too many times.' WHERE id = ?",
+                    [(message_id,) for message_id in expired]
+                )
+                self._conn.executemany(
+                    "UPDATE insight_queue SET attempts = attempts + 1, leased = 1, visible_at = ? WHERE id = ?",
+                    [(now + self.visibility_seconds, message.id) for message in batch]
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._record(dead_lettered=len(expired))
+        return batch
+
+    # Settlement only matches the latest delivery of a message: once its lease expired and it was
+    # delivered again, attempts has moved on and a late ack or nack of the old delivery is a no-op
+    SETTLE_WHERE = "id = ? AND attempts = ? AND leased = 1 AND dead = 0"
+
+    def ack(self, messages):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            acked = self._conn.executemany(
+                f"DELETE FROM insight_queue WHERE {self.SETTLE_WHERE}",
+                [(message.id, message.attempts) for message in messages]
+            ).rowcount
+            self._conn.execute("COMMIT")
+        self._record(acked=acked)
+
+    def nack(self, messages, error=None):
+        error = str(error) if error else None
+        dead = [message for message in messages if message.attempts >= self.max_attempts]
+        retry = [message for message in messages if message.attempts < self.max_attempts]
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            dead_lettered = self._conn.executemany(
+                f"UPDATE insight_queue SET dead = 1, last_error = ? WHERE {self.SETTLE_WHERE}",
+                [(error, message.id, message.attempts) for message in dead]
+            ).rowcount
+            retried = self._conn.executemany(
+                f"UPDATE insight_queue SET leased = 0, visible_at = ?, last_error = ? WHERE {self.SETTLE_WHERE}",
+                [(now + self.retry_backoff_seconds * message.attempts, error, message.id, message.attempts)
+                 for message in retry]
+            ).rowcount
+            self._conn.execute("COMMIT")
+        self._record(retried=retried, dead_lettered=dead_lettered)
+
+    def dead_letters(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT insight_id, attempts, last_error FROM insight_queue WHERE dead = 1 ORDER BY id"
+            ).fetchall()
+
+    def depth(self):
+        with self._lock:
+            now = time.time()
+            waiting, in_flight, dead = self._conn.execute("""
+                SELECT COALESCE(SUM(dead = 0 AND NOT (leased = 1 AND visible_at > ?)), 0),
+                       COALESCE(SUM(dead = 0 AND leased = 1 AND visible_at > ?), 0),
+                       COALESCE(SUM(dead = 1), 0)
+                FROM insight_queue
+            """, (now, now)).fetchone()
+            return waiting, in_flight, dead
+
+    def oldest_enqueued_at(self):
+        with self._lock:
+            return self._conn.execute("SELECT MIN(enqueued_at) FROM insight_queue WHERE dead = 0").fetchone()[0]
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_insight_queue():
+    """
+    Returns the process-wide queue for InsightQueueBackend, or None when queueing is disabled.
+    """
+    global _queue
+    if QUEUE_BACKEND in ("none", "off", ""):
+        return None
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                if QUEUE_BACKEND == "sqlite":
+                    _queue = SqliteInsightQueue()
+                elif QUEUE_BACKEND == "memory":
+                    logging.warning("InsightQueueBackend is memory: queued insights are lost on restart and "
+                                    "are only scored by this instance.")
+                    _queue = MemoryInsightQueue()
+                else:
+                    raise ValueError(f"Unknown InsightQueueBackend '{QUEUE_BACKEND}'.")
+                logging.info(f"Insight queue backend: {type(_queue).__name__}.")
+    return _queue
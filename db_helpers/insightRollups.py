@@ -0,0 +1,274 @@
+import collections
+import datetime
+import logging
+
+from db_helpers.dimensionCache import INSIGHT_DIMENSIONS
+from db_helpers.instrumentation import span
+
+# Insights are counted per combination of these lookups and the month of created_at
+ROLLUP_DIMENSIONS = ("domain", "audience", "confidence_level", "value_priority")
+ROLLUP_COLUMNS = [INSIGHT_DIMENSIONS[key][2] for key in ROLLUP_DIMENSIONS]
+GROUP_KEYS = ROLLUP_DIMENSIONS + ("month",)
+
+MONTH_FORMAT = "%Y-%m"
+
+
+def month_of(expression):
+    """T-SQL for the first day of the month of a datetime expression, the month key of the rollups."""
+    return f"DATEFROMPARTS(YEAR({expression}), MONTH({expression}), 1)"
+
+
+# Lock order, so a rebuild cannot deadlock with writers: ingest inserts into Insights and adds to
+# InsightRollups at the end of the upload; recommendation writes insert into Recommendations and
+# then add to RecommendationStatusRollups; a rebuild reads both fact tables before it takes the
+# rollup tables.
+
+# Filled by ingest with the counts of every chunk it moves, and added to InsightRollups once just
+# before the upload commits, so the rollup rows are locked only at the end of the upload
+CREATE_INSIGHT_DELTA_SQL = f"""
+IF OBJECT_ID('tempdb..#InsightRollupDelta') IS NOT NULL DROP TABLE #InsightRollupDelta;
+CREATE TABLE #InsightRollupDelta (
+    {", ".join(f"{column} INT NOT NULL" for column in ROLLUP_COLUMNS)},
+    month DATE NULL,
+    insight_count BIGINT NOT NULL
+)
+"""
+
+APPLY_INSIGHT_DELTA_SQL = f"""
+MERGE InsightRollups WITH (HOLDLOCK) AS r
+USING (
+    SELECT {", ".join(ROLLUP_COLUMNS)}, month, SUM(insight_count) AS insight_count
+    FROM #InsightRollupDelta
+    GROUP BY {", ".join(ROLLUP_COLUMNS)}, month
+) d
+ON {" AND ".join(f"r.{column} = d.{column}" for column in ROLLUP_COLUMNS)}
+   AND (r.month = d.month OR (r.month IS NULL AND d.month IS NULL))
+WHEN MATCHED THEN
+    UPDATE SET insight_count = r.insight_count + d.insight_count
+WHEN NOT MATCHED THEN
+    INSERT ({", ".join(ROLLUP_COLUMNS)}, month, insight_count)
+    VALUES ({", ".join(f"d.{column}" for column in ROLLUP_COLUMNS)}, d.month, d.insight_count);
+"""
+
+ADD_RECOMMENDATION_STATUS_SQL = """
+MERGE RecommendationStatusRollups WITH (HOLDLOCK) AS r
+USING (SELECT CAST(? AS NVARCHAR(255)) AS status, CAST(? AS BIGINT) AS recommendation_count) d
+ON r.status = d.status
+WHEN MATCHED THEN
+    UPDATE SET recommendation_count = r.recommendation_count + d.recommendation_count
+WHEN NOT MATCHED THEN
+    INSERT (status, recommendation_count) VALUES (d.status, d.recommendation_count);
+"""
+
+
+def insight_counts_query(hints=""):
+    """The full GROUP BY over Insights the rollups stand for."""
+    return f"""
+SELECT {", ".join(ROLLUP_COLUMNS)}, month, COUNT_BIG(*)
+FROM (
+    SELECT {", ".join(ROLLUP_COLUMNS)}, {month_of("created_at")} AS month
+    FROM Insights{hints}
+) i
+GROUP BY {", ".join(ROLLUP_COLUMNS)}, month
+"""
+
+
+def status_counts_query(hints=""):
+    return f"SELECT status, COUNT_BIG(*) FROM Recommendations{hints} GROUP BY status"
+
+
+# The shared table locks keep writers out until the rebuild commits, so no increment is lost
+# between the counts and the swap
+REBUILD_SQL = f"""
+SET NOCOUNT ON;
+SELECT * INTO #InsightCounts FROM ({insight_counts_query(" WITH (TABLOCK, HOLDLOCK)")}) c ({", ".join(ROLLUP_COLUMNS)}, month, insight_count);
+SELECT * INTO #StatusCounts FROM ({status_counts_query(" WITH (TABLOCK, HOLDLOCK)")}) c (status, recommendation_count);
+DELETE FROM InsightRollups WITH (TABLOCKX);
+INSERT INTO InsightRollups ({", ".join(ROLLUP_COLUMNS)}, month, insight_count)
+SELECT {", ".join(ROLLUP_COLUMNS)}, month, insight_count FROM #InsightCounts;
+DELETE FROM RecommendationStatusRollups WITH (TABLOCKX);
+INSERT INTO RecommendationStatusRollups (status, recommendation_count)
+SELECT status, recommendation_count FROM #StatusCounts;
+DECLARE @insight_groups INT = (SELECT COUNT(*) FROM #InsightCounts);
+DECLARE @statuses INT = (SELECT COUNT(*) FROM #StatusCounts);
+DROP TABLE #InsightCounts;
+DROP TABLE #StatusCounts;
+SELECT @insight_groups, @statuses;
+"""
+
+INSIGHT_ROLLUPS_QUERY = f"SELECT {', '.join(ROLLUP_COLUMNS)}, month, insight_count FROM InsightRollups"
+STATUS_ROLLUPS_QUERY = "SELECT status, recommendation_count FROM RecommendationStatusRollups"
+
+
+def apply_insight_delta(cursor):
+    """Adds the counts collected in #InsightRollupDelta to InsightRollups. Part of the caller's transaction."""
+    with span("db.rollup"):
+        cursor.execute(APPLY_INSIGHT_DELTA_SQL)
+
+
+def add_recommendation_counts(cursor, counts):
+    """
+    Adds {status: count} of recommendations just inserted to RecommendationStatusRollups, in
+    the caller's transaction (after the insert, see the lock order above).
+    """
+    with span("db.rollup", rows=len(counts)):
+        for status, count in counts.items():
+            if count:
+                cursor.execute(ADD_RECOMMENDATION_STATUS_SQL, status, count)
+
+
+def rebuild_rollups(conn):
+    """
+    Recomputes both rollup tables from Insights and Recommendations in one transaction. Writes to
+    those tables wait until it commits; reads of the rollups see the old counts until then.
+
+    Returns:
+        dict: Rollup rows written per table.
+    """
+    cursor = conn.cursor()
+    with span("db.rollup_rebuild"):
+        cursor.execute(REBUILD_SQL)
+        insight_groups, statuses = cursor.fetchone()
+        conn.commit()
+    logging.info(f"Rebuilt rollups: {insight_groups} insight groups, {statuses} recommendation statuses.")
+    return {"insight_groups": insight_groups, "recommendation_statuses": statuses}
+
+
+def compare_counts(expected, actual):
+    """
+    Differences between two {group: count} maps, a missing group counting as zero.
+
+    Returns:
+        list: (group, expected count, actual count) for every group that differs.
+    """
+    return [
+        (group, expected.get(group, 0), actual.get(group, 0))
+        for group in sorted(expected.keys() | actual.keys(), key=repr)
+        if expected.get(group, 0) != actual.get(group, 0)
+    ]
+
+
+def _as_counts(rows):
+    return {tuple(row[:-1]): row[-1] for row in rows}
+
+
+def check_rollups(conn):
+    """
+    Compares both rollup tables with a full GROUP BY of the fact tables. The fact tables are read
+    under shared table locks and the rollups in the same transaction, so concurrent writes cannot
+    show up as differences; they wait for the check instead.
+
+    Returns:
+        dict: compare_counts results per table ("insights", "recommendations").
+    """
+    cursor = conn.cursor()
+    try:
+        with span("db.rollup_check"):
+            expected_insights = _as_counts(cursor.execute(insight_counts_query(" WITH (TABLOCK, HOLDLOCK)")).fetchall())
+            expected_statuses = _as_counts(cursor.execute(status_counts_query(" WITH (TABLOCK, HOLDLOCK)")).fetchall())
+            insights = _as_counts(cursor.execute(INSIGHT_ROLLUPS_QUERY).fetchall())
+            statuses = _as_counts(cursor.execute(STATUS_ROLLUPS_QUERY).fetchall())
+    finally:
+        conn.rollback()
+    return {
+        "insights": compare_counts(expected_insights, insights),
+        "recommendations": compare_counts(expected_statuses, statuses),
+    }
+
+
+def read_insight_rollups(conn, lookup_ids=None, from_month=None, to_month=None):
+    """
+    Rollup rows (lookup ids..., month, insight_count) matching the filters.
+
+    Args:
+        lookup_ids (dict): Rollup dimension key -> lookup id to keep.
+        from_month, to_month (datetime.date): Inclusive month range, as first days of months.
+    """
+    conditions = []
+    params = []
+    for key, lookup_id in (lookup_ids or {}).items():
+        conditions.append(f"{INSIGHT_DIMENSIONS[key][2]} = ?")
+        params.append(lookup_id)
+    if from_month is not None:
+        conditions.append("month >= ?")
+        params.append(from_month)
+    if to_month is not None:
+        conditions.append("month <= ?")
+        params.append(to_month)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    cursor = conn.cursor()
+    with span("db.query"):
+        cursor.execute(INSIGHT_ROLLUPS_QUERY + where, *params)
+    with span("db.fetch") as fetch:
+        rows = cursor.fetchall()
+        fetch.rows = len(rows)
+    return rows
+
+
+def read_status_rollups(conn):
+    cursor = conn.cursor()
+    with span("db.query"):
+        cursor.execute(STATUS_ROLLUPS_QUERY)
+        return cursor.fetchall()
+
+
+def _order(values):
+    # Months without created_at (None) sort last
+    return [(value is None, value) for value in values]
+
+
+def _label(tables, key, value):
+    if key == "month":
+        return value.strftime(MONTH_FORMAT) if value is not None else None
+    name = tables[key].name(value)
+    return name if name is not None else value
+
+
+def summarize_insights(rows, tables, group_by=()):
+    """
+    Insight counts from rollup rows: the total, the counts by each of GROUP_KEYS and, when
+    group_by names several keys, by their combination. Groups are listed in lookup id order,
+    months in calendar order; lookups are named from the dimension tables.
+
+    Returns:
+        dict: total, by ({key: [{key: name, "count": n}, ...]}) and groups (with group_by only).
+    """
+    total = 0
+    by_key = {key: collections.Counter() for key in GROUP_KEYS}
+    combined = collections.Counter()
+    positions = [GROUP_KEYS.index(key) for key in group_by]
+    for row in rows:
+        count = row[-1]
+        total += count
+        for position, key in enumerate(GROUP_KEYS):
+            by_key[key][row[position]] += count
+        if positions:
+            combined[tuple(row[position] for position in positions)] += count
+
+    result = {
+        "total": total,
+        "by": {
+            key: [{key: _label(tables, key, value), "count": counts[value]}
+                  for value in sorted(counts, key=lambda value: _order([value]))]
+            for key, counts in by_key.items()
+        },
+    }
+    if positions:
+        result["groups"] = [
+            {**{key: _label(tables, key, value) for key, value in zip(group_by, values)}, "count": combined[values]}
+            for values in sorted(combined, key=_order)
+        ]
+    return result
+
+
+def summarize_statuses(rows):
+    return {
+        "total": sum(count for _, count in rows),
+        "by_status": [{"status": status, "count": count}
+                      for status, count in sorted(rows, key=lambda row: (row[0] is None, row[0] or ""))],
+    }
+
+
+def parse_month(value):
+    """Parses YYYY-MM into the first day of the month; raises ValueError."""
+    return datetime.datetime.strptime(value, MONTH_FORMAT).date()
@@ -0,0 +1,358 @@
+import datetime
+import hashlib
+import json
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+
+import azure.functions as func
+
+from db_helpers.buildFiles import acquire_build_lock, release_build_lock, remove_old_generations
+from db_helpers.getInsights import iter_insights
+from db_helpers.instrumentation import span
+from db_helpers.responseEncoding import SUPPORTED_ENCODINGS, StreamCompressor, compact_json, etag_matches, negotiate_encoding
+
+# Serve GET /insights?snapshot=true from the materialized snapshot instead of a live query
+SNAPSHOT_ENABLED = os.getenv("InsightsSnapshotEnabled", "false").lower() in ("1", "true", "yes")
+# Local disk by default; a directory shared by all instances (e.g. under %HOME%) also shares invalidations
+SNAPSHOT_DIR = os.getenv("InsightsSnapshotDir") or os.path.join(tempfile.gettempdir(), "eureka-insights-snapshot")
+# Rebuilt at least this often, which bounds staleness from writes this instance never hears about
+SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("InsightsSnapshotMaxAgeSeconds", "300"))
+# How long a stale snapshot may still be served while a rebuild runs in the background
+SNAPSHOT_MAX_STALE_SECONDS = float(os.getenv("InsightsSnapshotMaxStaleSeconds", "30"))
+# Also store the body in every Content-Encoding responseEncoding supports
+SNAPSHOT_PRECOMPRESS = os.getenv("InsightsSnapshotPrecompress", "true").lower() in ("1", "true", "yes")
+
+# Rows per fetchmany while building
+SNAPSHOT_FETCH_ROWS = 5000
+MANIFEST_FORMAT = 1
+IDENTITY = "identity"
+FILE_SUFFIXES = {IDENTITY: "", "gzip": ".gz", "br": ".br"}
+
+# The body is exactly compact_json({"insights": [...], "next_cursor": None})
+PAYLOAD_PREFIX = b'{"insights":['
+PAYLOAD_SUFFIX = b'],"next_cursor":null}'
+
+
+class SnapshotGeneration:
+    """One built snapshot: its manifest and a read-only memory map of the body in each encoding."""
+
+    def __init__(self, directory, manifest):
+        self.manifest = manifest
+        self.version = manifest["version"]
+        self.generated_at = manifest["generated_at"]
+        self.rows = manifest["rows"]
+        self._maps = {}
+        for encoding, file_name in manifest["files"].items():
+            with open(os.path.join(directory, file_name), "rb") as file:
+                self._maps[encoding] = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def encodings(self):
+        return [encoding for encoding in self._maps if encoding != IDENTITY]
+
+    def etag(self, encoding=None):
+        """Strong ETag of the body in the given encoding; each encoding is its own representation."""
+        return f'"{self.version}"' if encoding is None else f'"{self.version}-{encoding}"'
+
+    def body(self, encoding=None):
+        """The stored bytes, copied straight out of the page cache."""
+        return self._maps[encoding or IDENTITY][:]
+
+
+class InsightsSnapshot:
+    """
+    Materialized, pre-encoded copy of the full GET /insights payload on disk.
+
+    A build streams every insight once, writes the JSON body and its compressed variants side by
+    side and publishes them by replacing manifest.json. Readers memory-map the files named in the
+    manifest, so serving is a copy out of the page cache with no query, serialization or
+    compression, and every process on the host shares the same pages.
+
+    Writes call invalidate(), which only touches a marker file. A snapshot is stale from the first
+    invalidation after its build started, or from max_age_seconds after it. A stale snapshot is
+    still served for max_stale_seconds while one background rebuild runs; after that one reader
+    rebuilds in the foreground, and the others get None (and use the live query) while that or
+    another process's build runs.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR, max_age_seconds=SNAPSHOT_MAX_AGE_SECONDS,
+                 max_stale_seconds=SNAPSHOT_MAX_STALE_SECONDS, precompress=SNAPSHOT_PRECOMPRESS, source=None):
+        self.directory = directory
+        self.max_age_seconds = max_age_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.encodings = list(SUPPORTED_ENCODINGS) if precompress else []
+        # Callable(batch_size) yielding insight dictionaries in id order
+        self.source = source or (lambda batch_size: iter_insights(batch_size=batch_size))
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.invalidated_path = os.path.join(directory, "invalidated")
+        self.lock_path = os.path.join(directory, "build.lock")
+        self._lock = threading.Lock()
+        # Held for the duration of a build in this process
+        self._build_lock = threading.Lock()
+        self._current = None
+        self._manifest_stat = None
+        self.counters = {"fresh": 0, "stale": 0, "unavailable": 0, "builds": 0, "unchanged_builds": 0}
+
+    def _generation(self):
+        """The published generation, re-read only when manifest.json changes."""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        if self._current is not None and key == self._manifest_stat:
+            return self._current
+
+        with self._lock:
+            if self._current is not None and key == self._manifest_stat:
+                return self._current
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as file:
+                    manifest = json.load(file)
+                if manifest.get("format") != MANIFEST_FORMAT:
+                    return None
+                generation = SnapshotGeneration(self.directory, manifest)
+            except (OSError, ValueError, KeyError) as e:
+                # e.g. files of an old generation cleaned up by another process; rebuilt below
+                logging.warning(f"Insights snapshot manifest could not be opened: {e}")
+                return None
+            # Readers still holding the previous generation keep its maps alive until they finish
+            self._current = generation
+            self._manifest_stat = key
+            return generation
+
+    def _invalidated_at(self):
+        try:
+            return os.stat(self.invalidated_path).st_mtime
+        except FileNotFoundError:
+            return 0.0
+
+    def invalidate(self):
+        """Marks the snapshot stale after a write to the data it contains. Costs a stat and a touch."""
+        generation = self._generation()
+        if generation is not None and self._invalidated_at() > generation.generated_at:
+            # Already stale; keep the time of the first invalidation so the staleness bound holds
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.invalidated_path, "a", encoding="utf-8"):
+            pass
+        os.utime(self.invalidated_path)
+
+    def staleness(self, generation, now=None):
+        """Seconds the generation has been stale; 0 while it is fresh."""
+        now = now or time.time()
+        stale_since = generation.generated_at + self.max_age_seconds
+        invalidated_at = self._invalidated_at()
+        if invalidated_at > generation.generated_at:
+            stale_since = min(stale_since, invalidated_at)
+        return max(0.0, now - stale_since)
+
+    def get(self):
+        """
+        Returns the generation to serve, rebuilding as the staleness bounds require.
+
+        Returns:
+            SnapshotGeneration or None: None if no generation within the bounds is available
+            because another thread or process is building one.
+        """
+        generation = self._generation()
+        if generation is not None:
+            stale = self.staleness(generation)
+            if stale == 0:
+                self.counters["fresh"] += 1
+                return generation
+            if stale <= self.max_stale_seconds:
+                self.counters["stale"] += 1
+                self.refresh_in_background()
+                return generation
+
+        # Request threads never queue behind a build; they answer from the live query meanwhile
+        generation = self.rebuild(wait=False)
+        if generation is None:
+            self.counters["unavailable"] += 1
+        return generation
+
+    def refresh(self):
+        """Rebuilds if the snapshot is missing or stale (timer entry point). Returns the generation or None."""
+        generation = self._generation()
+        if generation is not None and self.staleness(generation) == 0:
+            return generation
+        return self.rebuild()
+
+    def refresh_in_background(self):
+        if self._build_lock.locked():
+            return
+        threading.Thread(target=self._background_refresh, name="insights-snapshot", daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logging.error(f"Background insights snapshot build failed: {e}")
+
+    def rebuild(self, wait=True):
+        """
+        Builds and publishes a new generation unless another process is building one.
+
+        Args:
+            wait (bool): Wait for a build running in another thread of this process and reuse
+                its result; otherwise return None right away.
+        Returns:
+            SnapshotGeneration or None: None if the build is running in another process, or in
+            another thread and wait is False.
+        """
+        if not self._build_lock.acquire(blocking=wait):
+            return None
+        try:
+            generation = self._generation()
+            if generation is not None and self.staleness(generation) == 0:
+                return generation
+            if not acquire_build_lock(self.lock_path, "insights snapshot"):
+                return None
+            try:
+                return self._build()
+            finally:
+                release_build_lock(self.lock_path)
+        finally:
+            self._build_lock.release()
+
+    def _build(self):
+        # Writes committed after this instant invalidate the generation being built
+        generated_at = time.time()
+        started = time.perf_counter()
+        encodings = [IDENTITY] + self.encodings
+        temporary_paths = {encoding: os.path.join(self.directory, f"build-{os.getpid()}{FILE_SUFFIXES[encoding]}.tmp")
+                           for encoding in encodings}
+        files = {encoding: open(path, "wb") for encoding, path in temporary_paths.items()}
+        compressors = {encoding: StreamCompressor(encoding) for encoding in self.encodings}
+        digest = hashlib.sha256()
+        rows = 0
+
+        def write(data):
+            digest.update(data)
+            files[IDENTITY].write(data)
+            for encoding, compressor in compressors.items():
+                files[encoding].write(compressor.compress(data))
+
+        try:
+            with span("snapshot.build") as build:
+                write(PAYLOAD_PREFIX)
+                pending = []
+                pending_size = 0
+                for insight in self.source(SNAPSHOT_FETCH_ROWS):
+                    line = compact_json(insight)
+                    pending.append(line)
+                    pending_size += len(line)
+                    rows += 1
+                    # Hand the compressors reasonably sized blocks instead of one call per record
+                    if pending_size >= 64 * 1024:
+                        write(("," if rows > len(pending) else "").encode("utf-8") + ",".join(pending).encode("utf-8"))
+                        pending = []
+                        pending_size = 0
+                if pending:
+                    write(("," if rows > len(pending) else "").encode("utf-8") + ",".join(pending).encode("utf-8"))
+                write(PAYLOAD_SUFFIX)
+                for encoding, compressor in compressors.items():
+                    files[encoding].write(compressor.flush())
+                build.rows = rows
+        finally:
+            for file in files.values():
+                file.close()
+
+        version = digest.hexdigest()[:32]
+        previous = self._generation()
+        file_names = {encoding: f"insights-{version}.json{FILE_SUFFIXES[encoding]}" for encoding in encodings}
+        if previous is not None and previous.version == version and set(previous.manifest["files"]) == set(encodings):
+            # Same bytes: republish the existing files so clients' ETags stay valid
+            for path in temporary_paths.values():
+                os.remove(path)
+            self.counters["unchanged_builds"] += 1
+        else:
+            for encoding, path in temporary_paths.items():
+                os.replace(path, os.path.join(self.directory, file_names[encoding]))
+
+        manifest = {
+            "format": MANIFEST_FORMAT,
+            "version": version,
+            "generated_at": generated_at,
+            "rows": rows,
+            "files": file_names,
+            "bytes": {encoding: os.path.getsize(os.path.join(self.directory, name)) for encoding, name in file_names.items()},
+            "build_seconds": round(time.perf_counter() - started, 3),
+        }
+        temporary_manifest = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(temporary_manifest, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+        os.replace(temporary_manifest, self.manifest_path)
+        self.counters["builds"] += 1
+        remove_old_generations(self.directory, "insights-",
+                               keep={f"insights-{version}", f"insights-{previous.version}" if previous else None})
+        logging.info(f"Built insights snapshot {version}: {rows} rows, {manifest['bytes']} bytes "
+                     f"in {manifest['build_seconds']}s.")
+        return self._generation()
+
+    def metrics(self):
+        generation = self._current
+        return {
+            "version": generation.version if generation else None,
+            "rows": generation.rows if generation else None,
+            "age_seconds": round(time.time() - generation.generated_at, 3) if generation else None,
+            "staleness_seconds": round(self.staleness(generation), 3) if generation else None,
+            **self.counters,
+        }
+
+
+def snapshot_response(req, snapshot=None):
+    """
+    Serves the full insights payload from the snapshot, honoring If-None-Match.
+
+    Returns:
+        func.HttpResponse or None: None when no snapshot can be served within the staleness
+        bounds; the caller then answers from the live query.
+    """
+    snapshot = snapshot or get_insights_snapshot()
+    generation = snapshot.get()
+    if generation is None:
+        return None
+
+    encoding = negotiate_encoding(req)
+    if encoding not in generation.encodings:
+        encoding = None
+    etag = generation.etag(encoding)
+    headers = {
+        "ETag": etag,
+        "Vary": "Accept, Accept-Encoding",
+        "X-Snapshot-Generated-At": datetime.datetime.fromtimestamp(
+            generation.generated_at, datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+    if etag_matches(req, etag):
+        return func.HttpResponse(status_code=304, headers=headers)
+
+    with span("snapshot.read", rows=generation.rows):
+        body = generation.body(encoding)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return func.HttpResponse(body, mimetype="application/json", status_code=200, headers=headers)
+
+
+_snapshot = InsightsSnapshot()
+
+
+def get_insights_snapshot():
+    """Returns the process-wide InsightsSnapshot."""
+    return _snapshot
+
+
+def invalidate_insights_snapshot():
+    """Called after writes to Insights; a no-op unless snapshot mode is enabled."""
+    if not SNAPSHOT_ENABLED:
+        return
+    try:
+        _snapshot.invalidate()
+    except OSError as e:
+        # Never fail the write; the max age still bounds staleness
+        logging.warning(f"Could not invalidate the insights snapshot: {e}")
@@ -0,0 +1,330 @@
+import bisect
+import collections
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+# Per-request phase timing (Server-Timing header, structured log line, histograms)
+TIMING_ENABLED = os.getenv("RequestTimingEnabled", "true").lower() in ("1", "true", "yes")
+# Opt-in sampling profiler: stacks of the request thread are sampled every N milliseconds (0 = off)
+PROFILE_INTERVAL_MS = float(os.getenv("SamplingProfilerIntervalMs", "0"))
+# Stacks included in the profile log line of a request
+PROFILE_TOP_STACKS = int(os.getenv("SamplingProfilerTopStacks", "15"))
+
+# Histogram bucket upper bounds in milliseconds (roughly 1-2.5-5 steps)
+HISTOGRAM_BOUNDS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+_current = contextvars.ContextVar("request_timer", default=None)
+
+
+class Span:
+    """Times one phase; set rows to report how many rows the phase handled."""
+
+    __slots__ = ("timer", "name", "rows", "started")
+
+    def __init__(self, timer, name, rows):
+        self.timer = timer
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.timer.add(self.name, time.perf_counter() - self.started, self.rows)
+        return False
+
+
+class _NoopSpan:
+    """Returned when no request is being timed; costs one context variable lookup."""
+
+    __slots__ = ()
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class RequestTimer:
+    """
+    Phase durations and row counts of one function invocation.
+
+    The same phase may be entered many times (e.g. one fetch per batch); durations, calls and
+    rows are summed per phase name, in first-seen order. Async handlers run phases on several
+    threads at once, so updates are locked.
+    """
+
+    def __init__(self, function_name):
+        self.function_name = function_name
+        self.started = time.perf_counter()
+        self.phases = collections.OrderedDict()
+        # Sampled stacks of every thread that worked on the request (profiling only)
+        self.stacks = collections.Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, rows=None):
+        with self._lock:
+            phase = self.phases.get(name)
+            if phase is None:
+                phase = self.phases[name] = [0.0, 0, None]
+            phase[0] += seconds
+            phase[1] += 1
+            if rows is not None:
+                phase[2] = (phase[2] or 0) + rows
+
+    def add_stacks(self, stacks):
+        with self._lock:
+            self.stacks.update(stacks)
+
+    def span(self, name, rows=None):
+        return Span(self, name, rows)
+
+    def total_seconds(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self, total_seconds):
+        """Formats the phases as a Server-Timing header value."""
+        entries = []
+        for name, (seconds, _, rows) in self.phases.items():
+            entry = f"{name};dur={seconds * 1000:.2f}"
+            if rows is not None:
+                entry += f';desc="rows={rows}"'
+            entries.append(entry)
+        entries.append(f"total;dur={total_seconds * 1000:.2f}")
+        return ", ".join(entries)
+
+    def to_dict(self, total_seconds, status_code=None):
+        return {
+            "function": self.function_name,
+            "status": status_code,
+            "total_ms": round(total_seconds * 1000, 3),
+            "phases": {
+                name: {"ms": round(seconds * 1000, 3), "calls": calls, **({"rows": rows} if rows is not None else {})}
+                for name, (seconds, calls, rows) in self.phases.items()
+            },
+        }
+
+
+def span(name, rows=None):
+    """
+    Times a phase of the current request, e.g. ``with span("db.query") as s: ...; s.rows = n``.
+
+    Outside a timed request (or with RequestTimingEnabled=false) this is a shared no-op.
+    """
+    timer = _current.get()
+    if timer is None:
+        return _NOOP_SPAN
+    return Span(timer, name, rows)
+
+
+def current_timer():
+    return _current.get()
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with count, sum and max."""
+
+    __slots__ = ("counts", "count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q, capped at the observed max."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                bound = HISTOGRAM_BOUNDS_MS[index] if index < len(HISTOGRAM_BOUNDS_MS) else self.max_ms
+                return round(min(bound, self.max_ms), 3)
+        return round(self.max_ms, 3)
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max_ms, 3),
+        }
+
+
+_histograms = {}
+_histograms_lock = threading.Lock()
+
+
+def _record_histograms(timer, total_seconds):
+    with _histograms_lock:
+        for name, (seconds, _, _) in list(timer.phases.items()) + [("total", (total_seconds, 1, None))]:
+            key = f"{timer.function_name}.{name}"
+            histogram = _histograms.get(key)
+            if histogram is None:
+                histogram = _histograms[key] = Histogram()
+            histogram.observe(seconds * 1000)
+
+
+def phase_histograms():
+    """Returns {"function.phase": summary} for every phase observed in this process."""
+    with _histograms_lock:
+        return {key: histogram.to_dict() for key, histogram in sorted(_histograms.items())}
+
+
+def reset_histograms():
+    with _histograms_lock:
+        _histograms.clear()
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of registered threads from a background thread.
+
+    Stacks are collapsed to "module:function;module:function" strings and counted, which is the
+    input format of flamegraph tools. The sampler thread only runs while a thread is registered.
+    """
+
+    def __init__(self, interval_ms=PROFILE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self._lock = threading.Lock()
+        self._threads = {}  # thread id -> Counter of collapsed stacks
+        self._sampler = None
+
+    def start(self, thread_id):
+        with self._lock:
+            self._threads[thread_id] = collections.Counter()
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._sampler.start()
+
+    def stop(self, thread_id):
+        with self._lock:
+            return self._threads.pop(thread_id, collections.Counter())
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._threads:
+                    self._sampler = None
+                    return
+                frames = sys._current_frames()
+                for thread_id, stacks in self._threads.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        stacks[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+_profiler = SamplingProfiler() if PROFILE_INTERVAL_MS > 0 else None
+
+
+def profiled(fn, *args, **kwargs):
+    """
+    Calls fn, sampling this thread's stacks into the current request's profile when the sampling
+    profiler is on. Async handlers run their blocking work through this on pool threads.
+    """
+    timer = _current.get()
+    if _profiler is None or timer is None:
+        return fn(*args, **kwargs)
+    thread_id = threading.get_ident()
+    _profiler.start(thread_id)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        timer.add_stacks(_profiler.stop(thread_id))
+
+
+def _finish(timer, token, response):
+    _current.reset(token)
+    total_seconds = timer.total_seconds()
+    status_code = getattr(response, "status_code", None)
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        headers["Server-Timing"] = timer.server_timing(total_seconds)
+    _record_histograms(timer, total_seconds)
+    logging.info(json.dumps({"event": "request_timing", **timer.to_dict(total_seconds, status_code)}))
+    if _profiler is not None:
+        logging.info(json.dumps({
+            "event": "request_profile",
+            "function": timer.function_name,
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "samples": sum(timer.stacks.values()),
+            "stacks": dict(timer.stacks.most_common(PROFILE_TOP_STACKS)),
+        }))
+
+
+def instrumented(function_name):
+    """
+    Decorates a function's main: times the invocation and its spans, adds a Server-Timing header
+    to the HttpResponse, logs one structured line and feeds the phase histograms.
+
+    Works for sync and async mains. For async mains the profile covers the blocking calls made
+    through concurrency.run_blocking, which is where their time goes.
+
+    With RequestTimingEnabled=false the wrapper calls main directly.
+    """
+    def decorator(main):
+        if not TIMING_ENABLED:
+            return main
+
+        if inspect.iscoroutinefunction(main):
+            @functools.wraps(main)
+            async def async_wrapper(*args, **kwargs):
+                timer = RequestTimer(function_name)
+                token = _current.set(timer)
+                response = None
+                try:
+                    response = await main(*args, **kwargs)
+                    return response
+                finally:
+                    _finish(timer, token, response)
+            return async_wrapper
+
+        @functools.wraps(main)
+        def wrapper(*args, **kwargs):
+            timer = RequestTimer(function_name)
+            token = _current.set(timer)
+            response = None
+            try:
+                response = profiled(main, *args, **kwargs)
+                return response
+            finally:
+                _finish(timer, token, response)
+        return wrapper
+    return decorator
@@ -0,0 +1,287 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from db_helpers.compiledPredictor import FEATURE_COLUMNS, compile_model, compiled_path_for, load_compiled, model_predict
+from db_helpers.generateRecommendations import RECOMMENDATION_MAPPING
+from db_helpers.instrumentation import span
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODEL_NAME = "Random Forest Classifier"
+MODEL_FILE_NAME = "recommendation_model.pkl"
+MODEL_PATH = os.getenv(
+    "RecommendationModelPath",
+    os.path.join(BASE_DIR, "generate_recommendations", MODEL_FILE_NAME)
+)
+# Memory-map the model's numpy arrays instead of copying them into the heap (large models)
+MODEL_MMAP = os.getenv("RecommendationModelMmap", "false").lower() in ("1", "true", "yes")
+# How often the model file is checked for a new version
+MODEL_CHECK_SECONDS = float(os.getenv("RecommendationModelCheckSeconds", "30"))
+# Serve predictions from the precomputed lookup table instead of calling sklearn
+MODEL_COMPILED = os.getenv("RecommendationModelCompiled", "true").lower() in ("1", "true", "yes")
+# Refuse models without a metadata file (train_recommendation_model.py writes one)
+MODEL_REQUIRE_METADATA = os.getenv("RecommendationModelRequireMetadata", "false").lower() in ("1", "true", "yes")
+
+METADATA_FORMAT = 1
+
+
+def metadata_path_for(model_path):
+    """recommendation_model.pkl -> recommendation_model.meta.json"""
+    return os.path.splitext(model_path)[0] + ".meta.json"
+
+
+def read_metadata(path):
+    """Returns the parsed metadata file, or None if there is none."""
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def validate_metadata(metadata, version, model=None):
+    """
+    Checks that a metadata file describes the model file of the given version and that the
+    model agrees with what serving expects: the feature order, and class ids whose texts match
+    RECOMMENDATION_MAPPING.
+
+    Raises:
+        ValueError: Describing the first mismatch.
+    """
+    if metadata.get("format") != METADATA_FORMAT:
+        raise ValueError(f"Unsupported model metadata format {metadata.get('format')!r}.")
+    if metadata.get("model_version") != version:
+        raise ValueError(f"Metadata is for model version {metadata.get('model_version')}, the file is {version}.")
+    if metadata.get("feature_columns") != FEATURE_COLUMNS:
+        raise ValueError(f"Model was trained on {metadata.get('feature_columns')}, serving sends {FEATURE_COLUMNS}.")
+    classes = metadata.get("classes") or {}
+    for label, text in classes.items():
+        if RECOMMENDATION_MAPPING.get(int(label)) != text:
+            raise ValueError(f"Model class {label} means {text!r}, serving maps it to "
+                             f"{RECOMMENDATION_MAPPING.get(int(label))!r}.")
+    if model is not None:
+        model_classes = [str(int(label)) for label in getattr(model, "classes_", [])]
+        if model_classes != list(classes):
+            raise ValueError(f"Model classes {model_classes} differ from the metadata {list(classes)}.")
+        if getattr(model, "n_features_in_", len(FEATURE_COLUMNS)) != len(FEATURE_COLUMNS):
+            raise ValueError(f"Model expects {model.n_features_in_} features, not {len(FEATURE_COLUMNS)}.")
+
+
+def file_version(path):
+    """Returns a short content hash identifying a model file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+class LoadedModel:
+    """A model together with the version of the file it was loaded from."""
+
+    __slots__ = ("model", "version", "metadata", "loaded_at", "load_seconds")
+
+    def __init__(self, model, version, load_seconds, metadata=None):
+        self.model = model
+        self.version = version
+        self.metadata = metadata
+        self.loaded_at = time.time()
+        self.load_seconds = load_seconds
+
+
+class ModelRegistry:
+    """
+    Lazily loads the recommendation model and hot-swaps it when the file on disk changes.
+
+    Nothing is unpickled until the first get(). Afterwards the file's mtime and size are checked
+    at most every check_seconds; if they changed, the content hash decides whether a new version
+    is loaded. The swap replaces one reference, so in-flight predictions keep the model they
+    started with.
+    """
+
+    def __init__(self, path=MODEL_PATH, name=MODEL_NAME, mmap=MODEL_MMAP, check_seconds=MODEL_CHECK_SECONDS,
+                 compiled=MODEL_COMPILED, require_metadata=MODEL_REQUIRE_METADATA):
+        self.path = path
+        self.metadata_path = metadata_path_for(path)
+        self.require_metadata = require_metadata
+        # Metadata of the last version that passed validation
+        self.metadata = None
+        self.name = name
+        self.file_name = os.path.basename(path)
+        self.mmap = mmap
+        self.check_seconds = check_seconds
+        self.compiled = compiled
+        self.compiled_path = compiled_path_for(path)
+        # Reentrant: predictor() falls back to get() while holding the lock
+        self._lock = threading.RLock()
+        self._current = None
+        self._compiled = None
+        self._compiled_checked_at = 0.0
+        self.compiled_load_seconds = None
+        self._stat = None
+        self._version = None
+        self._checked_at = 0.0
+        self.loads = 0
+        self.swaps = 0
+
+    def _file_stat(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def version(self):
+        """Returns the content hash of the model file on disk, without unpickling it."""
+        stat = self._file_stat()
+        if stat != self._stat or self._version is None:
+            self._version = file_version(self.path)
+            self._stat = stat
+        return self._version
+
+    def _metadata(self, version, model=None):
+        """Reads and validates the metadata of the given version; None for a legacy model without one."""
+        metadata = read_metadata(self.metadata_path)
+        if metadata is None:
+            if self.require_metadata:
+                raise ValueError(f"Model metadata {os.path.basename(self.metadata_path)} is missing.")
+            return None
+        validate_metadata(metadata, version, model)
+        self.metadata = metadata
+        return metadata
+
+    def _load(self, version):
+        # Imported here so functions that only report model metadata never pay for joblib/sklearn
+        import joblib
+
+        start = time.perf_counter()
+        with span("model.load"):
+            model = joblib.load(self.path, mmap_mode="r" if self.mmap else None)
+        metadata = self._metadata(version, model)
+        loaded = LoadedModel(model, version, time.perf_counter() - start, metadata)
+        self.loads += 1
+        logging.info(f"Loaded model {self.file_name} version {version} in {loaded.load_seconds * 1000:.1f} ms.")
+        return loaded
+
+    def get(self):
+        """
+        Returns the current LoadedModel, loading it on first use or when a new version is on disk.
+        """
+        current = self._current
+        if current is not None and time.monotonic() - self._checked_at < self.check_seconds:
+            return current
+
+        with self._lock:
+            current = self._current
+            if current is not None and time.monotonic() - self._checked_at < self.check_seconds:
+                return current
+            try:
+                version = self.version()
+            except OSError as e:
+                if current is None:
+                    raise
+                logging.warning(f"Model file check failed, keeping version {current.version}: {e}")
+                version = current.version
+            self._checked_at = time.monotonic()
+
+            if current is None or version != current.version:
+                try:
+                    loaded = self._load(version)
+                except Exception as e:
+                    if current is None:
+                        raise
+                    # e.g. a half-copied file during deployment; retry at the next check
+                    logging.error(f"Loading model version {version} failed, keeping {current.version}: {e}")
+                    return current
+                if current is not None:
+                    self.swaps += 1
+                    logging.info(f"Swapped model version {current.version} -> {version}.")
+                self._current = loaded
+            return self._current
+
+    def _fallback(self, rows):
+        return model_predict(self.get().model, rows)
+
+    def predictor(self):
+        """
+        Returns what serving code should call predict() on for the current model version.
+
+        In compiled mode this is a CompiledPredictor read from the .compiled.json table written at
+        training time, so sklearn is never imported unless a row has an unseen feature id. If the
+        table is missing or belongs to another version, the model is loaded and compiled once and
+        the table is written back (best effort; the deployment directory may be read-only).
+        A model whose metadata does not validate is never served.
+        """
+        if not self.compiled:
+            return self.get().model
+
+        compiled = self._compiled
+        if compiled is not None and time.monotonic() - self._compiled_checked_at < self.check_seconds:
+            return compiled
+
+        with self._lock:
+            compiled = self._compiled
+            if compiled is not None and time.monotonic() - self._compiled_checked_at < self.check_seconds:
+                return compiled
+            try:
+                version = self.version()
+            except OSError:
+                if compiled is None:
+                    raise
+                version = compiled.model_version
+            self._compiled_checked_at = time.monotonic()
+            if compiled is not None and compiled.model_version == version:
+                return compiled
+
+            try:
+                self._metadata(version)
+            except (OSError, ValueError) as e:
+                if compiled is None:
+                    raise
+                # e.g. the model is renamed into place but its metadata not yet; retry at the next check
+                logging.error(f"Model version {version} failed validation, keeping {compiled.model_version}: {e}")
+                return compiled
+
+            start = time.perf_counter()
+            with span("model.compiled_load"):
+                compiled = load_compiled(self.compiled_path, version)
+            if compiled is None:
+                compiled = compile_model(self.get().model, version)
+                try:
+                    compiled.save(self.compiled_path)
+                except OSError as e:
+                    logging.warning(f"Could not write compiled model table: {e}")
+            compiled.fallback = self._fallback
+            self.compiled_load_seconds = time.perf_counter() - start
+            self._compiled = compiled
+            return compiled
+
+    def metrics(self):
+        """Returns model load metrics for diagnostics."""
+        current = self._current
+        compiled = self._compiled
+        return {
+            "model_name": self.name,
+            "model_file_name": self.file_name,
+            "model_version": current.version if current else None,
+            "loaded": current is not None,
+            "load_ms": round(current.load_seconds * 1000, 3) if current else None,
+            "loads": self.loads,
+            "swaps": self.swaps,
+            "trained_at": self.metadata.get("trained_at") if self.metadata else None,
+            "training_rows": self.metadata.get("training_rows") if self.metadata else None,
+            "mmap": self.mmap,
+            "compiled": self.compiled,
+            "compiled_version": compiled.model_version if compiled else None,
+            "compiled_cells": len(compiled.predictions) if compiled else None,
+            "compiled_load_ms": round(self.compiled_load_seconds * 1000, 3) if compiled else None,
+            "compiled_fallback_rows": compiled.fallback_rows if compiled else None,
+        }
+
+
+_registry = ModelRegistry()
+
+
+def get_model_registry():
+    """Returns the process-wide ModelRegistry."""
+    return _registry
@@ -0,0 +1,427 @@
+import codecs
+import csv
+import io
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from db_helpers.ingestDedup import content_hash
+from db_helpers.ingestInsights import (
+    CHUNK_SIZE, MAX_REPORTED_REJECTS, InsightWriter, header_positions, ingest_result, name_lookups, validate_row,
+)
+from db_helpers.instrumentation import current_timer
+
+# Processes parsing and validating upload chunks; 1 parses in the reading thread, which still
+# overlaps with the database writes
+PARSE_WORKERS = int(os.getenv("IngestParseWorkers", str(min(4, os.cpu_count() or 1))))
+
+# Bytes of CSV per parse task; chunks are cut at the last record boundary past this size
+PARSE_CHUNK_BYTES = int(os.getenv("IngestParseChunkBytes", str(4 << 20)))
+
+# Chunks read ahead of the database writer (parsing or parsed); bounds the memory of an upload
+WRITE_QUEUE_CHUNKS = int(os.getenv("IngestWriteQueueChunks", "4"))
+
+READ_BLOCK_BYTES = 1 << 20
+
+UTF8_BOM = codecs.BOM_UTF8
+
+# Chunks are cut by quote parity, which is only right while csv reads every quote as opening,
+# doubling or closing a quoted field. A quote it keeps as a literal character instead (5" screen,
+# 12", or text after a closing quote) makes the rest of the upload parse serially. _FIELD is a
+# field without such a quote: quoted, with quotes inside doubled, or unquoted without any quote.
+# The quantifiers are possessive, so a scan never backtracks over what it accepted.
+_FIELD = rb'(?:"(?:[^"]|"")*+"|[^,\r\n"]*+)'
+# Complete records made of such fields
+CLEAN_RECORDS = re.compile(rb'(?:' + _FIELD + rb'(?:,' + _FIELD + rb')*+(?:\r\n|\n|\r))*+')
+# What may follow them at the end of the bytes read so far: the start of a record
+CLEAN_RECORD_START = re.compile(rb'(?:' + _FIELD + rb',)*+(?:"(?:[^"]|"")*+"?|[^,\r\n"]*+)\Z')
+
+_DONE = object()
+
+# Worker count -> process pool, kept for the life of the worker process like the other caches
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def record_boundary(data):
+    """
+    Offset just past the last newline of data that ends a record, i.e. is not inside a quoted
+    field, or 0 if there is none. data must start at a record boundary.
+    """
+    quotes = data.count(b'"')
+    end = len(data)
+    while True:
+        newline = data.rfind(b"\n", 0, end)
+        if newline < 0:
+            return 0
+        quotes -= data.count(b'"', newline, end)
+        if quotes % 2 == 0:
+            return newline + 1
+        end = newline
+
+
+def first_record_end(data, start=0):
+    """
+    Offset just past the first newline of data at or after start that ends a record, or 0 if
+    there is none. data must start at a record boundary.
+    """
+    newline = data.find(b"\n", start)
+    if newline < 0:
+        return 0
+    quotes = data.count(b'"', 0, newline)
+    while quotes % 2:
+        following = data.find(b"\n", newline + 1)
+        if following < 0:
+            return 0
+        quotes += data.count(b'"', newline, following)
+        newline = following
+    return newline + 1
+
+
+class UploadChunks:
+    """
+    Reads an upload's header row, then splits the rest into byte ranges that start and end at
+    record boundaries, so each can be decoded and parsed on its own.
+
+    Args:
+        stream: A binary file-like object.
+        chunk_bytes (int): Target size of a chunk.
+    Raises:
+        CsvHeaderError: If the header row is missing or does not contain exactly the expected columns.
+    """
+
+    def __init__(self, stream, chunk_bytes=PARSE_CHUNK_BYTES):
+        self.stream = stream
+        self.chunk_bytes = chunk_bytes
+        self.bytes_read = 0
+        self.read_seconds = 0.0
+
+        buffer = self._read()
+        if buffer.startswith(UTF8_BOM):
+            buffer = buffer[len(UTF8_BOM):]
+        cut = first_record_end(buffer)
+        while not cut:
+            block = self._read()
+            if not block:
+                cut = len(buffer)
+                break
+            buffer += block
+            cut = first_record_end(buffer)
+        header = buffer[:cut]
+        self.header_index = header_positions(next(csv.reader(io.StringIO(header.decode("utf-8"))), []))
+        self._buffer = buffer[cut:]
+        self._first_line = header.count(b"\n") + 1
+
+    def _read(self, size=READ_BLOCK_BYTES):
+        started = time.perf_counter()
+        block = self.stream.read(size)
+        self.read_seconds += time.perf_counter() - started
+        self.bytes_read += len(block)
+        return block
+
+    def __iter__(self):
+        """
+        Yields (first line number, bytes, tail). tail is None, except after a stray quote: then
+        bytes and the blocks tail yields are the rest of the upload, to be parsed as one stream.
+        """
+        buffer, line = self._buffer, self._first_line
+        self._buffer = b""
+        # buffer[:checked] holds complete clean records; each byte is scanned about once
+        checked = 0
+        while True:
+            checked = CLEAN_RECORDS.match(buffer, checked).end()
+            if not CLEAN_RECORD_START.match(buffer, checked):
+                yield line, buffer, iter(self._read, b"")
+                return
+            # The last boundary within a chunk's length, or the first past it for a longer record;
+            # both lie within the checked records
+            while len(buffer) >= self.chunk_bytes:
+                cut = record_boundary(buffer[:self.chunk_bytes]) or first_record_end(buffer, self.chunk_bytes)
+                if not cut:
+                    break
+                data, buffer = buffer[:cut], buffer[cut:]
+                checked -= cut
+                yield line, data, None
+                line += data.count(b"\n")
+            block = self._read(self.chunk_bytes)
+            if not block:
+                if buffer:
+                    yield line, buffer, None
+                return
+            buffer += block
+
+
+def parse_records(reader, line_offset, header_index, lookups, limit=None):
+    """
+    Validates up to limit rows of a CSV reader (see validate_row) and hashes the content of
+    valid ones, as the writer expects them.
+
+    Returns:
+        list: (line number, values, errors, row) per non-empty row. row is only kept when a
+        lookup name was unknown, so the writer can retry it after reloading the lookups.
+    """
+    records = []
+    for row in itertools.islice(reader, limit):
+        if not row:
+            continue
+        values, errors = validate_row(row, header_index, lookups)
+        if errors:
+            retry = row if any(error.startswith("Unknown ") for error in errors) else None
+            records.append((line_offset + reader.line_num, None, errors, retry))
+        else:
+            values.append(content_hash(values[-1]))
+            records.append((line_offset + reader.line_num, values, errors, None))
+    return records
+
+
+def parse_chunk(data, first_line, header_index, lookups):
+    """
+    Parse task of one chunk (runs in a pool process).
+
+    Returns:
+        tuple: (records as from parse_records, seconds spent)
+    Raises:
+        UnicodeDecodeError: If the chunk is not valid UTF-8.
+    """
+    started = time.perf_counter()
+    reader = csv.reader(io.StringIO(data.decode("utf-8")))
+    records = parse_records(reader, first_line - 1, header_index, lookups)
+    return records, time.perf_counter() - started
+
+
+def parse_pool(workers):
+    """The process pool with this many workers, started on first use."""
+    with _pools_lock:
+        pool = _pools.get(workers)
+        if pool is None:
+            # The host process runs other threads, which fork would copy in whatever state they are
+            # in. The fork server imports only this module (not the host's __main__), and each
+            # worker is forked from it with the app already imported.
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload([__name__])
+            else:
+                context = multiprocessing.get_context("spawn")
+            pool = _pools[workers] = ProcessPoolExecutor(workers, mp_context=context)
+        return pool
+
+
+def _discard_pool(workers, pool):
+    with _pools_lock:
+        if _pools.get(workers) is pool:
+            del _pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _completed(fn, *args):
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+class _Reader(threading.Thread):
+    """
+    Reads and splits the upload and hands each chunk's parse (a future) to the writer through a
+    bounded queue, in upload order. Waits for queue space, so parsing runs at most the queue
+    length ahead of the database.
+    """
+
+    def __init__(self, chunks, workers, chunk_size, state):
+        super().__init__(name="ingest-reader", daemon=True)
+        self.chunks = chunks
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.state = state
+        self.queue = queue.Queue(WRITE_QUEUE_CHUNKS)
+        self.stopped = threading.Event()
+        self.blocked_seconds = 0.0
+        self.chunk_count = 0
+        self.pool = None
+
+    def run(self):
+        try:
+            self._read_chunks()
+        except Exception as e:
+            failed = Future()
+            failed.set_exception(e)
+            self._put(failed)
+        self._put(_DONE)
+
+    def _put(self, item):
+        started = time.perf_counter()
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        else:
+            if isinstance(item, Future):
+                item.cancel()
+        self.blocked_seconds += time.perf_counter() - started
+
+    def _read_chunks(self):
+        header_index = self.chunks.header_index
+        chunks = iter(self.chunks)
+        chunk = next(chunks, None)
+        single = True
+        while chunk is not None and not self.stopped.is_set():
+            following = next(chunks, None)
+            first_line, data, tail = chunk
+            if tail is not None:
+                self._parse_serially(first_line, data, tail)
+                return
+            self.chunk_count += 1
+            # A single-chunk upload is not worth a round trip through the pool
+            if self.workers > 1 and not (single and following is None):
+                self.pool = parse_pool(self.workers)
+                future = self.pool.submit(parse_chunk, data, first_line, header_index, self.state["lookups"])
+            else:
+                future = _completed(parse_chunk, data, first_line, header_index, self.state["lookups"])
+            self._put(future)
+            chunk, single = following, False
+
+    def _parse_serially(self, first_line, data, tail):
+        logging.info(f"Stray quote in upload; parsing from line {first_line} on serially.")
+        reader = csv.reader(codecs.iterdecode(_lines(data, tail), "utf-8"))
+        while not self.stopped.is_set():
+            started = time.perf_counter()
+            line_num = reader.line_num
+            records = parse_records(reader, first_line - 1, self.chunks.header_index, self.state["lookups"],
+                                    self.chunk_size)
+            if reader.line_num == line_num:
+                return
+            if records:
+                self.chunk_count += 1
+                parsed = Future()
+                parsed.set_result((records, time.perf_counter() - started))
+                self._put(parsed)
+
+
+def _lines(data, blocks):
+    """The lines of data and the blocks after it, split at newlines as reading a file by lines does."""
+    pending = b""
+    for block in itertools.chain([data], blocks):
+        lines = (pending + block).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + b"\n"
+    if pending:
+        yield pending
+
+
+def ingest_chunks(conn, chunks, workers=PARSE_WORKERS, chunk_size=CHUNK_SIZE, deduplicator=None):
+    """
+    Pipelined ingest_rows: chunks of the upload are parsed and validated in a process pool while
+    this thread writes the ones already parsed, in upload order. Line numbers, rejects,
+    duplicates and inserted rows are the same as ingest_rows gives for the same upload.
+
+    Args:
+        conn: An open pyodbc connection. The caller owns it; this function commits on success.
+        chunks (UploadChunks): The upload, header already read.
+        workers (int): Parse processes; 1 parses in the reading thread.
+        chunk_size (int): Rows per bulk round trip.
+        deduplicator (UploadDeduplicator): Duplicate checks to apply.
+    Returns:
+        dict: As ingest_rows, plus "stages": time and throughput of reading, parsing and writing.
+    Raises:
+        UnicodeDecodeError: If the upload is not valid UTF-8.
+    """
+    started = time.perf_counter()
+    header_index = chunks.header_index
+    state = {"lookups": name_lookups(conn)}
+    refreshed = False
+    writer = InsightWriter(conn, chunk_size, deduplicator)
+    reader = _Reader(chunks, workers, chunk_size, state)
+
+    rejects = []
+    rejected_count = 0
+    rows = 0
+    parse_seconds = 0.0
+    wait_seconds = 0.0
+    timer = current_timer()
+
+    reader.start()
+    try:
+        while True:
+            waited = time.perf_counter()
+            item = reader.queue.get()
+            if item is _DONE:
+                break
+            try:
+                records, seconds = item.result()
+            except BrokenProcessPool:
+                _discard_pool(workers, reader.pool)
+                raise
+            wait_seconds += time.perf_counter() - waited
+            parse_seconds += seconds
+            rows += len(records)
+            if timer is not None:
+                timer.add("parse", seconds, len(records))
+
+            for line_number, values, errors, retry in records:
+                hashed = True
+                if retry is not None:
+                    if not refreshed:
+                        state["lookups"] = name_lookups(conn, force=True)
+                        refreshed = True
+                    values, errors = validate_row(retry, header_index, state["lookups"])
+                    hashed = False
+                if errors:
+                    rejected_count += 1
+                    if len(rejects) < MAX_REPORTED_REJECTS:
+                        rejects.append({"line": line_number, "errors": errors})
+                    continue
+                if writer.add(line_number, values, hashed=hashed):
+                    writer.flush()
+        duplicates = writer.finish()
+    finally:
+        reader.stopped.set()
+        while not reader.queue.empty():
+            item = reader.queue.get_nowait()
+            if isinstance(item, Future):
+                item.cancel()
+        reader.join()
+
+    elapsed = time.perf_counter() - started
+    if timer is not None:
+        timer.add("read", chunks.read_seconds)
+    stages = pipeline_stages(elapsed, chunks, reader, rows, len(writer.insight_ids), workers,
+                             parse_seconds, wait_seconds)
+    logging.info(f"Ingest stages: {stages}")
+    return {**ingest_result(writer.insight_ids, rejected_count, rejects, duplicates), "stages": stages}
+
+
+def _per_second(count, seconds):
+    return round(count / seconds) if seconds > 0 else None
+
+
+def pipeline_stages(elapsed, chunks, reader, rows, inserted, workers, parse_seconds, wait_seconds):
+    """
+    Throughput of each stage. Stages overlap, so their seconds add up to more than the total;
+    the writer's wait is time the database sat idle for want of parsed rows, the reader's
+    blocked time is parsing held back by the database.
+    """
+    write_seconds = elapsed - wait_seconds
+    return {
+        "total": {"seconds": round(elapsed, 3), "rows_per_second": _per_second(rows, elapsed)},
+        "read": {"seconds": round(chunks.read_seconds, 3), "bytes": chunks.bytes_read,
+                 "mb_per_second": _per_second(chunks.bytes_read / 2**20, chunks.read_seconds),
+                 "blocked_seconds": round(reader.blocked_seconds, 3)},
+        "parse": {"workers": workers, "chunks": reader.chunk_count, "rows": rows,
+                  "worker_seconds": round(parse_seconds, 3),
+                  "rows_per_worker_second": _per_second(rows, parse_seconds)},
+        "write": {"seconds": round(write_seconds, 3), "rows": rows, "inserted": inserted,
+                  "rows_per_second": _per_second(rows, write_seconds),
+                  "wait_seconds": round(wait_seconds, 3)},
+    }
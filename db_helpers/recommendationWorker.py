@@ -0,0 +1,63 @@
+import logging
+import os
+import time
+from db_helpers.connectionPool import get_connection
+from db_helpers.generateRecommendations import generate_batch
+from db_helpers.modelRegistry import get_model_registry
+
+# Micro-batch: a batch is processed once it holds this many insights or its window has passed
+WORKER_BATCH_SIZE = int(os.getenv("RecommendationWorkerBatchSize", "500"))
+WORKER_BATCH_WINDOW_SECONDS = float(os.getenv("RecommendationWorkerBatchWindowSeconds", "1"))
+# Time budget of one worker invocation; keep it below the timer interval
+WORKER_MAX_SECONDS = float(os.getenv("RecommendationWorkerMaxSeconds", "10"))
+
+
+def drain_queue(queue, batch_size=WORKER_BATCH_SIZE, window_seconds=WORKER_BATCH_WINDOW_SECONDS,
+                max_seconds=WORKER_MAX_SECONDS, process=None):
+    """
+    Consumes queued insight ids in micro-batches until the queue is empty or max_seconds is spent.
+
+    Each batch is scored with one predict call and one bulk insert (generate_batch) and acked
+    once committed. A failed batch is nacked as a whole, so its messages are retried with
+    backoff and eventually dead-lettered; the worker stops at the first failure rather than
+    spinning against a database that is down.
+
+    Args:
+        queue (InsightQueue): Source of insight ids.
+        process (callable): Optional replacement for the scoring step, taking a list of insight
+            ids and returning a generate_batch-style summary (used by benchmarks).
+    Returns:
+        dict: Batches, insights scored, skipped and not found, failures and throughput.
+    """
+    started = time.perf_counter()
+    totals = {"batches": 0, "processed": 0, "skipped": 0, "not_found": 0, "failed_batches": 0}
+    registry = get_model_registry() if process is None else None
+
+    while time.perf_counter() - started < max_seconds:
+        messages = queue.get_batch(batch_size, window_seconds)
+        if not messages:
+            break
+        insight_ids = [message.insight_id for message in messages]
+        try:
+            if process is not None:
+                summary = process(insight_ids)
+            else:
+                with get_connection() as conn:
+                    summary = generate_batch(conn, registry.predictor(), insight_ids=insight_ids, skip_scored=True)
+        except Exception as e:
+            logging.error(f"Recommendation batch of {len(messages)} insights failed: {e}")
+            queue.nack(messages, e)
+            totals["failed_batches"] += 1
+            break
+
+        # Ids that do not exist are settled too; retrying them cannot succeed
+        queue.ack(messages)
+        totals["batches"] += 1
+        totals["processed"] += summary["processed"]
+        totals["skipped"] += summary.get("skipped", 0)
+        totals["not_found"] += len(summary["not_found"])
+
+    elapsed = time.perf_counter() - started
+    totals["seconds"] = round(elapsed, 3)
+    totals["insights_per_second"] = round(totals["processed"] / elapsed) if elapsed > 0 else None
+    return totals
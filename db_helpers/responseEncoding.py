@@ -0,0 +1,160 @@
+import json
+import zlib
+
+import azure.functions as func
+
+try:
+    import brotli
+except ImportError:  # br is only offered when the optional brotli package is installed
+    brotli = None
+
+from db_helpers.instrumentation import span
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+# Content-Encodings this module can produce, in order of preference
+SUPPORTED_ENCODINGS = (["br"] if brotli else []) + ["gzip"]
+
+_encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+
+def compact_json(obj):
+    """Serializes obj without insignificant whitespace."""
+    return _encoder.encode(obj)
+
+
+def wants_ndjson(req):
+    """True when the client asked for NDJSON via ?format=ndjson or the Accept header."""
+    if req.params.get("format", "").lower() == "ndjson":
+        return True
+    return NDJSON_MIMETYPE in (req.headers.get("Accept") or "").lower()
+
+
+def negotiate_encoding(req):
+    """
+    Picks a Content-Encoding from the request's Accept-Encoding header.
+
+    Returns:
+        str or None: "br" (if brotli is installed), "gzip", or None for identity.
+    """
+    accepted = {}
+    for item in (req.headers.get("Accept-Encoding") or "").split(","):
+        parts = item.strip().split(";")
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for parameter in parts[1:]:
+            key, _, value = parameter.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+
+    for coding in SUPPORTED_ENCODINGS:
+        if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+            return coding
+    return None
+
+
+def etag_matches(req, etag):
+    """True when the request's If-None-Match lists etag (or *), i.e. a 304 can be returned."""
+    if_none_match = req.headers.get("If-None-Match") or ""
+    return any(tag.strip() in (etag, "*") for tag in if_none_match.split(","))
+
+
+class StreamCompressor:
+    """Incremental compressor with a common interface over gzip, br and identity."""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "gzip":
+            # wbits=31 writes a gzip header and trailer
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=5)
+        else:
+            self._compressor = None
+
+    def compress(self, data):
+        if self._compressor is None:
+            return data
+        if self.encoding == "br":
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self):
+        if self._compressor is None:
+            return b""
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def encode_ndjson(records, encoding=None):
+    """
+    Encodes an iterable of JSON-serializable records as NDJSON, compressing as it goes.
+
+    Only encoded bytes are accumulated, so peak memory is bounded by the (compressed) body and
+    one record rather than by the number of Python objects built for the result set.
+
+    Returns:
+        bytes: The (optionally compressed) body.
+    """
+    compressor = StreamCompressor(encoding)
+    chunks = []
+    pending = []
+    pending_size = 0
+    for record in records:
+        line = compact_json(record)
+        pending.append(line)
+        pending_size += len(line)
+        # Hand the compressor reasonably sized blocks instead of one call per record
+        if pending_size >= 64 * 1024:
+            chunks.append(compressor.compress(("\n".join(pending) + "\n").encode("utf-8")))
+            pending = []
+            pending_size = 0
+    if pending:
+        chunks.append(compressor.compress(("\n".join(pending) + "\n").encode("utf-8")))
+    chunks.append(compressor.flush())
+    return b"".join(chunks)
+
+
+def encode_body(text, encoding=None):
+    """Encodes a complete text body, compressing it when worthwhile."""
+    data = text.encode("utf-8")
+    if encoding is None or len(data) < MIN_COMPRESS_BYTES:
+        return data, None
+    compressor = StreamCompressor(encoding)
+    return compressor.compress(data) + compressor.flush(), encoding
+
+
+def json_response(obj, req, status_code=200, headers=None):
+    """Builds a compact JSON HttpResponse, compressed according to the request's Accept-Encoding."""
+    with span("serialize"):
+        text = compact_json(obj)
+    with span("compress"):
+        body, encoding = encode_body(text, negotiate_encoding(req))
+    return _response(body, "application/json", encoding, status_code, headers)
+
+
+def ndjson_response(records, req, status_code=200, headers=None):
+    """Builds an NDJSON HttpResponse from an iterable of records."""
+    encoding = negotiate_encoding(req)
+    # Includes producing the records, which for streamed reads is where the fetches happen
+    with span("stream"):
+        body = encode_ndjson(records, encoding)
+    return _response(body, NDJSON_MIMETYPE, encoding, status_code, headers)
+
+
+def _response(body, mimetype, encoding, status_code, headers):
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept, Accept-Encoding"
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return func.HttpResponse(body, mimetype=mimetype, status_code=status_code, headers=headers)
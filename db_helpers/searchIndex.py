@@ -0,0 +1,667 @@
+import array
+import collections
+import json
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+
+from db_helpers.buildFiles import acquire_build_lock, release_build_lock, remove_old_generations
+from db_helpers.dimensionCache import INSIGHT_DIMENSIONS
+from db_helpers.getInsights import FILTER_DIMENSIONS
+from db_helpers.instrumentation import span
+
+# Local disk by default; a directory shared by all instances (e.g. under %HOME%) lets a new
+# instance start from the index another one built
+SEARCH_INDEX_DIR = os.getenv("SearchIndexDir") or os.path.join(tempfile.gettempdir(), "eureka-search-index")
+# How often a search checks the database for insights added by other processes
+REFRESH_SECONDS = float(os.getenv("SearchIndexRefreshSeconds", "5"))
+# Insights held in the in-memory delta before it is merged into a new generation on disk
+MAX_DELTA_DOCS = int(os.getenv("SearchIndexMaxDeltaDocs", "50000"))
+# Full rebuilds pick up edited and deleted insights; compactions in between only add new ones
+REBUILD_SECONDS = float(os.getenv("SearchIndexRebuildSeconds", "86400"))
+
+# Rows per fetchmany while building or catching up
+FETCH_ROWS = 10000
+MANIFEST_FORMAT = 1
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Words of a query at most; further words are ignored
+MAX_QUERY_TERMS = 16
+# Query words not in the vocabulary and at least this long match the words containing them
+MIN_EXPANSION_LENGTH = 3
+MAX_EXPANSIONS = 20
+MAX_FREQUENCY = np.iinfo(np.uint16).max
+# Queries whose postings number less than 1/SPARSE_RATIO of a segment's documents are scored sparsely
+SPARSE_RATIO = 8
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+FILTER_COLUMNS = tuple(INSIGHT_DIMENSIONS[key][2] for key in FILTER_DIMENSIONS)
+
+ROWS_QUERY = f"""
+SELECT TOP (?) id, content, {", ".join(FILTER_COLUMNS)}
+FROM Insights
+WHERE id > ?
+ORDER BY id
+"""
+
+
+class SearchIndexUnavailable(Exception):
+    """Raised by searches before an index has been built; one is being built in the background."""
+
+
+def tokenize(text):
+    """Case-folded words of two or more letters or digits."""
+    if not text:
+        return []
+    return [token for token in TOKEN_PATTERN.findall(text.casefold()) if len(token) > 1]
+
+
+def _trigrams(term):
+    return {term[i:i + 3] for i in range(len(term) - 2)}
+
+
+def trigram_index(terms):
+    """
+    (trigram key, term id) pairs for every term of at least three characters, sorted by key and
+    term id. Keys are crc32 of the UTF-8 trigram, which is stable across processes.
+    """
+    keys = array.array("I")
+    term_ids = array.array("I")
+    for term_id, term in enumerate(terms):
+        for gram in _trigrams(term):
+            keys.append(zlib.crc32(gram.encode("utf-8")))
+            term_ids.append(term_id)
+    keys = np.frombuffer(keys, dtype=np.uint32)
+    term_ids = np.frombuffer(term_ids, dtype=np.uint32)
+    order = np.lexsort((term_ids, keys))
+    return keys[order], term_ids[order]
+
+
+class Segment:
+    """
+    An immutable inverted index over a run of insights, as a handful of flat arrays.
+
+    A document's position is its index in insight_ids, which is sorted. The postings of term t
+    are postings[offsets[t]:offsets[t + 1]] (document positions, ascending) with the matching
+    frequencies. filters holds each document's FILTER_DIMENSIONS lookup ids, so filtered searches
+    never touch the database. Saved segments are loaded with np.load(mmap_mode="r"), so a cold
+    start maps the files instead of reading them and every process on the host shares the pages.
+    """
+
+    ARRAYS = {
+        "insight_ids": np.uint32,
+        "doc_lengths": np.uint32,
+        "filters": np.int32,
+        "offsets": np.int64,
+        "postings": np.uint32,
+        "frequencies": np.uint16,
+        "trigram_keys": np.uint32,
+        "trigram_terms": np.uint32,
+    }
+
+    def __init__(self, terms, arrays):
+        self.terms = terms
+        self.term_ids = {term: term_id for term_id, term in enumerate(terms)}
+        for name in self.ARRAYS:
+            setattr(self, name, arrays[name])
+        self.docs = len(self.insight_ids)
+        self.total_length = int(self.doc_lengths.sum())
+        self.max_insight_id = int(self.insight_ids[-1]) if self.docs else 0
+
+    @classmethod
+    def from_postings(cls, terms, term_column, positions, frequencies, insight_ids, doc_lengths, filters):
+        """Builds a segment from unordered (term id, position, frequency) triples."""
+        order = np.lexsort((positions, term_column))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_column, minlength=len(terms)), out=offsets[1:])
+        trigram_keys, trigram_terms = trigram_index(terms)
+        return cls(terms, {
+            "insight_ids": insight_ids.astype(np.uint32, copy=False),
+            "doc_lengths": doc_lengths.astype(np.uint32, copy=False),
+            "filters": filters.astype(np.int32, copy=False).reshape(-1, len(FILTER_COLUMNS)),
+            "offsets": offsets,
+            "postings": positions[order].astype(np.uint32, copy=False),
+            "frequencies": frequencies[order].astype(np.uint16, copy=False),
+            "trigram_keys": trigram_keys,
+            "trigram_terms": trigram_terms,
+        })
+
+    @classmethod
+    def load(cls, directory):
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in cls.ARRAYS}
+        with open(os.path.join(directory, "terms.json"), "r", encoding="utf-8") as file:
+            terms = json.load(file)
+        return cls(terms, arrays)
+
+    def save(self, directory):
+        os.makedirs(directory)
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(directory, "terms.json"), "w", encoding="utf-8") as file:
+            json.dump(self.terms, file, ensure_ascii=False)
+
+    @property
+    def postings_count(self):
+        return int(self.offsets[-1])
+
+    def document_frequency(self, term):
+        term_id = self.term_ids.get(term)
+        return 0 if term_id is None else int(self.offsets[term_id + 1] - self.offsets[term_id])
+
+    def term_postings(self, term):
+        """(positions, frequencies) of a term; empty arrays if it does not occur."""
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return self.postings[:0], self.frequencies[:0]
+        start, end = self.offsets[term_id], self.offsets[term_id + 1]
+        return self.postings[start:end], self.frequencies[start:end]
+
+    def terms_containing(self, token):
+        """Vocabulary terms containing token (at least three characters), via the trigram index."""
+        candidates = None
+        for gram in _trigrams(token):
+            key = zlib.crc32(gram.encode("utf-8"))
+            start, end = np.searchsorted(self.trigram_keys, [key, key + 1])
+            term_ids = self.trigram_terms[start:end]
+            candidates = term_ids if candidates is None else np.intersect1d(candidates, term_ids)
+            if not len(candidates):
+                return []
+        # Trigram hits are candidates only: "abcab" has the trigrams of "cabc" without containing it
+        return [self.terms[term_id] for term_id in candidates.tolist() if token in self.terms[term_id]]
+
+    def score(self, groups, idf, avgdl, match_all, filters):
+        """
+        BM25 scores of the documents matching the query.
+
+        Args:
+            groups (list): One list of terms per query word; a document matching any term of a
+                group matches the word.
+            idf (dict): Term -> inverse document frequency over the whole index.
+            avgdl (float): Average document length over the whole index.
+            match_all (bool): Only documents matching every group, instead of any.
+            filters (dict): Column index in FILTER_DIMENSIONS -> required lookup id.
+        Returns:
+            tuple: (insight ids, scores) of the matching documents.
+        """
+        weighted = []
+        for group in groups:
+            group_postings = []
+            for term in group:
+                positions, frequencies = self.term_postings(term)
+                if len(positions):
+                    tf = frequencies.astype(np.float64)
+                    norm = K1 * (1 - B + B * self.doc_lengths[positions] / avgdl)
+                    group_postings.append((positions, idf[term] * tf * (K1 + 1) / (tf + norm)))
+            if group_postings or not match_all:
+                weighted.append(group_postings)
+            else:
+                return self.insight_ids[:0], np.zeros(0, dtype=np.float32)
+
+        matching = sum(len(positions) for group in weighted for positions, _ in group)
+        if matching * SPARSE_RATIO < self.docs:
+            # Few postings: sum them per document instead of touching an array of every document
+            positions = np.concatenate([positions for group in weighted for positions, _ in group] or [self.postings[:0]])
+            candidates, inverse = np.unique(positions, return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([w for group in weighted for _, w in group] or [[]]),
+                                 minlength=len(candidates))
+            if match_all:
+                hits, counts = np.unique(np.concatenate(
+                    [np.unique(np.concatenate([positions for positions, _ in group])) for group in weighted]
+                ), return_counts=True)
+                keep = np.isin(candidates, hits[counts == len(weighted)], assume_unique=True)
+                candidates, scores = candidates[keep], scores[keep]
+        else:
+            scores = np.zeros(self.docs, dtype=np.float64)
+            matched = np.zeros(self.docs, dtype=np.uint8) if match_all else None
+            for group in weighted:
+                seen = np.zeros(self.docs, dtype=bool) if match_all else None
+                for positions, weights in group:
+                    # A term occurs once per document, so the fancy-indexed add never collides
+                    scores[positions] += weights
+                    if match_all:
+                        seen[positions] = True
+                if match_all:
+                    matched += seen
+            candidates = np.flatnonzero(matched == len(weighted)) if match_all else np.flatnonzero(scores)
+            scores = scores[candidates]
+
+        keep = np.ones(len(candidates), dtype=bool)
+        for column, lookup_id in filters.items():
+            keep &= self.filters[candidates, column] == lookup_id
+        return self.insight_ids[candidates[keep]], scores[keep].astype(np.float32)
+
+
+class SegmentBuilder:
+    """Accumulates insights in id order and turns them into a Segment."""
+
+    def __init__(self):
+        self.terms = []
+        self.term_ids = {}
+        self._term_column = array.array("I")
+        self._positions = array.array("I")
+        self._frequencies = array.array("H")
+        self._insight_ids = array.array("I")
+        self._doc_lengths = array.array("I")
+        self._filters = array.array("i")
+
+    def __len__(self):
+        return len(self._insight_ids)
+
+    @property
+    def max_insight_id(self):
+        return self._insight_ids[-1] if self._insight_ids else 0
+
+    def add(self, insight_id, content, filter_ids):
+        position = len(self._insight_ids)
+        tokens = tokenize(content)
+        for term, count in collections.Counter(tokens).items():
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                term_id = self.term_ids[term] = len(self.terms)
+                self.terms.append(term)
+            self._term_column.append(term_id)
+            self._positions.append(position)
+            self._frequencies.append(min(count, MAX_FREQUENCY))
+        self._insight_ids.append(insight_id)
+        self._doc_lengths.append(len(tokens))
+        self._filters.extend(lookup_id or 0 for lookup_id in filter_ids)
+
+    def add_rows(self, rows):
+        """Adds ROWS_QUERY rows: (id, content, *FILTER_COLUMNS)."""
+        for row in rows:
+            self.add(row[0], row[1], row[2:])
+
+    def segment(self):
+        return Segment.from_postings(
+            list(self.terms),
+            np.frombuffer(self._term_column, dtype=np.uint32).copy(),
+            np.frombuffer(self._positions, dtype=np.uint32).copy(),
+            np.frombuffer(self._frequencies, dtype=np.uint16).copy(),
+            np.frombuffer(self._insight_ids, dtype=np.uint32).copy(),
+            np.frombuffer(self._doc_lengths, dtype=np.uint32).copy(),
+            np.frombuffer(self._filters, dtype=np.int32).copy(),
+        )
+
+
+def merge_segments(base, delta):
+    """One segment holding base followed by delta; every delta insight id must exceed base's."""
+    terms = list(base.terms)
+    term_ids = dict(base.term_ids)
+    mapping = np.empty(len(delta.terms), dtype=np.uint32)
+    for term_id, term in enumerate(delta.terms):
+        merged_id = term_ids.get(term)
+        if merged_id is None:
+            merged_id = term_ids[term] = len(terms)
+            terms.append(term)
+        mapping[term_id] = merged_id
+
+    def term_column(segment):
+        return np.repeat(np.arange(len(segment.terms), dtype=np.uint32), np.diff(segment.offsets))
+
+    return Segment.from_postings(
+        terms,
+        np.concatenate([term_column(base), mapping[term_column(delta)]]),
+        np.concatenate([base.postings, delta.postings + np.uint32(base.docs)]),
+        np.concatenate([base.frequencies, delta.frequencies]),
+        np.concatenate([base.insight_ids, delta.insight_ids]),
+        np.concatenate([base.doc_lengths, delta.doc_lengths]),
+        np.concatenate([base.filters, delta.filters]),
+    )
+
+
+def read_rows(conn, after_id, fetch_rows=FETCH_ROWS):
+    """Yields ROWS_QUERY rows with ids above after_id, in id order, in chunks of fetch_rows."""
+    cursor = conn.cursor()
+    while True:
+        cursor.execute(ROWS_QUERY, fetch_rows, after_id)
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < fetch_rows:
+            return
+        after_id = rows[-1][0]
+
+
+class SearchIndex:
+    """
+    Full-text index over Insights.content, ranked with BM25.
+
+    The index is a base segment published on disk plus an in-memory delta. A generation
+    directory holds the base segment's arrays; manifest.json names the current one and is
+    replaced atomically, so readers in any process see a whole generation or the previous one.
+
+    New insights reach the delta through catch-up reads of the rows above the highest indexed
+    id: after each CSV ingest in this process, and from searches at most every refresh_seconds.
+    A delta of max_delta_docs or more is merged into a new generation in the background.
+    Whenever a newer generation is published, by this process or another, the delta is
+    dropped and caught up again from the new generation's highest id.
+
+    Only a full rebuild (the insights_search_index timer, every rebuild_seconds) reflects
+    edited or deleted insights, and rows committed with an id below one already indexed.
+    """
+
+    def __init__(self, directory=SEARCH_INDEX_DIR, refresh_seconds=REFRESH_SECONDS,
+                 max_delta_docs=MAX_DELTA_DOCS, rebuild_seconds=REBUILD_SECONDS, fetch_rows=FETCH_ROWS):
+        self.directory = directory
+        self.refresh_seconds = refresh_seconds
+        self.max_delta_docs = max_delta_docs
+        self.rebuild_seconds = rebuild_seconds
+        self.fetch_rows = fetch_rows
+        self.manifest_path = os.path.join(directory, "manifest.json")
+        self.lock_path = os.path.join(directory, "build.lock")
+        # (manifest, base segment, delta segment); replaced as a whole so searches need no lock
+        self._state = (None, None, None)
+        self._delta = SegmentBuilder()
+        self._manifest_stat = None
+        self._synced_at = 0.0
+        # Guards the delta and the state
+        self._lock = threading.Lock()
+        # Held for the duration of a build or compaction in this process
+        self._build_lock = threading.Lock()
+        self.counters = {"searches": 0, "syncs": 0, "caught_up": 0, "builds": 0, "compactions": 0}
+
+    @property
+    def loaded(self):
+        return self._state[1] is not None
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return None
+        return manifest if manifest.get("format") == MANIFEST_FORMAT else None
+
+    def _load_published(self):
+        """Switches to the published generation if it changed. Call with _lock held."""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return
+        key = (stat.st_mtime_ns, stat.st_size)
+        if key == self._manifest_stat:
+            return
+        try:
+            manifest = self._read_manifest()
+            if manifest is None:
+                return
+            with span("search.load"):
+                base = Segment.load(os.path.join(self.directory, manifest["generation"]))
+        except (OSError, ValueError, KeyError) as e:
+            # e.g. a generation cleaned up by another process; the next manifest change is picked up
+            logging.warning(f"Search index generation could not be opened: {e}")
+            return
+        self._manifest_stat = key
+        # Insights above the new generation's watermark are read again by the next catch-up
+        self._delta = SegmentBuilder()
+        self._state = (manifest, base, None)
+        self._synced_at = 0.0
+        logging.info(f"Loaded search index {manifest['generation']}: {manifest['docs']} insights.")
+
+    def _catch_up(self, conn):
+        """Indexes the insights above the highest indexed id. Call with _lock held."""
+        manifest, base, delta = self._state
+        if base is None:
+            return 0
+        added = 0
+        with span("search.catch_up") as catch_up:
+            for rows in read_rows(conn, max(base.max_insight_id, self._delta.max_insight_id), self.fetch_rows):
+                self._delta.add_rows(rows)
+                added += len(rows)
+            catch_up.rows = added
+            if added:
+                self._state = (manifest, base, self._delta.segment())
+        self._synced_at = time.monotonic()
+        self.counters["caught_up"] += added
+        return added
+
+    def needs_sync(self):
+        return not self.loaded or time.monotonic() - self._synced_at >= self.refresh_seconds
+
+    def sync(self, conn, wait=False):
+        """
+        Loads a newly published generation and catches up with the database.
+
+        Without wait the call returns at once if another thread is syncing; searches then use the
+        state as it is.
+        """
+        if not self._lock.acquire(blocking=wait):
+            return
+        try:
+            self._load_published()
+            self._catch_up(conn)
+            self.counters["syncs"] += 1
+        finally:
+            self._lock.release()
+        self._compact_if_due()
+
+    def update(self, conn):
+        """Indexes the insights an ingest just committed, if this process has the index loaded."""
+        if not self.loaded:
+            return
+        with self._lock:
+            self._load_published()
+            self._catch_up(conn)
+        self._compact_if_due()
+
+    def _compact_if_due(self):
+        if len(self._delta) >= self.max_delta_docs and not self._build_lock.locked():
+            threading.Thread(target=self._background(self.compact), name="search-index-compact", daemon=True).start()
+
+    def build_in_background(self):
+        """Starts a full build on a pooled connection unless one is running in this process."""
+        if self._build_lock.locked():
+            return
+
+        def build():
+            from db_helpers.connectionPool import get_connection
+            with get_connection() as conn:
+                self.rebuild(conn)
+
+        threading.Thread(target=self._background(build), name="search-index-build", daemon=True).start()
+
+    @staticmethod
+    def _background(fn):
+        def run():
+            try:
+                fn()
+            except Exception as e:
+                logging.error(f"Background search index build failed: {e}")
+        return run
+
+    def rebuild(self, conn):
+        """
+        Indexes every insight and publishes the result, unless another process is building.
+
+        Returns:
+            bool: False if another process holds the build lock.
+        """
+        with self._build_lock:
+            if not acquire_build_lock(self.lock_path, "search index"):
+                return False
+            try:
+                started = time.perf_counter()
+                builder = SegmentBuilder()
+                with span("search.build") as build:
+                    for rows in read_rows(conn, 0, self.fetch_rows):
+                        builder.add_rows(rows)
+                    segment = builder.segment()
+                    build.rows = segment.docs
+                self._publish(segment, "rebuild", started, rebuilt_at=time.time())
+                self.counters["builds"] += 1
+            finally:
+                release_build_lock(self.lock_path)
+        with self._lock:
+            self._load_published()
+            self._catch_up(conn)
+        return True
+
+    def compact(self):
+        """
+        Merges the delta into a new generation, unless another process is building.
+
+        Returns:
+            bool: False if there was nothing to merge or another process holds the build lock.
+        """
+        with self._build_lock:
+            manifest, base, delta = self._state
+            if base is None or delta is None:
+                return False
+            if not acquire_build_lock(self.lock_path, "search index"):
+                return False
+            try:
+                started = time.perf_counter()
+                with span("search.compact", rows=delta.docs):
+                    segment = merge_segments(base, delta)
+                self._publish(segment, "compaction", started, rebuilt_at=manifest["rebuilt_at"])
+                self.counters["compactions"] += 1
+            finally:
+                release_build_lock(self.lock_path)
+        with self._lock:
+            self._load_published()
+        return True
+
+    def maintain(self, conn):
+        """
+        Timer entry point: rebuilds when there is no generation or the last rebuild is older than
+        rebuild_seconds, otherwise catches up and compacts whatever delta there is, so new
+        processes start from a recent generation.
+        """
+        manifest = self._read_manifest()
+        if manifest is None or time.time() - manifest["rebuilt_at"] >= self.rebuild_seconds:
+            return self.rebuild(conn)
+        self.sync(conn, wait=True)
+        return self.compact()
+
+    def _publish(self, segment, kind, started, rebuilt_at):
+        generation = f"generation-{time.time_ns()}-{os.getpid()}"
+        temporary = os.path.join(self.directory, f"{generation}.tmp")
+        segment.save(temporary)
+        os.replace(temporary, os.path.join(self.directory, generation))
+        manifest = {
+            "format": MANIFEST_FORMAT,
+            "generation": generation,
+            "kind": kind,
+            "docs": segment.docs,
+            "terms": len(segment.terms),
+            "postings": segment.postings_count,
+            "max_insight_id": segment.max_insight_id,
+            "bytes": sum(entry.stat().st_size for entry in os.scandir(os.path.join(self.directory, generation))),
+            "rebuilt_at": rebuilt_at,
+            "published_at": time.time(),
+            "build_seconds": round(time.perf_counter() - started, 3),
+        }
+        previous = self._read_manifest()
+        temporary_manifest = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(temporary_manifest, "w", encoding="utf-8") as file:
+            json.dump(manifest, file)
+        os.replace(temporary_manifest, self.manifest_path)
+        remove_old_generations(self.directory, "generation-",
+                               keep={generation, previous["generation"] if previous else None})
+        logging.info(f"Published search index {generation} ({kind}): {manifest['docs']} insights, "
+                     f"{manifest['terms']} terms, {manifest['bytes']} bytes in {manifest['build_seconds']}s.")
+
+    def expand(self, token, segments):
+        """
+        The terms a query word matches: itself if indexed, otherwise (when long enough) up to
+        MAX_EXPANSIONS indexed terms containing it, the most frequent first.
+        """
+        if any(token in segment.term_ids for segment in segments):
+            return [token]
+        if len(token) < MIN_EXPANSION_LENGTH:
+            return []
+        frequencies = collections.Counter()
+        for segment in segments:
+            for term in segment.terms_containing(token):
+                frequencies[term] += segment.document_frequency(term)
+        return [term for term, _ in frequencies.most_common(MAX_EXPANSIONS)]
+
+    def search(self, text, filters=None, limit=20, offset=0, match_all=False):
+        """
+        Ranks the insights matching a query.
+
+        Args:
+            text (str): The query; see tokenize.
+            filters (dict): FILTER_DIMENSIONS key -> lookup id the insight must have.
+            limit (int): Results to return.
+            offset (int): Ranked results to skip.
+            match_all (bool): Require every query word instead of any.
+        Returns:
+            dict: total (matching insights), terms (the indexed terms each query word matched)
+            and results, a list of (insight id, score) in descending score order.
+        Raises:
+            SearchIndexUnavailable: If no generation has been loaded yet.
+        """
+        manifest, base, delta = self._state
+        if base is None:
+            raise SearchIndexUnavailable("The search index is being built.")
+        self.counters["searches"] += 1
+        segments = [segment for segment in (base, delta) if segment is not None and segment.docs]
+        words = list(dict.fromkeys(tokenize(text)))[:MAX_QUERY_TERMS]
+        expanded = {word: self.expand(word, segments) for word in words}
+        groups = [terms for terms in expanded.values() if terms]
+        if not groups or (match_all and len(groups) < len(words)):
+            return {"total": 0, "terms": expanded, "results": []}
+
+        docs = sum(segment.docs for segment in segments)
+        avgdl = max(sum(segment.total_length for segment in segments) / docs, 1.0)
+        idf = {}
+        for term in {term for group in groups for term in group}:
+            df = sum(segment.document_frequency(term) for segment in segments)
+            idf[term] = math.log(1 + (docs - df + 0.5) / (df + 0.5))
+        columns = {FILTER_DIMENSIONS.index(key): lookup_id for key, lookup_id in (filters or {}).items()}
+
+        matches = [segment.score(groups, idf, avgdl, match_all, columns) for segment in segments]
+        insight_ids = np.concatenate([ids for ids, _ in matches])
+        scores = np.concatenate([segment_scores for _, segment_scores in matches])
+        total = len(insight_ids)
+        wanted = min(offset + limit, total)
+        if wanted == 0:
+            return {"total": total, "terms": expanded, "results": []}
+        top = np.argpartition(-scores, wanted - 1)[:wanted] if wanted < total else np.arange(total)
+        # Highest score first, ties by insight id
+        top = top[np.lexsort((insight_ids[top], -scores[top]))][offset:]
+        results = [(int(insight_id), round(float(score), 4)) for insight_id, score in zip(insight_ids[top], scores[top])]
+        return {"total": total, "terms": expanded, "results": results}
+
+    def stats(self):
+        manifest, base, delta = self._state
+        return {
+            "generation": manifest["generation"] if manifest else None,
+            "docs": base.docs if base else None,
+            "terms": len(base.terms) if base else None,
+            "postings": base.postings_count if base else None,
+            "bytes": manifest["bytes"] if manifest else None,
+            "delta_docs": delta.docs if delta else 0,
+            "max_insight_id": max(base.max_insight_id if base else 0, delta.max_insight_id if delta else 0),
+            **self.counters,
+        }
+
+
+_index = SearchIndex()
+
+
+def get_search_index():
+    """Returns the process-wide SearchIndex."""
+    return _index
+
+
+def update_search_index(conn):
+    """Called after inserts into Insights; indexes them if this process has the index loaded."""
+    try:
+        _index.update(conn)
+    except Exception as e:
+        # Never fail the write; the next search catches up
+        logging.warning(f"Could not update the search index: {e}")
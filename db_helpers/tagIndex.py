@@ -0,0 +1,433 @@
+import itertools
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from db_helpers.dimensionCache import normalize_name
+from db_helpers.instrumentation import span
+
+MAX_TAG_LENGTH = 100
+# Bounds of one bulk add/remove call
+MAX_TAGS_PER_REQUEST = 100
+MAX_INSIGHT_IDS_PER_REQUEST = int(os.getenv("TagMaxInsightIdsPerRequest", "100000"))
+# Upper bound on unknown insight ids returned to the caller; the count is always exact
+MAX_REPORTED_UNKNOWN_IDS = 1000
+
+# How often a worker checks Tags for writes made by other workers, and how often it reloads
+# everything regardless (picks up anything the version check cannot see, such as deleted tags)
+REFRESH_SECONDS = float(os.getenv("TagIndexRefreshSeconds", "5"))
+MAX_AGE_SECONDS = float(os.getenv("TagIndexMaxAgeSeconds", "3600"))
+
+# Rows per fetchmany call when loading postings
+LOAD_CHUNK_SIZE = 100000
+# SQL Server allows 2100 parameters per statement
+MAX_IN_PARAMETERS = 2000
+
+EMPTY = np.empty(0, dtype=np.uint32)
+
+LOAD_TAGS_QUERY = """
+SELECT id, tag_name, CAST(version AS BIGINT)
+FROM Tags
+WHERE version > CAST(CAST(? AS BIGINT) AS BINARY(8))
+"""
+
+LOAD_POSTINGS_QUERY = """
+SELECT tag_id, insight_id
+FROM InsightTags
+ORDER BY tag_id, insight_id
+"""
+
+CREATE_STAGING_SQL = """
+IF OBJECT_ID('tempdb..#TagStaging') IS NOT NULL DROP TABLE #TagStaging;
+CREATE TABLE #TagStaging (insight_id INT NOT NULL PRIMARY KEY)
+"""
+
+STAGING_INSERT_SQL = "INSERT INTO #TagStaging (insight_id) VALUES (?)"
+
+UNKNOWN_INSIGHTS_SQL = """
+SELECT s.insight_id
+FROM #TagStaging s
+WHERE NOT EXISTS (SELECT 1 FROM Insights i WHERE i.id = s.insight_id)
+ORDER BY s.insight_id
+"""
+
+# Tag names are unique; the range lock keeps two concurrent creations of one name from racing
+CREATE_TAG_SQL = """
+INSERT INTO Tags (tag_name)
+SELECT ?
+WHERE NOT EXISTS (SELECT 1 FROM Tags WITH (UPDLOCK, HOLDLOCK) WHERE tag_name = ?)
+"""
+
+ADD_POSTINGS_SQL = """
+INSERT INTO InsightTags (tag_id, insight_id)
+OUTPUT INSERTED.insight_id
+SELECT ?, s.insight_id
+FROM #TagStaging s
+WHERE EXISTS (SELECT 1 FROM Insights i WHERE i.id = s.insight_id)
+  AND NOT EXISTS (
+      SELECT 1 FROM InsightTags t WITH (UPDLOCK, HOLDLOCK)
+      WHERE t.tag_id = ? AND t.insight_id = s.insight_id
+  )
+"""
+
+REMOVE_POSTINGS_SQL = """
+DELETE t
+OUTPUT DELETED.insight_id
+FROM InsightTags t
+JOIN #TagStaging s ON s.insight_id = t.insight_id
+WHERE t.tag_id = ?
+"""
+
+# Also moves Tags.version, which is how other workers notice the change
+UPDATE_COUNT_SQL = "UPDATE Tags SET insight_count = insight_count + ? WHERE id = ?"
+
+
+def intersect(a, b):
+    """Intersection of two sorted unique id arrays, probing the larger with the smaller."""
+    if len(a) > len(b):
+        a, b = b, a
+    if not len(a):
+        return a
+    positions = np.minimum(np.searchsorted(b, a), len(b) - 1)
+    return a[b[positions] == a]
+
+
+def difference(a, b):
+    """Ids of sorted array a that are not in sorted array b."""
+    if not len(a) or not len(b):
+        return a
+    if len(b) < len(a):
+        # Locate b's ids in a and mask them out, probing with the smaller array
+        positions = np.minimum(np.searchsorted(a, b), len(a) - 1)
+        keep = np.ones(len(a), dtype=bool)
+        keep[positions[a[positions] == b]] = False
+        return a[keep]
+    positions = np.minimum(np.searchsorted(b, a), len(b) - 1)
+    return a[b[positions] != a]
+
+
+def merge(a, b):
+    """Sorted array a with the ids of sorted array b added; linear in len(a) when b is small."""
+    new = difference(b, a)
+    return np.insert(a, np.searchsorted(a, new), new) if len(new) else a
+
+
+def union(arrays):
+    """Union of sorted unique id arrays."""
+    if not arrays:
+        return EMPTY
+    if len(arrays) == 1:
+        return arrays[0]
+    return np.unique(np.concatenate(arrays))
+
+
+def _as_postings(insight_ids):
+    return np.unique(np.asarray(insight_ids, dtype=np.uint32))
+
+
+def _grouped(rows):
+    """Splits (tag_id, insight_id) rows ordered by tag into {tag_id: uint32 insight ids}."""
+    pairs = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int64, count=2 * len(rows)).reshape(-1, 2)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(pairs[:, 0])) + 1))
+    insight_ids = pairs[:, 1].astype(np.uint32)
+    return {
+        int(pairs[start, 0]): insight_ids[start:end]
+        for start, end in zip(starts, itertools.chain(starts[1:], [len(pairs)]))
+    }
+
+
+class TagIndex:
+    """
+    In-memory inverted index of InsightTags: tag id -> sorted uint32 array of insight ids.
+
+    Four bytes per posting, and boolean queries are vectorized merges of those arrays, so
+    "tags A and B but not C" never touches Insights. Writes made through this worker are applied
+    as soon as they commit. Writes made by other workers are picked up by sync(), which reloads
+    only the tags whose Tags.version moved. Arrays are replaced on update, never changed in
+    place, so readers need no lock.
+    """
+
+    def __init__(self, refresh_seconds=REFRESH_SECONDS, max_age_seconds=MAX_AGE_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._postings = {}
+        self._names = {}
+        self._ids = {}
+        self._version = 0
+        self._loaded_at = None
+        self._checked_at = 0.0
+        self.full_loads = 0
+        self.incremental_syncs = 0
+        self.tags_reloaded = 0
+        self.last_load_seconds = None
+
+    def needs_sync(self):
+        """True when sync() would go to the database."""
+        now = time.monotonic()
+        return (self._loaded_at is None or now - self._loaded_at >= self.max_age_seconds
+                or now - self._checked_at >= self.refresh_seconds)
+
+    def sync(self, conn, force=False):
+        """
+        Brings the index up to date: a full load on first use, after max_age_seconds or when
+        forced, otherwise a reload of the tags changed since the last sync.
+
+        Args:
+            conn: An open database connection.
+            force (bool): Reload everything.
+        """
+        with self._sync_lock:
+            if not force and not self.needs_sync():
+                return
+            now = time.monotonic()
+            if force or self._loaded_at is None or now - self._loaded_at >= self.max_age_seconds:
+                self._load_all(conn)
+            else:
+                self._load_changed(conn)
+            self._checked_at = time.monotonic()
+
+    def _changed_tags(self, cursor, since):
+        cursor.execute(LOAD_TAGS_QUERY, since)
+        return cursor.fetchall()
+
+    def _load_all(self, conn):
+        started = time.perf_counter()
+        cursor = conn.cursor()
+        with span("db.tags"):
+            tags = self._changed_tags(cursor, 0)
+            postings = {}
+            cursor.execute(LOAD_POSTINGS_QUERY)
+            while True:
+                rows = cursor.fetchmany(LOAD_CHUNK_SIZE)
+                if not rows:
+                    break
+                for tag_id, insight_ids in _grouped(rows).items():
+                    # A tag's postings may straddle two chunks
+                    postings[tag_id] = np.concatenate((postings[tag_id], insight_ids)) if tag_id in postings else insight_ids
+        cursor.close()
+
+        names = {row[0]: row[1] for row in tags}
+        with self._lock:
+            self._postings = {tag_id: postings.get(tag_id, EMPTY) for tag_id in names}
+            self._names = names
+            self._ids = {normalize_name(name): tag_id for tag_id, name in names.items()}
+            self._version = max((row[2] for row in tags), default=0)
+            self._loaded_at = time.monotonic()
+
+        self.full_loads += 1
+        self.last_load_seconds = time.perf_counter() - started
+        logging.info(f"Loaded {len(names)} tags with {sum(len(p) for p in postings.values())} postings "
+                     f"in {self.last_load_seconds * 1000:.1f} ms.")
+
+    def _load_changed(self, conn):
+        cursor = conn.cursor()
+        with span("db.tags"):
+            tags = self._changed_tags(cursor, self._version)
+            if not tags:
+                return
+            tag_ids = [row[0] for row in tags]
+            postings = {}
+            for start in range(0, len(tag_ids), MAX_IN_PARAMETERS):
+                chunk = tag_ids[start:start + MAX_IN_PARAMETERS]
+                cursor.execute(
+                    f"SELECT tag_id, insight_id FROM InsightTags WHERE tag_id IN ({', '.join('?' * len(chunk))}) "
+                    f"ORDER BY tag_id, insight_id",
+                    *chunk
+                )
+                rows = cursor.fetchall()
+                if rows:
+                    postings.update(_grouped(rows))
+        cursor.close()
+
+        with self._lock:
+            for tag_id, name, _ in tags:
+                self._postings[tag_id] = postings.get(tag_id, EMPTY)
+                self._names[tag_id] = name
+                self._ids[normalize_name(name)] = tag_id
+            self._version = max(self._version, max(row[2] for row in tags))
+        self.incremental_syncs += 1
+        self.tags_reloaded += len(tags)
+
+    def apply(self, tag_id, name, added=(), removed=()):
+        """Applies a committed write of this worker to the index."""
+        with self._lock:
+            postings = self._postings.get(tag_id, EMPTY)
+            if len(added):
+                postings = merge(postings, _as_postings(added))
+            if len(removed):
+                postings = difference(postings, _as_postings(removed))
+            self._postings[tag_id] = postings
+            self._names[tag_id] = name
+            self._ids[normalize_name(name)] = tag_id
+
+    def tag_id(self, name):
+        return self._ids.get(normalize_name(name))
+
+    def postings(self, name):
+        """Sorted insight ids carrying the tag (empty for an unknown tag)."""
+        tag_id = self.tag_id(name)
+        return self._postings.get(tag_id, EMPTY) if tag_id is not None else EMPTY
+
+    def query(self, all_of=(), any_of=(), none_of=()):
+        """
+        Insight ids carrying every tag in all_of, at least one tag in any_of (if given) and none
+        of the tags in none_of.
+
+        Returns:
+            numpy.ndarray: Sorted uint32 insight ids.
+        Raises:
+            ValueError: If neither all_of nor any_of is given; the complement of a tag would
+                need the full list of insights.
+        """
+        if not all_of and not any_of:
+            raise ValueError("A tag query needs at least one 'all' or 'any' tag.")
+        result = None
+        # Smallest first, so every intersection probes with the shortest array
+        for postings in sorted((self.postings(name) for name in all_of), key=len):
+            result = postings if result is None else intersect(result, postings)
+            if not len(result):
+                return EMPTY
+        if any_of:
+            postings = [self.postings(name) for name in any_of]
+            # Under an AND, narrow each alternative first: the union is then of small arrays
+            result = union(postings) if result is None else union([intersect(result, p) for p in postings])
+        for name in none_of:
+            if not len(result):
+                break
+            result = difference(result, self.postings(name))
+        return result
+
+    def tags(self):
+        """[(name, insight count)] of every tag, by name."""
+        return sorted(((name, len(self._postings.get(tag_id, EMPTY))) for tag_id, name in self._names.items()),
+                      key=lambda tag: normalize_name(tag[0]))
+
+    def stats(self):
+        postings = list(self._postings.values())
+        return {
+            "tags": len(postings),
+            "postings": sum(len(p) for p in postings),
+            "bytes": sum(p.nbytes for p in postings),
+            "full_loads": self.full_loads,
+            "incremental_syncs": self.incremental_syncs,
+            "tags_reloaded": self.tags_reloaded,
+            "last_load_ms": round(self.last_load_seconds * 1000, 3) if self.last_load_seconds is not None else None,
+        }
+
+
+_index = TagIndex()
+
+
+def get_tag_index():
+    """Returns the process-wide TagIndex."""
+    return _index
+
+
+def validate_tag_names(tag_names):
+    """
+    Checks a list of tag names from a request.
+
+    Returns:
+        list: The names, stripped, without duplicates (first spelling wins).
+    Raises:
+        ValueError: If a name is empty, too long or not a string.
+    """
+    if not isinstance(tag_names, list) or not tag_names:
+        raise ValueError("tags must be a non-empty list of tag names.")
+    if len(tag_names) > MAX_TAGS_PER_REQUEST:
+        raise ValueError(f"At most {MAX_TAGS_PER_REQUEST} tags per request.")
+    names = {}
+    for name in tag_names:
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError("Tag names must be non-empty strings.")
+        name = name.strip()
+        if len(name) > MAX_TAG_LENGTH:
+            raise ValueError(f"Tag names are at most {MAX_TAG_LENGTH} characters.")
+        names.setdefault(normalize_name(name), name)
+    return list(names.values())
+
+
+def resolve_tags(cursor, tag_names, create):
+    """
+    Returns {name: (tag id, stored name)} for tag_names, creating missing tags when create is set
+    (otherwise unknown names are left out).
+    """
+    def select():
+        cursor.execute(f"SELECT id, tag_name FROM Tags WHERE tag_name IN ({', '.join('?' * len(tag_names))})",
+                       *tag_names)
+        return {normalize_name(name): (tag_id, name) for tag_id, name in cursor.fetchall()}
+
+    found = select()
+    missing = [name for name in tag_names if normalize_name(name) not in found]
+    if missing and create:
+        for name in missing:
+            cursor.execute(CREATE_TAG_SQL, name, name)
+        found = select()
+    return {name: found[normalize_name(name)] for name in tag_names if normalize_name(name) in found}
+
+
+def update_tags(conn, tag_names, insight_ids, remove=False, index=None):
+    """
+    Adds every tag in tag_names to every insight in insight_ids (or removes them) in one
+    transaction, then applies the change to the worker's tag index.
+
+    The ids are bulk copied into a session temp table once; each tag is then one set-based
+    INSERT ... SELECT (or DELETE ... JOIN) that skips existing (or absent) pairs. Unknown insight
+    ids are ignored and reported.
+
+    Args:
+        conn: An open pyodbc connection. The caller owns it; this function commits on success.
+        tag_names (list): Validated tag names (see validate_tag_names). Missing tags are created
+            when adding.
+        insight_ids (list): Insight ids.
+        remove (bool): Remove the tags instead of adding them.
+        index (TagIndex): Index to update; the process-wide one by default.
+    Returns:
+        dict: Per tag the number of insights added or removed, plus the unknown insight ids.
+    """
+    index = index or get_tag_index()
+    insight_ids = sorted(set(insight_ids))
+    cursor = conn.cursor()
+    cursor.fast_executemany = True
+    with span("db.stage", rows=len(insight_ids)):
+        cursor.execute(CREATE_STAGING_SQL)
+        cursor.executemany(STAGING_INSERT_SQL, [(insight_id,) for insight_id in insight_ids])
+    cursor.fast_executemany = False
+
+    with span("db.tags"):
+        tags = resolve_tags(cursor, tag_names, create=not remove)
+        unknown = [row[0] for row in cursor.execute(UNKNOWN_INSIGHTS_SQL).fetchall()]
+        changed = {}
+        for name, (tag_id, stored_name) in tags.items():
+            if remove:
+                cursor.execute(REMOVE_POSTINGS_SQL, tag_id)
+            else:
+                cursor.execute(ADD_POSTINGS_SQL, tag_id, tag_id)
+            changed[name] = (tag_id, stored_name, [row[0] for row in cursor.fetchall()])
+            count = len(changed[name][2])
+            if count:
+                cursor.execute(UPDATE_COUNT_SQL, -count if remove else count, tag_id)
+
+    cursor.execute("DROP TABLE #TagStaging")
+    with span("db.commit"):
+        conn.commit()
+
+    for tag_id, stored_name, ids in changed.values():
+        if remove:
+            index.apply(tag_id, stored_name, removed=ids)
+        else:
+            index.apply(tag_id, stored_name, added=ids)
+
+    verb = "removed" if remove else "added"
+    logging.info(f"Tags {verb}: " + ", ".join(f"{name}={len(ids)}" for name, (_, _, ids) in changed.items()))
+    return {
+        "tags": {name: {verb: len(ids)} for name, (_, _, ids) in changed.items()},
+        "unknown_tags": [name for name in tag_names if name not in tags],
+        "unknown_insight_ids": unknown[:MAX_REPORTED_UNKNOWN_IDS],
+        "unknown_insight_count": len(unknown),
+    }
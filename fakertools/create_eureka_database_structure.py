@@ -1,61 +1,402 @@
-import pyodbc
+"""
+Deploys and inspects the Eureka schema.
+
+    python create_eureka_database_structure.py migrate       # apply pending migrations
+    python create_eureka_database_structure.py status        # list applied and pending migrations
+    python create_eureka_database_structure.py plans         # estimated plans of the service queries
+    python create_eureka_database_structure.py backfill-hashes  # content_hash of rows inserted without one
+    python create_eureka_database_structure.py rebuild-rollups  # recompute the analytics rollups
+    python create_eureka_database_structure.py check-rollups    # compare the rollups with a full GROUP BY
+    python create_eureka_database_structure.py run file.sql  # execute any script, batch by batch
+
+Migrations are the scripts in MIGRATIONS, applied in order and recorded in SchemaMigrations, so
+reruns only apply what is new. Scripts are split into batches on GO lines (outside strings and
+comments) and each batch is sent in one round trip.
+
+The connection string comes from --connection-string or the SqlConnectionString environment
+variable.
+"""
+import argparse
+import hashlib
 import os
+import re
 import sys
+import time
+
+import pyodbc
+
+FAKERTOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(FAKERTOOLS_DIR)
+
+# (version, script relative to fakertools/), in the order they must be applied
+MIGRATIONS = [
+    ("0001", "create_eureka_db.sql"),
+    ("0002", "load_eureka_db.sql"),
+    ("0003", "migrations/0003_service_indexes.sql"),
+    ("0004", "migrations/0004_tags.sql"),
+    ("0005", "migrations/0005_content_hash.sql"),
+    ("0006", "migrations/0006_rollups.sql"),
+    ("0007", "migrations/0007_recommendation_row_version.sql"),
+]
+# Applied by hand before this tool existed; recorded without running when the tables are present
+BASELINE_VERSIONS = ("0001", "0002")
+
+CREATE_VERSION_TABLE_SQL = """
+IF OBJECT_ID('SchemaMigrations') IS NULL
+    CREATE TABLE SchemaMigrations (
+        version NVARCHAR(50) NOT NULL PRIMARY KEY,
+        script NVARCHAR(255) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        applied_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME(),
+        duration_ms INT NULL
+    );
+"""
 
-def execute_sql_file(sql_file):
+GO_LINE = re.compile(r"^\s*GO(?:\s+(\d+))?\s*(?:--.*)?$", re.IGNORECASE)
+
+
+def split_batches(script):
     """
-    Executes a SQL script file against an MS SQL Server database using a connection string from an environment variable.
+    Splits a T-SQL script into batches on GO separator lines, like sqlcmd.
+
+    GO only separates batches when it stands on its own line outside string literals,
+    quoted or bracketed identifiers and block comments; "GO n" repeats the batch n times.
+    Batches consisting only of whitespace and comments are dropped.
 
-    Args:
-        sql_file (str): Path to the SQL file.
+    Returns:
+        list: Batch texts.
     """
-    # Read connection string from environment variable
-    connection_string = "Driver={ODBC Driver 17 for SQL Server};Server=insights-engine.database.windows.net,1433;Database=eureka;Uid=insights-admin;Pwd=d£xXe96n2o+_;Encrypt=yes;TrustServerCertificate=no;Connection Timeout=30;"
+    batches = []
+    current = []
+    has_code = False
+    closing = None  # closing quote of the literal or identifier being scanned
+    comment_depth = 0  # T-SQL block comments nest
+
+    for line in script.splitlines(keepends=True):
+        if closing is None and comment_depth == 0:
+            match = GO_LINE.match(line)
+            if match:
+                if has_code:
+                    batches.extend(["".join(current)] * int(match.group(1) or 1))
+                current = []
+                has_code = False
+                continue
+
+        position = 0
+        length = len(line)
+        while position < length:
+            char = line[position]
+            pair = line[position:position + 2]
+            if comment_depth:
+                if pair == "/*":
+                    comment_depth += 1
+                    position += 1
+                elif pair == "*/":
+                    comment_depth -= 1
+                    position += 1
+            elif closing is not None:
+                if char == closing:
+                    if line[position + 1:position + 2] == closing:
+                        position += 1  # doubled quote is an escaped quote
+                    else:
+                        closing = None
+            elif pair == "--":
+                break
+            elif pair == "/*":
+                comment_depth = 1
+                position += 1
+            elif char in "'\"[":
+                closing = "]" if char == "[" else char
+                has_code = True
+            elif not char.isspace():
+                has_code = True
+            position += 1
+        current.append(line)
+
+    if has_code:
+        batches.append("".join(current))
+    return batches
+
+
+def read_script(relative_path):
+    with open(os.path.join(FAKERTOOLS_DIR, relative_path), "r", encoding="utf-8-sig") as file:
+        return file.read()
+
+
+def checksum(script):
+    return hashlib.sha256(script.encode("utf-8")).hexdigest()
+
+
+def execute_batch(cursor, batch):
+    """Runs one batch and walks all its result sets so errors from later statements surface."""
+    cursor.execute(batch)
+    while cursor.nextset():
+        pass
+
+
+def connect(connection_string):
     if not connection_string:
-        raise EnvironmentError("Environment variable 'SqlConnectionString' is not set.")
+        raise EnvironmentError("Set SqlConnectionString or pass --connection-string.")
+    return pyodbc.connect(connection_string, autocommit=False)
+
+
+def applied_migrations(conn):
+    """Returns {version: checksum} of recorded migrations, creating the version table if needed."""
+    cursor = conn.cursor()
+    execute_batch(cursor, CREATE_VERSION_TABLE_SQL)
+    conn.commit()
+    return dict(cursor.execute("SELECT version, checksum FROM SchemaMigrations").fetchall())
+
+
+def _record(cursor, version, script_path, script, duration_ms):
+    cursor.execute(
+        "INSERT INTO SchemaMigrations (version, script, checksum, duration_ms) VALUES (?, ?, ?, ?)",
+        version, script_path, checksum(script), duration_ms
+    )
+
+
+def migrate(conn, log=print):
+    """
+    Applies pending migrations, each in its own transaction together with its version row.
+
+    A database whose tables were created before SchemaMigrations existed is baselined: the
+    BASELINE_VERSIONS are recorded without running them.
+
+    Returns:
+        list: Versions applied by this call.
+    """
+    applied = applied_migrations(conn)
+    cursor = conn.cursor()
+
+    if not applied and cursor.execute("SELECT OBJECT_ID('Insights')").fetchone()[0] is not None:
+        for version, script_path in MIGRATIONS:
+            if version in BASELINE_VERSIONS:
+                _record(cursor, version, script_path, read_script(script_path), None)
+                applied[version] = checksum(read_script(script_path))
+                log(f"Baselined {version} {script_path} (schema already present).")
+        conn.commit()
+
+    newly_applied = []
+    for version, script_path in MIGRATIONS:
+        script = read_script(script_path)
+        if version in applied:
+            if applied[version] != checksum(script):
+                log(f"Warning: {version} {script_path} changed after it was applied; not re-running it.")
+            continue
 
+        batches = split_batches(script)
+        started = time.perf_counter()
+        try:
+            for batch in batches:
+                execute_batch(cursor, batch)
+            duration_ms = int((time.perf_counter() - started) * 1000)
+            _record(cursor, version, script_path, script, duration_ms)
+            conn.commit()
+        except pyodbc.Error:
+            conn.rollback()
+            log(f"Migration {version} {script_path} failed; nothing from it was kept.")
+            raise
+        newly_applied.append(version)
+        log(f"Applied {version} {script_path}: {len(batches)} batch(es) in {duration_ms} ms.")
+    return newly_applied
+
+
+def created_tables():
+    """Tables created by the migrations, in creation order."""
+    tables = []
+    for _, script_path in MIGRATIONS:
+        tables += re.findall(r"^\s*CREATE\s+TABLE\s+\[?(\w+)\]?", read_script(script_path), re.IGNORECASE | re.MULTILINE)
+    return tables
+
+
+def drop_schema(conn):
+    """Drops every migrated table and the version table. Only for disposable databases."""
+    cursor = conn.cursor()
+    # Children are created after their parents, so reverse order respects the foreign keys
+    for table in reversed(created_tables() + ["SchemaMigrations"]):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    conn.commit()
+
+
+def status(conn):
+    applied = applied_migrations(conn)
+    for version, script_path in MIGRATIONS:
+        state = "applied" if version in applied else "pending"
+        if version in applied and applied[version] != checksum(read_script(script_path)):
+            state = "applied (script changed since)"
+        print(f"{version}  {state:<30} {script_path}")
+
+
+def backfill_content_hashes(conn, chunk_rows=5000, log=print):
+    """
+    Fills Insights.content_hash for rows inserted before migration 0005 or by other tools, so
+    ingest duplicate checks see them. Commits per chunk; safe to interrupt and rerun.
+    """
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    from db_helpers.ingestDedup import content_hash
+
+    cursor = conn.cursor()
+    cursor.fast_executemany = True
+    after_id = 0
+    updated = 0
+    while True:
+        rows = cursor.execute(
+            "SELECT TOP (?) id, content FROM Insights WHERE id > ? AND content_hash IS NULL ORDER BY id",
+            chunk_rows, after_id
+        ).fetchall()
+        if not rows:
+            break
+        cursor.executemany("UPDATE Insights SET content_hash = ? WHERE id = ?",
+                           [(content_hash(content or ""), insight_id) for insight_id, content in rows])
+        conn.commit()
+        updated += len(rows)
+        after_id = rows[-1][0]
+    log(f"Backfilled content_hash of {updated} insights.")
+    return updated
+
+
+def rebuild_rollups(conn, log=print):
+    """Recomputes the analytics rollups, e.g. after insights or recommendations were loaded directly."""
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    from db_helpers import insightRollups
+
+    started = time.perf_counter()
+    written = insightRollups.rebuild_rollups(conn)
+    log(f"Rebuilt rollups in {time.perf_counter() - started:.1f}s: {written['insight_groups']} insight groups, "
+        f"{written['recommendation_statuses']} recommendation statuses.")
+    return written
+
+
+def check_rollups(conn, log=print):
+    """Compares the analytics rollups with a full GROUP BY; exits non-zero when they differ."""
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    from db_helpers import insightRollups
+
+    differences = insightRollups.check_rollups(conn)
+    for table, rows in differences.items():
+        for group, expected, actual in rows:
+            log(f"{table} {group}: {actual} in the rollup, {expected} counted")
+    count = sum(map(len, differences.values()))
+    if count:
+        sys.exit(f"{count} rollup groups differ; run rebuild-rollups.")
+    log("Rollups match the fact tables.")
+
+
+def service_queries():
+    """
+    (name, SQL) pairs for the queries the functions run on hot paths, with parameters inlined
+    as representative literals so SHOWPLAN can compile them.
+    """
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    from db_helpers.compiledPredictor import FEATURE_COLUMNS
+    from db_helpers.dimensionCache import LOAD_QUERY
+    from db_helpers.generateRecommendations import UPSERT_PENDING_SQL
+    from db_helpers.getInsights import INSIGHT_FACTS_QUERY, insights_query
+    from db_helpers.insightRollups import INSIGHT_ROLLUPS_QUERY
+    from db_helpers.tagIndex import ADD_POSTINGS_SQL, LOAD_POSTINGS_QUERY, LOAD_TAGS_QUERY
+    from recommendations_summary import DELTA_QUERY, RECOMMENDATIONS_QUERY, STATE_QUERY
+
+    def inline(sql, *values):
+        for value in values:
+            sql = sql.replace("?", value, 1)
+        return sql
+
+    features = ", ".join(f"i.{column}" for column in FEATURE_COLUMNS)
+    return [
+        ("dimension cache load", LOAD_QUERY),
+        ("insights: all", INSIGHT_FACTS_QUERY),
+        ("insights: page", inline(insights_query("i.id > ?", top=True), "101", "5000")),
+        ("insights: page filtered by domain", inline(insights_query("i.id > ? AND i.domain_id = ?", top=True), "101", "5000", "2")),
+        ("insights: created_at range", inline(insights_query("i.id > ? AND i.created_at >= ? AND i.created_at < ?", top=True),
+                                              "101", "0", "'2024-01-01'", "'2024-02-01'")),
+        ("recommendations: all", RECOMMENDATIONS_QUERY),
+        ("recommendations: state", STATE_QUERY),
+        ("recommendations: delta", inline(DELTA_QUERY, "5001", "0x00000000000007D1")),
+        ("features by id", f"SELECT i.id, {features} FROM Insights i WHERE i.id IN (1, 2, 3)"),
+        ("unscored features by id", f"""
+            SELECT i.id, {features} FROM Insights i
+            WHERE i.id IN (1, 2, 3) AND NOT EXISTS (SELECT 1 FROM Recommendations r WHERE r.insight_id = i.id)"""),
+        ("features missing a recommendation", f"""
+            SELECT TOP (2000) i.id, {features}
+            FROM Insights i
+            WHERE i.id > 0 AND NOT EXISTS (SELECT 1 FROM Recommendations r WHERE r.insight_id = i.id)
+            ORDER BY i.id"""),
+        ("pending recommendation upsert", inline(UPSERT_PENDING_SQL, "1", "N'text'", "1", "1", "GETDATE()", "GETDATE()", "1", "1")),
+        ("analytics rollups filtered by domain", INSIGHT_ROLLUPS_QUERY + " WHERE domain_id = 2 AND month >= '2024-01-01'"),
+        ("tags changed since a version", inline(LOAD_TAGS_QUERY, "0")),
+        ("tag postings: all", LOAD_POSTINGS_QUERY),
+        ("tag postings: changed tags", "SELECT tag_id, insight_id FROM InsightTags WHERE tag_id IN (1, 2, 3) ORDER BY tag_id, insight_id"),
+        # The staging temp table only exists inside update_tags; a table variable stands in for it
+        ("tag bulk add", "DECLARE @s TABLE (insight_id INT PRIMARY KEY);\n"
+                         + inline(ADD_POSTINGS_SQL, "1", "1").replace("#TagStaging", "@s")),
+    ]
+
+
+def show_plans(conn):
+    """Prints the estimated plan of every service query (SET SHOWPLAN_TEXT; nothing is executed)."""
+    cursor = conn.cursor()
+    cursor.execute("SET SHOWPLAN_TEXT ON")
     try:
-        # Connect to the database
-        connection = pyodbc.connect(connection_string)
-        cursor = connection.cursor()
-
-        # Read the SQL file
-        with open(sql_file, 'r') as file:
-            sql_script = file.read()
-
-        # Split and execute each SQL statement
-        for statement in sql_script.split(';'):
-            statement = statement.strip()
-            if statement:
-                cursor.execute(statement)
-                print(f"Executed statement: {statement[:50]}...")
-
-        # Commit changes
-        connection.commit()
-        print("SQL script executed successfully.")
-
-    except pyodbc.Error as e:
-        print(f"Database error: {e}")
-    except FileNotFoundError:
-        print(f"SQL file not found: {sql_file}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+        for name, sql in service_queries():
+            print(f"=== {name}")
+            cursor.execute(sql)
+            while True:
+                if cursor.description:
+                    for row in cursor.fetchall():
+                        print(row[0].rstrip())
+                if not cursor.nextset():
+                    break
+            print()
     finally:
-        if 'cursor' in locals() and cursor:
-            cursor.close()
-        if 'connection' in locals() and connection:
-            connection.close()
+        cursor.execute("SET SHOWPLAN_TEXT OFF")
 
-if __name__ == "__main__":
-    # Example usage
-    if len(sys.argv) != 2:
-        print("Usage: python create_eureka_database_structure.py <sql_file>")
-        sys.exit(1)
 
-    sql_file = sys.argv[1]
+def execute_sql_file(connection_string, sql_file):
+    """Executes a script against the database batch by batch in one transaction."""
+    with open(sql_file, "r", encoding="utf-8-sig") as file:
+        batches = split_batches(file.read())
+    conn = connect(connection_string)
     try:
-        execute_sql_file(sql_file)
-    except EnvironmentError as env_err:
-        print(env_err)
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        cursor = conn.cursor()
+        for number, batch in enumerate(batches, start=1):
+            execute_batch(cursor, batch)
+            print(f"Executed batch {number}/{len(batches)}.")
+        conn.commit()
+    except pyodbc.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["migrate", "status", "plans", "backfill-hashes",
+                                                         "rebuild-rollups", "check-rollups", "run"])
+    parser.add_argument("sql_file", nargs="?", help="Script for the run command")
+    parser.add_argument("--connection-string", default=os.getenv("SqlConnectionString"))
+    args = parser.parse_args()
+
+    try:
+        if args.command == "run":
+            if not args.sql_file:
+                parser.error("run needs a SQL file")
+            execute_sql_file(args.connection_string, args.sql_file)
+            return
+        conn = connect(args.connection_string)
+        try:
+            {"migrate": migrate, "status": status, "plans": show_plans,
+             "backfill-hashes": backfill_content_hashes, "rebuild-rollups": rebuild_rollups,
+             "check-rollups": check_rollups}[args.command](conn)
+        finally:
+            conn.close()
+    except (EnvironmentError, pyodbc.Error) as e:
+        sys.exit(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
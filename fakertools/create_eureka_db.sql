@@ -1,5 +1,3 @@
--- Switch to the eureka database
-USE eureka;
 -- Table: InsightTypes
 CREATE TABLE InsightTypes (
     id INT IDENTITY(1,1) PRIMARY KEY,
@@ -116,3 +114,5 @@ CREATE TABLE Recommendations (
 -- Indexes
 CREATE INDEX IDX_recommendations_insight_id ON Recommendations(insight_id);
 CREATE INDEX IDX_recommendations_status ON Recommendations(status);
+-- Watermark order for delta sync in recommendations_summary
+CREATE INDEX IDX_recommendations_updated_at_id ON Recommendations(updated_at, id);
@@ -1,40 +1,189 @@
+"""
+Generates synthetic customer profiles (or insights uploads) for load tests.
+
+Rows are produced in chunks across a process pool. Chunk i is always generated from seed
+chunk_seed(seed, i), so the output for a given --seed is identical whatever the number of
+workers. Each chunk is streamed row by row into its own part file; CSV parts are appended to the
+output file in chunk order, Parquet parts are kept as a dataset directory.
+
+    python generate_customer_profiles.py --rows 1000000 --workers 8 --output customer_profiles.csv
+    python generate_customer_profiles.py --kind insights --rows 100000 --output insights.csv
+    python generate_customer_profiles.py --rows 5000000 --format parquet --output profiles_parquet
+"""
+import argparse
 import csv
-from faker import Faker
+import itertools
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from generate_insights import INSIGHT_CSV_HEADERS, insight_csv_rows
+except ImportError:  # imported as fakertools.generate_customer_profiles
+    from fakertools.generate_insights import INSIGHT_CSV_HEADERS, insight_csv_rows
+
+PROFILE_COLUMNS = [
+    "id", "first_name", "last_name", "email", "phone_number", "address", "city", "state",
+    "zip_code", "company", "job_title", "dob"
+]
+
+DEFAULT_CHUNK_SIZE = 50000
+# Rows buffered per Parquet row group; CSV rows are written one at a time
+PARQUET_ROW_GROUP_SIZE = 10000
+
+
+def chunk_seed(seed, index):
+    """Seed of chunk index; independent of how chunks are spread over workers."""
+    return seed * 1_000_003 + index
+
 
-fake = Faker()
+def profile_rows(count, seed):
+    """Yields count customer profiles in PROFILE_COLUMNS order from a Faker seeded with seed."""
+    from faker import Faker
 
-def generate_customer_profiles(count):
-    profiles = []
+    fake = Faker()
+    fake.seed_instance(seed)
     for _ in range(count):
-        profiles.append({
-            "id": fake.uuid4(),
-            "first_name": fake.first_name(),
-            "last_name": fake.last_name(),
-            "email": fake.email(),
-            "phone_number": fake.phone_number(),
-            "address": fake.address(),
-            "city": fake.city(),
-            "state": fake.state(),
-            "zip_code": fake.zipcode(),
-            "company": fake.company(),
-            "job_title": fake.job(),
-            "dob": fake.date_of_birth(minimum_age=18, maximum_age=70).strftime("%Y-%m-%d"),
-        })
-    return profiles
-
-def generate_and_save_in_batches(batch_size=100, total_count=500, filename="customer_profiles.csv"):
-    with open(filename, mode="w", newline="", encoding="utf-8") as file:
-        writer = None
-        generated_count = 0
-        
-        while generated_count < total_count:
-            profiles = generate_customer_profiles(min(batch_size, total_count - generated_count))
-            if writer is None:
-                # Initialize writer with header for the first batch
-                writer = csv.DictWriter(file, fieldnames=profiles[0].keys())
-                writer.writeheader()
-            writer.writerows(profiles)
-            generated_count += len(profiles)
-            print(f"{generated_count}/{total_count} records written.")
-
-generate_and_save_in_batches(batch_size=100, total_count=500)
\ No newline at end of file
+        yield (
+            fake.uuid4(),
+            fake.first_name(),
+            fake.last_name(),
+            fake.email(),
+            fake.phone_number(),
+            fake.address(),
+            fake.city(),
+            fake.state(),
+            fake.zipcode(),
+            fake.company(),
+            fake.job(),
+            fake.date_of_birth(minimum_age=18, maximum_age=70).strftime("%Y-%m-%d"),
+        )
+
+
+# Kind -> (columns, row generator taking (count, seed))
+KINDS = {
+    "profiles": (PROFILE_COLUMNS, profile_rows),
+    "insights": (INSIGHT_CSV_HEADERS, insight_csv_rows),
+}
+
+
+def write_csv(path, rows):
+    with open(path, mode="w", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerows(rows)
+
+
+def write_parquet(path, columns, rows, row_group_size=PARQUET_ROW_GROUP_SIZE):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(column, pa.string()) for column in columns])
+    with pq.ParquetWriter(path, schema) as writer:
+        while True:
+            group = list(itertools.islice(rows, row_group_size))
+            if not group:
+                break
+            arrays = [pa.array([str(value) for value in values], pa.string()) for values in zip(*group)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+def write_chunk(task):
+    """Worker: generates one chunk straight into its part file. Returns (index, rows, seconds)."""
+    kind, output_format, path, index, count, seed = task
+    columns, generator = KINDS[kind]
+    started = time.perf_counter()
+    rows = generator(count, chunk_seed(seed, index))
+    if output_format == "parquet":
+        write_parquet(path, columns, rows)
+    else:
+        write_csv(path, rows)
+    return index, count, time.perf_counter() - started
+
+
+def generate(kind="profiles", rows=500, output="customer_profiles.csv", output_format="csv",
+             workers=None, chunk_size=DEFAULT_CHUNK_SIZE, seed=0, progress=print):
+    """
+    Generates rows of the given kind into output.
+
+    Args:
+        kind (str): "profiles" or "insights" (an insights_injest_csv upload with lookup names).
+        rows (int): Total rows.
+        output (str): CSV file, or a directory of part files for Parquet.
+        output_format (str): "csv" or "parquet" (requires pyarrow).
+        workers (int): Processes; defaults to the CPU count. 1 runs in this process.
+        chunk_size (int): Rows per chunk (and per part file).
+        seed (int): Base seed.
+        progress (callable): Receives one progress line per finished chunk; None for silence.
+    Returns:
+        dict: rows, chunks, seconds and rows_per_second.
+    """
+    columns, _ = KINDS[kind]
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+
+    if output_format == "parquet":
+        os.makedirs(output, exist_ok=True)
+        parts_dir = output
+    else:
+        parts_dir = tempfile.mkdtemp(prefix="parts-", dir=os.path.dirname(os.path.abspath(output)))
+    extension = "parquet" if output_format == "parquet" else "csv"
+    tasks = [
+        (kind, output_format, os.path.join(parts_dir, f"part-{index:05d}.{extension}"),
+         index, min(chunk_size, rows - start), seed)
+        for index, start in enumerate(range(0, rows, chunk_size))
+    ]
+
+    done = 0
+    output_file = None
+    try:
+        if output_format != "parquet":
+            output_file = open(output, mode="w", newline="", encoding="utf-8")
+            csv.writer(output_file).writerow(columns)
+
+        executor = ProcessPoolExecutor(workers) if workers > 1 else None
+        results = executor.map(write_chunk, tasks) if executor else map(write_chunk, tasks)
+        try:
+            # map yields in chunk order, so CSV parts are appended deterministically
+            for (index, count, _), task in zip(results, tasks):
+                if output_file is not None:
+                    with open(task[2], "r", newline="", encoding="utf-8") as part:
+                        shutil.copyfileobj(part, output_file, 1 << 20)
+                    os.remove(task[2])
+                done += count
+                if progress:
+                    elapsed = time.perf_counter() - started
+                    progress(f"{done}/{rows} rows ({done / elapsed:,.0f} rows/s)")
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+    finally:
+        if output_file is not None:
+            output_file.close()
+            shutil.rmtree(parts_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - started
+    return {"rows": done, "chunks": len(tasks), "seconds": round(elapsed, 3),
+            "rows_per_second": round(done / elapsed) if elapsed > 0 else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kind", choices=sorted(KINDS), default="profiles")
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--output", help="Output CSV file, or directory for Parquet")
+    parser.add_argument("--format", dest="output_format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    output = args.output or (f"{'customer_profiles' if args.kind == 'profiles' else 'insights'}"
+                             f"{'.csv' if args.output_format == 'csv' else '_parquet'}")
+    summary = generate(args.kind, args.rows, output, args.output_format, args.workers, args.chunk_size, args.seed)
+    print(f"Wrote {summary['rows']} {args.kind} rows to {output} in {summary['seconds']}s "
+          f"({summary['rows_per_second']:,} rows/s).")
+
+
+if __name__ == "__main__":
+    main()
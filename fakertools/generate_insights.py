@@ -0,0 +1,90 @@
+import datetime
+import random
+
+# Insights columns in insert order
+INSIGHT_COLUMNS = [
+    "content", "created_at", "insight_type_id", "data_source_id", "audience_id", "domain_id",
+    "confidence_level_id", "timeliness_id", "alignment_goal_id", "value_priority_id"
+]
+
+# Lookup names seeded by load_eureka_db.sql, in id order (id = position + 1)
+LOOKUP_NAMES = {
+    "insight_type": ["Descriptive", "Predictive", "Prescriptive"],
+    "data_source": ["Claims Data", "Member Portal Usage", "Pharmacy Data", "Demographic Data"],
+    "audience": ["Individual Members", "Member Cohorts", "Organization-Wide"],
+    "domain": ["Health Outcomes", "Operational Efficiency", "Member Engagement"],
+    "confidence_level": ["High", "Medium", "Low"],
+    "timeliness": ["Real-Time", "Periodic", "Historical"],
+    "alignment_goal": ["Cost Optimization", "Member Engagement", "Risk Mitigation",
+                       "Health Improvement", "Operational Efficiency"],
+    "value_priority": ["Actionable", "Informational", "Strategic"],
+}
+# Number of rows each lookup table gets (ids 1..N)
+LOOKUP_COUNTS = {f"{key}_id": len(names) for key, names in LOOKUP_NAMES.items()}
+
+# Header of an insights_injest_csv upload
+INSIGHT_CSV_HEADERS = ["content", "created_at"] + list(LOOKUP_NAMES)
+
+DELIVERY_CHANNEL_COUNT = 5
+
+# Sentence parts for insight content; plain word lists keep generation fast at millions of rows
+COHORTS = ["members over 65", "new enrollees", "members with diabetes", "high-risk members", "members in rural areas",
+           "members with hypertension", "members without a primary care physician", "pediatric members",
+           "members with asthma", "members on specialty drugs"]
+METRICS = ["ER visits", "portal logins", "prescription adherence", "preventive screenings", "claims cost",
+           "telehealth usage", "readmissions", "wellness program sign-ups", "call center contacts", "annual checkups"]
+PERIODS = ["the last 30 days", "the last quarter", "the last 6 months", "the last year", "flu season"]
+RECOMMENDATION_TEXTS = [
+    "Send targeted notification about health resources.",
+    "Send an email to select a primary care physician.",
+    "Provide manual review for custom recommendation.",
+]
+STATUSES = ["Pending", "Pending", "Pending", "Delivered", "Dismissed"]
+
+START_DATE = datetime.datetime(2023, 1, 1)
+DATE_RANGE_SECONDS = 2 * 365 * 24 * 3600
+
+
+def insight_content(rng):
+    change = rng.randint(2, 60)
+    direction = rng.choice(["increase", "decrease"])
+    return (f"{rng.choice(COHORTS).capitalize()} showed a {change}% {direction} in "
+            f"{rng.choice(METRICS)} over {rng.choice(PERIODS)}.")
+
+
+def insight_rows(count, seed=0):
+    """
+    Yields synthetic Insights rows in INSIGHT_COLUMNS order.
+
+    Lookup ids reference the seed data of load_eureka_db.sql. The same seed always yields the
+    same rows, so benchmark runs are comparable.
+    """
+    rng = random.Random(seed)
+    lookup_counts = list(LOOKUP_COUNTS.values())
+    for _ in range(count):
+        created_at = START_DATE + datetime.timedelta(seconds=rng.randrange(DATE_RANGE_SECONDS))
+        yield (insight_content(rng), created_at, *(rng.randint(1, size) for size in lookup_counts))
+
+
+def insight_csv_rows(count, seed=0):
+    """
+    Yields synthetic upload rows in INSIGHT_CSV_HEADERS order, with lookup names instead of ids.
+    """
+    for row in insight_rows(count, seed):
+        names = [seeded[lookup_id - 1] for seeded, lookup_id in zip(LOOKUP_NAMES.values(), row[2:])]
+        yield [row[0], row[1].strftime("%Y-%m-%d %H:%M:%S")] + names
+
+
+def recommendation_rows(insight_ids, seed=0):
+    """
+    Yields synthetic Recommendations rows (insight_id, recommendation_text, confidence_level_id,
+    delivery_channel_id, status, created_at, updated_at) for the given insight ids.
+    """
+    rng = random.Random(seed)
+    for insight_id in insight_ids:
+        created_at = START_DATE + datetime.timedelta(seconds=rng.randrange(DATE_RANGE_SECONDS))
+        updated_at = created_at + datetime.timedelta(seconds=rng.randrange(7 * 24 * 3600))
+        yield (
+            insight_id, rng.choice(RECOMMENDATION_TEXTS), rng.randint(1, LOOKUP_COUNTS["confidence_level_id"]),
+            rng.randint(1, DELIVERY_CHANNEL_COUNT), rng.choice(STATUSES), created_at, updated_at
+        )
@@ -1,72 +1,242 @@
+"""
+Bulk loads a customer profiles CSV (see generate_customer_profiles.py) into the Customers table.
+
+The CSV is streamed in chunks; each chunk is inserted with fast_executemany and committed on its
+own, and finished chunks are recorded in a checkpoint file so an interrupted load resumes where
+it stopped. With --workers N, chunks are spread over N threads with one connection each. A chunk
+the database rejects is retried row by row, so one bad row only costs that row; rejected rows are
+written to <csv>.rejects.csv.
+
+Connection settings come from --connection-string or the CustomerDataStoreConnectionString
+(falling back to SqlConnectionString) environment variable.
+
+    python load_customer_profiles_csv.py customer_profiles.csv --workers 4
+"""
+import argparse
+import csv
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
 import pyodbc
-import pandas as pd
-
-# Database connection details
-server = 'insights-engine.database.windows.net'  # Azure SQL Server name
-database = 'CustomerDataStore'  # Database name
-username = 'insights-admin'       # Username
-password = 'd£xXe96n2o+_'       # Password
-driver = '{ODBC Driver 17 for SQL Server}'  # ODBC Driver
-
-# CSV file path
-csv_file_path = '/Users/ananthagutta/web-apps/eureka-backend-functions/fakertools/customer_profiles.csv'
-
-# Table name
-table_name = 'Customers'
-
-# Create a connection to the database
-def create_connection():
-    connection_string = f"""
-    DRIVER={driver};
-    SERVER={server};
-    PORT=1433;
-    DATABASE={database};
-    UID={username};
-    PWD={password};
+
+# Columns loaded into the table; the CSV's generated id column is not loaded
+LOAD_COLUMNS = [
+    "first_name", "last_name", "email", "phone_number", "address", "city", "state",
+    "zip_code", "company", "job_title", "dob"
+]
+
+DEFAULT_TABLE = "Customers"
+DEFAULT_CHUNK_SIZE = 10000
+
+
+def connection_string_from_env():
+    return os.getenv("CustomerDataStoreConnectionString") or os.getenv("SqlConnectionString")
+
+
+def read_chunks(csv_file_path, chunk_size):
+    """Yields (chunk index, first line number, rows) with rows in LOAD_COLUMNS order."""
+    with open(csv_file_path, "r", newline="", encoding="utf-8-sig") as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return
+        missing = [column for column in LOAD_COLUMNS if column not in header]
+        if missing:
+            raise ValueError(f"CSV is missing columns: {', '.join(missing)}")
+        positions = [header.index(column) for column in LOAD_COLUMNS]
+
+        index = 0
+        rows = []
+        first_line = reader.line_num + 1
+        for record in reader:
+            if not record:
+                continue
+            rows.append([record[position] or None for position in positions])
+            if len(rows) == chunk_size:
+                yield index, first_line, rows
+                index += 1
+                rows = []
+                first_line = reader.line_num + 1
+        if rows:
+            yield index, first_line, rows
+
+
+class Checkpoint:
     """
+    Set of committed chunk indices, persisted after every chunk with an atomic replace.
+
+    The checkpoint is only valid for the same file (size and mtime) and chunk size; anything
+    else starts a fresh load.
+    """
+
+    def __init__(self, path, csv_file_path, chunk_size, restart=False):
+        self.path = path
+        stat = os.stat(csv_file_path)
+        self.identity = {"csv": os.path.abspath(csv_file_path), "size": stat.st_size,
+                         "mtime": stat.st_mtime, "chunk_size": chunk_size}
+        self.completed = set()
+        self._lock = threading.Lock()
+        if not restart and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                saved = json.load(file)
+            if {key: saved.get(key) for key in self.identity} == self.identity:
+                self.completed = set(saved.get("completed", []))
+            else:
+                print(f"Ignoring checkpoint {path}: it belongs to another file or chunk size.")
+
+    def done(self, index):
+        with self._lock:
+            self.completed.add(index)
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump({**self.identity, "completed": sorted(self.completed)}, file)
+            os.replace(temporary_path, self.path)
+
+
+def insert_chunk(conn, sql, first_line, rows):
+    """
+    Inserts one chunk in a single transaction. If the database rejects the batch, the chunk is
+    retried row by row so only the offending rows are skipped.
+
+    Returns:
+        tuple: (rows inserted, list of (line number, row, error) rejects)
+    """
+    cursor = conn.cursor()
+    cursor.fast_executemany = True
     try:
-        conn = pyodbc.connect(connection_string)
-        print("Database connection successful.")
-        return conn
-    except pyodbc.Error as e:
-        print("Error connecting to database:", e)
-        exit(1)
-
-# Load CSV into the database
-def load_csv_to_database(conn, csv_file_path, table_name):
-    try:
-        # Read the CSV file into a DataFrame
-        df = pd.read_csv(csv_file_path)
-
-        # Insert data row by row
-        cursor = conn.cursor()
-        for index, row in df.iterrows():
-            cursor.execute(f"""
-                INSERT INTO {table_name} (first_name, last_name, email, phone_number, address, city, state, zip_code, company, job_title, dob)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, 
-            row['first_name'], row['last_name'], row['email'], row['phone_number'], 
-            row['address'], row['city'], row['state'], row['zip_code'], 
-            row['company'], row['job_title'], row['dob'])
-        
-        # Commit the transaction
+        cursor.executemany(sql, rows)
         conn.commit()
-        print("Data successfully loaded into the database.")
+        return len(rows), []
+    except pyodbc.Error:
+        conn.rollback()
+
+    cursor.fast_executemany = False
+    inserted = 0
+    rejects = []
+    for offset, row in enumerate(rows):
+        try:
+            cursor.execute(sql, row)
+            inserted += 1
+        except pyodbc.Error as e:
+            # Approximate for records spanning several lines (quoted addresses)
+            rejects.append((first_line + offset, row, str(e)))
+    conn.commit()
+    return inserted, rejects
+
+
+def load_csv_to_database(connection_string, csv_file_path, table_name=DEFAULT_TABLE, chunk_size=DEFAULT_CHUNK_SIZE,
+                         workers=1, checkpoint_path=None, restart=False):
+    """
+    Loads csv_file_path into table_name chunk by chunk; see the module docstring.
+
+    Returns:
+        dict: inserted, rejected and skipped (already checkpointed) rows, seconds and rows/sec.
+    """
+    sql = f"INSERT INTO {table_name} ({', '.join(LOAD_COLUMNS)}) VALUES ({', '.join('?' * len(LOAD_COLUMNS))})"
+    checkpoint = Checkpoint(checkpoint_path or f"{csv_file_path}.checkpoint.json", csv_file_path, chunk_size, restart)
+    rejects_path = f"{csv_file_path}.rejects.csv"
+    if restart and os.path.exists(rejects_path):
+        os.remove(rejects_path)
+
+    # Bounded so the reader stays at most a few chunks ahead of the writers
+    chunks = queue.Queue(maxsize=workers * 2)
+    lock = threading.Lock()
+    totals = {"inserted": 0, "rejected": 0, "skipped": 0}
+    errors = []
+    started = time.perf_counter()
+
+    def report(inserted, rejects):
+        with lock:
+            totals["inserted"] += inserted
+            totals["rejected"] += len(rejects)
+            if rejects:
+                with open(rejects_path, "a", newline="", encoding="utf-8") as file:
+                    rejects_writer = csv.writer(file)
+                    for line_number, row, error in rejects:
+                        rejects_writer.writerow([line_number, error] + list(row))
+            elapsed = time.perf_counter() - started
+            print(f"{totals['inserted']} rows inserted, {totals['rejected']} rejected "
+                  f"({totals['inserted'] / elapsed:,.0f} rows/s).")
+
+    def writer():
+        try:
+            conn = pyodbc.connect(connection_string, autocommit=False)
+        except pyodbc.Error as e:
+            errors.append(e)
+            conn = None
+        try:
+            while True:
+                item = chunks.get()
+                if item is None:
+                    return
+                if conn is None:
+                    continue  # keep draining so the reader never blocks
+                index, first_line, rows = item
+                try:
+                    inserted, rejects = insert_chunk(conn, sql, first_line, rows)
+                except pyodbc.Error as e:
+                    # Connection-level failure: stop this writer, the chunk stays unchecked
+                    errors.append(e)
+                    conn.close()
+                    conn = None
+                    continue
+                checkpoint.done(index)
+                report(inserted, rejects)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    threads = [threading.Thread(target=writer, name=f"loader-{n}") for n in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        for index, first_line, rows in read_chunks(csv_file_path, chunk_size):
+            if index in checkpoint.completed:
+                totals["skipped"] += len(rows)
+                continue
+            if len(errors) >= workers:
+                break
+            chunks.put((index, first_line, rows))
+    finally:
+        for _ in threads:
+            chunks.put(None)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise RuntimeError(f"Load stopped after a database error; rerun to resume from {checkpoint.path}.") from errors[0]
+
+    elapsed = time.perf_counter() - started
+    return {**totals, "seconds": round(elapsed, 3),
+            "rows_per_second": round(totals["inserted"] / elapsed) if elapsed > 0 else None}
 
-    except Exception as e:
-        print("Error loading data:", e)
-        conn.rollback()  # Rollback in case of error
 
-# Main function
 def main():
-    # Create a database connection
-    conn = create_connection()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv_file_path", nargs="?", default=os.getenv("CustomerProfilesCsv", "customer_profiles.csv"))
+    parser.add_argument("--connection-string", default=connection_string_from_env())
+    parser.add_argument("--table", default=os.getenv("CustomerProfilesTable", DEFAULT_TABLE))
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=1, help="Parallel connections")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <csv>.checkpoint.json)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    if not args.connection_string:
+        sys.exit("Set CustomerDataStoreConnectionString (or SqlConnectionString) or pass --connection-string.")
+    if not re.fullmatch(r"[A-Za-z_][\w.]*", args.table):
+        sys.exit(f"Invalid table name: {args.table}")
 
-    # Load the CSV data into the database
-    load_csv_to_database(conn, csv_file_path, table_name)
+    summary = load_csv_to_database(args.connection_string, args.csv_file_path, args.table, args.chunk_size,
+                                   max(1, args.workers), args.checkpoint, args.restart)
+    print(f"Loaded {summary['inserted']} rows ({summary['rejected']} rejected, {summary['skipped']} already loaded) "
+          f"in {summary['seconds']}s ({summary['rows_per_second']:,} rows/s).")
 
-    # Close the connection
-    conn.close()
 
-if __name__ == '__main__':
+if __name__ == "__main__":
     main()
@@ -0,0 +1,55 @@
+-- Indexes behind the service's hot queries. Every statement is guarded, so databases created
+-- before this migration (or by an older create_eureka_db.sql) converge to the same set.
+
+-- Insights foreign keys: lookup filters in insights_summary seek on these; the clustered id is
+-- the implicit key suffix, so "WHERE domain_id = ? AND id > ? ORDER BY id" is one range seek
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_insights_insight_type_id' AND object_id = OBJECT_ID('Insights'))
+    CREATE INDEX IX_insights_insight_type_id ON Insights (insight_type_id);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_insights_data_source_id' AND object_id = OBJECT_ID('Insights'))
+    CREATE INDEX IX_insights_data_source_id ON Insights (data_source_id);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_insights_audience_id' AND object_id = OBJECT_ID('Insights'))
+    CREATE INDEX IX_insights_audience_id ON Insights (audience_id);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_insights_domain_id' AND object_id = OBJECT_ID('Insights'))
+    CREATE INDEX IX_insights_domain_id ON Insights (domain_id);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_insights_confidence_level_id' AND object_id = OBJECT_ID('Insights'))
+    CREATE INDEX IX_insights_confidence_level_id ON Insights (confidence_level_id);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_insights_timeliness_id' AND object_id = OBJECT_ID('Insights'))
+    CREATE INDEX IX_insights_timeliness_id ON Insights (timeliness_id);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_insights_alignment_goal_id' AND object_id = OBJECT_ID('Insights'))
+    CREATE INDEX IX_insights_alignment_goal_id ON Insights (alignment_goal_id);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_insights_value_priority_id' AND object_id = OBJECT_ID('Insights'))
+    CREATE INDEX IX_insights_value_priority_id ON Insights (value_priority_id);
+
+-- created_from / created_to filters
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_insights_created_at' AND object_id = OBJECT_ID('Insights'))
+    CREATE INDEX IX_insights_created_at ON Insights (created_at);
+
+-- Feedback and Recommendations point at Insights
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_feedback_insight_id' AND object_id = OBJECT_ID('Feedback'))
+    CREATE INDEX IX_feedback_insight_id ON Feedback (insight_id);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IDX_recommendations_insight_id' AND object_id = OBJECT_ID('Recommendations'))
+    CREATE INDEX IDX_recommendations_insight_id ON Recommendations (insight_id);
+
+-- Delta sync watermark order in recommendations_summary
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IDX_recommendations_updated_at_id' AND object_id = OBJECT_ID('Recommendations'))
+    CREATE INDEX IDX_recommendations_updated_at_id ON Recommendations (updated_at, id);
+
+-- Lookup names are resolved by name during ingest and filtering; they must be unique
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_insighttypes_type_name' AND object_id = OBJECT_ID('InsightTypes'))
+    CREATE UNIQUE INDEX UX_insighttypes_type_name ON InsightTypes (type_name);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_datasources_source_name' AND object_id = OBJECT_ID('DataSources'))
+    CREATE UNIQUE INDEX UX_datasources_source_name ON DataSources (source_name);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_audiences_audience_name' AND object_id = OBJECT_ID('Audiences'))
+    CREATE UNIQUE INDEX UX_audiences_audience_name ON Audiences (audience_name);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_domains_domain_name' AND object_id = OBJECT_ID('Domains'))
+    CREATE UNIQUE INDEX UX_domains_domain_name ON Domains (domain_name);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_confidencelevels_level_name' AND object_id = OBJECT_ID('ConfidenceLevels'))
+    CREATE UNIQUE INDEX UX_confidencelevels_level_name ON ConfidenceLevels (level_name);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_timeliness_timeliness_type' AND object_id = OBJECT_ID('Timeliness'))
+    CREATE UNIQUE INDEX UX_timeliness_timeliness_type ON Timeliness (timeliness_type);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_deliverychannels_channel_name' AND object_id = OBJECT_ID('DeliveryChannels'))
+    CREATE UNIQUE INDEX UX_deliverychannels_channel_name ON DeliveryChannels (channel_name);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_alignmentgoals_goal_name' AND object_id = OBJECT_ID('AlignmentGoals'))
+    CREATE UNIQUE INDEX UX_alignmentgoals_goal_name ON AlignmentGoals (goal_name);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_valuepriorities_priority_name' AND object_id = OBJECT_ID('ValuePriorities'))
+    CREATE UNIQUE INDEX UX_valuepriorities_priority_name ON ValuePriorities (priority_name);
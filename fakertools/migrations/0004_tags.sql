@@ -0,0 +1,38 @@
+-- Tagging of insights. Tags holds one row per tag; InsightTags is the junction table, clustered
+-- on (tag_id, insight_id) so the postings of a tag are one ordered range scan. The service keeps
+-- an inverted index of it in memory (db_helpers/tagIndex.py).
+
+-- Table: Tags
+-- version changes with every write to the tag (insight_count is updated in the same
+-- transaction), so workers can reload only the tags changed since they last synced
+IF OBJECT_ID('Tags') IS NULL
+    CREATE TABLE Tags (
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        tag_name NVARCHAR(100) NOT NULL,
+        insight_count INT NOT NULL DEFAULT 0,
+        created_at DATETIME DEFAULT GETDATE(),
+        version ROWVERSION
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_tags_tag_name' AND object_id = OBJECT_ID('Tags'))
+    CREATE UNIQUE INDEX UX_tags_tag_name ON Tags (tag_name);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_tags_version' AND object_id = OBJECT_ID('Tags'))
+    CREATE INDEX IX_tags_version ON Tags (version);
+GO
+
+-- Table: InsightTags
+IF OBJECT_ID('InsightTags') IS NULL
+    CREATE TABLE InsightTags (
+        tag_id INT NOT NULL, -- FK to Tags
+        insight_id INT NOT NULL, -- FK to Insights
+        created_at DATETIME DEFAULT GETDATE(),
+        CONSTRAINT PK_insighttags PRIMARY KEY CLUSTERED (tag_id, insight_id),
+        FOREIGN KEY (tag_id) REFERENCES Tags (id),
+        FOREIGN KEY (insight_id) REFERENCES Insights (id)
+    );
+GO
+
+-- Tags of one insight (and the foreign key check when insights are deleted)
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_insighttags_insight_id' AND object_id = OBJECT_ID('InsightTags'))
+    CREATE INDEX IX_insighttags_insight_id ON InsightTags (insight_id, tag_id);
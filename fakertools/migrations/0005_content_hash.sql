@@ -0,0 +1,14 @@
+-- Duplicate detection during CSV ingest (db_helpers/ingestDedup.py). content_hash is a 16 byte
+-- BLAKE2b digest of the normalized content, computed by the service, so it is NULL for rows
+-- inserted before this migration until "create_eureka_database_structure.py backfill-hashes"
+-- has run. Two insights are duplicates when the hash and every lookup id match.
+
+IF COL_LENGTH('Insights', 'content_hash') IS NULL
+    ALTER TABLE Insights ADD content_hash BINARY(16) NULL;
+GO
+
+-- The ingest probe seeks on the hash and compares the lookup ids without key lookups
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_insights_content_hash' AND object_id = OBJECT_ID('Insights'))
+    CREATE INDEX IX_insights_content_hash ON Insights (content_hash)
+        INCLUDE (insight_type_id, data_source_id, audience_id, domain_id, confidence_level_id,
+                 timeliness_id, alignment_goal_id, value_priority_id);
@@ -0,0 +1,52 @@
+-- Pre-aggregated counts for GET insights/analytics (db_helpers/insightRollups.py). Ingest and
+-- recommendation writes add to them in the same transaction as the rows they count;
+-- "create_eureka_database_structure.py rebuild-rollups" recomputes them after rows were loaded
+-- by other means, and "check-rollups" compares them with a full GROUP BY.
+
+-- Table: InsightRollups
+-- One row per domain, audience, confidence level, value priority and month of created_at (the
+-- first day of the month; NULL for insights without created_at)
+IF OBJECT_ID('InsightRollups') IS NULL
+    CREATE TABLE InsightRollups (
+        domain_id INT NOT NULL,
+        audience_id INT NOT NULL,
+        confidence_level_id INT NOT NULL,
+        value_priority_id INT NOT NULL,
+        month DATE NULL,
+        insight_count BIGINT NOT NULL
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_insightrollups' AND object_id = OBJECT_ID('InsightRollups'))
+    CREATE UNIQUE CLUSTERED INDEX UX_insightrollups
+        ON InsightRollups (domain_id, audience_id, confidence_level_id, value_priority_id, month);
+GO
+
+-- Table: RecommendationStatusRollups
+IF OBJECT_ID('RecommendationStatusRollups') IS NULL
+    CREATE TABLE RecommendationStatusRollups (
+        status NVARCHAR(255) NULL,
+        recommendation_count BIGINT NOT NULL
+    );
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_recommendationstatusrollups' AND object_id = OBJECT_ID('RecommendationStatusRollups'))
+    CREATE UNIQUE CLUSTERED INDEX UX_recommendationstatusrollups ON RecommendationStatusRollups (status);
+GO
+
+-- Initial fill from the rows already present; the migration's transaction holds the shared
+-- table locks until its version row is recorded
+IF NOT EXISTS (SELECT 1 FROM InsightRollups)
+    INSERT INTO InsightRollups (domain_id, audience_id, confidence_level_id, value_priority_id, month, insight_count)
+    SELECT domain_id, audience_id, confidence_level_id, value_priority_id, month, COUNT_BIG(*)
+    FROM (
+        SELECT domain_id, audience_id, confidence_level_id, value_priority_id,
+               DATEFROMPARTS(YEAR(created_at), MONTH(created_at), 1) AS month
+        FROM Insights WITH (TABLOCK, HOLDLOCK)
+    ) i
+    GROUP BY domain_id, audience_id, confidence_level_id, value_priority_id, month;
+IF NOT EXISTS (SELECT 1 FROM RecommendationStatusRollups)
+    INSERT INTO RecommendationStatusRollups (status, recommendation_count)
+    SELECT status, COUNT_BIG(*)
+    FROM Recommendations WITH (TABLOCK, HOLDLOCK)
+    GROUP BY status;
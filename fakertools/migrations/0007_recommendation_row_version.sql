@@ -0,0 +1,13 @@
+-- Delta sync watermark for recommendations_summary. updated_at is stamped by the writer before
+-- its transaction commits, so a row can become visible with an updated_at below a token that
+-- was already handed out. row_version is assigned by the database on every insert and update,
+-- and the service never hands out a token at or above MIN_ACTIVE_ROWVERSION(), below which
+-- every change is committed.
+
+IF COL_LENGTH('Recommendations', 'row_version') IS NULL
+    ALTER TABLE Recommendations ADD row_version ROWVERSION;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_recommendations_row_version' AND object_id = OBJECT_ID('Recommendations'))
+    CREATE INDEX IX_recommendations_row_version ON Recommendations (row_version);
+GO
@@ -1,88 +1,111 @@
-import logging
-import azure.functions as func
-import pyodbc
-import pandas as pd
-import joblib
-import datetime
-import os
-import json
-
-# Load the pre-trained ML model
-# Get the directory of the current script
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_NAME = "Random Forest Classifier";
-MODEL_PATH = os.path.join(BASE_DIR, "recommendation_model.pkl")
-model = joblib.load(MODEL_PATH)
-
-# Database connection string
-CONNECTION_STRING = os.getenv("SqlConnectionString")
-
-# Recommendation mapping
-recommendation_mapping = {
-    0: "Send targeted notification about health resources.",
-    1: "Send an email to select a primary care physician.",
-    2: "Provide manual review for custom recommendation."
-}
-
-def main(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info("Processing insight for generating a recommendation.")
-
-    try:
-        # Parse the request body to get insight_id
-        try:
-            req_body = req.get_json()
-        except ValueError:
-            return func.HttpResponse("Invalid JSON in request body.", status_code=400)
-
-        insight_id = req_body.get("insight_id")
-        if not insight_id:
-            return func.HttpResponse("Insight ID is required in the request body.", status_code=400)
-
-        # Connect to the database
-        with pyodbc.connect(CONNECTION_STRING) as conn:
-            cursor = conn.cursor()
-
-            # Fetch the insight features
-            query = """
-            SELECT confidence_level_id, timeliness_id, value_priority_id
-            FROM Insights
-            WHERE id = ?
-            """
-            data = pd.read_sql(query, conn, params=[insight_id])
-
-            if data.empty:
-                return func.HttpResponse("Insight not found.", status_code=404)
-
-            # Prepare features for prediction
-            features = data[['confidence_level_id', 'timeliness_id', 'value_priority_id']]
-
-            # Predict the recommendation type
-            prediction = model.predict(features)[0]
-            recommendation_text = recommendation_mapping.get(prediction, "No recommendation available.")
-
-            # Insert the recommendation into the Recommendations table
-            now = datetime.datetime.utcnow()
-            insert_query = """
-            INSERT INTO Recommendations (insight_id, recommendation_text, confidence_level_id, delivery_channel_id, status, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """
-            cursor.execute(
-                insert_query,
-                insight_id, recommendation_text, int(data['confidence_level_id'].iloc[0]),
-                1,  # Assuming delivery_channel_id = 1 (default notification channel)
-                'Pending', now, now
-            )
-            conn.commit()
-
-        return func.HttpResponse(
-            json.dumps({"message": "Recommendation generated and stored successfully.", "recommendation": recommendation_text}),
-            mimetype="application/json",
-            status_code=200
-        )
-
-    except pyodbc.Error as db_err:
-        logging.error(f"Database error: {db_err}")
-        return func.HttpResponse("Internal server error: Database query failed.", status_code=500)
-    except Exception as e:
-        logging.error(f"Error generating recommendation: {e}")
+import logging
+import azure.functions as func
+import pyodbc
+import json
+from db_helpers.concurrency import limited, run_blocking
+from db_helpers.connectionPool import get_connection
+from db_helpers.generateRecommendations import (
+    CHUNK_SIZE, IDEMPOTENT_DEFAULT, MISSING_FILTER, generate_batch, generate_one
+)
+from db_helpers.instrumentation import instrumented
+from db_helpers.modelRegistry import get_model_registry
+
+
+def batch_request(req_body):
+    """
+    Handles a batch body: {"insight_ids": [...]} or {"filter": "missing_recommendation"},
+    with optional "chunk_size", "max_seconds" and, for the filter, "resume_after_id".
+    """
+    insight_ids = req_body.get("insight_ids")
+    missing = req_body.get("filter") == MISSING_FILTER
+    if req_body.get("filter") is not None and not missing:
+        return func.HttpResponse(f"Unsupported filter. Use '{MISSING_FILTER}'.", status_code=400)
+    if not missing and (not isinstance(insight_ids, list) or not insight_ids
+                        or not all(isinstance(insight_id, int) for insight_id in insight_ids)):
+        return func.HttpResponse("insight_ids must be a non-empty list of integers.", status_code=400)
+
+    try:
+        chunk_size = max(1, int(req_body.get("chunk_size", CHUNK_SIZE)))
+        max_seconds = float(req_body["max_seconds"]) if req_body.get("max_seconds") else None
+        after_id = int(req_body.get("resume_after_id") or 0)
+    except (TypeError, ValueError):
+        return func.HttpResponse("chunk_size, max_seconds and resume_after_id must be numbers.", status_code=400)
+
+    # The pre-trained ML model (or its compiled lookup table) is loaded on first use
+    # and reloaded when a new version is deployed
+    registry = get_model_registry()
+    predictor = registry.predictor()
+
+    with get_connection() as conn:
+        summary = generate_batch(
+            conn, predictor, insight_ids=None if missing else insight_ids, missing=missing,
+            after_id=after_id, chunk_size=chunk_size, max_seconds=max_seconds
+        )
+
+    return func.HttpResponse(
+        json.dumps({"message": "Recommendations generated and stored successfully.",
+                    "model_version": registry.version(), **summary}),
+        mimetype="application/json",
+        status_code=200
+    )
+
+def generate_single(insight_id, idempotent):
+    """Predicts with the current model version and stores the recommendation for one insight."""
+    registry = get_model_registry()
+    with get_connection() as conn:
+        result = generate_one(conn, registry.predictor(), registry.version(), insight_id, idempotent)
+    return result, registry.version()
+
+
+@instrumented("generate_recommendations")
+@limited("generate_recommendations")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info("Processing insight for generating a recommendation.")
+
+    try:
+        # Parse the request body to get insight_id
+        try:
+            req_body = req.get_json()
+        except ValueError:
+            return func.HttpResponse("Invalid JSON in request body.", status_code=400)
+
+        if not isinstance(req_body, dict):
+            return func.HttpResponse("Request body must be a JSON object.", status_code=400)
+
+        # Batch mode: a list of ids or a filter; scored on the bulk thread pool so backfills do
+        # not hold up single-insight requests
+        if "insight_ids" in req_body or "filter" in req_body:
+            return await run_blocking(batch_request, req_body, lane="bulk")
+
+        insight_id = req_body.get("insight_id")
+        if not insight_id:
+            return func.HttpResponse("Insight ID is required in the request body.", status_code=400)
+        try:
+            insight_id = int(insight_id)
+        except (TypeError, ValueError):
+            return func.HttpResponse("Insight ID must be an integer.", status_code=400)
+
+        # Retries of an idempotent request return the existing Pending recommendation
+        idempotent = req_body.get("idempotent", IDEMPOTENT_DEFAULT) is True or \
+            str(req.params.get("idempotent", "")).lower() == "true"
+
+        # Model loading, prediction and the insert run on the interactive thread pool
+        result, model_version = await run_blocking(generate_single, insight_id, idempotent)
+
+        if result is None:
+            return func.HttpResponse("Insight not found.", status_code=404)
+
+        message = "Recommendation generated and stored successfully." if result["created"] \
+            else "Existing pending recommendation returned."
+        return func.HttpResponse(
+            json.dumps({"message": message, **result, "model_version": model_version}),
+            mimetype="application/json",
+            status_code=200
+        )
+
+    except pyodbc.Error as db_err:
+        logging.error(f"Database error: {db_err}")
+        return func.HttpResponse("Internal server error: Database query failed.", status_code=500)
+    except Exception as e:
+        logging.error(f"Error generating recommendation: {e}")
         return func.HttpResponse("Internal server error.", status_code=500)
\ No newline at end of file
@@ -1,21 +1,349 @@
-import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
+"""
+Trains the recommendation model and writes it, with its metadata and compiled lookup table, next
+to the function.
+
+Labeled rows are Recommendations joined to their insight's features; the label is the class of the
+recommendation text (RECOMMENDATION_MAPPING). Rows are read from the database in keyset-paged
+chunks and folded into counts per distinct (features, class) pair, so memory depends on the
+number of distinct pairs rather than on the number of rows; the forest is fitted on the distinct
+pairs with the counts as sample weights.
+
+Hyperparameters are searched over PARAM_GRID. Candidates whose batch prediction latency or pickled
+size exceed the budgets are rejected; the most accurate remaining candidate (on a holdout sampled
+from the counts) is refitted on all rows.
+
+    python train_recommendation_model.py                      # from SqlConnectionString
+    python train_recommendation_model.py --csv insights_training_data.csv
+    python train_recommendation_model.py --n-jobs 8 --max-latency-ms 20 --max-size-mb 5
+
+Outputs: recommendation_model.pkl, recommendation_model.meta.json (read and validated by
+db_helpers/modelRegistry.py on load) and recommendation_model.compiled.json.
+"""
+import argparse
+import collections
+import csv
+import datetime
+import io
+import itertools
+import json
+import os
+import sys
+import time
+
 import joblib
+import numpy as np
+import sklearn
+from sklearn.ensemble import RandomForestClassifier
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_helpers.compiledPredictor import FEATURE_COLUMNS, compile_model, compiled_path_for, default_domains, model_predict
+from db_helpers.generateRecommendations import CHUNK_SIZE, RECOMMENDATION_MAPPING
+from db_helpers.modelRegistry import METADATA_FORMAT, MODEL_PATH, file_version, metadata_path_for
+
+TRAINING_QUERY = f"""
+SELECT TOP (?) r.id, {', '.join(f'i.{column}' for column in FEATURE_COLUMNS)}, r.recommendation_text
+FROM Recommendations r
+JOIN Insights i ON i.id = r.insight_id
+WHERE r.id > ? AND r.status IN ({{statuses}})
+ORDER BY r.id
+"""
+
+# Recommendations that were acted on are the labels; Pending rows are the model's own output
+DEFAULT_STATUSES = ["Delivered"]
+DEFAULT_CHUNK_SIZE = 50000
+
+# Searched in this order; n_estimators grows fastest so over-budget families are pruned early
+PARAM_GRID = {
+    "max_depth": [None, 12, 6],
+    "min_samples_leaf": [1, 4],
+    "n_estimators": [25, 50, 100, 200],
+}
+DEFAULT_MAX_LATENCY_MS = 50.0
+DEFAULT_MAX_SIZE_MB = 20.0
+DEFAULT_HOLDOUT = 0.2
+# Rows per timed predict call; the size of a generate_recommendations chunk
+LATENCY_BATCH_ROWS = CHUNK_SIZE
+LATENCY_REPEATS = 5
+
+CLASS_BY_TEXT = {text: label for label, text in RECOMMENDATION_MAPPING.items()}
+
+
+def database_chunks(conn, statuses=DEFAULT_STATUSES, chunk_size=DEFAULT_CHUNK_SIZE, limit=None):
+    """
+    Yields lists of (*FEATURE_COLUMNS, class) rows read in recommendation id order.
+
+    Each chunk is one short keyset query, so no transaction or cursor stays open across the read.
+    Recommendations whose text is not in RECOMMENDATION_MAPPING are skipped.
+    """
+    cursor = conn.cursor()
+    sql = TRAINING_QUERY.format(statuses=", ".join("?" * len(statuses)))
+    after_id = 0
+    read = 0
+    while limit is None or read < limit:
+        size = chunk_size if limit is None else min(chunk_size, limit - read)
+        cursor.execute(sql, size, after_id, *statuses)
+        rows = cursor.fetchall()
+        if not rows:
+            return
+        read += len(rows)
+        after_id = rows[-1][0]
+        yield [(*row[1:-1], CLASS_BY_TEXT[row[-1]]) for row in rows if row[-1] in CLASS_BY_TEXT]
+
+
+def csv_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields rows of a CSV with FEATURE_COLUMNS and recommendation_type columns (the original format)."""
+    with open(path, "r", newline="", encoding="utf-8-sig") as file:
+        reader = csv.DictReader(file)
+        while True:
+            rows = [tuple(int(record[column]) for column in FEATURE_COLUMNS + ["recommendation_type"])
+                    for record in itertools.islice(reader, chunk_size)]
+            if not rows:
+                return
+            yield rows
+
+
+def aggregate(chunks, progress=None):
+    """
+    Folds labeled rows into counts per distinct (*features, class) tuple.
+
+    Returns:
+        collections.Counter: The counts; its total is the number of training rows.
+    """
+    counts = collections.Counter()
+    rows = 0
+    for chunk in chunks:
+        counts.update(chunk)
+        rows += len(chunk)
+        if progress:
+            progress(f"{rows} rows read, {len(counts)} distinct")
+    return counts
+
+
+def to_arrays(counts):
+    """Returns (X, y, weights) numpy arrays from aggregate() counts."""
+    keys = list(counts)
+    data = np.asarray(keys, dtype=np.int64).reshape(len(keys), len(FEATURE_COLUMNS) + 1)
+    return data[:, :-1], data[:, -1], np.asarray([counts[key] for key in keys], dtype=np.float64)
+
+
+def split_weights(weights, holdout, seed):
+    """Splits every count binomially, as if each underlying row were sent to the holdout with probability holdout."""
+    held_out = np.random.default_rng(seed).binomial(weights.astype(np.int64), holdout).astype(np.float64)
+    return weights - held_out, held_out
+
+
+def candidate_params(grid=PARAM_GRID):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def pickled_size(model):
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.tell()
+
+
+def latency_sample(X, weights, seed):
+    """LATENCY_BATCH_ROWS feature rows drawn with the observed frequencies."""
+    rng = np.random.default_rng(seed)
+    return X[rng.choice(len(X), size=LATENCY_BATCH_ROWS, p=weights / weights.sum())]
+
+
+def predict_latency_ms(model, sample):
+    """Median milliseconds of a single-threaded predict call on sample, the way serving calls it."""
+    timings = []
+    for _ in range(LATENCY_REPEATS):
+        started = time.perf_counter()
+        model_predict(model, sample)
+        timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings))
+
+
+def fit(params, X, y, weights, n_jobs, seed):
+    # Bootstrapping the distinct rows would drop whole (features, class) groups at once, unlike
+    # resampling the rows they stand for; the trees still differ through the feature sampling
+    model = RandomForestClassifier(random_state=seed, n_jobs=n_jobs, bootstrap=False, **params)
+    mask = weights > 0
+    model.fit(X[mask], y[mask], sample_weight=weights[mask])
+    # Serving predicts small batches, where a thread pool costs more than it saves
+    model.set_params(n_jobs=1)
+    return model
+
+
+def search(X, y, weights, n_jobs=-1, max_latency_ms=DEFAULT_MAX_LATENCY_MS, max_size_mb=DEFAULT_MAX_SIZE_MB,
+           holdout=DEFAULT_HOLDOUT, seed=42, progress=None):
+    """
+    Evaluates every PARAM_GRID candidate against the budgets and the holdout.
+
+    Returns:
+        tuple: (best params or None, list of per-candidate result dicts)
+    """
+    train_weights, holdout_weights = split_weights(weights, holdout, seed)
+    if holdout_weights.sum() == 0:
+        # Too few rows to hold any out; candidates are compared on the training rows
+        holdout_weights = train_weights
+    sample = latency_sample(X, weights, seed)
+    scored = holdout_weights > 0
+
+    results = []
+    over_budget = set()
+    for params in candidate_params():
+        family = (params["max_depth"], params["min_samples_leaf"])
+        if family in over_budget:
+            # A larger forest of the same shape is only slower and bigger
+            results.append({"params": params, "skipped": "smaller forest already over budget"})
+            continue
+        started = time.perf_counter()
+        model = fit(params, X, y, train_weights, n_jobs, seed)
+        result = {
+            "params": params,
+            "fit_seconds": round(time.perf_counter() - started, 3),
+            "accuracy": round(float(model.score(X[scored], y[scored], sample_weight=holdout_weights[scored])), 5),
+            "latency_ms": round(predict_latency_ms(model, sample), 3),
+            "size_bytes": pickled_size(model),
+        }
+        result["within_budget"] = (result["latency_ms"] <= max_latency_ms
+                                   and result["size_bytes"] <= max_size_mb * 1024 * 1024)
+        if not result["within_budget"]:
+            over_budget.add(family)
+        results.append(result)
+        if progress:
+            progress(json.dumps(result))
+
+    eligible = [result for result in results if result.get("within_budget")]
+    if not eligible:
+        return None, results
+    # Most accurate first; ties go to the smaller, then faster model
+    best = min(eligible, key=lambda result: (-result["accuracy"], result["size_bytes"], result["latency_ms"]))
+    return best["params"], results
+
+
+def write_artifacts(model, metadata, domains, path=MODEL_PATH):
+    """
+    Writes the model, its metadata and its compiled table.
+
+    The files are written under temporary names and renamed into place model first, so the
+    registry never validates a new model against old metadata for longer than one check interval
+    (and rejects the pair, keeping the previous model, if it does).
+
+    Returns:
+        dict: The metadata as written, with model_version (the content hash the registry computes)
+        and size_bytes added.
+    """
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    joblib.dump(model, temporary_path)
+    version = file_version(temporary_path)
+    metadata = {**metadata, "model_version": version, "size_bytes": os.path.getsize(temporary_path)}
+
+    compile_model(model, version, domains).save(compiled_path_for(path))
+    metadata_path = metadata_path_for(path)
+    temporary_metadata_path = f"{metadata_path}.{os.getpid()}.tmp"
+    with open(temporary_metadata_path, "w", encoding="utf-8") as file:
+        json.dump(metadata, file, indent=2)
+    os.replace(temporary_path, path)
+    os.replace(temporary_metadata_path, metadata_path)
+    return metadata
+
+
+def train(chunks, output=MODEL_PATH, n_jobs=-1, max_latency_ms=DEFAULT_MAX_LATENCY_MS,
+          max_size_mb=DEFAULT_MAX_SIZE_MB, holdout=DEFAULT_HOLDOUT, seed=42, source=None, progress=print):
+    """
+    Runs the whole pipeline on labeled row chunks and writes the artifacts to output.
+
+    Returns:
+        dict: The metadata written next to the model.
+    Raises:
+        ValueError: No labeled rows, or no candidate within the budgets.
+    """
+    timings = {}
+    started = time.perf_counter()
+    counts = aggregate(chunks, progress)
+    timings["read_seconds"] = round(time.perf_counter() - started, 3)
+    training_rows = sum(counts.values())
+    if not training_rows:
+        raise ValueError("No labeled rows to train on.")
+    X, y, weights = to_arrays(counts)
+
+    phase = time.perf_counter()
+    params, results = search(X, y, weights, n_jobs, max_latency_ms, max_size_mb, holdout, seed, progress)
+    timings["search_seconds"] = round(time.perf_counter() - phase, 3)
+    if params is None:
+        raise ValueError(f"No candidate fits the budgets ({max_latency_ms} ms per {LATENCY_BATCH_ROWS} rows, "
+                         f"{max_size_mb} MB); raise them or extend PARAM_GRID.")
+
+    phase = time.perf_counter()
+    model = fit(params, X, y, weights, n_jobs, seed)
+    timings["fit_seconds"] = round(time.perf_counter() - phase, 3)
+    chosen = next(result for result in results if result["params"] == params)
+
+    # Compiled domains cover the ids seen in training as well as the default id range
+    domains = [sorted(set(domain) | set(X[:, position].tolist())) for position, domain in enumerate(default_domains())]
+    metadata = {
+        "format": METADATA_FORMAT,
+        "model_type": type(model).__name__,
+        "feature_columns": FEATURE_COLUMNS,
+        "classes": {str(int(label)): RECOMMENDATION_MAPPING[int(label)] for label in model.classes_},
+        "params": params,
+        "training_rows": int(training_rows),
+        "distinct_rows": int(len(X)),
+        "class_counts": {str(int(label)): int(weights[y == label].sum()) for label in model.classes_},
+        "holdout_accuracy": chosen["accuracy"],
+        "latency_ms_per_batch": chosen["latency_ms"],
+        "latency_batch_rows": LATENCY_BATCH_ROWS,
+        "budgets": {"max_latency_ms": max_latency_ms, "max_size_mb": max_size_mb},
+        "candidates": results,
+        "source": source,
+        "sklearn_version": sklearn.__version__,
+        "trained_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+    }
+    timings["total_seconds"] = round(time.perf_counter() - started, 3)
+    metadata["timings"] = timings
+    return write_artifacts(model, metadata, domains, output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", help="Train from a CSV instead of the database")
+    parser.add_argument("--connection-string", default=os.getenv("SqlConnectionString"))
+    parser.add_argument("--status", action="append", dest="statuses",
+                        help=f"Recommendation status used as a label (repeatable; default {DEFAULT_STATUSES})")
+    parser.add_argument("--limit", type=int, help="Read at most this many labeled rows")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Training threads (-1: all cores)")
+    parser.add_argument("--max-latency-ms", type=float, default=DEFAULT_MAX_LATENCY_MS,
+                        help=f"Budget for one predict call on {LATENCY_BATCH_ROWS} rows")
+    parser.add_argument("--max-size-mb", type=float, default=DEFAULT_MAX_SIZE_MB)
+    parser.add_argument("--holdout", type=float, default=DEFAULT_HOLDOUT)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=MODEL_PATH)
+    args = parser.parse_args()
 
-# Load the historical dataset
-data = pd.read_csv("insights_training_data.csv")
+    conn = None
+    if args.csv:
+        chunks = csv_chunks(args.csv, args.chunk_size)
+        source = {"csv": os.path.basename(args.csv)}
+    else:
+        if not args.connection_string:
+            sys.exit("Set SqlConnectionString, pass --connection-string or train from --csv.")
+        import pyodbc
 
-# Features and target variable
-features = data[['confidence_level_id', 'timeliness_id', 'value_priority_id']]
-target = data['recommendation_type']
+        statuses = args.statuses or DEFAULT_STATUSES
+        conn = pyodbc.connect(args.connection_string)
+        chunks = database_chunks(conn, statuses, args.chunk_size, args.limit)
+        source = {"database": True, "statuses": statuses, "limit": args.limit}
 
-# Split data into training and testing sets
-X_train, X_test, y_train, y_test = train_test_split(features, target, test_size=0.2, random_state=42)
+    try:
+        metadata = train(chunks, args.output, args.n_jobs, args.max_latency_ms, args.max_size_mb,
+                         args.holdout, args.seed, source)
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+    finally:
+        if conn is not None:
+            conn.close()
+    print(f"Wrote model version {metadata['model_version']} ({metadata['params']}, "
+          f"holdout accuracy {metadata['holdout_accuracy']}) trained on {metadata['training_rows']} rows "
+          f"in {metadata['timings']['total_seconds']}s to {args.output}.")
 
-# Train the Random Forest Classifier
-model = RandomForestClassifier(n_estimators=100, random_state=42)
-model.fit(X_train, y_train)
 
-# Save the trained model to a file
-joblib.dump(model, "recommendation_model.pkl")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import logging
+import azure.functions as func
+import pyodbc
+import json
+from db_helpers.concurrency import limited, run_blocking
+from db_helpers.connectionPool import get_connection
+from db_helpers.getInsights import dimension_tables
+from db_helpers.insightRollups import (
+    GROUP_KEYS, ROLLUP_DIMENSIONS, parse_month, read_insight_rollups, read_status_rollups, summarize_insights,
+    summarize_statuses,
+)
+from db_helpers.instrumentation import instrumented, span
+
+
+def error_response(message, status_code):
+    return func.HttpResponse(json.dumps({"error": message}), mimetype="application/json", status_code=status_code)
+
+
+def parse_analytics_request(params):
+    """
+    Reads the analytics query parameters.
+
+    Returns:
+        tuple: (group_by, filters, from_month, to_month)
+    Raises:
+        ValueError: With a client-facing message.
+    """
+    group_by = tuple(key.strip() for key in params.get("group_by", "").split(",") if key.strip())
+    unknown = [key for key in group_by if key not in GROUP_KEYS]
+    if unknown:
+        raise ValueError(f"Unknown group_by {', '.join(unknown)}. Use any of {', '.join(GROUP_KEYS)}.")
+    if len(set(group_by)) != len(group_by):
+        raise ValueError("group_by lists a key twice.")
+    filters = {key: params[key] for key in ROLLUP_DIMENSIONS if params.get(key)}
+    months = []
+    for name in ("from_month", "to_month"):
+        try:
+            months.append(parse_month(params[name]) if params.get(name) else None)
+        except ValueError:
+            raise ValueError(f"Invalid {name} '{params[name]}'. Expected YYYY-MM.")
+    return (group_by, filters, *months)
+
+
+def insight_analytics(group_by, filters, from_month, to_month):
+    """
+    Insight counts from InsightRollups and recommendation counts by status from
+    RecommendationStatusRollups. Reads a few thousand rollup rows at most, however many insights
+    there are.
+    """
+    tables = dimension_tables()
+    lookup_ids = {}
+    for key, name in filters.items():
+        lookup_ids[key] = tables[key].id_for(name)
+    with get_connection() as conn:
+        if None in lookup_ids.values():
+            rows = []
+        else:
+            rows = read_insight_rollups(conn, lookup_ids, from_month, to_month)
+        statuses = read_status_rollups(conn)
+    with span("build", rows=len(rows)):
+        return {
+            "insights": summarize_insights(rows, tables, group_by),
+            "recommendations": summarize_statuses(statuses),
+        }
+
+
+@instrumented("insights_analytics")
+@limited("insights_analytics")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Counts of insights for dashboards, served from the rollup tables (see insightRollups).
+
+    GET insights/analytics
+        domain, audience, confidence_level, value_priority
+                            lookup names; only insights with these are counted
+        from_month, to_month
+                            YYYY-MM, inclusive range of created_at months
+        group_by            comma separated keys among domain, audience, confidence_level,
+                            value_priority and month; adds the counts per combination of them
+
+    The response has the insight total and counts by each key, and recommendation counts by
+    status (not filtered).
+    """
+    try:
+        group_by, filters, from_month, to_month = parse_analytics_request(req.params)
+    except ValueError as e:
+        return error_response(str(e), 400)
+    logging.info("Reading insight analytics.")
+
+    try:
+        result = await run_blocking(insight_analytics, group_by, filters, from_month, to_month)
+        return func.HttpResponse(json.dumps(result), mimetype="application/json")
+
+    except pyodbc.Error as db_err:
+        logging.error(f"Database error: {db_err}")
+        return error_response("Internal server error: Database query failed.", 500)
+    except Exception as e:
+        logging.error(f"Error reading insight analytics: {e}")
+        return error_response("Internal server error.", 500)
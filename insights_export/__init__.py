@@ -0,0 +1,89 @@
+import json
+import logging
+import azure.functions as func
+import pyodbc
+from db_helpers.columnarExport import (
+    COMPRESSIONS, DATASETS, DEFAULT_CHUNK_SIZE, FORMATS, MAX_CHUNK_SIZE, PARQUET_MIMETYPE,
+    export_schema, record_batches, write_export
+)
+from db_helpers.concurrency import limited, run_blocking
+from db_helpers.connectionPool import get_connection
+from db_helpers.instrumentation import instrumented
+from db_helpers.responseEncoding import negotiate_encoding
+
+
+def error_response(message, status_code):
+    return func.HttpResponse(json.dumps({"error": message}), mimetype="application/json", status_code=status_code)
+
+
+def requested_format(req):
+    """?format=arrow|parquet, else the Accept header, else Arrow."""
+    if req.params.get("format"):
+        return req.params["format"].lower()
+    accept = (req.headers.get("Accept") or "").lower()
+    return "parquet" if PARQUET_MIMETYPE in accept else "arrow"
+
+
+def export_body(dataset, after_id, chunk_size, output_format, compression, content_encoding, stats):
+    with get_connection() as conn:
+        return write_export(
+            record_batches(conn, dataset, after_id, chunk_size, stats), export_schema(dataset),
+            output_format, compression, content_encoding
+        )
+
+
+@instrumented("insights_export")
+@limited("insights_export")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Exports insights or recommendations (route export/{dataset}) as an Arrow IPC stream or a
+    Parquet file for analytics clients, with lookup columns dictionary-encoded.
+
+    Query parameters: format (arrow or parquet), compression (lz4/zstd for Arrow; zstd, snappy,
+    gzip or none for Parquet), after_id (export rows with a larger id; X-Export-Last-Id of the
+    previous export resumes from there) and chunk_size (rows per record batch).
+    """
+    dataset = req.route_params.get("dataset", "").lower()
+    if dataset not in DATASETS:
+        return error_response(f"Unknown dataset. Use one of: {', '.join(DATASETS)}.", 404)
+
+    output_format = requested_format(req)
+    if output_format not in FORMATS:
+        return error_response(f"Unsupported format. Use one of: {', '.join(FORMATS)}.", 400)
+    compression = req.params.get("compression", "").lower() or None
+    if compression is not None and compression not in COMPRESSIONS[output_format]:
+        options = ", ".join(option for option in COMPRESSIONS[output_format] if option)
+        return error_response(f"Unsupported compression for {output_format}. Use one of: {options}.", 400)
+    try:
+        after_id = int(req.params.get("after_id", 0))
+        chunk_size = min(MAX_CHUNK_SIZE, max(1, int(req.params.get("chunk_size", DEFAULT_CHUNK_SIZE))))
+    except ValueError:
+        return error_response("after_id and chunk_size must be integers.", 400)
+
+    logging.info(f"Exporting {dataset} as {output_format} after id {after_id}.")
+
+    # Arrow without buffer compression is still worth compressing on the wire; Parquet pages already are
+    content_encoding = negotiate_encoding(req) if output_format == "arrow" and compression is None else None
+
+    try:
+        stats = {}
+        # Runs on the bulk thread pool, which interactive functions never wait on
+        body = await run_blocking(export_body, dataset, after_id, chunk_size, output_format,
+                                  compression, content_encoding, stats)
+
+        headers = {
+            "Content-Disposition": f'attachment; filename="{dataset}.{output_format}"',
+            "X-Export-Rows": str(stats["rows"]),
+            "X-Export-Last-Id": str(stats["last_id"]),
+            "Vary": "Accept, Accept-Encoding",
+        }
+        if content_encoding:
+            headers["Content-Encoding"] = content_encoding
+        return func.HttpResponse(body, mimetype=FORMATS[output_format], status_code=200, headers=headers)
+
+    except pyodbc.Error as e:
+        logging.error(f"Database error: {e}")
+        return error_response("Internal server error: Database query failed.", 500)
+    except Exception as e:
+        logging.error(f"Error exporting {dataset}: {e}")
+        return error_response(f"An error occurred while exporting {dataset}.", 500)
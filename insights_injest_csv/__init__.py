@@ -1,101 +1,99 @@
-import logging
-import pyodbc
-import os
-import csv
-from io import StringIO  # Required for file-like string handling
-import azure.functions as func
-# Database connection details (update these with your EurekaDB credentials)
-DB_CONNECTION_STRING = os.getenv("SqlConnectionString")
-
-def main(req: func.HttpRequest) -> func.HttpResponse:
-    try:
-        logging.info("Processing CSV upload request.")
-
-        # Check if a file was uploaded
-        file = req.files.get('file')
-        if not file:
-            logging.error("No file uploaded.")
-            return func.HttpResponse("No file uploaded.", status_code=400)
-
-        logging.info(f"File received: {file.filename}")
-
-        # Decode and parse the file content
-        file_content = file.stream.read().decode('utf-8')
-        csv_reader = csv.reader(StringIO(file_content))
-        headers = next(csv_reader, None)
-
-        logging.info(f"CSV headers: {headers}")
-
-        # Expected CSV headers
-        expected_headers = [
-            "content", "created_at", "insight_type", "data_source", "audience", 
-            "domain", "confidence_level", "timeliness", 
-            "alignment_goal", "value_priority"
-        ]
-
-        # Validate headers
-        if headers != expected_headers:
-            logging.error(f"Invalid CSV headers. Expected: {expected_headers}, Received: {headers}")
-            return func.HttpResponse(f"Invalid CSV headers. Expected: {expected_headers}", status_code=400)
-
-        # Connect to the database
-        conn = pyodbc.connect(DB_CONNECTION_STRING)
-        cursor = conn.cursor()
-        logging.info("Database connection established.")
-
-        # Process rows and insert into the database
-        inserted_count = 0
-        for row in csv_reader:
-            logging.info(f"Processing row: {row}")
-            try:
-                cursor.execute("""
-                    INSERT INTO Insights (
-                        insight_type_id, data_source_id, audience_id, domain_id, confidence_level_id,
-                        timeliness_id, alignment_goal_id, value_priority_id, created_at, content
-                    )
-                    VALUES (
-                        (SELECT id FROM InsightTypes WHERE type_name = ?),
-                        (SELECT id FROM DataSources WHERE source_name = ?),
-                        (SELECT id FROM Audiences WHERE audience_name = ?),
-                        (SELECT id FROM Domains WHERE domain_name = ?),
-                        (SELECT id FROM ConfidenceLevels WHERE level_name = ?),
-                        (SELECT id FROM Timeliness WHERE timeliness_type = ?),
-                        (SELECT id FROM AlignmentGoals WHERE goal_name = ?),
-                        (SELECT id FROM ValuePriorities WHERE priority_name = ?),
-                        ?, ?
-                    )
-                """, (
-                    row[1],  # insight_type
-                    row[2],  # data_source
-                    row[3],  # audience
-                    row[4],  # domain
-                    row[5],  # confidence_level
-                    row[6],  # timeliness
-                    
-                    row[7],  # alignment_goal
-                    row[8], # value_priority
-                    row[9],  # created_at
-                    row[10],  # content
-                ))
-                inserted_count += 1
-                logging.info(f"Row inserted successfully: {row}")
-            except Exception as e:
-                logging.error(f"Failed to insert row: {row}. Error: {e}")
-
-        # Commit the transaction
-        conn.commit()
-        logging.info(f"Inserted {inserted_count} rows into the database.")
-
-        return func.HttpResponse(
-            f"File uploaded successfully. {inserted_count} rows inserted.",
-            status_code=200
-        )
-
-    except Exception as e:
-        logging.error(f"Unhandled error: {e}")
-        return func.HttpResponse(f"Error processing file: {e}", status_code=500)
-
-    finally:
-        if 'conn' in locals():
-            conn.close()
-            logging.info("Database connection closed.")
+import logging
+import json
+import azure.functions as func
+from db_helpers.concurrency import limited, run_blocking
+from db_helpers.connectionPool import get_connection
+from db_helpers.ingestDedup import UploadDeduplicator, synced_near_duplicate_index
+from db_helpers.ingestInsights import CsvHeaderError
+from db_helpers.insightQueue import QueueFullError, get_insight_queue
+from db_helpers.insightsSnapshot import invalidate_insights_snapshot
+from db_helpers.instrumentation import instrumented
+from db_helpers.parallelIngest import UploadChunks, ingest_chunks
+from db_helpers.searchIndex import update_search_index
+
+def ingest_upload(stream):
+    """
+    Validates, resolves and bulk inserts an uploaded CSV on a pooled connection, skipping
+    duplicates, indexes the new insights for search, invalidates the GET /insights snapshot and
+    queues them for recommendation.
+
+    Returns:
+        tuple: (ingest_chunks result, number of insights queued)
+    Raises:
+        CsvHeaderError: If the header row is missing required columns.
+    """
+    # The upload is read in chunks that are parsed in a process pool while earlier ones are written
+    chunks = UploadChunks(stream)
+
+    with get_connection() as conn:
+        # Near duplicates are looked up in the worker's MinHash index (None when disabled)
+        near_index = synced_near_duplicate_index(conn)
+        result = ingest_chunks(conn, chunks, deduplicator=UploadDeduplicator(near_index=near_index))
+        # Searchable right away in this worker; other workers catch up on their next search
+        if result["inserted"]:
+            update_search_index(conn)
+            synced_near_duplicate_index(conn)
+
+    # The materialized GET /insights snapshot no longer matches the table
+    if result["inserted"]:
+        invalidate_insights_snapshot()
+
+    # Hand the new insights to recommendation_worker; anything not queued is still picked
+    # up by the missing_recommendation backfill of generate_recommendations
+    queued = 0
+    queue = get_insight_queue()
+    if queue is not None and result["insight_ids"]:
+        try:
+            queued = queue.put_many(result["insight_ids"])
+        except QueueFullError as e:
+            queued = e.enqueued
+            logging.warning(f"{e} Queued {queued} of {len(result['insight_ids'])} new insights.")
+    return result, queued
+
+
+@instrumented("insights_injest_csv")
+@limited("insights_injest_csv")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    try:
+        logging.info("Processing CSV upload request.")
+
+        # Check if a file was uploaded
+        file = req.files.get('file')
+        if not file:
+            logging.error("No file uploaded.")
+            return func.HttpResponse("No file uploaded.", status_code=400)
+
+        logging.info(f"File received: {file.filename}")
+
+        # Runs on the bulk thread pool, which interactive functions never wait on
+        try:
+            result, queued = await run_blocking(ingest_upload, file.stream)
+        except CsvHeaderError as e:
+            logging.error(str(e))
+            return func.HttpResponse(str(e), status_code=400)
+
+        return func.HttpResponse(
+            json.dumps({
+                "message": f"File uploaded successfully. {result['inserted']} rows inserted, "
+                           f"{result['duplicates']} duplicates skipped.",
+                "inserted": result["inserted"],
+                "rejected": result["rejected"],
+                "rejects": result["rejects"],
+                "rejects_truncated": result["rejects_truncated"],
+                "duplicates": result["duplicates"],
+                "duplicates_by_kind": result["duplicates_by_kind"],
+                "duplicate_rows": result["duplicate_rows"],
+                "duplicates_truncated": result["duplicates_truncated"],
+                "queued_for_recommendation": queued
+            }),
+            mimetype="application/json",
+            status_code=200
+        )
+
+    except UnicodeDecodeError as e:
+        logging.error(f"Upload is not valid UTF-8: {e}")
+        return func.HttpResponse("Error processing file: upload is not valid UTF-8.", status_code=400)
+
+    except Exception as e:
+        logging.error(f"Unhandled error: {e}")
+        return func.HttpResponse(f"Error processing file: {e}", status_code=500)
@@ -0,0 +1,132 @@
+import logging
+import azure.functions as func
+import pyodbc
+import json
+from db_helpers.concurrency import RETRY_AFTER_SECONDS, limited, run_blocking
+from db_helpers.connectionPool import get_connection
+from db_helpers.getInsights import FILTER_DIMENSIONS, decorate_insights, dimension_tables, insights_query
+from db_helpers.instrumentation import instrumented, span
+from db_helpers.searchIndex import SearchIndexUnavailable, get_search_index
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# Ranking deeper than this is not useful to a reader and costs a larger partial sort
+MAX_OFFSET = 1000
+
+
+def error_response(message, status_code, headers=None):
+    return func.HttpResponse(json.dumps({"error": message}), mimetype="application/json",
+                             status_code=status_code, headers=headers)
+
+
+def parse_search_request(params):
+    """
+    Reads the search query parameters.
+
+    Returns:
+        tuple: (text, limit, offset, match_all, filters)
+    Raises:
+        ValueError: With a client-facing message.
+    """
+    text = (params.get("q") or "").strip()
+    if not text:
+        raise ValueError("Pass the words to search for in 'q'.")
+    try:
+        limit = int(params.get("limit", DEFAULT_LIMIT))
+        offset = int(params.get("offset", 0))
+    except ValueError:
+        raise ValueError("limit and offset must be integers.")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}.")
+    if not 0 <= offset <= MAX_OFFSET:
+        raise ValueError(f"offset must be between 0 and {MAX_OFFSET}.")
+    match = params.get("match", "any").lower()
+    if match not in ("any", "all"):
+        raise ValueError("match must be 'any' or 'all'.")
+    filters = {key: params[key] for key in FILTER_DIMENSIONS if params.get(key)}
+    return text, limit, offset, match == "all", filters
+
+
+def search_insights(text, limit, offset, match_all, filters):
+    """
+    Ranks insights from the worker's search index (caught up with the database first when due)
+    and reads the page of results by id, in the GET /insights shape plus a score.
+
+    Raises:
+        SearchIndexUnavailable: If no index has been built yet; a build is started.
+    """
+    index = get_search_index()
+    if index.needs_sync():
+        with get_connection() as conn:
+            index.sync(conn)
+    if not index.loaded:
+        index.build_in_background()
+        raise SearchIndexUnavailable("The search index is being built.")
+
+    # Lookup names become ids once; the index holds each insight's lookup ids
+    lookup_ids = {}
+    if filters:
+        tables = dimension_tables()
+        for key, name in filters.items():
+            lookup_ids[key] = tables[key].id_for(name)
+            if lookup_ids[key] is None:
+                return {"total": 0, "terms": {}, "insights": []}
+
+    with span("search.query") as query:
+        ranked = index.search(text, lookup_ids, limit, offset, match_all)
+        query.rows = ranked["total"]
+
+    insights = []
+    scores = dict(ranked["results"])
+    if scores:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            with span("db.query"):
+                cursor.execute(insights_query(f"i.id IN ({', '.join('?' * len(scores))})"), *scores)
+            with span("db.fetch") as fetch:
+                rows = cursor.fetchall()
+                fetch.rows = len(rows)
+            with span("build", rows=len(rows)):
+                by_id = {insight["insight_id"]: insight for insight in decorate_insights(conn, rows)}
+        # Insights deleted since the last rebuild are skipped
+        for insight_id, score in ranked["results"]:
+            if insight_id in by_id:
+                insights.append({**by_id[insight_id], "score": score})
+    return {"total": ranked["total"], "terms": ranked["terms"], "insights": insights}
+
+
+@instrumented("insights_search")
+@limited("insights_search")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Full-text search over insight content, ranked with BM25 (see searchIndex).
+
+    GET insights/search?q=...
+        q                   the words to search for; a word that is not indexed matches the
+                            indexed words containing it ("forecast" finds "forecasting")
+        match               any (default) ranks insights containing any of the words, all only
+                            those containing every word
+        domain, audience, confidence_level
+                            lookup names, as on GET /insights
+        limit, offset       page through the ranked results (limit up to 100, default 20)
+
+    Answers 503 with Retry-After while the first index is being built.
+    """
+    try:
+        text, limit, offset, match_all, filters = parse_search_request(req.params)
+    except ValueError as e:
+        return error_response(str(e), 400)
+    logging.info(f"Searching insights for '{text}'.")
+
+    try:
+        result = await run_blocking(search_insights, text, limit, offset, match_all, filters)
+        return func.HttpResponse(json.dumps(result), mimetype="application/json")
+
+    except SearchIndexUnavailable as e:
+        return error_response(str(e), 503, headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    except pyodbc.Error as db_err:
+        logging.error(f"Database error: {db_err}")
+        return error_response("Internal server error: Database query failed.", 500)
+    except Exception as e:
+        logging.error(f"Error searching insights: {e}")
+        return error_response("Internal server error.", 500)
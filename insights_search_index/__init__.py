@@ -0,0 +1,22 @@
+import logging
+import azure.functions as func
+from db_helpers.connectionPool import get_connection
+from db_helpers.instrumentation import instrumented
+from db_helpers.searchIndex import get_search_index
+
+
+@instrumented("insights_search_index")
+def main(timer: func.TimerRequest) -> None:
+    """
+    Keeps the persisted search index current: a full rebuild when there is none or the last one
+    is older than SearchIndexRebuildSeconds, otherwise the insights added since the published
+    generation are merged into a new one, so instances starting cold load a recent index.
+    """
+    if timer.past_due:
+        logging.warning("Search index maintenance is running late.")
+
+    index = get_search_index()
+    with get_connection() as conn:
+        if not index.maintain(conn):
+            logging.info("Search index is up to date or being built by another process.")
+    logging.info(f"Search index: {index.stats()}")
@@ -0,0 +1,22 @@
+import logging
+import azure.functions as func
+from db_helpers.insightsSnapshot import SNAPSHOT_ENABLED, get_insights_snapshot
+from db_helpers.instrumentation import instrumented
+
+
+@instrumented("insights_snapshot")
+def main(timer: func.TimerRequest) -> None:
+    """
+    Rebuilds the materialized GET /insights snapshot when it is missing, invalidated by a write
+    or older than InsightsSnapshotMaxAgeSeconds, so readers rarely pay for a foreground build.
+    """
+    if not SNAPSHOT_ENABLED:
+        return
+
+    if timer.past_due:
+        logging.warning("Insights snapshot refresh is running late.")
+
+    snapshot = get_insights_snapshot()
+    if snapshot.refresh() is None:
+        logging.info("Insights snapshot is being built by another process.")
+    logging.info(f"Insights snapshot: {snapshot.metrics()}")
@@ -1,37 +1,133 @@
-import json
-import logging
-import azure.functions as func
-from db_helpers.getInsights import read_all_insights
-
-def main(req: func.HttpRequest) -> func.HttpResponse:
-    """
-    Azure Function to fetch all insights from the database and return them as a JSON response.
-    """
-    logging.info("HTTP trigger function to fetch all insights invoked.")
-
-    try:
-        # Use the helper function to fetch insights
-        insights = read_all_insights()
-
-        # Handle the case where no insights are found
-        if not insights:
-            return func.HttpResponse(
-                json.dumps({"message": "No insights found."}),
-                mimetype="application/json",
-                status_code=404
-            )
-
-        # Return the insights as a JSON response
-        return func.HttpResponse(
-            json.dumps(insights, indent=4),
-            mimetype="application/json",
-            status_code=200
-        )
-
-    except Exception as e:
-        logging.error(f"Error fetching insights: {e}")
-        return func.HttpResponse(
-            json.dumps({"error": "An error occurred while fetching insights."}),
-            mimetype="application/json",
-            status_code=500
-        )
+import json
+import logging
+import datetime
+import azure.functions as func
+from db_helpers.concurrency import limited, run_blocking
+from db_helpers.getInsights import DEFAULT_PAGE_SIZE, FILTER_DIMENSIONS, iter_insights, read_all_insights, read_insights_page_async
+from db_helpers.insightsSnapshot import SNAPSHOT_ENABLED, snapshot_response
+from db_helpers.instrumentation import instrumented
+from db_helpers.responseEncoding import json_response, ndjson_response, wants_ndjson
+
+DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d")
+
+
+def parse_datetime_param(name, value):
+    """Parses a created_at range query parameter; raises ValueError with a client-facing message."""
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid {name} '{value}'. Expected YYYY-MM-DD or YYYY-MM-DD HH:MM:SS.")
+
+
+def parse_page_request(params):
+    """
+    Reads paging and filter query parameters.
+
+    Returns:
+        tuple: (limit, cursor, filters)
+    Raises:
+        ValueError: If a parameter is malformed.
+    """
+    try:
+        limit = int(params.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer.")
+    if limit < 1:
+        raise ValueError("limit must be positive.")
+
+    filters = {key: params[key] for key in FILTER_DIMENSIONS if params.get(key)}
+    for name in ("created_from", "created_to"):
+        if params.get(name):
+            filters[name] = parse_datetime_param(name, params[name])
+
+    return limit, params.get("cursor") or None, filters
+
+
+def snapshot_or_live(req):
+    """The whole, unfiltered set: pre-encoded bytes when snapshot mode is on, else read live."""
+    response = snapshot_response(req) if SNAPSHOT_ENABLED else None
+    if response is None:
+        response = json_response({"insights": read_all_insights(), "next_cursor": None}, req)
+    return response
+
+
+@instrumented("insights_summary")
+@limited("insights_summary")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Azure Function to fetch a page of insights from the database and return it as a JSON response.
+
+    Query parameters: limit, cursor (next_cursor from the previous page), domain, audience,
+    confidence_level, created_from and created_to.
+
+    With ?format=ndjson or Accept: application/x-ndjson every matching insight after the cursor
+    is returned, one JSON object per line, instead of a single page.
+
+    With ?snapshot=true every insight is returned as one page. When InsightsSnapshotEnabled is
+    set the body comes pre-encoded from the materialized snapshot (see insightsSnapshot), with a
+    strong ETag for conditional requests; otherwise it is read live.
+
+    Database reads and encoding run on the interactive thread pool (see concurrency), so bulk
+    functions running in the same worker do not delay it.
+    """
+    logging.info("HTTP trigger function to fetch insights invoked.")
+
+    try:
+        limit, cursor, filters = parse_page_request(req.params)
+    except ValueError as e:
+        return func.HttpResponse(
+            json.dumps({"error": str(e)}),
+            mimetype="application/json",
+            status_code=400
+        )
+
+    snapshot = req.params.get("snapshot", "").lower() == "true"
+    if snapshot and (cursor or filters or wants_ndjson(req)):
+        return func.HttpResponse(
+            json.dumps({"error": "snapshot cannot be combined with cursor, filters or NDJSON."}),
+            mimetype="application/json",
+            status_code=400
+        )
+
+    try:
+        # The whole, unfiltered set: pre-encoded bytes when snapshot mode is on
+        if snapshot:
+            return await run_blocking(snapshot_or_live, req)
+
+        # Stream every matching insight as NDJSON
+        if wants_ndjson(req):
+            try:
+                return await run_blocking(ndjson_response, iter_insights(cursor, filters), req)
+            except ValueError as e:
+                return json_response({"error": str(e)}, req, status_code=400)
+
+        # Use the helper function to fetch one page of insights
+        try:
+            insights, next_cursor = await read_insights_page_async(limit, cursor, filters)
+        except ValueError as e:
+            return func.HttpResponse(
+                json.dumps({"error": str(e)}),
+                mimetype="application/json",
+                status_code=400
+            )
+
+        # Handle the case where no insights are found
+        if not insights and not cursor:
+            return func.HttpResponse(
+                json.dumps({"message": "No insights found."}),
+                mimetype="application/json",
+                status_code=404
+            )
+
+        # Return the page as a compact (optionally compressed) JSON response
+        return await run_blocking(json_response, {"insights": insights, "next_cursor": next_cursor}, req)
+
+    except Exception as e:
+        logging.error(f"Error fetching insights: {e}")
+        return func.HttpResponse(
+            json.dumps({"error": "An error occurred while fetching insights."}),
+            mimetype="application/json",
+            status_code=500
+        )
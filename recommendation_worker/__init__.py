@@ -0,0 +1,25 @@
+import logging
+import azure.functions as func
+from db_helpers.insightQueue import get_insight_queue
+from db_helpers.instrumentation import instrumented
+from db_helpers.recommendationWorker import drain_queue
+
+
+@instrumented("recommendation_worker")
+def main(timer: func.TimerRequest) -> None:
+    """
+    Scores insights queued by insights_injest_csv in micro-batches and stores their recommendations.
+    """
+    queue = get_insight_queue()
+    if queue is None:
+        return
+
+    if timer.past_due:
+        logging.warning("Recommendation worker is running late.")
+
+    summary = drain_queue(queue)
+    metrics = queue.metrics()
+    if summary["batches"] or summary["failed_batches"]:
+        logging.info(f"Recommendation worker: {summary}; queue: {metrics}")
+    if metrics["dead_letters"]:
+        logging.warning(f"{metrics['dead_letters']} queued insights are dead-lettered.")
@@ -1,79 +1,240 @@
+import base64
+import binascii
+import hashlib
+import json
 import logging
+import asyncio
 import azure.functions as func
 import pyodbc
-import json
-import os
+from db_helpers.concurrency import limited, run_blocking
+from db_helpers.connectionPool import DB_CONNECTION_STRING, get_connection
+from db_helpers.getInsights import dimension_tables
+from db_helpers.instrumentation import instrumented, span
+from db_helpers.modelRegistry import get_model_registry
+from db_helpers.responseEncoding import etag_matches, json_response, ndjson_response, wants_ndjson
 
-# Database connection string
-CONNECTION_STRING = os.getenv("SqlConnectionString")
-MODEL_NAME = "Random Forest Classifier"
-MODEL_FILE_NAME = "recommendation_model.pkl"
+# Rows pulled from the database per fetchmany call
+FETCH_BATCH_SIZE = 1000
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info("Fetching all recommendations with insight content.")
+# SQL query to fetch all recommendations with the insight content;
+# lookup names come from the process-wide dimension cache
+RECOMMENDATIONS_QUERY = """
+SELECT r.id, i.content, r.recommendation_text,
+       r.confidence_level_id, r.delivery_channel_id, r.status,
+       r.created_at, r.updated_at
+FROM Recommendations r
+JOIN Insights i ON r.insight_id = i.id
+"""
+
+# Delta mode: rows changed after the client's row_version watermark, in row_version order.
+# row_version is assigned by the database when a change is written; rows at or above
+# MIN_ACTIVE_ROWVERSION() may still have uncommitted changes below them, so they wait for a
+# later request. Served by the index on Recommendations(row_version).
+DELTA_QUERY = """
+SELECT TOP (?) r.id, i.content, r.recommendation_text,
+       r.confidence_level_id, r.delivery_channel_id, r.status,
+       r.created_at, r.updated_at, r.row_version
+FROM Recommendations r
+JOIN Insights i ON r.insight_id = i.id
+WHERE r.row_version > ? AND r.row_version < MIN_ACTIVE_ROWVERSION()
+ORDER BY r.row_version
+"""
+
+# Sync token of full responses (the newest committed row_version below which no change is still
+# in flight), newest row_version and row count; all three go into the ETag. Every value is read
+# from Recommendations: MIN_ACTIVE_ROWVERSION() moves with any rowversion write in the database
+# (e.g. Tags.version), so it only bounds the token and never appears in the state itself.
+STATE_QUERY = """
+SELECT (SELECT MAX(row_version) FROM Recommendations WHERE row_version < MIN_ACTIVE_ROWVERSION()),
+       MAX(row_version), COUNT_BIG(*)
+FROM Recommendations
+"""
+
+DEFAULT_DELTA_LIMIT = 5000
 
+ROW_VERSION_BYTES = 8
+
+
+def encode_token(row_version):
+    """Encodes a row_version watermark as an opaque sync token."""
+    position = {"row_version": bytes(row_version or bytes(ROW_VERSION_BYTES)).hex()}
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+
+def decode_token(token):
+    """
+    Decodes a sync token produced by encode_token.
+
+    Raises:
+        ValueError: If the token is malformed, or an (updated_at, id) token of an earlier version.
+    """
     try:
-        # Validate connection string
-        if not CONNECTION_STRING:
-            logging.error("Database connection string is not configured.")
-            return func.HttpResponse(
-                "Internal server error: Missing database connection string.",
-                status_code=500
-            )
+        position = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        row_version = bytes.fromhex(position["row_version"])
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError) as e:
+        raise ValueError("Invalid since token.") from e
+    if len(row_version) != ROW_VERSION_BYTES:
+        raise ValueError("Invalid since token.")
+    return row_version
+
+
+def make_etag(state, *variant):
+    """Strong ETag over the table watermark, row count and anything else the body depends on."""
+    digest = hashlib.sha256(repr((tuple(state), variant)).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def to_record(row, confidence_levels, delivery_channels):
+    """Converts one RECOMMENDATIONS_QUERY row into the API dictionary."""
+    return {
+        "id": row[0],
+        "insight_content": row[1],
+        "recommendation_text": row[2],
+        "confidence_level_name": confidence_levels.name(row[3]),
+        "delivery_channel_name": delivery_channels.name(row[4]),
+        "status": row[5],
+        "created_at": row[6].strftime("%Y-%m-%d %H:%M:%S") if row[6] else None,
+        "updated_at": row[7].strftime("%Y-%m-%d %H:%M:%S") if row[7] else None
+    }
+
+
+def iter_records(cursor, first_batch):
+    """Yields API dictionaries for an executed cursor, fetching FETCH_BATCH_SIZE rows at a time."""
+    # The cursor's connection is busy with the open result set; a cache reload borrows another one
+    dimensions = dimension_tables()
+    confidence_levels = dimensions["confidence_level"]
+    delivery_channels = dimensions["delivery_channel"]
+
+    rows = first_batch
+    while rows:
+        with span("build", rows=len(rows)):
+            records = [to_record(row, confidence_levels, delivery_channels) for row in rows]
+        yield from records
+        with span("db.fetch") as fetch:
+            rows = cursor.fetchmany(FETCH_BATCH_SIZE)
+            fetch.rows = len(rows)
 
-        # Connect to the database
-        with pyodbc.connect(CONNECTION_STRING) as conn:
-            cursor = conn.cursor()
-
-            # SQL query to fetch all recommendations with joined data
-            query = """
-            SELECT r.id, i.content, r.recommendation_text, 
-                   cl.level_name, dc.channel_name, r.status, 
-                   r.created_at, r.updated_at
-            FROM Recommendations r
-            JOIN Insights i ON r.insight_id = i.id
-            JOIN ConfidenceLevels cl ON r.confidence_level_id = cl.id
-            JOIN DeliveryChannels dc ON r.delivery_channel_id = dc.id
-            """
-            cursor.execute(query)
-
-            # Fetch all results
-            recommendations = cursor.fetchall()
+
+def read_state():
+    """Current (sync token row_version, newest row_version, row count) of Recommendations, on a connection of its own."""
+    with get_connection() as conn:
+        with span("db.state"):
+            return tuple(conn.cursor().execute(STATE_QUERY).fetchone())
+
+
+def build_response(req, state, watermark, since, limit, ndjson, registry, model_version, etag):
+    """Reads the recommendations (all, or the delta after watermark) and encodes the response."""
+    # Borrow a pooled database connection
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if watermark:
+            with span("db.query") as query:
+                rows = cursor.execute(DELTA_QUERY, limit + 1, watermark).fetchall()
+                query.rows = len(rows)
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            # The token only advances past rows actually returned
+            sync_token = encode_token(rows[-1][8]) if rows else since
+            records = iter_records(cursor, rows) if rows else iter(())
+        else:
+            with span("db.query"):
+                cursor.execute(RECOMMENDATIONS_QUERY)
 
             # Check if recommendations exist
-            if not recommendations:
+            with span("db.fetch") as fetch:
+                first_batch = cursor.fetchmany(FETCH_BATCH_SIZE)
+                fetch.rows = len(first_batch)
+            if not first_batch:
                 return func.HttpResponse(
                     "No recommendations found.",
                     status_code=404
                 )
+            has_more = False
+            # Taken before the read: every change up to it is committed and so part of the read;
+            # changes racing with the read are sent again by the next delta
+            sync_token = encode_token(state[0])
+            records = iter_records(cursor, first_batch)
 
-            # Convert results to JSON
-            recommendations_list = []
-            for row in recommendations:
-                recommendations_list.append({
-                    "id": row[0],
-                    "insight_content": row[1],
-                    "recommendation_text": row[2],
-                    "confidence_level_name": row[3],
-                    "delivery_channel_name": row[4],
-                    "status": row[5],
-                    "created_at": row[6].strftime("%Y-%m-%d %H:%M:%S") if row[6] else None,
-                    "updated_at": row[7].strftime("%Y-%m-%d %H:%M:%S") if row[7] else None
-                })
+        if ndjson:
+            return ndjson_response(records, req, headers={
+                "X-Model-Name": registry.name,
+                "X-Model-File": registry.file_name,
+                "X-Model-Version": model_version,
+                "X-Sync-Token": sync_token,
+                "X-Has-More": str(has_more).lower(),
+                "ETag": etag
+            })
 
         # Include model information in the response
         response = {
-            "model_name": MODEL_NAME,
-            "model_file_name": MODEL_FILE_NAME,
-            "recommendations": recommendations_list
+            "model_name": registry.name,
+            "model_file_name": registry.file_name,
+            "model_version": model_version,
+            "recommendations": list(records),
+            "sync_token": sync_token
         }
+        if watermark:
+            response["has_more"] = has_more
 
-        # Return recommendations along with model info as JSON
-        return func.HttpResponse(
-            json.dumps(response, indent=2),
-            mimetype="application/json",
-            status_code=200
+    # Return recommendations along with model info as compact (optionally compressed) JSON
+    return json_response(response, req, headers={"ETag": etag})
+
+
+@instrumented("recommendations_summary")
+@limited("recommendations_summary")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Returns all recommendations with their insight content and the model that produced them.
+
+    With ?format=ndjson or Accept: application/x-ndjson the recommendations are returned one
+    JSON object per line and the model information moves to X-Model-* headers.
+
+    Full responses carry a sync_token. Passing it back as ?since=<token> returns only the
+    recommendations inserted or updated after it (at most ?limit rows, in the order their changes
+    were written) plus the next token, with has_more set while more changes remain. Every
+    response has an ETag over the table watermark, so a repeated request with If-None-Match is
+    answered 304 without reading any recommendations. Deleted rows are not reported by delta
+    requests.
+
+    The watermark, the model version and the dimension cache are read concurrently, each on its
+    own pooled connection, before the recommendations themselves.
+
+    Tokens are row_version watermarks capped below MIN_ACTIVE_ROWVERSION(), so a change that
+    commits after a token was handed out is still returned by the next delta request.
+    """
+    logging.info("Fetching all recommendations with insight content.")
+
+    try:
+        # Validate connection string
+        if not DB_CONNECTION_STRING:
+            logging.error("Database connection string is not configured.")
+            return func.HttpResponse(
+                "Internal server error: Missing database connection string.",
+                status_code=500
+            )
+
+        since = req.params.get("since")
+        try:
+            watermark = decode_token(since) if since else None
+            limit = int(req.params.get("limit", DEFAULT_DELTA_LIMIT))
+            if limit < 1:
+                raise ValueError("limit must be positive.")
+        except ValueError as e:
+            return func.HttpResponse(f"Invalid request: {e}", status_code=400)
+
+        ndjson = wants_ndjson(req)
+
+        # Model information comes from the registry; the version is a file hash, no unpickling
+        registry = get_model_registry()
+        state, model_version, _ = await asyncio.gather(
+            run_blocking(read_state), run_blocking(registry.version), run_blocking(dimension_tables)
         )
+        etag = make_etag(state, since, limit if since else None, ndjson, model_version)
+        if etag_matches(req, etag):
+            return func.HttpResponse(status_code=304, headers={"ETag": etag})
+
+        return await run_blocking(build_response, req, state, watermark, since, limit, ndjson,
+                                  registry, model_version, etag)
 
     except pyodbc.Error as db_err:
         logging.error(f"Database error: {db_err}")
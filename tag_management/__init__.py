@@ -2,12 +2,150 @@ import logging
 import azure.functions as func
 import pyodbc
 import json
-import os
+import numpy as np
+from db_helpers.concurrency import limited, run_blocking
+from db_helpers.connectionPool import get_connection
+from db_helpers.getInsights import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, decode_cursor, decorate_insights, encode_cursor, insights_query
+from db_helpers.instrumentation import instrumented, span
+from db_helpers.tagIndex import MAX_INSIGHT_IDS_PER_REQUEST, get_tag_index, update_tags, validate_tag_names
 
-# Database connection string
-CONNECTION_STRING = os.getenv("SqlConnectionString")
 
-def main(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info("Fetching all recommendations with insight content.")
+def error_response(message, status_code):
+    return func.HttpResponse(json.dumps({"error": message}), mimetype="application/json", status_code=status_code)
 
-   
+
+def synced_tag_index():
+    """The worker's tag index, synced with the database first when due."""
+    index = get_tag_index()
+    if index.needs_sync():
+        with get_connection() as conn:
+            index.sync(conn)
+    return index
+
+
+def tag_list(value):
+    """Comma separated tag names from a query parameter."""
+    return [name.strip() for name in (value or "").split(",") if name.strip()]
+
+
+def list_tags():
+    index = synced_tag_index()
+    return {"tags": [{"name": name, "insight_count": count} for name, count in index.tags()]}
+
+
+def query_tags(all_of, any_of, none_of, limit, after_id, expand):
+    """
+    Answers a boolean tag query from the index; with expand the page of insights is read by id
+    and returned in the GET /insights shape.
+    """
+    index = synced_tag_index()
+    with span("tags.query") as query:
+        matches = index.query(all_of, any_of, none_of)
+        query.rows = len(matches)
+    page = matches[np.searchsorted(matches, after_id, side="right"):][:limit + 1]
+    page_ids = [int(insight_id) for insight_id in page[:limit]]
+    result = {
+        "total": len(matches),
+        "next_cursor": encode_cursor(page_ids[-1]) if len(page) > limit else None,
+    }
+    if not expand:
+        result["insight_ids"] = page_ids
+        return result
+
+    insights = []
+    if page_ids:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            with span("db.query"):
+                cursor.execute(insights_query(f"i.id IN ({', '.join('?' * len(page_ids))})"), *page_ids)
+            with span("db.fetch") as fetch:
+                rows = cursor.fetchall()
+                fetch.rows = len(rows)
+            with span("build", rows=len(rows)):
+                insights = decorate_insights(conn, rows)
+    result["insights"] = insights
+    return result
+
+
+def write_tags(tag_names, insight_ids, remove):
+    with get_connection() as conn:
+        return update_tags(conn, tag_names, insight_ids, remove=remove)
+
+
+def parse_write(req):
+    """
+    Reads a bulk add/remove body: {"tags": [...], "insight_ids": [...]}.
+
+    Raises:
+        ValueError: With a client-facing message.
+    """
+    try:
+        body = req.get_json()
+    except ValueError:
+        raise ValueError("Invalid JSON in request body.")
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object.")
+    tag_names = validate_tag_names(body.get("tags"))
+    insight_ids = body.get("insight_ids")
+    if (not isinstance(insight_ids, list) or not insight_ids
+            or not all(isinstance(insight_id, int) and insight_id > 0 for insight_id in insight_ids)):
+        raise ValueError("insight_ids must be a non-empty list of positive integers.")
+    if len(insight_ids) > MAX_INSIGHT_IDS_PER_REQUEST:
+        raise ValueError(f"At most {MAX_INSIGHT_IDS_PER_REQUEST} insight_ids per request.")
+    return tag_names, insight_ids
+
+
+@instrumented("tag_management")
+@limited("tag_management")
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Tags insights and answers tag queries from the worker's inverted tag index (see tagIndex).
+
+    GET  tags                 every tag with its insight count
+    GET  tags/query           insights by tag: all, any and none take comma separated tag names
+                              ("all=a,b&none=c" is tagged a and b but not c); limit and cursor
+                              page through the matching ids, expand=true returns the insights
+    POST tags/add             {"tags": [...], "insight_ids": [...]} adds every tag to every
+                              insight, creating missing tags
+    POST tags/remove          the same body, removes the tags
+    """
+    action = (req.route_params.get("action") or "").lower()
+    logging.info(f"Tag management request: {req.method} {action or 'list'}.")
+
+    try:
+        if req.method == "GET" and not action:
+            return func.HttpResponse(json.dumps(await run_blocking(list_tags)), mimetype="application/json")
+
+        if req.method == "GET" and action == "query":
+            params = req.params
+            try:
+                limit = int(params.get("limit", DEFAULT_PAGE_SIZE))
+                if limit < 1:
+                    raise ValueError("limit must be positive.")
+                after_id = decode_cursor(params["cursor"]) if params.get("cursor") else 0
+            except ValueError as e:
+                return error_response(str(e), 400)
+            all_of, any_of, none_of = tag_list(params.get("all")), tag_list(params.get("any")), tag_list(params.get("none"))
+            if not all_of and not any_of:
+                return error_response("Pass at least one tag in 'all' or 'any'.", 400)
+            result = await run_blocking(query_tags, all_of, any_of, none_of, min(limit, MAX_PAGE_SIZE), after_id,
+                                        params.get("expand", "").lower() == "true")
+            return func.HttpResponse(json.dumps(result), mimetype="application/json")
+
+        if req.method == "POST" and action in ("add", "remove"):
+            try:
+                tag_names, insight_ids = parse_write(req)
+            except ValueError as e:
+                return error_response(str(e), 400)
+            # Bulk writes run on the bulk thread pool, away from tag queries
+            result = await run_blocking(write_tags, tag_names, insight_ids, action == "remove", lane="bulk")
+            return func.HttpResponse(json.dumps(result), mimetype="application/json")
+
+        return error_response("Unknown tag action. Use GET tags, GET tags/query, POST tags/add or POST tags/remove.", 404)
+
+    except pyodbc.Error as db_err:
+        logging.error(f"Database error: {db_err}")
+        return error_response("Internal server error: Database query failed.", 500)
+    except Exception as e:
+        logging.error(f"Error handling tag request: {e}")
+        return error_response("Internal server error.", 500)
@@ -0,0 +1,171 @@
+import collections
+import copy
+import datetime
+import os
+import sys
+
+import pytest
+
+# Make the function app packages (db_helpers, function folders) importable from test/
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from db_helpers.compiledPredictor import FEATURE_COLUMNS  # noqa: E402
+from db_helpers.dimensionCache import LOAD_QUERY, get_dimension_cache  # noqa: E402
+from db_helpers.generateRecommendations import INSERT_RECOMMENDATION_SQL, UPSERT_PENDING_SQL  # noqa: E402
+from db_helpers.ingestInsights import (CREATE_STAGING_SQL, FACT_COLUMNS, LOOKUP_COLUMNS,  # noqa: E402
+                                       MARK_DUPLICATES_SQL, MOVE_STAGING_SQL, STAGING_INSERT_SQL)
+from db_helpers.insightRollups import (ADD_RECOMMENDATION_STATUS_SQL, APPLY_INSIGHT_DELTA_SQL,  # noqa: E402
+                                       CREATE_INSIGHT_DELTA_SQL, INSIGHT_ROLLUPS_QUERY, ROLLUP_COLUMNS,
+                                       STATUS_ROLLUPS_QUERY, insight_counts_query, status_counts_query)
+from fakertools.generate_insights import LOOKUP_NAMES  # noqa: E402
+
+CHECK_HINTS = " WITH (TABLOCK, HOLDLOCK)"
+
+
+class EurekaDatabase:
+    """
+    Connection stand-in that carries out the statements of the ingest, recommendation and rollup
+    paths on Python lists: seed lookups, Insights, Recommendations and both rollup tables, with
+    commit and rollback. Any other statement fails the test, so a new write path has to be
+    taught here before its rollup maintenance can pass unchecked.
+    """
+
+    def __init__(self):
+        self.tables = {"insights": [], "recommendations": [],
+                       "insight_rollups": collections.Counter(), "status_rollups": collections.Counter()}
+        self._committed = copy.deepcopy(self.tables)
+        # Session temp tables, outside the transaction like their T-SQL counterparts
+        self.staging = []
+        self.delta = collections.Counter()
+        # Every row bulk copied into #InsightsStaging, for checks of the parsed values
+        self.staged = []
+        self.fast_executemany = False
+        self._rows = []
+
+    def cursor(self):
+        return self
+
+    def close(self):
+        pass
+
+    def commit(self):
+        self._committed = copy.deepcopy(self.tables)
+
+    def rollback(self):
+        self.tables = copy.deepcopy(self._committed)
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def executemany(self, sql, rows):
+        for row in rows:
+            self.execute(sql, *row)
+
+    def execute(self, sql, *params):
+        self._rows = []
+        insights = self.tables["insights"]
+        recommendations = self.tables["recommendations"]
+        if sql == LOAD_QUERY:
+            self._rows = [(key, position + 1, name, None)
+                          for key, names in LOOKUP_NAMES.items() for position, name in enumerate(names)]
+        elif sql == CREATE_STAGING_SQL or sql.startswith("TRUNCATE TABLE #InsightsStaging"):
+            self.staging = []
+        elif sql == CREATE_INSIGHT_DELTA_SQL:
+            self.delta = collections.Counter()
+        elif sql.startswith("DROP TABLE #"):
+            pass
+        elif sql == STAGING_INSERT_SQL:
+            row = dict(zip(["row_num"] + FACT_COLUMNS, params), duplicate_of=None)
+            self.staging.append(row)
+            self.staged.append(list(params))
+        elif sql == MARK_DUPLICATES_SQL:
+            for row in self.staging:
+                row["duplicate_of"] = next((insight["id"] for insight in insights
+                                            if insight["content_hash"] == row["content_hash"]
+                                            and all(insight[column] == row[column] for column in LOOKUP_COLUMNS)), None)
+            self._rows = [(row["row_num"], row["duplicate_of"]) for row in self.staging if row["duplicate_of"]]
+        elif sql == MOVE_STAGING_SQL:
+            now = datetime.datetime.now()
+            for row in sorted(self.staging, key=lambda row: row["row_num"]):
+                if row["duplicate_of"] is not None:
+                    continue
+                insight = {column: row[column] for column in FACT_COLUMNS}
+                insight["created_at"] = insight["created_at"] or now
+                insight["id"] = len(insights) + 1
+                insights.append(insight)
+                self.delta[self._rollup_key(insight)] += 1
+                self._rows.append((insight["id"],))
+        elif sql == APPLY_INSIGHT_DELTA_SQL:
+            self.tables["insight_rollups"].update(self.delta)
+        elif sql == ADD_RECOMMENDATION_STATUS_SQL:
+            status, count = params
+            self.tables["status_rollups"][(status,)] += count
+        elif sql == INSERT_RECOMMENDATION_SQL:
+            self._add_recommendation(*params)
+        elif sql == UPSERT_PENDING_SQL:
+            insight_id, text, confidence_level_id, channel_id, created_at, updated_at = params[:6]
+            inserted = 0
+            if not any(r["insight_id"] == insight_id and r["status"] == "Pending" for r in recommendations):
+                self._add_recommendation(insight_id, text, confidence_level_id, channel_id, "Pending",
+                                         created_at, updated_at)
+                inserted = 1
+            pending = next(r for r in recommendations if r["insight_id"] == insight_id and r["status"] == "Pending")
+            self._rows = [(pending["id"], pending["recommendation_text"], inserted)]
+        elif "FROM Insights i" in sql and "TOP (?)" in sql:
+            limit, after_id = params
+            scored = {r["insight_id"] for r in recommendations}
+            self._rows = [self._features(insight) for insight in insights
+                          if insight["id"] > after_id and insight["id"] not in scored][:limit]
+        elif "FROM Insights i" in sql and "WHERE i.id IN" in sql:
+            scored = {r["insight_id"] for r in recommendations} if "NOT EXISTS" in sql else set()
+            self._rows = [self._features(insight) for insight in insights
+                          if insight["id"] in params and insight["id"] not in scored]
+        elif sql == insight_counts_query(CHECK_HINTS):
+            counts = collections.Counter(self._rollup_key(insight) for insight in insights)
+            self._rows = [key + (count,) for key, count in counts.items()]
+        elif sql == status_counts_query(CHECK_HINTS):
+            counts = collections.Counter(r["status"] for r in recommendations)
+            self._rows = [(status, count) for status, count in counts.items()]
+        elif sql == INSIGHT_ROLLUPS_QUERY:
+            self._rows = [key + (count,) for key, count in self.tables["insight_rollups"].items()]
+        elif sql == STATUS_ROLLUPS_QUERY:
+            self._rows = [key + (count,) for key, count in self.tables["status_rollups"].items()]
+        else:
+            raise AssertionError(f"Statement not supported by the stand-in: {sql}")
+        return self
+
+    @staticmethod
+    def _rollup_key(insight):
+        created_at = insight["created_at"]
+        return tuple(insight[column] for column in ROLLUP_COLUMNS) + (datetime.date(created_at.year, created_at.month, 1),)
+
+    @staticmethod
+    def _features(insight):
+        return (insight["id"],) + tuple(insight[column] for column in FEATURE_COLUMNS)
+
+    def _add_recommendation(self, insight_id, text, confidence_level_id, channel_id, status, created_at, updated_at):
+        recommendations = self.tables["recommendations"]
+        recommendations.append({
+            "id": len(recommendations) + 1, "insight_id": insight_id, "recommendation_text": text,
+            "confidence_level_id": confidence_level_id, "delivery_channel_id": channel_id, "status": status,
+            "created_at": created_at, "updated_at": updated_at,
+        })
+
+
+@pytest.fixture
+def make_database():
+    """Factory of empty EurekaDatabase instances; the process-wide lookup cache is reloaded from them."""
+    get_dimension_cache().invalidate()
+    yield EurekaDatabase
+    get_dimension_cache().invalidate()
+
+
+@pytest.fixture
+def database(make_database):
+    return make_database()
@@ -0,0 +1,34 @@
+import os
+import time
+
+from db_helpers.buildFiles import (BUILD_LOCK_TIMEOUT_SECONDS, acquire_build_lock, release_build_lock,
+                                   remove_old_generations)
+
+
+def test_build_lock_is_exclusive_until_released_or_stale(tmp_path):
+    lock_path = str(tmp_path / "index" / "build.lock")
+    assert acquire_build_lock(lock_path, "test")
+    assert not acquire_build_lock(lock_path, "test")
+
+    release_build_lock(lock_path)
+    assert acquire_build_lock(lock_path, "test")
+
+    # Left over from a crashed build
+    stale = time.time() - BUILD_LOCK_TIMEOUT_SECONDS - 1
+    os.utime(lock_path, (stale, stale))
+    assert acquire_build_lock(lock_path, "test")
+    with open(lock_path, encoding="ascii") as file:
+        assert file.read() == str(os.getpid())
+
+
+def test_remove_old_generations_keeps_listed_files_and_directories(tmp_path):
+    for name in ("insights-old.json", "insights-old.json.gz", "insights-new.json", "insights-new.json.br",
+                 "insights-previous.json", "manifest.json"):
+        (tmp_path / name).write_bytes(b"{}")
+    for name in ("insights-old", "insights-new"):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "postings.bin").write_bytes(b"")
+
+    remove_old_generations(str(tmp_path), "insights-", keep={"insights-new", "insights-previous", None})
+    assert sorted(os.listdir(tmp_path)) == ["insights-new", "insights-new.json", "insights-new.json.br",
+                                            "insights-previous.json", "manifest.json"]
@@ -0,0 +1,17 @@
+import itertools
+
+from db_helpers.compiledPredictor import FEATURE_COLUMNS, load_compiled, model_predict
+from db_helpers.modelRegistry import ModelRegistry
+
+
+def test_shipped_table_matches_model_on_every_grid_point():
+    registry = ModelRegistry(compiled=False)
+    loaded = registry.get()
+    compiled = load_compiled(registry.compiled_path, loaded.version)
+    assert compiled is not None, f"{registry.compiled_path} is missing or was built from another model version"
+    assert len(compiled.domains) == len(FEATURE_COLUMNS)
+
+    grid = list(itertools.product(*compiled.domains))
+    expected = [int(prediction) for prediction in model_predict(loaded.model, grid)]
+    mismatches = [(row, want, got) for row, want, got in zip(grid, expected, compiled.predict(grid)) if want != got]
+    assert not mismatches, f"{len(mismatches)} of {len(grid)} grid points differ, first: {mismatches[:5]}"
@@ -0,0 +1,54 @@
+import asyncio
+
+from db_helpers.concurrency import FunctionLimiter
+
+
+async def capacity(limiter):
+    """Slots that can still be taken at once; each is given back afterwards."""
+    taken = 0
+    while await limiter.acquire(timeout=0.01) is not None:
+        taken += 1
+    for _ in range(taken):
+        limiter.release()
+    return taken
+
+
+def test_timed_out_waiters_leave_every_slot_free():
+    async def main():
+        limiter = FunctionLimiter("test", "interactive", 2)
+        for _ in range(limiter.limit):
+            assert await limiter.acquire(timeout=1) is not None
+        loop = asyncio.get_running_loop()
+        # Slots freed around the moment each waiter's timeout fires
+        for offset in (-0.002, -0.001, 0.0, 0.001, 0.002):
+            waiter = asyncio.ensure_future(limiter.acquire(timeout=0.02))
+            loop.call_later(0.02 + offset, limiter.release)
+            if await waiter is not None:
+                limiter.release()
+            await asyncio.sleep(0.01)
+            assert await limiter.acquire(timeout=1) is not None
+        for _ in range(limiter.limit):
+            limiter.release()
+        return limiter
+
+    limiter = asyncio.run(main())
+    assert limiter.stats()["running"] == limiter.stats()["waiting"] == 0
+    assert asyncio.run(capacity(limiter)) == limiter.limit
+
+
+def test_cancelled_waiter_gives_back_a_slot_freed_for_it():
+    async def main():
+        limiter = FunctionLimiter("test", "interactive", 1)
+        assert await limiter.acquire(timeout=1) is not None
+        waiter = asyncio.ensure_future(limiter.acquire(timeout=5))
+        await asyncio.sleep(0.01)
+        # The invocation is cancelled in the same loop iteration that hands it the slot
+        limiter.release()
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+        return limiter.stats()["running"], await capacity(limiter)
+
+    assert asyncio.run(main()) == (0, 1)
@@ -0,0 +1,20 @@
+from db_helpers import dimensionCache
+from db_helpers.dimensionCache import DimensionCache
+
+
+def test_snapshot_returns_tables_when_invalidated_during_the_freshness_check(database, monkeypatch):
+    cache = DimensionCache(ttl_seconds=60)
+    tables = cache.snapshot(database)
+
+    # invalidate() from another thread, landing after the fast path has looked at the tables
+    monotonic = dimensionCache.time.monotonic
+
+    def invalidating_monotonic():
+        monkeypatch.setattr(dimensionCache.time, "monotonic", monotonic)
+        cache.invalidate()
+        return monotonic()
+    monkeypatch.setattr(dimensionCache.time, "monotonic", invalidating_monotonic)
+
+    assert cache.snapshot(database) is tables
+    assert not cache.fresh()
+    assert cache.snapshot(database) is not tables
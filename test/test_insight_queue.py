@@ -0,0 +1,84 @@
+import time
+
+import pytest
+
+from db_helpers.insightQueue import InsightQueue, MemoryInsightQueue, SqliteInsightQueue
+
+LEASE_SECONDS = 0.2
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_queue(request, tmp_path):
+    def make_queue(**options):
+        if request.param == "sqlite":
+            return SqliteInsightQueue(path=str(tmp_path / "queue.sqlite3"), **options)
+        return MemoryInsightQueue(**options)
+    return make_queue
+
+
+def counts(queue):
+    metrics = queue.metrics()
+    return {name: metrics[name] for name in ("acked", "retried", "dead_lettered")}
+
+
+def test_nacked_message_is_retried_after_backoff_then_dead_lettered(make_queue):
+    queue = make_queue(max_attempts=2, visibility_seconds=30, retry_backoff_seconds=LEASE_SECONDS)
+    queue.put_many([7])
+
+    first = queue.get_batch(10, 0)
+    assert [(message.insight_id, message.attempts) for message in first] == [(7, 1)]
+    queue.nack(first, error="scoring failed")
+    assert queue.get_batch(10, 0) == []
+
+    time.sleep(LEASE_SECONDS * 1.5)
+    second = queue.get_batch(10, 0)
+    assert [(message.insight_id, message.attempts) for message in second] == [(7, 2)]
+    queue.nack(second, error="scoring failed again")
+
+    assert [tuple(letter) for letter in queue.dead_letters()] == [(7, 2, "scoring failed again")]
+    assert queue.depth() == (0, 0, 1)
+    assert counts(queue) == {"acked": 0, "retried": 1, "dead_lettered": 1}
+
+
+def test_only_the_latest_delivery_of_an_expired_lease_settles(make_queue):
+    queue = make_queue(max_attempts=3, visibility_seconds=LEASE_SECONDS, retry_backoff_seconds=30)
+    queue.put_many([7])
+
+    stale = queue.get_batch(10, 0)
+    time.sleep(LEASE_SECONDS * 1.5)
+    latest = queue.get_batch(10, 0)
+    assert [(message.id, message.attempts) for message in latest] == [(stale[0].id, 2)]
+    assert stale[0].attempts == 1
+
+    # The first consumer finishing late must neither delete nor requeue the message under the second
+    queue.ack(stale)
+    queue.nack(stale, error="late failure")
+    assert queue.depth() == (0, 1, 0)
+    assert counts(queue) == {"acked": 0, "retried": 0, "dead_lettered": 0}
+
+    queue.ack(latest)
+    queue.ack(latest)
+    assert queue.depth() == (0, 0, 0)
+    assert counts(queue) == {"acked": 1, "retried": 0, "dead_lettered": 0}
+
+
+def test_lease_expiring_max_attempts_times_dead_letters(make_queue):
+    queue = make_queue(max_attempts=2, visibility_seconds=LEASE_SECONDS / 2)
+    queue.put_many([7])
+
+    for attempts in (1, 2):
+        assert [message.attempts for message in queue.get_batch(10, 0)] == [attempts]
+        time.sleep(LEASE_SECONDS)
+    assert queue.get_batch(10, 0) == []
+
+    assert [tuple(letter) for letter in queue.dead_letters()] == [(7, 2, "Lease expired too many times.")]
+    assert queue.depth() == (0, 0, 1)
+
+
+def test_backend_missing_an_operation_cannot_be_constructed():
+    class ListQueue(InsightQueue):
+        def put_many(self, insight_ids, timeout=0):
+            return 0
+
+    with pytest.raises(TypeError):
+        ListQueue()
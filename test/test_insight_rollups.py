@@ -0,0 +1,70 @@
+import io
+
+from db_helpers.compiledPredictor import CompiledPredictor, default_domains
+from db_helpers.generateRecommendations import generate_batch, generate_one
+from db_helpers.ingestDedup import UploadDeduplicator
+from db_helpers.ingestInsights import ingest_rows, open_csv
+from db_helpers.insightRollups import check_rollups
+
+HEADER = ("content,created_at,insight_type,data_source,audience,domain,confidence_level,timeliness,"
+          "alignment_goal,value_priority\n")
+
+FIRST_UPLOAD = HEADER + """\
+"Members aged 50+ have a 20% higher risk of chronic illness.","2024-01-15 08:30:00","Descriptive","Claims Data","Individual Members","Health Outcomes","High","Historical","Risk Mitigation","Informational"
+"Annual check-ups reduce chronic disease risk by 15%.","2024-01-20 12:45:00","Predictive","Member Portal Usage","Member Cohorts","Health Outcomes","Medium","Periodic","Health Improvement","Actionable"
+"Portal reminders cut missed appointments by 12%.","2024-01-31 23:59:59","Prescriptive","Member Portal Usage","Organization-Wide","Member Engagement","High","Periodic","Member Engagement","Strategic"
+"Claims triage shortens approval time.","2024-02-01 00:00:00","Descriptive","Demographic Data","Organization-Wide","Operational Efficiency","Low","Real-Time","Cost Optimization","Actionable"
+"Generic substitution lowers pharmacy spend.","2024-02-25 15:00:00","Predictive","Pharmacy Data","Member Cohorts","Operational Efficiency","Medium","Historical","Cost Optimization","Strategic"
+"""
+
+# A second upload: new insights, one without created_at (counted under the month it is
+# stored with), one unknown lookup name (rejected) and a repeat of the first upload's first row
+SECOND_UPLOAD = HEADER + """\
+"Telehealth visits doubled in rural cohorts.","2024-03-18 11:00:00","Descriptive","Claims Data","Member Cohorts","Health Outcomes","Low","Historical","Risk Mitigation","Actionable"
+"Pharmacy refills lapse after 90 days.",,"Predictive","Pharmacy Data","Individual Members","Health Outcomes","High","Real-Time","Health Improvement","Informational"
+"Unknown audience row.","2024-03-19 09:00:00","Predictive","Claims Data","Nobody","Health Outcomes","High","Periodic","Risk Mitigation","Actionable"
+"Members aged 50+ have a 20% higher risk of chronic illness.","2024-01-15 08:30:00","Descriptive","Claims Data","Individual Members","Health Outcomes","High","Historical","Risk Mitigation","Informational"
+"""
+
+
+def ingest(database, payload):
+    reader, header_index = open_csv(io.BytesIO(payload))
+    return ingest_rows(database, reader, header_index, chunk_size=2, deduplicator=UploadDeduplicator(exact=True))
+
+
+def predictor():
+    domains = default_domains()
+    size = 1
+    for domain in domains:
+        size *= len(domain)
+    return CompiledPredictor("test", domains, [position % 3 for position in range(size)])
+
+
+def test_writes_keep_rollups_equal_to_full_counts(database):
+    first = ingest(database, FIRST_UPLOAD.encode("utf-8"))
+    second = ingest(database, SECOND_UPLOAD.encode("utf-8"))
+    assert (first["inserted"], second["inserted"], second["rejected"], second["duplicates"]) == (5, 2, 1, 1)
+
+    model = predictor()
+    assert generate_batch(database, model, insight_ids=first["insight_ids"][:2])["processed"] == 2
+    assert generate_batch(database, model, missing=True, chunk_size=2)["processed"] == 5
+    assert generate_batch(database, model, insight_ids=first["insight_ids"], skip_scored=True)["skipped"] == 5
+    insight_id = second["insight_ids"][0]
+    assert generate_one(database, model, "test", insight_id, idempotent=True)["created"] is False
+    assert generate_one(database, model, "test", insight_id, idempotent=False)["created"] is True
+
+    assert len(database.tables["insights"]) == 7
+    assert len(database.tables["recommendations"]) == 8
+    assert check_rollups(database) == {"insights": [], "recommendations": []}
+
+
+def test_check_rollups_reports_rows_written_around_the_rollups(database):
+    ingest(database, FIRST_UPLOAD.encode("utf-8"))
+    database.tables["insights"].append(dict(database.tables["insights"][0], id=6))
+    database.commit()
+
+    differences = check_rollups(database)
+    assert len(differences["insights"]) == 1
+    group, expected, actual = differences["insights"][0]
+    assert expected == actual + 1
+    assert differences["recommendations"] == []
@@ -0,0 +1,143 @@
+import csv
+import datetime
+import io
+import os
+
+import pytest
+
+from db_helpers.dimensionCache import INSIGHT_DIMENSIONS, normalize_name
+from db_helpers.ingestDedup import UploadDeduplicator
+from db_helpers.ingestInsights import EXPECTED_HEADERS, ingest_rows, open_csv
+from db_helpers.parallelIngest import UploadChunks, ingest_chunks
+from fakertools.generate_insights import LOOKUP_NAMES
+
+TEST_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        "insights_injest_csv", "test_data", "insights.csv")
+
+# Tiny chunks, so even the five test rows are split across several parse tasks
+MAPPING_CHUNK_BYTES = 200
+
+
+# csv.writer would quote a field holding a quote; this stands in for one it writes literally
+STRAY = "<stray quote>"
+
+
+def write_csv(rows, lineterminator="\n", quoting=csv.QUOTE_MINIMAL):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator=lineterminator, quoting=quoting).writerows(rows)
+    return buffer.getvalue().replace(STRAY, '"').encode("utf-8")
+
+
+def mapping_variants(payload):
+    """(name, CSV bytes) variants of the test upload that must all map to the same values."""
+    rows = list(csv.reader(io.StringIO(payload.decode("utf-8"))))
+    header, data = rows[0], rows[1:]
+    content = header.index("content")
+
+    def with_content(suffix):
+        return [row[:content] + [row[content] + suffix] + row[content + 1:] for row in data]
+
+    def permuted(rows):
+        # Reversed, so content is the last column
+        return [list(reversed(row)) for row in rows]
+
+    stray_inside = with_content(f" on a 5{STRAY} screen")
+    stray_at_end = with_content(f" on a screen of 12{STRAY}")
+    multiline = with_content("\nover two lines")
+    return [
+        ("original", payload),
+        ("permuted columns", write_csv(permuted(rows))),
+        ("quoted commas and newlines", write_csv([header] + with_content(', "quoted"\nover two lines'),
+                                                 quoting=csv.QUOTE_ALL)),
+        ("bom and crlf", b"\xef\xbb\xbf" + write_csv(rows, lineterminator="\r\n")),
+        ("stray quote inside a field", write_csv([header] + data[:2] + stray_inside[2:])),
+        ("stray quote ending a field", write_csv([header] + data[:2] + stray_at_end[2:])),
+        ("stray quote ending a line", write_csv(permuted([header] + data[:2] + stray_at_end[2:]))),
+        # Quote parity flipped by the stray quote would cut inside the quoted newlines after it
+        ("stray quote before quoted newlines", write_csv([header] + data[:1] + stray_at_end[1:2] + multiline[2:])),
+    ]
+
+
+def seed_lookups():
+    return {column: {normalize_name(name): position + 1 for position, name in enumerate(names)}
+            for column, names in LOOKUP_NAMES.items()}
+
+
+def expected_by_name(payload):
+    """
+    {line: values or errors} mapped independently of ingestInsights: by header name through
+    csv.DictReader, resolved against the seed lookups, created_at parsed as a timestamp.
+    """
+    lookups = seed_lookups()
+    reader = csv.DictReader(io.StringIO(payload.decode("utf-8-sig"), newline=""))
+    expected = {}
+    for row in reader:
+        row = {name.strip(): value for name, value in row.items()}
+        unknown = [f"Unknown {column} '{row[column]}'" for column in INSIGHT_DIMENSIONS
+                   if normalize_name(row[column]) not in lookups[column]]
+        if unknown:
+            expected[reader.line_num] = unknown
+            continue
+        ids = [lookups[column][normalize_name(row[column])] for column in INSIGHT_DIMENSIONS]
+        expected[reader.line_num] = ids + [datetime.datetime.strptime(row["created_at"], "%Y-%m-%d %H:%M:%S"),
+                                           row["content"]]
+    return expected
+
+
+def outcome(result, database):
+    """{line: staged values without the content hash, or reject errors}"""
+    mapped = {row[0]: row[1:-1] for row in database.staged}
+    mapped.update({reject["line"]: reject["errors"] for reject in result["rejects"]})
+    return mapped
+
+
+def ingest_both_ways(make_database, payload, chunk_bytes, workers):
+    """(serial outcome, pipelined outcome) of one upload, each into an empty database."""
+    database = make_database()
+    reader, header_index = open_csv(io.BytesIO(payload))
+    serial = outcome(ingest_rows(database, reader, header_index), database)
+
+    database = make_database()
+    chunks = UploadChunks(io.BytesIO(payload), chunk_bytes=chunk_bytes)
+    result = ingest_chunks(database, chunks, workers=workers, deduplicator=UploadDeduplicator(exact=True))
+    return serial, outcome(result, database)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_pipelined_ingest_maps_columns_like_serial_ingest(make_database, workers):
+    with open(TEST_CSV, "rb") as upload:
+        payload = upload.read()
+    for name, variant in mapping_variants(payload):
+        serial, pipelined = ingest_both_ways(make_database, variant, MAPPING_CHUNK_BYTES, workers)
+        assert pipelined == serial == expected_by_name(variant), name
+
+
+def test_stray_quote_ending_a_field_before_multiline_records(make_database):
+    names = {column: names[0] for column, names in LOOKUP_NAMES.items()}
+    rows = [EXPECTED_HEADERS]
+    for number in range(1, 41):
+        content = f"multi {number}\nline" if number % 5 == 0 else f"row {number}"
+        if number == 3:
+            content = f"screen 12{STRAY}"
+        rows.append([content, "2024-01-15 08:30:00"] + [names[column] for column in EXPECTED_HEADERS[2:]])
+    payload = write_csv(rows)
+    assert b'12",' in payload
+
+    serial, pipelined = ingest_both_ways(make_database, payload, chunk_bytes=300, workers=1)
+    contents = [values[-1] for values in pipelined.values()]
+    assert len(contents) == 40 and 'screen 12"' in contents and "multi 5\nline" in contents
+    assert pipelined == serial == expected_by_name(payload)
+
+
+@pytest.mark.parametrize("payload, stray", [
+    (b'a,"quoted, ""twice""\nover two lines",c\nd,e,f\n', False),
+    (b'a,5" screen,c\nd,e,f\n', True),
+    (b'a,12",c\nd,e,f\n', True),
+    (b'a,b,12"\nd,e,f\n', True),
+    (b'a,"quoted"text,c\nd,e,f\n', True),
+])
+def test_upload_chunks_fall_back_to_serial_parsing_on_stray_quotes(payload, stray):
+    header = ",".join(EXPECTED_HEADERS).encode("utf-8") + b"\n"
+    chunks = list(UploadChunks(io.BytesIO(header + payload), chunk_bytes=8))
+    assert (chunks[-1][2] is not None) == stray
+    assert b"".join(data for _, data, _ in chunks) == payload
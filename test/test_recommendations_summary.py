@@ -0,0 +1,119 @@
+import contextlib
+
+import pytest
+
+import recommendations_summary
+from recommendations_summary import decode_token, encode_token, make_etag, read_state
+
+
+class RowVersionDatabase:
+    """
+    Connection stand-in for STATE_QUERY: evaluates the expressions of its select list over a
+    database whose rowversion counter is shared by Recommendations and Tags, as in SQL Server.
+    Writes may be left in flight, holding their row_version below MIN_ACTIVE_ROWVERSION() until
+    they commit; readers see committed rows only.
+    """
+
+    def __init__(self):
+        self.dbts = 0
+        # table -> {row id: row_version} of committed rows
+        self.tables = {"Recommendations": {}, "Tags": {}}
+        # row_version -> (table, row id) of writes not yet committed
+        self.in_flight = {}
+
+    def write(self, table, row_id, commit=True):
+        self.dbts += 1
+        if commit:
+            self.tables[table][row_id] = self.dbts
+        else:
+            self.in_flight[self.dbts] = (table, row_id)
+        return self.dbts
+
+    def commit(self, row_version):
+        table, row_id = self.in_flight.pop(row_version)
+        self.tables[table][row_id] = row_version
+
+    def min_active_row_version(self):
+        return min(self.in_flight, default=self.dbts + 1)
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, *params):
+        select_list, from_clause = sql.strip()[len("SELECT "):].rsplit("\nFROM ", 1)
+        assert from_clause.strip() == "Recommendations"
+        self._row = tuple(self._evaluate(expression.strip()) for expression in self._split(select_list))
+        return self
+
+    def _evaluate(self, expression):
+        versions = list(self.tables["Recommendations"].values())
+        bound = self.min_active_row_version()
+        values = {
+            "MAX(row_version)": lambda: self._binary(max(versions, default=None)),
+            "COUNT_BIG(*)": lambda: len(versions),
+            "(SELECT MAX(row_version) FROM Recommendations WHERE row_version < MIN_ACTIVE_ROWVERSION())":
+                lambda: self._binary(max((version for version in versions if version < bound), default=None)),
+            "CAST(CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) - 1 AS BINARY(8))": lambda: self._binary(bound - 1),
+        }
+        assert expression in values, f"Expression not supported by the stand-in: {expression}"
+        return values[expression]()
+
+    @staticmethod
+    def _split(select_list):
+        """Splits a select list at the commas outside parentheses."""
+        expressions, depth, start = [], 0, 0
+        for position, character in enumerate(select_list):
+            depth += {"(": 1, ")": -1}.get(character, 0)
+            if character == "," and depth == 0:
+                expressions.append(select_list[start:position])
+                start = position + 1
+        return expressions + [select_list[start:]]
+
+    def fetchone(self):
+        return self._row
+
+    @staticmethod
+    def _binary(version):
+        return None if version is None else version.to_bytes(8, "big")
+
+
+@pytest.fixture
+def state_database(monkeypatch):
+    database = RowVersionDatabase()
+    monkeypatch.setattr(recommendations_summary, "get_connection", lambda: contextlib.nullcontext(database))
+    return database
+
+
+def etag():
+    return make_etag(read_state(), None, None, False, "model-version")
+
+
+def test_writes_to_other_tables_leave_the_etag_unchanged(state_database):
+    state_database.write("Recommendations", 1)
+    state_database.write("Recommendations", 2)
+    before = etag()
+
+    state_database.write("Tags", 1)
+    in_flight_tag = state_database.write("Tags", 2, commit=False)
+    assert etag() == before
+    state_database.commit(in_flight_tag)
+    assert etag() == before
+
+    state_database.write("Recommendations", 1)
+    assert etag() != before
+
+
+def test_full_token_stays_below_recommendations_still_in_flight(state_database):
+    state_database.write("Recommendations", 1)
+    in_flight = state_database.write("Recommendations", 2, commit=False)
+    state_database.write("Recommendations", 3)
+    state_database.write("Tags", 1)
+
+    token = read_state()[0]
+    assert int.from_bytes(decode_token(encode_token(token)), "big") < in_flight
+    before = etag()
+
+    # The late commit has to reach clients through the next delta, so the ETag must move
+    state_database.commit(in_flight)
+    assert etag() != before
+    assert int.from_bytes(read_state()[0], "big") == state_database.tables["Recommendations"][3]